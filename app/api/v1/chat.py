@@ -3,21 +3,23 @@
 基于 Redis 共享内存的聊天系统
 """
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from loguru import logger
 
-from app.core.config import get_settings, Settings
+from app.core.client_registry import get_client_registry, ClientRegistry
 from app.services.rag.conversation_service import ConversationService
 from app.schemas.rag import ChatRequest, ChatResponse, ChatEngineType
+from app.utils.sse import format_sse, SSE_HEADERS
 
 
 router = APIRouter(prefix="/chat", tags=["智能聊天"])
 
 
-def get_chat_service(settings: Settings = Depends(get_settings)) -> ConversationService:
-    """获取聊天服务实例"""
-    from app.services.rag.rag_settings import get_rag_config_manager
-    rag_config_manager = get_rag_config_manager()
-    return ConversationService(settings, rag_config_manager)
+def get_chat_service(
+    registry: ClientRegistry = Depends(get_client_registry)
+) -> ConversationService:
+    """获取共享的聊天服务实例"""
+    return registry.get_conversation_service()
 
 
 @router.post("/", response_model=ChatResponse)
@@ -88,6 +90,43 @@ async def intelligent_chat(
         )
 
 
+@router.post("/stream")
+async def intelligent_chat_stream(
+    request: ChatRequest,
+    chat_service: ConversationService = Depends(get_chat_service)
+):
+    """
+    流式智能对话接口（Server-Sent Events）
+
+    参数与非流式接口相同，响应为 `text/event-stream`，事件依次为：
+    - `sources`: 检索到的来源信息，在生成开始前发送
+    - `token`: 增量生成的文本，`data.delta` 为新增内容
+    - `done`: 生成结束，包含完整回答、首Token耗时和总耗时
+    - `error`: 处理出错时发送
+
+    回答在流结束后写回Redis会话内存
+    """
+    # 验证参数
+    if not request.conversation_id.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="conversation_id 不能为空"
+        )
+
+    if not request.question.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="question 不能为空"
+        )
+
+    async def event_stream():
+        async for event in chat_service.stream_chat(request):
+            yield format_sse(event["data"], event=event["event"])
+
+    logger.info(f"流式聊天开始 - 会话ID: {request.conversation_id}, 引擎: {request.chat_engine_type}")
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @router.get("/health")
 async def chat_health_check(
     chat_service: ConversationService = Depends(get_chat_service)
@@ -4,22 +4,22 @@
 """
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from loguru import logger
 
-from app.core.config import get_settings, Settings
+from app.core.client_registry import get_client_registry, ClientRegistry
 from app.services.rag.conversation_service import ConversationService
-from app.services.rag.rag_settings import get_rag_config_manager, RAGConfigManager
 from app.schemas.rag import ChatRequest, ChatResponse, ChatEngineType
+from app.utils.sse import format_sse, SSE_HEADERS
 
 router = APIRouter(prefix="/conversation", tags=["智能对话"])
 
 
 def get_conversation_service(
-    settings: Settings = Depends(get_settings),
-    rag_config_manager: RAGConfigManager = Depends(get_rag_config_manager)
+    registry: ClientRegistry = Depends(get_client_registry)
 ) -> ConversationService:
-    """获取对话服务实例"""
-    return ConversationService(settings, rag_config_manager)
+    """获取共享的对话服务实例"""
+    return registry.get_conversation_service()
 
 
 @router.post("/chat", response_model=ChatResponse)
@@ -93,6 +93,43 @@ async def intelligent_chat(
         )
 
 
+@router.post("/chat/stream")
+async def intelligent_chat_stream(
+    request: ChatRequest,
+    conv_service: ConversationService = Depends(get_conversation_service)
+):
+    """
+    流式智能对话接口（Server-Sent Events）
+
+    参数与非流式接口相同，响应为 `text/event-stream`，事件依次为：
+    - `sources`: 检索到的来源信息，在生成开始前发送
+    - `token`: 增量生成的文本，`data.delta` 为新增内容
+    - `done`: 生成结束，包含完整回答、首Token耗时和总耗时
+    - `error`: 处理出错时发送
+
+    回答在流结束后写回Redis会话内存
+    """
+    # 验证参数
+    if not request.conversation_id.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="conversation_id 不能为空"
+        )
+
+    if not request.question.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="question 不能为空"
+        )
+
+    async def event_stream():
+        async for event in conv_service.stream_chat(request):
+            yield format_sse(event["data"], event=event["event"])
+
+    logger.info(f"流式聊天开始 - 会话ID: {request.conversation_id}, 引擎: {request.chat_engine_type}")
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @router.delete("/conversations/{conversation_id}")
 async def clear_conversation(
     conversation_id: str,
@@ -2,7 +2,7 @@
 课程管理API路由
 专门处理课程级别的操作
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from typing import Optional
 import shutil
 from pathlib import Path
@@ -10,14 +10,18 @@ from urllib.parse import unquote
 
 from ...core.logging import get_logger
 from ...constants.paths import UPLOADS_DIR, OUTLINES_DIR
-from ...repositories.rag_repository import rag_repository
+from ...core.client_registry import get_client_registry
+from ...services.course_material.cleanup_service import cleanup_service
 
 logger = get_logger("course_api")
 router = APIRouter(prefix="/course", tags=["课程管理"])
 
 
 @router.delete("/{course_id}")
-async def delete_course(course_id: str):
+async def delete_course(
+    course_id: str,
+    background: bool = Query(False, description="是否以后台任务删除向量数据，大课程建议开启")
+):
     """
     删除整个课程及其所有数据
 
@@ -26,8 +30,12 @@ async def delete_course(course_id: str):
     - data/outputs/outlines/{course_id} 文件夹
     - Qdrant中所有course_id匹配的向量点
 
+    向量数据在Qdrant服务端按过滤条件删除，不传输点ID；background为true时
+    向量删除以后台任务执行，返回的task_id可通过 `/course/tasks/{task_id}` 查询进度
+
     Args:
         course_id: 课程ID
+        background: 是否以后台任务删除向量数据
 
     Returns:
         删除操作的结果信息
@@ -86,26 +94,44 @@ async def delete_course(course_id: str):
         })
         
         # 3. 删除Qdrant向量数据
-        qdrant_success = False
-        deleted_count = 0
+        if background:
+            task_id = None
+            try:
+                record = await cleanup_service.submit_vector_delete(course_id)
+                task_id = record.task_id
+                qdrant_success = True
+                logger.info(f"已提交Qdrant向量删除任务: {task_id}")
+            except Exception as e:
+                logger.error(f"提交Qdrant向量删除任务失败: {str(e)}")
+                qdrant_success = False
 
-        try:
-            filter_condition = {
-                "must": [{"key": "course_id", "match": {"value": course_id}}]
-            }
-            # 注意：delete_vectors_by_filter 不是异步方法，不需要 await
-            deleted_count = rag_repository.delete_vectors_by_filter(filter_condition)
-            qdrant_success = True
-            logger.info(f"成功删除Qdrant向量数据: {deleted_count}个向量点")
-        except Exception as e:
-            logger.error(f"删除Qdrant向量数据失败: {str(e)}")
+            operations.append({
+                "type": "qdrant_vectors",
+                "success": qdrant_success,
+                "task_id": task_id
+            })
+        else:
             qdrant_success = False
-        
-        operations.append({
-            "type": "qdrant_vectors",
-            "success": qdrant_success,
-            "deleted_count": deleted_count
-        })
+            deleted_count = 0
+
+            try:
+                filter_condition = {
+                    "must": [{"key": "course_id", "match": {"value": course_id}}]
+                }
+                qdrant_repo = get_client_registry().get_qdrant_repository()
+                deleted_count = await qdrant_repo.delete_vectors_by_filter(filter_condition)
+                await get_client_registry().get_semantic_cache().invalidate(course_id)
+                qdrant_success = True
+                logger.info(f"成功删除Qdrant向量数据: {deleted_count}个向量点")
+            except Exception as e:
+                logger.error(f"删除Qdrant向量数据失败: {str(e)}")
+                qdrant_success = False
+
+            operations.append({
+                "type": "qdrant_vectors",
+                "success": qdrant_success,
+                "deleted_count": deleted_count
+            })
         
         # 检查是否所有操作都成功
         all_success = all(op["success"] for op in operations)
@@ -133,3 +159,31 @@ async def delete_course(course_id: str):
             status_code=500,
             detail=f"删除课程失败: {str(e)}"
         )
+
+
+@router.get("/tasks/{task_id}")
+async def get_course_task_status(task_id: str):
+    """
+    查询课程向量删除任务状态
+
+    Args:
+        task_id: 删除课程时返回的任务ID
+
+    Returns:
+        任务状态，包括删除前的匹配数量、已删除数量与删除后剩余数量
+    """
+    try:
+        status = await cleanup_service.get_vector_delete_status(task_id)
+    except Exception as e:
+        logger.error(f"查询向量删除任务状态异常: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"查询任务状态失败: {str(e)}"
+        )
+
+    if status is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"任务 {task_id} 不存在"
+        )
+    return status
@@ -2,18 +2,23 @@
 统一课程材料处理API路由
 实现文件上传、大纲生成、RAG索引建立的一站式服务
 """
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
-from fastapi.responses import JSONResponse
-from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional
 
 from ...core.logging import get_logger
 from ...schemas.course_materials import (
     CourseProcessRequest, CourseProcessResponse, TaskStatusQuery,
-    CleanupRequest, CleanupResponse, ProcessingStatus
+    CleanupRequest, CleanupResponse, ProcessingStatus,
+    BatchProcessRequest, BatchProcessResponse
 )
 from ...schemas.outline import ErrorResponse
+from ...core.client_registry import get_client_registry
+from ...services.jobs.idempotency import fingerprint_request
 from ...services.course_material.course_material_process_service import course_material_process_service
+from ...services.course_material.batch_process_service import batch_process_service
 from ...services.course_material.cleanup_service import cleanup_service
+from ...utils.sse import format_sse, SSE_HEADERS
 
 logger = get_logger("course_materials_api")
 
@@ -24,7 +29,7 @@ router = APIRouter(prefix="/course-materials", tags=["课程材料处理"])
     "/process",
     response_model=CourseProcessResponse,
     summary="统一处理课程材料",
-    description="上传课程材料并自动完成大纲生成和RAG索引建立"
+    description="上传课程材料并提交后台任务，自动完成大纲生成和RAG索引建立"
 )
 async def process_course_material(
     file: UploadFile = File(..., description="课程材料文件（支持.md和.txt格式）"),
@@ -35,17 +40,22 @@ async def process_course_material(
     include_refine: bool = Form(True, description="是否进行大纲精简处理"),
     model_name: Optional[str] = Form(None, description="指定使用的模型名称"),
     enable_rag_indexing: bool = Form(True, description="是否建立RAG索引"),
-    rag_collection_name: Optional[str] = Form(None, description="RAG集合名称")
+    rag_collection_name: Optional[str] = Form(None, description="RAG集合名称"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", description="幂等键，重试时携带相同的值返回首次请求的任务")
 ):
     """
     统一处理课程材料
     
-    该API将按顺序执行以下步骤：
-    1. 文件上传验证
-    2. 大纲生成
-    3. RAG索引建立（可选）
+    该API在请求内完成文件上传验证后立即返回任务ID（状态为 pending），
+    后续步骤由后台任务工作池执行：
+    1. 大纲生成
+    2. RAG索引建立（可选，与大纲生成并行）
+    
+    处理进度通过 `/course-materials/tasks/{task_id}/status` 查询；
+    失败时按配置自动重试，重试从断点继续；最终失败后保留已完成阶段的产物，
+    可通过 `/course-materials/tasks/{task_id}/resume` 恢复，放弃时调用删除接口清理。
     
-    处理过程中会提供实时进度反馈，失败时自动清理已完成的操作。
+    携带 `Idempotency-Key` 请求头重试时返回首次请求的任务，不会重复上传和处理。
     """
     try:
         # 构建处理请求
@@ -60,11 +70,20 @@ async def process_course_material(
             rag_collection_name=rag_collection_name
         )
         
-        # 执行处理
-        response = await course_material_process_service.process_course_material(file, request)
+        # 执行处理（携带幂等键时相同请求只执行一次）
+        fingerprint = await fingerprint_request(request.model_dump(mode="json"), file) if idempotency_key else ""
+        response = await get_client_registry().get_idempotency_store().execute(
+            "course_materials_process",
+            idempotency_key,
+            fingerprint,
+            lambda: course_material_process_service.process_course_material(file, request),
+            cacheable=lambda result: result.status != ProcessingStatus.FAILED
+        )
         
         return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"课程材料处理API异常: {str(e)}")
         raise HTTPException(
@@ -73,6 +92,95 @@ async def process_course_material(
         )
 
 
+@router.post(
+    "/batch",
+    response_model=BatchProcessResponse,
+    summary="批量处理课程材料",
+    description="一次上传多个文件或一个zip压缩包，以一个批量任务受限并发地完成大纲生成和RAG索引建立"
+)
+async def process_course_material_batch(
+    course_id: str = Form(..., description="课程ID"),
+    files: Optional[List[UploadFile]] = File(None, description="课程材料文件（支持.md和.txt格式），文件名格式为 {课程材料ID}_{材料名称}.md"),
+    archive: Optional[UploadFile] = File(None, description="zip压缩包，条目文件名格式同上"),
+    custom_prompt: Optional[str] = Form(None, description="自定义提示词"),
+    include_refine: bool = Form(True, description="是否进行大纲精简处理"),
+    model_name: Optional[str] = Form(None, description="指定使用的模型名称"),
+    enable_rag_indexing: bool = Form(True, description="是否建立RAG索引"),
+    rag_collection_name: Optional[str] = Form(None, description="RAG集合名称")
+):
+    """
+    批量处理课程材料
+    
+    请求内逐个完成文件上传验证并返回批量任务ID，每个文件对应一个子任务；
+    子任务由后台批量任务以 batch_concurrency 的并发执行，共享嵌入流水线。
+    
+    - 文件名 `{课程材料ID}_{材料名称}.md` 解析出材料ID与名称，不含下划线时文件名同时作为两者
+    - 压缩包逐个条目流式解压，跳过目录、隐藏文件和不支持的文件类型
+    - 未通过校验的文件在对应条目中返回错误，不影响其他文件
+    
+    批量进度通过 `/course-materials/batches/{batch_id}` 查询，
+    单个文件的详细进度可用子任务ID查询或订阅。
+    """
+    try:
+        if not files and archive is None:
+            raise HTTPException(status_code=400, detail="请上传文件或zip压缩包")
+        
+        request = BatchProcessRequest(
+            course_id=course_id,
+            custom_prompt=custom_prompt,
+            include_refine=include_refine,
+            llm_model=model_name,
+            enable_rag_indexing=enable_rag_indexing,
+            rag_collection_name=rag_collection_name
+        )
+        
+        return await batch_process_service.create_batch(request, files=files, archive=archive)
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"批量处理课程材料API异常: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"批量处理课程材料失败: {str(e)}"
+        )
+
+
+@router.get(
+    "/batches/{batch_id}",
+    response_model=BatchProcessResponse,
+    summary="查询批量任务状态",
+    description="查询批量任务的整体进度和每个文件的处理状态"
+)
+async def get_batch_status(batch_id: str):
+    """
+    查询批量任务状态
+    
+    各文件的状态从子任务记录实时汇总。
+    """
+    try:
+        response = await batch_process_service.get_batch_status(batch_id)
+        
+        if response is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"批量任务 {batch_id} 不存在"
+            )
+        
+        return response
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"查询批量任务状态异常: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"查询批量任务状态失败: {str(e)}"
+        )
+
+
 @router.get(
     "/tasks/{task_id}/status",
     response_model=TaskStatusQuery,
@@ -87,7 +195,7 @@ async def get_task_status(task_id: str):
     """
     try:
         # 获取任务状态
-        task_response = course_material_process_service.get_task_status(task_id)
+        task_response = await course_material_process_service.get_task_status(task_id)
         
         if not task_response:
             raise HTTPException(
@@ -96,24 +204,7 @@ async def get_task_status(task_id: str):
             )
         
         # 转换为查询响应格式
-        status_query = TaskStatusQuery(
-            task_id=task_response.task_id,
-            status=task_response.status,
-            message=task_response.message,
-            current_step=task_response.current_step,
-            completed_steps=task_response.completed_steps,
-            total_steps=task_response.total_steps,
-            progress_percentage=task_response.progress_percentage,
-            course_id=task_response.course_id,
-            course_material_id=task_response.course_material_id,
-            material_name=task_response.material_name,
-            upload_file_path=task_response.upload_file_path,
-            outline_file_path=task_response.outline_file_path,
-            rag_index_status=task_response.rag_index_status,
-            error_step=task_response.error_step,
-            error_message=task_response.error_message,
-            created_at=task_response.created_at
-        )
+        status_query = course_material_process_service.build_status_query(task_response)
         
         return status_query
         
@@ -127,6 +218,69 @@ async def get_task_status(task_id: str):
         )
 
 
+@router.post(
+    "/tasks/{task_id}/resume",
+    response_model=CourseProcessResponse,
+    summary="恢复失败的任务",
+    description="从断点继续处理失败的课程材料任务，跳过已完成的阶段和已写入的索引分段"
+)
+async def resume_task(task_id: str):
+    """
+    恢复失败的任务
+    
+    无需重新上传文件：已生成的大纲直接复用，RAG索引从最后写入的分段之后继续。
+    """
+    try:
+        response = await course_material_process_service.resume_task(task_id)
+        
+        if response is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"任务 {task_id} 不存在"
+            )
+        
+        return response
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"恢复任务异常: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"恢复任务失败: {str(e)}"
+        )
+
+
+@router.get(
+    "/tasks/{task_id}/events",
+    summary="订阅任务进度",
+    description="以Server-Sent Events推送课程材料处理任务的状态变化和索引进度"
+)
+async def stream_task_events(task_id: str):
+    """
+    订阅任务进度
+    
+    一个长连接代替轮询 `/course-materials/tasks/{task_id}/status`，事件依次为：
+    - `status`: 任务状态，连接建立时推送一次，之后每次状态变化推送，数据与状态查询接口相同
+    - `progress`: RAG索引的嵌入进度，每个批次完成后推送
+    - `job`: 后台任务完成、重试或最终失败
+    - `keepalive`: 保活，空闲超过 job_events_keepalive 秒时推送
+    - `done`: 任务结束，数据为最终状态，随后关闭连接
+    - `error`: 任务不存在
+    
+    使用Redis任务存储时事件跨工作进程转发；否则在保活间隔内从任务存储校对状态
+    """
+    logger.info(f"订阅任务进度 - 任务ID: {task_id}")
+    
+    async def event_stream():
+        async for event in course_material_process_service.watch_task(task_id):
+            yield format_sse(event["data"], event=event["event"])
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @router.delete(
     "/{course_id}/{course_material_id}",
     response_model=CleanupResponse,
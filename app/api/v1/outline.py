@@ -2,9 +2,10 @@
 大纲生成API路由模块
 提供文档大纲生成的REST API接口
 """
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import Optional
+import time
 from pathlib import Path
 import os
 from datetime import datetime
@@ -17,6 +18,7 @@ from ...core.deps import (
     get_current_settings
 )
 from ...core.config import Settings
+from ...core.client_registry import get_client_registry
 from ...core.logging import get_logger
 from ...schemas.outline import (
     OutlineGenerateResponse,
@@ -26,18 +28,150 @@ from ...schemas.outline import (
     TaskStatus
 )
 from ...services.outline.outline_service import outline_service
+from ...services.jobs.job_store import JobRecord, JobStore
+from ...services.jobs.idempotency import fingerprint_request
 from ...utils.fileio import file_utils
 from ...utils.idgen import IDGenerator, filename_generator, path_generator
 from ...utils.timers import async_timer, performance_monitor
 from ...utils.validation import CourseValidation, FileValidation
+from ...utils.sse import format_sse, SSE_HEADERS
 from ...constants.paths import UPLOADS_DIR, OUTLINES_DIR
 
 logger = get_logger("outline_api")
 
 router = APIRouter(prefix="/outline", tags=["大纲生成"])
 
-# 存储任务状态的简单内存存储（生产环境应使用数据库）
-task_storage = {}
+# 大纲任务在任务存储中的类型
+JOB_KIND = "outline"
+
+
+def _job_store() -> JobStore:
+    return get_client_registry().get_job_store()
+
+
+async def _get_outline_task(task_id: str) -> JobRecord:
+    """获取大纲任务记录，不存在时返回404"""
+    record = await _job_store().get(task_id)
+    if record is None or record.kind != JOB_KIND:
+        raise HTTPException(
+            status_code=404,
+            detail=f"任务不存在: {task_id}"
+        )
+    return record
+
+
+async def _create_outline_task(
+    task_id: str,
+    original_filename: str,
+    upload_path: Path,
+    file_size: int,
+    course_id: str,
+    course_material_id: str,
+    material_name: str
+) -> JobRecord:
+    """写入处理中的大纲任务记录"""
+    record = JobRecord(
+        task_id=task_id,
+        kind=JOB_KIND,
+        status=TaskStatus.PROCESSING.value,
+        state={
+            "original_filename": original_filename,
+            "upload_path": str(upload_path),
+            "file_size": file_size,
+            "course_id": course_id,
+            "course_material_id": course_material_id,
+            "material_name": material_name
+        }
+    )
+    await _job_store().save(record)
+    return record
+
+
+async def _finish_outline_task(
+    record: JobRecord,
+    status: TaskStatus,
+    result: Optional[OutlineGenerateResponse] = None,
+    error: Optional[str] = None
+) -> None:
+    """更新大纲任务的最终状态，写入失败只记录日志，不影响已生成的大纲"""
+    record.status = status.value
+    record.error = error
+    record.state["completed_at"] = time.time()
+    if result is not None:
+        record.state["result"] = result.model_dump(mode="json")
+    try:
+        await _job_store().save(record)
+    except Exception as e:
+        logger.warning(f"大纲任务状态写入失败 - 任务ID: {record.task_id}, 错误: {str(e)}")
+
+
+async def _save_material_upload(
+    file: UploadFile,
+    course_id: str,
+    course_material_id: str,
+    material_name: str,
+    settings: Settings
+):
+    """
+    校验并保存上传的课程材料
+
+    Args:
+        file: 上传文件
+        course_id: 课程ID
+        course_material_id: 课程材料ID
+        material_name: 材料名称
+        settings: 应用配置
+
+    Returns:
+        Tuple[校验后的文件, 上传路径, 文件大小, 文件内容]
+    """
+    # 验证输入参数
+    if not course_id.strip():
+        raise HTTPException(status_code=400, detail="课程ID不能为空")
+    if not course_material_id.strip():
+        raise HTTPException(status_code=400, detail="课程材料ID不能为空")
+    if not material_name.strip():
+        raise HTTPException(status_code=400, detail="材料名称不能为空")
+
+    # 验证上传文件
+    validated_file = await validate_upload_file(file, settings)
+
+    # 验证文件扩展名（只允许.md和.txt）
+    if not FileValidation.validate_file_extension(validated_file.filename, [".md", ".txt"]):
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支持的文件类型。只允许上传 .md 和 .txt 文件"
+        )
+
+    # 验证course_material_id的唯一性
+    CourseValidation.validate_course_material_id_unique(
+        course_id=course_id,
+        course_material_id=course_material_id,
+        uploads_base_dir=UPLOADS_DIR
+    )
+
+    # 获取文件扩展名
+    file_extension = Path(validated_file.filename).suffix
+
+    # 生成基于课程的上传路径
+    upload_path = path_generator.generate_course_upload_path(
+        base_dir=UPLOADS_DIR,
+        course_id=course_id,
+        course_material_id=course_material_id,
+        material_name=material_name,
+        file_extension=file_extension
+    )
+
+    # 确保目录存在
+    upload_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # 保存上传文件
+    file_size = await save_upload_file(validated_file, upload_path)
+    
+    # 读取文件内容
+    file_content = await file_utils.read_text_file_safe(upload_path)
+
+    return validated_file, upload_path, file_size, file_content
 
 
 @router.post(
@@ -51,70 +185,50 @@ async def generate_outline(
     course_id: str = Form(..., description="课程ID"),
     course_material_id: str = Form(..., description="课程材料ID"),
     material_name: str = Form(..., description="材料名称"),
-    settings: Settings = Depends(get_current_settings)
+    settings: Settings = Depends(get_current_settings),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", description="幂等键，重试时携带相同的值返回首次请求的结果")
 ):
-    """生成文档大纲"""
+    """
+    生成文档大纲
+
+    携带 `Idempotency-Key` 请求头重试时返回首次请求的结果；首次请求仍在生成时等待其完成，不会重复调用模型
+    """
+    fields = {"course_id": course_id, "course_material_id": course_material_id, "material_name": material_name}
+    fingerprint = await fingerprint_request(fields, file) if idempotency_key else ""
+    return await get_client_registry().get_idempotency_store().execute(
+        "outline_generate",
+        idempotency_key,
+        fingerprint,
+        lambda: _generate_outline(file, course_id, course_material_id, material_name, settings),
+        cacheable=lambda result: result.status != TaskStatus.FAILED
+    )
+
+
+async def _generate_outline(
+    file: UploadFile,
+    course_id: str,
+    course_material_id: str,
+    material_name: str,
+    settings: Settings
+) -> OutlineGenerateResponse:
+    """执行大纲生成并记录任务状态"""
     
     task_id = IDGenerator.generate_task_id()
+    record = None
     
     try:
         async with async_timer(f"outline_generation_{task_id}") as timer:
             logger.info(f"开始处理大纲生成请求 - 任务ID: {task_id}, 课程: {course_id}, 材料: {course_material_id}, 文件: {file.filename}")
 
-            # 验证输入参数
-            if not course_id.strip():
-                raise HTTPException(status_code=400, detail="课程ID不能为空")
-            if not course_material_id.strip():
-                raise HTTPException(status_code=400, detail="课程材料ID不能为空")
-            if not material_name.strip():
-                raise HTTPException(status_code=400, detail="材料名称不能为空")
-
-            # 验证上传文件
-            validated_file = await validate_upload_file(file, settings)
-
-            # 验证文件扩展名（只允许.md和.txt）
-            if not FileValidation.validate_file_extension(validated_file.filename, [".md", ".txt"]):
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"不支持的文件类型。只允许上传 .md 和 .txt 文件"
-                )
-
-            # 验证course_material_id的唯一性
-            CourseValidation.validate_course_material_id_unique(
-                course_id=course_id,
-                course_material_id=course_material_id,
-                uploads_base_dir=UPLOADS_DIR
-            )
-
-            # 获取文件扩展名
-            file_extension = Path(validated_file.filename).suffix
-
-            # 生成基于课程的上传路径
-            upload_path = path_generator.generate_course_upload_path(
-                base_dir=UPLOADS_DIR,
-                course_id=course_id,
-                course_material_id=course_material_id,
-                material_name=material_name,
-                file_extension=file_extension
+            validated_file, upload_path, file_size, file_content = await _save_material_upload(
+                file, course_id, course_material_id, material_name, settings
             )
-
-            # 确保目录存在
-            upload_path.parent.mkdir(parents=True, exist_ok=True)
-
-            # 保存上传文件
-            file_size = await save_upload_file(validated_file, upload_path)
-            
-            # 读取文件内容
-            file_content = await file_utils.read_text_file_safe(upload_path)
             
             # 更新任务状态
-            task_storage[task_id] = {
-                "status": TaskStatus.PROCESSING,
-                "original_filename": validated_file.filename,
-                "upload_path": str(upload_path),
-                "file_size": file_size,
-                "created_at": timer.start_time
-            }
+            record = await _create_outline_task(
+                task_id, validated_file.filename, upload_path, file_size,
+                course_id, course_material_id, material_name
+            )
             
             logger.info(f"文件处理完成，开始生成大纲 - 任务ID: {task_id}")
             
@@ -128,12 +242,19 @@ async def generate_outline(
                 task_id=task_id  # 传入API层的task_id
             )
 
+            # 设置原始文件路径
+            result.original_file_path = str(upload_path)
+
+            # 确保返回的结果使用正确的task_id
+            result.task_id = task_id
+
             # 更新任务存储
-            task_storage[task_id].update({
-                "status": result.status,
-                "result": result,
-                "completed_at": timer.get_elapsed()
-            })
+            await _finish_outline_task(
+                record,
+                result.status,
+                result=result,
+                error=result.message if result.status == TaskStatus.FAILED else None
+            )
 
             # 记录性能指标
             performance_monitor.record_timing(
@@ -142,32 +263,24 @@ async def generate_outline(
                 task_id=task_id,
                 file_size=file_size,
                 filename=validated_file.filename,
-                include_refine=include_refine,
-                model_name=model_name or settings.outline_model
+                model_name=settings.outline_model
             )
 
             logger.info(f"大纲生成完成 - 任务ID: {task_id}, 状态: {result.status}")
 
-            # 设置原始文件路径
-            result.original_file_path = str(upload_path)
-
-            # 确保返回的结果使用正确的task_id
-            result.task_id = task_id
-
             return result
             
     except HTTPException:
         # 更新任务状态为失败
-        if task_id in task_storage:
-            task_storage[task_id]["status"] = TaskStatus.FAILED
+        if record is not None:
+            await _finish_outline_task(record, TaskStatus.FAILED)
         raise
     except Exception as e:
         logger.error(f"大纲生成过程中发生错误 - 任务ID: {task_id}, 错误: {str(e)}")
         
         # 更新任务状态为失败
-        if task_id in task_storage:
-            task_storage[task_id]["status"] = TaskStatus.FAILED
-            task_storage[task_id]["error"] = str(e)
+        if record is not None:
+            await _finish_outline_task(record, TaskStatus.FAILED, error=str(e))
         
         raise HTTPException(
             status_code=500,
@@ -175,6 +288,89 @@ async def generate_outline(
         )
 
 
+@router.post(
+    "/generate/stream",
+    summary="流式生成文档大纲",
+    description="上传Markdown或文本文档，以Server-Sent Events流式返回大纲生成过程"
+)
+async def generate_outline_stream(
+    file: UploadFile = File(..., description="要处理的Markdown或文本文件(.md/.txt)"),
+    course_id: str = Form(..., description="课程ID"),
+    course_material_id: str = Form(..., description="课程材料ID"),
+    material_name: str = Form(..., description="材料名称"),
+    settings: Settings = Depends(get_current_settings)
+):
+    """
+    流式生成文档大纲
+
+    参数与 `/outline/generate` 相同，响应为 `text/event-stream`，事件依次为：
+    - `task`: 任务ID和大纲文件路径，可用于断线后查询任务状态
+    - `stage`: 阶段开始，`data.stage` 为 `generate`（原始大纲）或 `refine`（精简大纲）
+    - `token`: 增量生成的文本，`data.delta` 为新增内容；长文档分段生成时 `generate` 阶段按原文顺序逐段输出，每个分段完成后输出整段
+    - `stage_done`: 阶段完成，大纲文件已写入该阶段的结果
+    - `done`: 生成完成，数据与 `/outline/generate` 的响应相同
+    - `error`: 生成失败
+
+    生成在后台执行，客户端断开连接后仍会完成并写入大纲文件，结果可通过 `/outline/task/{task_id}` 查询
+    """
+    task_id = IDGenerator.generate_task_id()
+    logger.info(f"开始处理流式大纲生成请求 - 任务ID: {task_id}, 课程: {course_id}, 材料: {course_material_id}, 文件: {file.filename}")
+
+    validated_file, upload_path, file_size, file_content = await _save_material_upload(
+        file, course_id, course_material_id, material_name, settings
+    )
+
+    record = await _create_outline_task(
+        task_id, validated_file.filename, upload_path, file_size,
+        course_id, course_material_id, material_name
+    )
+
+    async def on_complete(result: OutlineGenerateResponse) -> None:
+        result.original_file_path = str(upload_path)
+        await _finish_outline_task(
+            record,
+            result.status,
+            result=result,
+            error=result.message if result.status == TaskStatus.FAILED else None
+        )
+        performance_monitor.record_timing(
+            "outline_generation_stream",
+            result.processing_time or 0.0,
+            task_id=task_id,
+            file_size=file_size,
+            filename=validated_file.filename,
+            status=result.status.value
+        )
+
+    queue = outline_service.start_streaming_generation(
+        file_content=file_content,
+        original_filename=validated_file.filename,
+        course_id=course_id,
+        course_material_id=course_material_id,
+        material_name=material_name,
+        task_id=task_id,
+        on_complete=on_complete
+    )
+    outline_path = outline_service.get_outline_path(
+        task_id, validated_file.filename, course_id, course_material_id, material_name
+    )
+
+    async def event_stream():
+        yield format_sse(
+            {"task_id": task_id, "outline_file_path": str(outline_path), "original_file_path": str(upload_path)},
+            event="task"
+        )
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            if event["event"] == "done":
+                event["data"]["original_file_path"] = str(upload_path)
+            yield format_sse(event["data"], event=event["event"])
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @router.get(
     "/task/{task_id}",
     response_model=OutlineTaskQuery,
@@ -186,35 +382,34 @@ async def get_task_status(task_id: str):
     
     logger.info(f"查询任务状态 - 任务ID: {task_id}")
     
-    if task_id not in task_storage:
-        raise HTTPException(
-            status_code=404,
-            detail=f"任务不存在: {task_id}"
-        )
-    
-    task_data = task_storage[task_id]
+    record = await _get_outline_task(task_id)
+    task_data = record.state
+    status = TaskStatus(record.status)
     
     # 构建响应
     response = OutlineTaskQuery(
         task_id=task_id,
-        status=task_data["status"],
-        message=f"任务状态: {task_data['status'].value}",
+        status=status,
+        message=f"任务状态: {status.value}",
+        course_id=task_data.get("course_id"),
+        course_material_id=task_data.get("course_material_id"),
+        material_name=task_data.get("material_name"),
         original_filename=task_data.get("original_filename"),
         file_size=task_data.get("file_size"),
-        created_at=task_data.get("created_at", 0)
+        created_at=record.created_at
     )
     
     # 如果任务完成，添加结果数据
-    if task_data["status"] == TaskStatus.COMPLETED and "result" in task_data:
-        result = task_data["result"]
+    if status == TaskStatus.COMPLETED and "result" in task_data:
+        result = OutlineGenerateResponse(**task_data["result"])
         response.outline_content = result.outline_content
         response.outline_file_path = result.outline_file_path
         response.processing_time = result.processing_time
         response.completed_at = result.completed_at
     
     # 如果任务失败，添加错误信息
-    elif task_data["status"] == TaskStatus.FAILED and "error" in task_data:
-        response.error_message = task_data["error"]
+    elif status == TaskStatus.FAILED and record.error:
+        response.error_message = record.error
     
     return response
 
@@ -230,29 +425,15 @@ async def list_tasks():
     logger.info("获取任务列表")
 
     tasks = []
-    for task_id, task_data in task_storage.items():
-        # 处理时间戳，确保可以 JSON 序列化
-        created_at = task_data.get("created_at")
-        completed_at = task_data.get("completed_at")
-
-        if isinstance(created_at, float):
-            from datetime import datetime
-            created_at = datetime.fromtimestamp(created_at).isoformat()
-        elif hasattr(created_at, 'isoformat'):
-            created_at = created_at.isoformat()
-
-        if isinstance(completed_at, float):
-            from datetime import datetime
-            completed_at = datetime.fromtimestamp(completed_at).isoformat()
-        elif hasattr(completed_at, 'isoformat'):
-            completed_at = completed_at.isoformat()
+    for record in await _job_store().list(JOB_KIND, limit=0):
+        completed_at = record.state.get("completed_at")
 
         task_info = {
-            "task_id": task_id,
-            "status": task_data["status"].value,
-            "original_filename": task_data.get("original_filename"),
-            "created_at": created_at,
-            "completed_at": completed_at
+            "task_id": record.task_id,
+            "status": record.status,
+            "original_filename": record.state.get("original_filename"),
+            "created_at": datetime.fromtimestamp(record.created_at).isoformat(),
+            "completed_at": datetime.fromtimestamp(completed_at).isoformat() if completed_at else None
         }
         tasks.append(task_info)
 
@@ -272,14 +453,10 @@ async def delete_task(task_id: str):
     
     logger.info(f"删除任务 - 任务ID: {task_id}")
     
-    if task_id not in task_storage:
-        raise HTTPException(
-            status_code=404,
-            detail=f"任务不存在: {task_id}"
-        )
+    await _get_outline_task(task_id)
     
     # 删除任务记录
-    del task_storage[task_id]
+    await _job_store().delete(task_id)
     
     return {
         "message": f"任务已删除: {task_id}"
@@ -297,14 +474,12 @@ async def get_metrics():
     logger.info("获取性能指标")
     
     metrics = performance_monitor.get_metrics()
+    counts = await _job_store().count_by_status(JOB_KIND)
     
     return {
         "performance_metrics": metrics,
-        "active_tasks": len([
-            task for task in task_storage.values()
-            if task["status"] == TaskStatus.PROCESSING
-        ]),
-        "total_tasks": len(task_storage)
+        "active_tasks": counts.get(TaskStatus.PROCESSING.value, 0),
+        "total_tasks": sum(counts.values())
     }
 
 
@@ -3,13 +3,13 @@ RAG模块API路由
 使用新的文档索引服务实现
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Header
 from fastapi.responses import JSONResponse
 from loguru import logger
 
-from app.core.config import get_settings, Settings
+from app.core.client_registry import get_client_registry, ClientRegistry
 from app.services.rag.document_indexing_service import DocumentIndexingService
-from app.services.rag.rag_settings import get_rag_config_manager, RAGConfigManager
+from app.services.jobs.idempotency import fingerprint_request
 from app.schemas.rag import (
     IndexRequest, IndexResponse, CollectionInfo,
     DocumentMetadata, DeleteCollectionResponse
@@ -19,11 +19,10 @@ router = APIRouter(prefix="/rag", tags=["RAG"])
 
 
 def get_document_indexing_service(
-    settings: Settings = Depends(get_settings),
-    rag_config_manager: RAGConfigManager = Depends(get_rag_config_manager)
+    registry: ClientRegistry = Depends(get_client_registry)
 ) -> DocumentIndexingService:
-    """获取文档索引服务实例"""
-    return DocumentIndexingService(settings, rag_config_manager)
+    """获取共享的文档索引服务实例"""
+    return registry.get_document_indexing_service()
 
 
 @router.post("/index", response_model=IndexResponse)
@@ -32,7 +31,9 @@ async def build_index(
     course_id: str = Form(...),
     course_material_id: str = Form(...),
     collection_name: Optional[str] = Form(None),
-    doc_service: DocumentIndexingService = Depends(get_document_indexing_service)
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    doc_service: DocumentIndexingService = Depends(get_document_indexing_service),
+    registry: ClientRegistry = Depends(get_client_registry)
 ):
     """
     建立文档索引
@@ -43,7 +44,26 @@ async def build_index(
     - **course_id**: 课程ID
     - **course_material_id**: 课程材料ID
     - **collection_name**: 集合名称（可选，默认使用配置中的名称）
+    - **Idempotency-Key**: 请求头（可选），重试时携带相同的值返回首次请求的结果，不会重复嵌入
     """
+    fields = {"course_id": course_id, "course_material_id": course_material_id, "collection_name": collection_name}
+    fingerprint = await fingerprint_request(fields, file) if idempotency_key else ""
+    return await registry.get_idempotency_store().execute(
+        "rag_index",
+        idempotency_key,
+        fingerprint,
+        lambda: _build_index(file, course_id, course_material_id, collection_name, doc_service)
+    )
+
+
+async def _build_index(
+    file: UploadFile,
+    course_id: str,
+    course_material_id: str,
+    collection_name: Optional[str],
+    doc_service: DocumentIndexingService
+) -> IndexResponse:
+    """执行索引建立"""
     try:
         # 验证文件类型
         if not file.filename.endswith(('.md', '.txt')):
@@ -93,8 +113,78 @@ async def build_index(
         )
 
 
+@router.put("/index", response_model=IndexResponse)
+async def update_index(
+    file: UploadFile = File(...),
+    course_id: str = Form(...),
+    course_material_id: str = Form(...),
+    collection_name: Optional[str] = Form(None),
+    doc_service: DocumentIndexingService = Depends(get_document_indexing_service)
+):
+    """
+    增量更新文档索引
+
+    按文本块内容哈希与已有索引比对，只嵌入新增的文本块、只删除已消失的文本块
+
+    - **file**: 更新后的MD文件
+    - **course_id**: 课程ID
+    - **course_material_id**: 课程材料ID
+    - **collection_name**: 集合名称（可选，默认使用配置中的名称）
+    """
+    try:
+        # 验证文件类型
+        if not file.filename.endswith(('.md', '.txt')):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="只支持.md和.txt文件"
+            )
+
+        # 读取文件内容
+        file_content = await file.read()
+        content_str = file_content.decode('utf-8')
+
+        # 构建请求对象
+        metadata = DocumentMetadata(
+            course_id=course_id,
+            course_material_id=course_material_id,
+            file_path=file.filename,
+            file_size=len(file_content)
+        )
+
+        request = IndexRequest(
+            file_content=content_str,
+            metadata=metadata,
+            collection_name=collection_name
+        )
+
+        # 执行增量更新
+        response = await doc_service.update_index(request)
+
+        if response.success:
+            logger.info(
+                f"索引增量更新成功: {file.filename} - 新增: {response.added_count}, "
+                f"删除: {response.deleted_count}, 保留: {response.unchanged_count}"
+            )
+            return response
+        else:
+            logger.error(f"索引增量更新失败: {response.message}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=response.message
+            )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"索引增量更新API错误: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"索引增量更新失败: {str(e)}"
+        )
+
+
 @router.get("/collections", response_model=List[CollectionInfo])
-def get_collections(
+async def get_collections(
     doc_service: DocumentIndexingService = Depends(get_document_indexing_service)
 ):
     """
@@ -103,7 +193,7 @@ def get_collections(
     返回详细的集合信息，包括向量数量等统计信息
     """
     try:
-        collections = doc_service.get_collections()
+        collections = await doc_service.get_collections()
         logger.info(f"获取集合列表成功: {len(collections)} 个集合")
         return collections
 
@@ -116,7 +206,7 @@ def get_collections(
 
 
 @router.get("/collections/{collection_name}", response_model=CollectionInfo)
-def get_collection_info(
+async def get_collection_info(
     collection_name: str,
     doc_service: DocumentIndexingService = Depends(get_document_indexing_service)
 ):
@@ -126,7 +216,7 @@ def get_collection_info(
     - **collection_name**: 集合名称
     """
     try:
-        collection_info = doc_service.get_collection_info(collection_name)
+        collection_info = await doc_service.get_collection_info(collection_name)
 
         if collection_info:
             logger.info(f"获取集合信息成功: {collection_name}")
@@ -148,7 +238,7 @@ def get_collection_info(
 
 
 @router.delete("/collections/{collection_name}", response_model=DeleteCollectionResponse)
-def delete_collection(
+async def delete_collection(
     collection_name: str,
     doc_service: DocumentIndexingService = Depends(get_document_indexing_service)
 ):
@@ -158,7 +248,7 @@ def delete_collection(
     - **collection_name**: 要删除的集合名称
     """
     try:
-        success = doc_service.delete_collection(collection_name)
+        success = await doc_service.delete_collection(collection_name)
 
         if success:
             logger.info(f"集合删除成功: {collection_name}")
@@ -184,7 +274,7 @@ def delete_collection(
 
 
 @router.delete("/documents/course/{course_id}")
-def delete_documents_by_course(
+async def delete_documents_by_course(
     course_id: str,
     collection_name: Optional[str] = None,
     doc_service: DocumentIndexingService = Depends(get_document_indexing_service)
@@ -196,7 +286,7 @@ def delete_documents_by_course(
     - **collection_name**: 集合名称（可选）
     """
     try:
-        deleted_count = doc_service.delete_documents_by_course(
+        deleted_count = await doc_service.delete_documents_by_course(
             course_id, collection_name
         )
 
@@ -218,7 +308,7 @@ def delete_documents_by_course(
 
 
 @router.delete("/documents/material/{course_id}/{course_material_id}")
-def delete_documents_by_material(
+async def delete_documents_by_material(
     course_id: str,
     course_material_id: str,
     collection_name: Optional[str] = None,
@@ -232,7 +322,7 @@ def delete_documents_by_material(
     - **collection_name**: 集合名称（可选）
     """
     try:
-        deleted_count = doc_service.delete_documents_by_material(
+        deleted_count = await doc_service.delete_documents_by_material(
             course_id, course_material_id, collection_name
         )
 
@@ -255,7 +345,7 @@ def delete_documents_by_material(
 
 
 @router.get("/collections/{collection_name}/count")
-def count_documents(
+async def count_documents(
     collection_name: str,
     doc_service: DocumentIndexingService = Depends(get_document_indexing_service)
 ):
@@ -265,7 +355,7 @@ def count_documents(
     - **collection_name**: 集合名称
     """
     try:
-        count = doc_service.count_documents(collection_name)
+        count = await doc_service.count_documents(collection_name)
 
         logger.info(f"文档数量统计成功: 集合={collection_name}, 数量={count}")
         return {
@@ -281,6 +371,26 @@ def count_documents(
         )
 
 
+@router.get("/embedding-cache/stats")
+def get_embedding_cache_stats(
+    doc_service: DocumentIndexingService = Depends(get_document_indexing_service)
+):
+    """
+    获取嵌入缓存统计信息
+
+    返回缓存命中/未命中次数、命中率、节省的Token数量和估算节省的嵌入耗时
+    """
+    try:
+        return doc_service.get_embedding_cache_stats()
+
+    except Exception as e:
+        logger.error(f"获取嵌入缓存统计API错误: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取嵌入缓存统计失败: {str(e)}"
+        )
+
+
 @router.get("/health")
 async def health_check(
     doc_service: DocumentIndexingService = Depends(get_document_indexing_service)
@@ -15,6 +15,7 @@ TEMP_DIR = DATA_DIR / "tmp"
 
 # 输出子目录
 OUTLINES_DIR = OUTPUTS_DIR / "outlines"
+OUTLINE_CACHE_DIR = OUTPUTS_DIR / "outline_cache"
 RAG_DIR = OUTPUTS_DIR / "rag"
 GRAPHRAG_DIR = OUTPUTS_DIR / "graphrag"
 
@@ -0,0 +1,414 @@
+"""
+共享客户端注册表
+进程内统一创建、复用和关闭 Qdrant、Redis、OpenAI 客户端，并统计各连接池的使用情况
+"""
+import asyncio
+import inspect
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Generic, Optional, TypeVar
+
+from .config import Settings, get_settings
+from .logging import get_logger
+
+logger = get_logger("client_registry")
+
+T = TypeVar("T")
+
+
+class ClientPool(Generic[T]):
+    """共享客户端池：在单个共享客户端上限制并发使用数量并统计使用情况"""
+
+    def __init__(
+        self,
+        name: str,
+        client: T,
+        max_in_use: int,
+        close_callback: Optional[Callable[[], Any]] = None,
+        extra_stats: Optional[Callable[[], Dict[str, Any]]] = None,
+        track_usage: bool = True
+    ):
+        """
+        初始化客户端池
+
+        Args:
+            name: 连接池名称
+            client: 共享客户端实例
+            max_in_use: 同时使用的最大数量
+            close_callback: 关闭时调用的回调，可为协程函数
+            extra_stats: 附加统计信息回调
+            track_usage: 调用方是否经 acquire 使用客户端；为False时客户端由调用方直接使用，
+                统计只报告并发上限与附加统计，不报告恒为零的使用计数
+        """
+        self.name = name
+        self.client = client
+        self.max_in_use = max(1, max_in_use)
+        self._close_callback = close_callback
+        self._extra_stats = extra_stats
+        self.track_usage = track_usage
+        self._semaphore = asyncio.Semaphore(self.max_in_use)
+
+        # 统计信息
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._acquisitions = 0
+        self._errors = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[T]:
+        """
+        获取共享客户端
+
+        超出并发上限时等待，等待时间、使用中数量和调用异常均计入统计
+
+        Yields:
+            共享客户端实例
+        """
+        wait_start = time.perf_counter()
+        await self._semaphore.acquire()
+        wait_time = time.perf_counter() - wait_start
+
+        self._acquisitions += 1
+        self._total_wait += wait_time
+        self._max_wait = max(self._max_wait, wait_time)
+        self._in_use += 1
+        self._peak_in_use = max(self._peak_in_use, self._in_use)
+        try:
+            yield self.client
+        except BaseException:
+            self._errors += 1
+            raise
+        finally:
+            self._in_use -= 1
+            self._semaphore.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池统计信息"""
+        stats: Dict[str, Any] = {"max_in_use": self.max_in_use}
+        if self.track_usage:
+            stats.update({
+                "in_use": self._in_use,
+                "peak_in_use": self._peak_in_use,
+                "acquisitions": self._acquisitions,
+                "errors": self._errors,
+                "avg_wait_ms": (self._total_wait / self._acquisitions * 1000) if self._acquisitions else 0.0,
+                "max_wait_ms": self._max_wait * 1000
+            })
+        if self._extra_stats is not None:
+            try:
+                stats.update(self._extra_stats())
+            except Exception as e:
+                logger.warning(f"获取连接池附加统计失败 - {self.name}: {e}")
+        return stats
+
+    async def close(self) -> None:
+        """关闭共享客户端"""
+        if self._close_callback is None:
+            return
+        result = self._close_callback()
+        if inspect.isawaitable(result):
+            await result
+
+
+class ClientRegistry:
+    """共享客户端注册表类，客户端在首次使用时创建，由应用生命周期统一关闭"""
+
+    def __init__(self, settings: Optional[Settings] = None):
+        """
+        初始化客户端注册表
+
+        Args:
+            settings: 应用配置，默认读取全局配置
+        """
+        self._settings = settings
+        self._pools: Dict[str, ClientPool] = {}
+        self._services: Dict[str, Any] = {}
+        self._qdrant_index_clients: Optional[tuple] = None
+
+    @property
+    def settings(self) -> Settings:
+        if self._settings is None:
+            self._settings = get_settings()
+        return self._settings
+
+    @staticmethod
+    def _get_rag_config_manager():
+        from ..services.rag.rag_settings import get_rag_config_manager
+
+        return get_rag_config_manager()
+
+    def _register(self, pool: ClientPool) -> ClientPool:
+        self._pools[pool.name] = pool
+        logger.info(f"共享客户端已创建 - {pool.name}, 并发上限: {pool.max_in_use}")
+        return pool
+
+    @property
+    def qdrant(self) -> ClientPool:
+        """Qdrant异步客户端池（供向量仓库使用）"""
+        if "qdrant" not in self._pools:
+            from ..repositories.rag_repository import AsyncQdrantRepository
+
+            client = AsyncQdrantRepository.create_client(self.settings)
+            self._register(ClientPool(
+                "qdrant",
+                client,
+                self.settings.qdrant_pool_size,
+                close_callback=client.close
+            ))
+        return self._pools["qdrant"]
+
+    @property
+    def qdrant_index_clients(self) -> tuple:
+        """
+        向量索引使用的 Qdrant 同步与异步客户端
+
+        由 LlamaIndex 向量存储直接调用，不经过客户端池统计
+
+        Returns:
+            (QdrantClient, AsyncQdrantClient)
+        """
+        if self._qdrant_index_clients is None:
+            from qdrant_client import QdrantClient, AsyncQdrantClient
+
+            qdrant_config = self._get_rag_config_manager().get_qdrant_config()
+            client_kwargs = dict(
+                host=qdrant_config["host"],
+                port=qdrant_config["port"],
+                prefer_grpc=qdrant_config["prefer_grpc"],
+                timeout=qdrant_config["timeout"]
+            )
+            self._qdrant_index_clients = (QdrantClient(**client_kwargs), AsyncQdrantClient(**client_kwargs))
+            logger.info(f"向量索引Qdrant客户端已创建 - {qdrant_config['host']}:{qdrant_config['port']}")
+        return self._qdrant_index_clients
+
+    @property
+    def redis(self) -> ClientPool:
+        """
+        Redis客户端池，客户端为 (同步客户端, 异步客户端)，两者各自使用连接池
+
+        聊天存储、缓存与任务组件直接使用客户端，由Redis连接池限制连接数，
+        统计只报告连接池中使用中与空闲的连接数
+        """
+        if "redis" not in self._pools:
+            import redis
+            import redis.asyncio as aredis
+
+            redis_config = self._get_rag_config_manager().get_redis_config()
+            max_connections = redis_config["max_connections"]
+            sync_client = redis.Redis(
+                connection_pool=redis.ConnectionPool.from_url(
+                    redis_config["redis_url"], max_connections=max_connections
+                )
+            )
+            async_client = aredis.Redis(
+                connection_pool=aredis.ConnectionPool.from_url(
+                    redis_config["redis_url"], max_connections=max_connections
+                )
+            )
+
+            async def close_redis() -> None:
+                sync_client.close()
+                sync_client.connection_pool.disconnect()
+                await async_client.aclose()
+
+            def redis_stats() -> Dict[str, Any]:
+                sync_pool = sync_client.connection_pool
+                async_pool = async_client.connection_pool
+                return {
+                    "sync_connections_in_use": len(getattr(sync_pool, "_in_use_connections", ())),
+                    "sync_connections_idle": len(getattr(sync_pool, "_available_connections", ())),
+                    "async_connections_in_use": len(getattr(async_pool, "_in_use_connections", ())),
+                    "async_connections_idle": len(getattr(async_pool, "_available_connections", ()))
+                }
+
+            self._register(ClientPool(
+                "redis",
+                (sync_client, async_client),
+                max_connections,
+                close_callback=close_redis,
+                extra_stats=redis_stats,
+                track_usage=False
+            ))
+        return self._pools["redis"]
+
+    @property
+    def openai(self) -> ClientPool:
+        """OpenAI异步客户端池"""
+        if "openai" not in self._pools:
+            from openai import AsyncOpenAI
+
+            client = AsyncOpenAI(
+                api_key=self.settings.api_key,
+                base_url=self.settings.base_url
+            )
+            self._register(ClientPool(
+                "openai",
+                client,
+                self.settings.openai_max_concurrency,
+                close_callback=client.close
+            ))
+        return self._pools["openai"]
+
+    def get_qdrant_repository(self):
+        """获取共享的异步Qdrant仓库"""
+        if "qdrant_repository" not in self._services:
+            from ..repositories.rag_repository import AsyncQdrantRepository
+
+            self._services["qdrant_repository"] = AsyncQdrantRepository(self.settings, pool=self.qdrant)
+        return self._services["qdrant_repository"]
+
+    def get_semantic_cache(self):
+        """获取共享的语义回答缓存"""
+        if "semantic_cache" not in self._services:
+            from ..services.rag.semantic_cache import SemanticCache
+
+            self._services["semantic_cache"] = SemanticCache(self._get_rag_config_manager())
+        return self._services["semantic_cache"]
+
+    def get_singleflight(self, name: str):
+        """获取指定名称的共享请求合并器"""
+        service_name = f"singleflight:{name}"
+        if service_name not in self._services:
+            from ..utils.singleflight import SingleFlight
+
+            self._services[service_name] = SingleFlight(
+                name,
+                redis_client=self.redis.client[1] if self.settings.singleflight_redis_enabled else None,
+                lock_ttl=self.settings.singleflight_lock_ttl,
+                wait_timeout=self.settings.singleflight_wait_timeout,
+                result_ttl=self.settings.singleflight_result_ttl
+            )
+        return self._services[service_name]
+
+    def get_singleflight_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取全部请求合并器的统计信息"""
+        return {
+            name.split(":", 1)[1]: service.get_stats()
+            for name, service in self._services.items()
+            if name.startswith("singleflight:")
+        }
+
+    def get_job_store(self):
+        """获取共享的后台任务存储"""
+        if "job_store" not in self._services:
+            from pathlib import Path
+            from ..services.jobs.job_store import create_job_store
+
+            backend = self.settings.job_store_backend
+            self._services["job_store"] = create_job_store(
+                backend,
+                Path(self.settings.job_store_path),
+                self.settings.job_result_ttl,
+                redis_client=self.redis.client[1] if backend == "redis" else None
+            )
+        return self._services["job_store"]
+
+    def get_idempotency_store(self):
+        """获取共享的幂等键存储（与任务存储使用相同后端）"""
+        if "idempotency_store" not in self._services:
+            from pathlib import Path
+            from ..services.jobs.idempotency import create_idempotency_store
+
+            backend = self.settings.job_store_backend
+            self._services["idempotency_store"] = create_idempotency_store(
+                backend,
+                Path(self.settings.job_store_path),
+                self.settings.idempotency_ttl,
+                self.settings.idempotency_wait_timeout,
+                redis_client=self.redis.client[1] if backend == "redis" else None
+            )
+        return self._services["idempotency_store"]
+
+    def get_task_event_bus(self):
+        """获取共享的任务事件总线（Redis任务存储时跨进程转发事件）"""
+        if "task_event_bus" not in self._services:
+            from ..services.jobs.task_events import TaskEventBus
+
+            use_redis = self.settings.job_store_backend == "redis"
+            self._services["task_event_bus"] = TaskEventBus(
+                redis_client=self.redis.client[1] if use_redis else None
+            )
+        return self._services["task_event_bus"]
+
+    def get_conversation_service(self):
+        """获取共享的对话服务（向量索引、提示词与聊天存储只初始化一次）"""
+        if "conversation_service" not in self._services:
+            from ..services.rag.conversation_service import ConversationService
+
+            self._services["conversation_service"] = ConversationService(
+                self.settings, self._get_rag_config_manager()
+            )
+        return self._services["conversation_service"]
+
+    def get_document_indexing_service(self):
+        """获取共享的文档索引服务"""
+        if "document_indexing_service" not in self._services:
+            from ..services.rag.document_indexing_service import DocumentIndexingService
+
+            self._services["document_indexing_service"] = DocumentIndexingService(
+                self.settings, self._get_rag_config_manager()
+            )
+        return self._services["document_indexing_service"]
+
+    async def startup(self) -> None:
+        """预先创建共享客户端，避免首个请求承担初始化开销"""
+        for name in ("qdrant", "redis", "openai"):
+            try:
+                getattr(self, name)
+            except Exception as e:
+                logger.error(f"共享客户端创建失败 - {name}: {e}")
+                raise
+
+    async def shutdown(self) -> None:
+        """关闭全部共享客户端"""
+        for name, pool in list(self._pools.items()):
+            try:
+                await pool.close()
+                logger.info(f"共享客户端已关闭 - {name}")
+            except Exception as e:
+                logger.error(f"共享客户端关闭失败 - {name}: {e}")
+
+        if self._qdrant_index_clients is not None:
+            sync_client, async_client = self._qdrant_index_clients
+            try:
+                sync_client.close()
+                await async_client.close()
+            except Exception as e:
+                logger.error(f"向量索引Qdrant客户端关闭失败: {e}")
+
+        task_event_bus = self._services.get("task_event_bus")
+        if task_event_bus is not None:
+            await task_event_bus.close()
+
+        idempotency_store = self._services.get("idempotency_store")
+        if idempotency_store is not None:
+            try:
+                await idempotency_store.close()
+            except Exception as e:
+                logger.error(f"幂等键存储关闭失败: {e}")
+
+        job_store = self._services.get("job_store")
+        if job_store is not None:
+            try:
+                await job_store.close()
+            except Exception as e:
+                logger.error(f"任务存储关闭失败: {e}")
+
+        self._pools.clear()
+        self._services.clear()
+        self._qdrant_index_clients = None
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取全部连接池统计信息"""
+        return {name: pool.get_stats() for name, pool in self._pools.items()}
+
+
+# 全局客户端注册表实例
+client_registry = ClientRegistry()
+
+
+def get_client_registry() -> ClientRegistry:
+    """获取客户端注册表 - 依赖注入用"""
+    return client_registry
@@ -2,7 +2,7 @@
 应用配置管理模块
 使用 pydantic-settings 进行类型安全的配置管理
 """
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import Field, validator
 from pydantic_settings import BaseSettings
 import os
@@ -17,6 +17,11 @@ class Settings(BaseSettings):
     base_url: str = Field(default="https://api.openai.com/v1", description="OpenAI API基础URL")
     outline_model: str = Field(default="gpt-4o-mini", description="大纲生成模型")
     refine_model: str = Field(default="gpt-4o-mini", description="大纲精简模型")
+    outline_map_reduce_threshold: int = Field(default=12000, description="超过该Token数的文档使用分段并行生成大纲")
+    outline_segment_max_tokens: int = Field(default=6000, description="分段生成大纲时每段的最大Token数")
+    outline_map_concurrency: int = Field(default=4, description="分段生成大纲的最大并发数")
+    outline_cache_enabled: bool = Field(default=True, description="是否启用大纲缓存")
+    outline_cache_max_bytes: int = Field(default=104857600, description="大纲缓存最大字节数（默认100MB）")
     
     # RAG 配置
     rag_embed_model: str = Field(default="text-embedding-3-small", description="RAG嵌入模型")
@@ -25,10 +30,42 @@ class Settings(BaseSettings):
     qdrant_grpc_port: int = Field(default=6334, description="Qdrant gRPC端口")
     qdrant_prefer_grpc: bool = Field(default=True, description="优先使用gRPC连接")
     qdrant_collection_name: str = Field(default="course_materials", description="Qdrant集合名称")
+    qdrant_timeout: float = Field(default=10.0, description="Qdrant单次调用超时（秒）")
+    qdrant_pool_size: int = Field(default=20, description="Qdrant HTTP连接池最大连接数")
+    qdrant_collection_profile: str = Field(default="full", description="新建集合默认使用的调优配置：full（不量化，与原有集合一致）、memory、balanced 或 latency，量化配置需显式启用")
+    qdrant_collection_profiles: Dict[str, str] = Field(default_factory=dict, description="按集合名称指定调优配置，如 {\"course_materials\": \"memory\"}")
+    qdrant_ensure_payload_indexes: bool = Field(default=True, description="启动时为已有集合补齐 course_id / course_material_id 载荷索引")
+    openai_max_concurrency: int = Field(default=20, description="共享OpenAI客户端的最大并发请求数")
     rag_chunk_size: int = Field(default=512, description="RAG文本分块大小")
     rag_chunk_overlap: int = Field(default=50, description="RAG文本分块重叠")
     rag_top_k: int = Field(default=5, description="RAG检索Top-K数量")
     
+    # 请求合并配置
+    singleflight_redis_enabled: bool = Field(default=False, description="是否通过Redis锁在集群范围内合并相同请求")
+    singleflight_lock_ttl: float = Field(default=120.0, description="请求合并锁过期时间（秒）")
+    singleflight_wait_timeout: float = Field(default=180.0, description="等待其他节点结果的最长时间（秒）")
+    singleflight_result_ttl: float = Field(default=10.0, description="集群共享结果无人读取时的最长保留时间（秒），只有执行期间的等待者能读取，最后一个等待者读取后即删除")
+    
+    # 后台任务配置
+    job_store_backend: str = Field(default="sqlite", description="任务存储后端：sqlite（单节点）或 redis（多节点共享）")
+    job_store_path: str = Field(default="./data/outputs/jobs.sqlite3", description="SQLite任务存储数据库路径")
+    job_workers: int = Field(default=2, description="每个进程的后台任务并发数")
+    job_max_attempts: int = Field(default=3, description="任务最大执行次数（含首次执行）")
+    job_retry_backoff: float = Field(default=5.0, description="任务重试的基础退避时间（秒），按2的幂次递增")
+    job_lease_timeout: float = Field(default=1800.0, description="任务执行租约时间（秒），超时未完成的任务重新排队")
+    job_result_ttl: int = Field(default=604800, description="已结束任务的保留时间（秒）")
+    job_poll_interval: float = Field(default=1.0, description="空闲时轮询任务队列的间隔（秒）")
+    job_events_keepalive: float = Field(default=15.0, description="任务事件推送连接的保活间隔（秒），同时按此间隔从任务存储校对状态")
+    job_progress_persist_interval: float = Field(default=1.0, description="索引进度写入任务存储的最小间隔（秒），进度事件本身实时推送")
+
+    # 批量导入配置
+    batch_concurrency: int = Field(default=4, description="单个批量任务内并行处理的课程材料数")
+    batch_max_files: int = Field(default=500, description="单个批量任务最多包含的文件数")
+
+    # 幂等键配置（存储后端与任务存储相同）
+    idempotency_ttl: int = Field(default=86400, description="幂等键记录的保留时间（秒）")
+    idempotency_wait_timeout: float = Field(default=300.0, description="重试请求等待进行中的首次请求的最长时间（秒）")
+    
     # GraphRAG 配置 (为后续模块预留)
     graph_rag_workdir: str = Field(default="./data/outputs/graphrag", description="GraphRAG工作目录")
     
@@ -17,6 +17,15 @@ from .constants.paths import ensure_directories
 from .api.v1 import api_router
 from .schemas.outline import ErrorResponse, HealthResponse
 from .services.rag.rag_settings import initialize_rag_config
+from .core.client_registry import client_registry
+from .services.outline.outline_service import outline_service
+from .services.course_material.course_material_process_service import (
+    JOB_KIND as COURSE_MATERIAL_JOB_KIND,
+    course_material_process_service
+)
+from .services.course_material.batch_process_service import BATCH_JOB_KIND, batch_process_service
+from .services.course_material.cleanup_service import VECTOR_DELETE_JOB_KIND, cleanup_service
+from .services.jobs.worker_pool import job_worker_pool
 from . import __version__, __description__
 
 # 设置日志
@@ -65,12 +74,66 @@ async def lifespan(app: FastAPI):
         logger.error(f"❌ RAG配置管理器初始化失败: {str(e)}")
         raise
     
+    # 创建共享客户端
+    try:
+        logger.info("🔌 创建共享客户端...")
+        await client_registry.startup()
+        logger.info("✅ 共享客户端创建完成")
+    except Exception as e:
+        logger.error(f"❌ 共享客户端创建失败: {str(e)}")
+        raise
+
+    # 补齐已有集合的载荷索引（后台建立，不阻塞启动）
+    if settings.qdrant_ensure_payload_indexes:
+        try:
+            logger.info("🗂️ 检查向量集合载荷索引...")
+            qdrant_repo = client_registry.get_qdrant_repository()
+            for collection in await qdrant_repo.get_collections():
+                await qdrant_repo.ensure_payload_indexes(collection.name, wait=False)
+            logger.info("✅ 向量集合载荷索引检查完成")
+        except Exception as e:
+            logger.warning(f"⚠️ 向量集合载荷索引检查失败: {str(e)}")
+
+    # 启动后台任务工作池
+    try:
+        logger.info("⚙️ 启动后台任务工作池...")
+        job_worker_pool.register(
+            COURSE_MATERIAL_JOB_KIND,
+            course_material_process_service.run_job,
+            course_material_process_service.on_job_failed,
+            course_material_process_service.on_job_cancelled
+        )
+        job_worker_pool.register(
+            BATCH_JOB_KIND,
+            batch_process_service.run_batch,
+            batch_process_service.on_batch_failed
+        )
+        job_worker_pool.register(
+            VECTOR_DELETE_JOB_KIND,
+            cleanup_service.run_vector_delete,
+            cleanup_service.on_vector_delete_failed
+        )
+        await job_worker_pool.start(
+            client_registry.get_job_store(),
+            concurrency=settings.job_workers,
+            lease_timeout=settings.job_lease_timeout,
+            retry_backoff=settings.job_retry_backoff,
+            poll_interval=settings.job_poll_interval,
+            event_bus=client_registry.get_task_event_bus()
+        )
+        logger.info("✅ 后台任务工作池启动完成")
+    except Exception as e:
+        logger.error(f"❌ 后台任务工作池启动失败: {str(e)}")
+        raise
+    
     logger.info("🎉 AI Backend 应用启动完成")
     
     yield
     
     # 关闭时执行
     logger.info("🛑 AI Backend 应用关闭中...")
+    await job_worker_pool.stop()
+    await client_registry.shutdown()
     logger.info("👋 AI Backend 应用已关闭")
 
 
@@ -181,7 +244,8 @@ async def root():
         "description": __description__,
         "docs_url": "/docs",
         "redoc_url": "/redoc",
-        "health_check": "/health"
+        "health_check": "/health",
+        "metrics": "/metrics"
     }
 
 
@@ -216,6 +280,29 @@ async def health_check():
     )
 
 
+# 运行指标
+@app.get(
+    "/metrics",
+    summary="运行指标",
+    description="返回共享客户端连接池、语义回答缓存、大纲缓存、请求合并、后台任务与幂等键的使用统计"
+)
+async def metrics():
+    """运行指标"""
+    outline_cache = outline_service.outline_cache
+    jobs = job_worker_pool.get_stats()
+    jobs["by_status"] = await client_registry.get_job_store().count_by_status()
+    jobs["events"] = client_registry.get_task_event_bus().get_stats()
+    return {
+        "uptime": time.time() - app_start_time,
+        "client_pools": client_registry.get_stats(),
+        "semantic_cache": client_registry.get_semantic_cache().get_stats(),
+        "outline_cache": outline_cache.get_stats() if outline_cache is not None else {"enabled": False},
+        "singleflight": client_registry.get_singleflight_stats(),
+        "jobs": jobs,
+        "idempotency": client_registry.get_idempotency_store().get_stats()
+    }
+
+
 # 注册路由
 app.include_router(
     api_router,
@@ -0,0 +1,222 @@
+"""
+Qdrant集合调优配置
+按名称定义向量存储类型、量化、HNSW参数与检索参数的组合，按集合在配置中选择
+"""
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from qdrant_client.http import models
+from qdrant_client.http.models import Distance, VectorParams
+
+from app.core.config import Settings
+from app.utils.idgen import IDGenerator
+
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    """集合调优配置"""
+
+    name: str
+    description: str
+    # 原始向量的存储类型：float32 或 float16
+    vector_datatype: str = "float32"
+    # 原始向量是否存放在磁盘（内存映射），量化向量常驻内存时只在重排序时读取
+    on_disk_vectors: bool = False
+    # 载荷是否存放在磁盘
+    on_disk_payload: bool = False
+    # 量化方式：none、scalar（int8）或 binary
+    quantization: str = "none"
+    # 量化向量是否常驻内存
+    quantization_always_ram: bool = True
+    # 标量量化的分位数，排除极端值以提高精度
+    scalar_quantile: float = 0.99
+    # HNSW图每个节点的连接数
+    hnsw_m: int = 16
+    # 建图时的候选数量
+    hnsw_ef_construct: int = 100
+    # HNSW图是否存放在磁盘
+    hnsw_on_disk: bool = False
+    # 检索时的候选数量，为None时使用Qdrant默认值
+    search_hnsw_ef: Optional[int] = None
+    # 量化检索是否使用原始向量重排序
+    search_rescore: bool = True
+    # 量化检索的过采样倍数，重排序前多取的候选比例
+    search_oversampling: Optional[float] = None
+
+    def vectors_config(self, vector_size: int, distance: Distance = Distance.COSINE) -> VectorParams:
+        """构建创建集合时的向量配置"""
+        return VectorParams(
+            size=vector_size,
+            distance=distance,
+            on_disk=self.on_disk_vectors,
+            datatype=models.Datatype.FLOAT16 if self.vector_datatype == "float16" else models.Datatype.FLOAT32
+        )
+
+    def hnsw_config(self) -> models.HnswConfigDiff:
+        """构建HNSW参数"""
+        return models.HnswConfigDiff(
+            m=self.hnsw_m,
+            ef_construct=self.hnsw_ef_construct,
+            on_disk=self.hnsw_on_disk
+        )
+
+    def quantization_config(self) -> Optional[models.QuantizationConfig]:
+        """构建量化配置，不量化时返回None"""
+        if self.quantization == "scalar":
+            return models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(
+                    type=models.ScalarType.INT8,
+                    quantile=self.scalar_quantile,
+                    always_ram=self.quantization_always_ram
+                )
+            )
+        if self.quantization == "binary":
+            return models.BinaryQuantization(
+                binary=models.BinaryQuantizationConfig(always_ram=self.quantization_always_ram)
+            )
+        return None
+
+    def search_params(self) -> Optional[models.SearchParams]:
+        """构建检索参数，全部使用默认值时返回None"""
+        quantization = None
+        if self.quantization != "none":
+            quantization = models.QuantizationSearchParams(
+                rescore=self.search_rescore,
+                oversampling=self.search_oversampling
+            )
+        if quantization is None and self.search_hnsw_ef is None:
+            return None
+        return models.SearchParams(hnsw_ef=self.search_hnsw_ef, quantization=quantization)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典（用于展示）"""
+        return {
+            "name": self.name,
+            "description": self.description,
+            "vector_datatype": self.vector_datatype,
+            "on_disk_vectors": self.on_disk_vectors,
+            "on_disk_payload": self.on_disk_payload,
+            "quantization": self.quantization,
+            "quantization_always_ram": self.quantization_always_ram,
+            "hnsw_m": self.hnsw_m,
+            "hnsw_ef_construct": self.hnsw_ef_construct,
+            "hnsw_on_disk": self.hnsw_on_disk,
+            "search_hnsw_ef": self.search_hnsw_ef,
+            "search_rescore": self.search_rescore,
+            "search_oversampling": self.search_oversampling
+        }
+
+
+# 预定义的调优配置
+COLLECTION_PROFILES: Dict[str, CollectionProfile] = {
+    profile.name: profile
+    for profile in (
+        CollectionProfile(
+            name="memory",
+            description="内存优先：float16原始向量与HNSW图存放在磁盘，二值量化向量常驻内存，检索时过采样后用原始向量重排序",
+            vector_datatype="float16",
+            on_disk_vectors=True,
+            on_disk_payload=True,
+            quantization="binary",
+            hnsw_m=16,
+            hnsw_ef_construct=100,
+            hnsw_on_disk=True,
+            search_oversampling=3.0
+        ),
+        CollectionProfile(
+            name="balanced",
+            description="均衡：float16原始向量存放在磁盘，int8标量量化向量常驻内存，检索时用原始向量重排序",
+            vector_datatype="float16",
+            on_disk_vectors=True,
+            on_disk_payload=True,
+            quantization="scalar",
+            hnsw_m=16,
+            hnsw_ef_construct=128,
+            search_oversampling=2.0
+        ),
+        CollectionProfile(
+            name="latency",
+            description="延迟优先：float32原始向量与int8量化向量均在内存，更密的HNSW图与更大的检索候选数",
+            quantization="scalar",
+            hnsw_m=32,
+            hnsw_ef_construct=256,
+            search_hnsw_ef=128,
+            search_oversampling=1.5
+        ),
+        CollectionProfile(
+            name="full",
+            description="不量化：float32原始向量全部在内存，Qdrant默认HNSW参数（调优配置引入前的集合配置）"
+        )
+    )
+}
+
+
+# 别名背后的版本化物理集合名称：{别名}_v{创建时间}
+_VERSION_SUFFIX = re.compile(r"_v\d{14}$")
+
+
+def versioned_collection_name(alias_name: str, created_at: Optional[datetime] = None) -> str:
+    """生成别名的新版本物理集合名称"""
+    return f"{alias_name}_v{(created_at or datetime.now()):%Y%m%d%H%M%S}"
+
+
+def alias_of_version(collection_name: str) -> Optional[str]:
+    """版本化物理集合所属的别名，不是版本化名称时返回None"""
+    alias_name = _VERSION_SUFFIX.sub("", collection_name)
+    return alias_name if alias_name != collection_name else None
+
+
+def chunk_point_id(
+    collection_name: str,
+    course_id: str,
+    course_material_id: str,
+    chunk_index: int,
+    content_hash: str
+) -> str:
+    """
+    生成文本块向量点ID
+
+    版本化物理集合按所属别名生成ID，通过别名写入与直接写入某个版本的同一文本块ID一致
+
+    Args:
+        collection_name: 集合名称（别名或版本化物理集合）
+        course_id: 课程ID
+        course_material_id: 课程材料ID
+        chunk_index: 文本块序号
+        content_hash: 文本块内容哈希
+
+    Returns:
+        向量点ID
+    """
+    return IDGenerator.generate_chunk_point_id(
+        alias_of_version(collection_name) or collection_name,
+        course_id,
+        course_material_id,
+        chunk_index,
+        content_hash
+    )
+
+
+def get_collection_profile(settings: Settings, collection_name: str) -> CollectionProfile:
+    """
+    获取集合使用的调优配置
+
+    Args:
+        settings: 应用配置
+        collection_name: 集合名称
+
+    Returns:
+        qdrant_collection_profiles 中为该集合指定的配置，版本化物理集合使用其别名的配置，
+        未指定时使用 qdrant_collection_profile
+
+    Raises:
+        ValueError: 配置名称不存在
+    """
+    profiles = settings.qdrant_collection_profiles
+    name = profiles.get(collection_name) or profiles.get(alias_of_version(collection_name) or "") \
+        or settings.qdrant_collection_profile
+    if name not in COLLECTION_PROFILES:
+        raise ValueError(f"未知的集合调优配置: {name}，可选: {', '.join(COLLECTION_PROFILES)}")
+    return COLLECTION_PROFILES[name]
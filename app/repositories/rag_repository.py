@@ -1,121 +1,289 @@
 """
 RAG存储仓库 - 负责Qdrant向量数据库操作
 """
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union, Awaitable, TypeVar, TYPE_CHECKING
+from dataclasses import dataclass
 import asyncio
+import httpx
 from loguru import logger
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.http import models
-from qdrant_client.http.models import Distance, VectorParams, PointStruct
+from qdrant_client.http.models import Distance, PointStruct
 from app.core.config import Settings
 from app.schemas.rag import CollectionInfo
+from app.repositories.qdrant_profiles import CollectionProfile, get_collection_profile
 
+if TYPE_CHECKING:
+    from app.core.client_registry import ClientPool
 
-class QdrantRepository:
-    """Qdrant向量数据库仓库类"""
+T = TypeVar("T")
+
+# 课程数据的载荷索引：检索与清理都按这两个字段过滤；
+# course_id 标记为租户键，Qdrant按课程组织存储，使同一课程的向量点相邻
+PAYLOAD_INDEXES: Dict[str, models.KeywordIndexParams] = {
+    "course_id": models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True),
+    "course_material_id": models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD)
+}
+
+# 等待大批量删除完成的超时（秒），按过滤条件删除在Qdrant服务端执行，耗时随匹配数量增长
+_DELETE_WAIT_TIMEOUT = 600.0
+
+
+@dataclass
+class FilterDeleteResult:
+    """按过滤条件删除的结果"""
+
+    collection_name: str
+    # 删除前精确统计的匹配数量
+    matched: int
+    # Qdrant更新操作ID，无匹配未执行删除时为None
+    operation_id: Optional[int] = None
+    # completed：删除已完成；acknowledged：已提交，由Qdrant在后台执行；skipped：无匹配
+    status: str = "skipped"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "collection_name": self.collection_name,
+            "matched": self.matched,
+            "operation_id": self.operation_id,
+            "status": self.status
+        }
+
+
+class AsyncQdrantRepository:
+    """Qdrant向量数据库异步仓库类，基于AsyncQdrantClient，不阻塞事件循环"""
     
-    def __init__(self, settings: Settings):
-        """初始化Qdrant客户端"""
+    def __init__(self, settings: Settings, pool: Optional["ClientPool"] = None):
+        """
+        初始化异步Qdrant仓库
+        
+        Args:
+            settings: 应用配置
+            pool: 共享客户端池，不提供时按配置创建独立客户端
+        """
         self.settings = settings
-        self.client = None
-        self._initialize_client()
+        self.timeout = settings.qdrant_timeout
+        self.pool = pool
+        self.client = pool.client if pool is not None else self.create_client(settings)
     
-    def _initialize_client(self):
-        """初始化Qdrant客户端"""
+    @staticmethod
+    def create_client(settings: Settings) -> AsyncQdrantClient:
+        """按配置创建异步Qdrant客户端（HTTP模式下使用连接池）"""
         try:
-            if self.settings.qdrant_prefer_grpc:
-                # 使用gRPC连接
-                self.client = QdrantClient(
+            if settings.qdrant_prefer_grpc:
+                # gRPC基于HTTP/2多路复用，单个通道即可承载并发请求
+                client = AsyncQdrantClient(
                     host="localhost",
-                    grpc_port=self.settings.qdrant_grpc_port,
-                    prefer_grpc=True
+                    grpc_port=settings.qdrant_grpc_port,
+                    prefer_grpc=True,
+                    timeout=int(settings.qdrant_timeout)
                 )
-                logger.info(f"Qdrant客户端初始化成功 (gRPC端口: {self.settings.qdrant_grpc_port})")
+                logger.info(f"异步Qdrant客户端初始化成功 (gRPC端口: {settings.qdrant_grpc_port})")
             else:
-                # 使用HTTP连接
-                self.client = QdrantClient(url=self.settings.qdrant_url)
-                logger.info(f"Qdrant客户端初始化成功 (HTTP URL: {self.settings.qdrant_url})")
+                client = AsyncQdrantClient(
+                    url=settings.qdrant_url,
+                    timeout=int(settings.qdrant_timeout),
+                    limits=httpx.Limits(
+                        max_connections=settings.qdrant_pool_size,
+                        max_keepalive_connections=settings.qdrant_pool_size
+                    )
+                )
+                logger.info(
+                    f"异步Qdrant客户端初始化成功 (HTTP URL: {settings.qdrant_url}, "
+                    f"连接池: {settings.qdrant_pool_size})"
+                )
+            return client
         except Exception as e:
-            logger.error(f"Qdrant客户端初始化失败: {e}")
+            logger.error(f"异步Qdrant客户端初始化失败: {e}")
             raise
     
-    def create_collection(
+    async def _call(self, awaitable: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """执行单次Qdrant调用并施加超时，使用共享客户端池时计入池统计"""
+        if self.pool is None:
+            return await asyncio.wait_for(awaitable, timeout=timeout or self.timeout)
+        async with self.pool.acquire():
+            return await asyncio.wait_for(awaitable, timeout=timeout or self.timeout)
+    
+    async def create_collection(
         self,
         collection_name: str,
         vector_size: int = 1536,  # text-embedding-3-small的向量维度
-        distance: Distance = Distance.COSINE
+        distance: Distance = Distance.COSINE,
+        profile: Optional[CollectionProfile] = None
     ) -> bool:
-        """创建集合"""
+        """创建集合，profile 为None时使用配置中为该集合指定的调优配置；名称已是别名时视为已存在"""
         try:
-            # 检查集合是否已存在
-            collections = self.client.get_collections()
-            existing_names = [col.name for col in collections.collections]
-            
-            if collection_name in existing_names:
+            if await self._call(self.client.collection_exists(collection_name)) \
+                    or await self.get_alias_target(collection_name):
                 logger.info(f"集合 {collection_name} 已存在")
                 return True
             
-            # 创建集合
-            self.client.create_collection(
+            profile = profile or get_collection_profile(self.settings, collection_name)
+            await self._call(self.client.create_collection(
                 collection_name=collection_name,
-                vectors_config=VectorParams(size=vector_size, distance=distance)
-            )
-            logger.info(f"集合 {collection_name} 创建成功")
+                vectors_config=profile.vectors_config(vector_size, distance),
+                hnsw_config=profile.hnsw_config(),
+                quantization_config=profile.quantization_config(),
+                on_disk_payload=profile.on_disk_payload
+            ))
+            await self.ensure_payload_indexes(collection_name)
+            logger.info(f"集合 {collection_name} 创建成功，调优配置: {profile.name}")
             return True
         except Exception as e:
             logger.error(f"创建集合失败: {e}")
             return False
     
-    def delete_collection(self, collection_name: str) -> bool:
+    async def ensure_payload_indexes(self, collection_name: str, wait: bool = True) -> List[str]:
+        """
+        补齐集合缺失的载荷索引
+        
+        Args:
+            collection_name: 集合名称
+            wait: 是否等待索引建立完成，为False时Qdrant在后台建立索引
+            
+        Returns:
+            新建索引的字段列表
+        """
+        collection_info = await self._call(self.client.get_collection(collection_name))
+        existing = collection_info.payload_schema or {}
+        
+        created = []
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            if field_name in existing:
+                continue
+            # 已有大量数据时建立索引耗时较长，单独放宽超时
+            await self._call(self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema,
+                wait=wait
+            ), timeout=max(self.timeout, 600.0) if wait else None)
+            created.append(field_name)
+        
+        if created:
+            logger.info(f"集合 {collection_name} 已建立载荷索引: {', '.join(created)}")
+        return created
+    
+    async def apply_collection_profile(self, collection_name: str, profile: CollectionProfile) -> Dict[str, Any]:
+        """
+        将调优配置应用到已有集合
+        
+        量化、HNSW参数、向量与载荷的存储位置可在线修改，Qdrant在后台按新配置重建段；
+        原始向量的存储类型（float32/float16）创建后无法修改，需要重建集合
+        
+        Args:
+            collection_name: 集合名称
+            profile: 调优配置
+            
+        Returns:
+            应用结果，包含是否成功与未能应用的项
+        """
+        collection_info = await self._call(self.client.get_collection(collection_name))
+        vectors = collection_info.config.params.vectors
+        current_datatype = getattr(vectors, "datatype", None) or models.Datatype.FLOAT32
+        target_datatype = profile.vectors_config(vectors.size, vectors.distance).datatype
+        
+        skipped = []
+        if current_datatype != target_datatype:
+            skipped.append(f"vector_datatype: {current_datatype} -> {target_datatype}（需要重建集合）")
+            logger.warning(f"集合 {collection_name} 的向量存储类型无法在线修改: {current_datatype} -> {target_datatype}")
+        
+        # 未量化的配置需要显式关闭已有的量化
+        quantization_config = profile.quantization_config() or models.Disabled.DISABLED
+        
+        updated = await self._call(self.client.update_collection(
+            collection_name=collection_name,
+            vectors_config={"": models.VectorParamsDiff(on_disk=profile.on_disk_vectors)},
+            hnsw_config=profile.hnsw_config(),
+            quantization_config=quantization_config,
+            collection_params=models.CollectionParamsDiff(on_disk_payload=profile.on_disk_payload)
+        ), timeout=max(self.timeout, 60.0))
+        
+        logger.info(f"集合 {collection_name} 已应用调优配置: {profile.name}, 结果: {updated}")
+        return {
+            "collection_name": collection_name,
+            "profile": profile.name,
+            "success": bool(updated),
+            "skipped": skipped
+        }
+    
+    async def delete_collection(self, collection_name: str) -> bool:
         """删除集合"""
         try:
-            self.client.delete_collection(collection_name=collection_name)
+            await self._call(self.client.delete_collection(collection_name=collection_name))
             logger.info(f"集合 {collection_name} 删除成功")
             return True
         except Exception as e:
             logger.error(f"删除集合失败: {e}")
             return False
     
-    def get_collections(self) -> List[CollectionInfo]:
+    async def list_aliases(self) -> Dict[str, str]:
+        """列出全部别名，返回 {别名: 指向的集合}"""
+        aliases_response = await self._call(self.client.get_aliases())
+        return {alias.alias_name: alias.collection_name for alias in aliases_response.aliases}
+    
+    async def get_alias_target(self, alias_name: str) -> Optional[str]:
+        """获取别名当前指向的集合，别名不存在时返回None"""
+        return (await self.list_aliases()).get(alias_name)
+    
+    async def swap_alias(self, alias_name: str, collection_name: str) -> Optional[str]:
+        """
+        将别名原子地切换到指定集合
+        
+        删除旧别名与创建新别名在同一次请求中提交，Qdrant原子地应用，
+        通过别名访问的检索与写入不会出现别名不存在的窗口
+        
+        Args:
+            alias_name: 别名
+            collection_name: 目标集合
+            
+        Returns:
+            切换前别名指向的集合，别名原先不存在时返回None
+        """
+        previous = await self.get_alias_target(alias_name)
+        operations = []
+        if previous is not None:
+            operations.append(models.DeleteAliasOperation(
+                delete_alias=models.DeleteAlias(alias_name=alias_name)
+            ))
+        operations.append(models.CreateAliasOperation(
+            create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias_name)
+        ))
+        await self._call(self.client.update_collection_aliases(change_aliases_operations=operations))
+        logger.info(f"别名 {alias_name} 已切换: {previous} -> {collection_name}")
+        return previous
+    
+    async def get_collections(self) -> List[CollectionInfo]:
         """获取所有集合信息"""
         try:
-            collections_response = self.client.get_collections()
-            collections = []
+            collections_response = await self._call(self.client.get_collections())
+            names = [collection.name for collection in collections_response.collections]
             
-            for collection in collections_response.collections:
-                # 获取集合详细信息
-                collection_info = self.client.get_collection(collection.name)
-                
-                collections.append(CollectionInfo(
-                    name=collection.name,
-                    vectors_count=collection_info.vectors_count or 0,
-                    indexed_only=getattr(collection_info, 'indexed_only', False),
-                    payload_schema=getattr(collection_info, 'payload_schema', {})
-                ))
-            
-            return collections
+            # 并发获取各集合详细信息
+            infos = await asyncio.gather(*(self.get_collection_info(name) for name in names))
+            return [info for info in infos if info is not None]
         except Exception as e:
             logger.error(f"获取集合列表失败: {e}")
             return []
     
-    def upsert_points(
+    async def upsert_points(
         self,
         collection_name: str,
         points: List[PointStruct]
     ) -> bool:
         """插入或更新向量点"""
         try:
-            self.client.upsert(
+            await self._call(self.client.upsert(
                 collection_name=collection_name,
                 points=points
-            )
+            ))
             logger.info(f"成功插入 {len(points)} 个向量点到集合 {collection_name}")
             return True
         except Exception as e:
             logger.error(f"插入向量点失败: {e}")
             return False
     
-    def search_points(
+    async def search_points(
         self,
         collection_name: str,
         query_vector: List[float],
@@ -125,7 +293,6 @@ class QdrantRepository:
     ) -> List[Dict[str, Any]]:
         """搜索相似向量点"""
         try:
-            # 构建过滤条件
             query_filter = None
             if filter_conditions:
                 query_filter = models.Filter(
@@ -137,34 +304,98 @@ class QdrantRepository:
                     ]
                 )
             
-            # 执行搜索
-            search_result = self.client.search(
+            search_result = await self._call(self.client.search(
                 collection_name=collection_name,
                 query_vector=query_vector,
                 query_filter=query_filter,
                 limit=limit,
-                score_threshold=score_threshold
-            )
-            
-            # 转换结果格式
-            results = []
-            for point in search_result:
-                results.append({
-                    "id": point.id,
-                    "score": point.score,
-                    "payload": point.payload
-                })
+                score_threshold=score_threshold,
+                search_params=get_collection_profile(self.settings, collection_name).search_params()
+            ))
             
+            results = [
+                {"id": point.id, "score": point.score, "payload": point.payload}
+                for point in search_result
+            ]
             logger.info(f"搜索完成，返回 {len(results)} 个结果")
             return results
         except Exception as e:
             logger.error(f"搜索向量点失败: {e}")
             return []
     
-    def get_collection_info(self, collection_name: str) -> Optional[CollectionInfo]:
+    async def scroll_points(
+        self,
+        collection_name: str,
+        filter_condition: Optional[Dict[str, Any]] = None,
+        with_payload: Union[bool, List[str]] = True,
+        with_vectors: bool = False,
+        batch_size: int = 256
+    ) -> List[models.Record]:
+        """分页遍历匹配过滤条件的全部向量点（每页单独计算超时）"""
+        scroll_filter = models.Filter(**filter_condition) if filter_condition else None
+        records: List[models.Record] = []
+        offset = None
+        
+        while True:
+            points, offset = await self._call(self.client.scroll(
+                collection_name=collection_name,
+                scroll_filter=scroll_filter,
+                limit=batch_size,
+                offset=offset,
+                with_payload=with_payload,
+                with_vectors=with_vectors
+            ))
+            records.extend(points)
+            if offset is None:
+                break
+        
+        logger.info(f"遍历完成，集合 {collection_name} 中匹配 {len(records)} 个向量点")
+        return records
+    
+    async def delete_points(
+        self,
+        collection_name: str,
+        point_ids: List[Union[str, int]]
+    ) -> bool:
+        """根据ID删除向量点"""
+        if not point_ids:
+            return True
+        try:
+            await self._call(self.client.delete(
+                collection_name=collection_name,
+                points_selector=models.PointIdsList(points=point_ids)
+            ))
+            logger.info(f"成功删除 {len(point_ids)} 个向量点，集合 {collection_name}")
+            return True
+        except Exception as e:
+            logger.error(f"删除向量点失败: {e}")
+            return False
+    
+    async def retrieve_points(
+        self,
+        collection_name: str,
+        point_ids: List[Union[str, int]],
+        with_payload: Union[bool, List[str]] = False,
+        with_vectors: bool = True
+    ) -> List[models.Record]:
+        """根据ID批量读取向量点"""
+        if not point_ids:
+            return []
+        try:
+            return await self._call(self.client.retrieve(
+                collection_name=collection_name,
+                ids=point_ids,
+                with_payload=with_payload,
+                with_vectors=with_vectors
+            ))
+        except Exception as e:
+            logger.error(f"读取向量点失败: {e}")
+            return []
+    
+    async def get_collection_info(self, collection_name: str) -> Optional[CollectionInfo]:
         """获取指定集合的信息"""
         try:
-            collection_info = self.client.get_collection(collection_name)
+            collection_info = await self._call(self.client.get_collection(collection_name))
             return CollectionInfo(
                 name=collection_name,
                 vectors_count=collection_info.vectors_count or 0,
@@ -175,77 +406,85 @@ class QdrantRepository:
             logger.error(f"获取集合信息失败: {e}")
             return None
     
-    def count_points(self, collection_name: str) -> int:
+    async def count_points(self, collection_name: str) -> int:
         """统计集合中的向量点数量"""
         try:
-            count_result = self.client.count(collection_name=collection_name)
+            count_result = await self._call(self.client.count(collection_name=collection_name))
             return count_result.count
         except Exception as e:
             logger.error(f"统计向量点数量失败: {e}")
             return 0
-
-    def delete_vectors_by_filter(
+    
+    async def count_by_filter(
         self,
         filter_condition: Dict[str, Any],
         collection_name: Optional[str] = None
     ) -> int:
-        """根据过滤条件删除向量"""
+        """精确统计匹配过滤条件的向量点数量（由Qdrant在服务端计数，不传输点ID）"""
+        count_result = await self._call(self.client.count(
+            collection_name=collection_name or self.settings.qdrant_collection_name,
+            count_filter=models.Filter(**filter_condition),
+            exact=True
+        ))
+        return count_result.count
+    
+    async def delete_by_filter(
+        self,
+        filter_condition: Dict[str, Any],
+        collection_name: Optional[str] = None,
+        wait: bool = True
+    ) -> FilterDeleteResult:
+        """
+        按过滤条件删除向量点
+        
+        先精确统计匹配数量，再以过滤条件选择器删除，全程不传输点ID
+        
+        Args:
+            filter_condition: 过滤条件
+            collection_name: 集合名称，默认使用配置中的集合
+            wait: 是否等待删除完成，为False时提交后立即返回操作ID
+            
+        Returns:
+            删除结果
+            
+        Raises:
+            Exception: 统计或删除失败
+        """
+        collection_name = collection_name or self.settings.qdrant_collection_name
+        matched = await self.count_by_filter(filter_condition, collection_name)
+        if matched == 0:
+            logger.info(f"集合 {collection_name} 中没有匹配的向量点")
+            return FilterDeleteResult(collection_name=collection_name, matched=0)
+        
+        update_result = await self._call(self.client.delete(
+            collection_name=collection_name,
+            points_selector=models.FilterSelector(filter=models.Filter(**filter_condition)),
+            wait=wait
+        ), timeout=max(self.timeout, _DELETE_WAIT_TIMEOUT) if wait else None)
+        result = FilterDeleteResult(
+            collection_name=collection_name,
+            matched=matched,
+            operation_id=update_result.operation_id,
+            status=str(getattr(update_result.status, "value", update_result.status))
+        )
+        logger.info(f"按过滤条件删除 {matched} 个向量点 - 集合: {collection_name}, 状态: {result.status}")
+        return result
+    
+    async def delete_vectors_by_filter(
+        self,
+        filter_condition: Dict[str, Any],
+        collection_name: Optional[str] = None,
+        wait: bool = True
+    ) -> int:
+        """根据过滤条件删除向量，返回删除前精确统计的匹配数量，失败时抛出异常"""
         try:
-            if collection_name is None:
-                collection_name = self.settings.qdrant_collection_name
-
-            # 构建Qdrant过滤器
-            query_filter = models.Filter(**filter_condition)
-
-            # 先查询匹配的向量数量
-            try:
-                # 使用scroll方法获取匹配的点，只获取ID
-                scroll_result = self.client.scroll(
-                    collection_name=collection_name,
-                    scroll_filter=query_filter,
-                    limit=10000,  # 设置一个较大的限制
-                    with_payload=False,  # 不需要payload，只要ID
-                    with_vectors=False   # 不需要向量数据
-                )
-                points_to_delete = scroll_result[0]  # scroll返回(points, next_page_offset)
-                deleted_count = len(points_to_delete)
-
-                if deleted_count == 0:
-                    logger.info("没有找到匹配的向量点")
-                    return 0
-
-            except Exception as e:
-                logger.warning(f"无法查询匹配的向量数量: {e}，将直接执行删除")
-                deleted_count = 0
-
-            # 执行删除操作
-            delete_result = self.client.delete(
-                collection_name=collection_name,
-                points_selector=models.FilterSelector(filter=query_filter)
-            )
-
-            # 如果之前无法获取数量，使用删除结果的状态来估计
-            if deleted_count == 0:
-                # 检查删除操作是否成功
-                if hasattr(delete_result, 'status') and delete_result.status == 'completed':
-                    deleted_count = 1  # 假设至少删除了一些数据
-                else:
-                    deleted_count = 0
-
-            logger.info(f"成功删除 {deleted_count} 个向量点")
-            return deleted_count
-
+            return (await self.delete_by_filter(filter_condition, collection_name, wait)).matched
         except Exception as e:
             logger.error(f"删除向量失败: {e}")
-            return 0
+            raise
     
-    def close(self):
-        """关闭客户端连接"""
-        if self.client:
-            self.client.close()
-            logger.info("Qdrant客户端连接已关闭")
-
-
-# 创建全局RAG仓库实例
-from app.core.config import get_settings
-rag_repository = QdrantRepository(get_settings())
+    async def close(self):
+        """关闭客户端连接（共享客户端由客户端注册表负责关闭）"""
+        if self.client and self.pool is None:
+            await self.client.close()
+            logger.info("异步Qdrant客户端连接已关闭")
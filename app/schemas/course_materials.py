@@ -10,9 +10,11 @@ from enum import Enum
 
 class ProcessingStatus(str, Enum):
     """处理状态枚举"""
+    PENDING = "pending"                        # 已提交，等待后台处理
     UPLOADING = "uploading"                    # 文件上传中
     OUTLINE_GENERATING = "outline_generating"  # 大纲生成中
     RAG_INDEXING = "rag_indexing"             # RAG索引建立中
+    PROCESSING = "processing"                  # 大纲生成与RAG索引并行处理中
     COMPLETED = "completed"                    # 处理完成
     FAILED = "failed"                         # 处理失败
 
@@ -104,6 +106,8 @@ class CourseProcessResponse(BaseModel):
     rag_index_status: Optional[str] = Field(None, description="RAG索引状态")
     rag_collection_name: Optional[str] = Field(None, description="RAG集合名称")
     rag_document_count: Optional[int] = Field(None, description="RAG文档数量")
+    rag_indexed_chunks: Optional[int] = Field(None, description="RAG索引已完成嵌入的文本块数量")
+    rag_total_chunks: Optional[int] = Field(None, description="RAG索引的文本块总数")
 
     # 错误信息
     error_step: Optional[str] = Field(None, description="出错的步骤")
@@ -153,6 +157,57 @@ class CourseProcessResponse(BaseModel):
         }
 
 
+class BatchProcessRequest(BaseModel):
+    """批量课程材料处理请求模型，各文件的材料ID与名称由文件名解析"""
+    course_id: str = Field(
+        ...,
+        description="课程ID，批量中的所有材料属于同一课程",
+        min_length=1,
+        max_length=50
+    )
+    custom_prompt: Optional[str] = Field(None, description="自定义提示词")
+    include_refine: bool = Field(default=True, description="是否进行大纲精简处理")
+    llm_model: Optional[str] = Field(None, description="指定使用的模型名称")
+    enable_rag_indexing: bool = Field(default=True, description="是否建立RAG索引")
+    rag_collection_name: Optional[str] = Field(None, description="RAG集合名称，如果不提供则使用默认集合")
+
+    class Config:
+        protected_namespaces = ()
+
+
+class BatchItemStatus(BaseModel):
+    """批量任务中单个文件的处理状态"""
+    filename: str = Field(..., description="原始文件名（压缩包内为条目路径）")
+    task_id: Optional[str] = Field(None, description="子任务ID，文件未通过校验时为空")
+    course_material_id: Optional[str] = Field(None, description="课程材料ID")
+    material_name: Optional[str] = Field(None, description="材料名称")
+    status: ProcessingStatus = Field(..., description="当前处理状态")
+    current_step: Optional[str] = Field(None, description="当前处理步骤")
+    progress_percentage: float = Field(default=0.0, description="进度百分比")
+    rag_indexed_chunks: Optional[int] = Field(None, description="RAG索引已完成嵌入的文本块数量")
+    rag_total_chunks: Optional[int] = Field(None, description="RAG索引的文本块总数")
+    error_message: Optional[str] = Field(None, description="错误消息")
+
+
+class BatchProcessResponse(BaseModel):
+    """批量课程材料处理响应模型"""
+    batch_id: str = Field(..., description="批量任务ID")
+    status: ProcessingStatus = Field(..., description="批量任务状态，所有文件结束后为 completed")
+    message: str = Field(..., description="状态消息")
+    course_id: str = Field(..., description="课程ID")
+
+    total_files: int = Field(..., description="文件总数")
+    completed_files: int = Field(default=0, description="处理完成的文件数")
+    failed_files: int = Field(default=0, description="处理失败的文件数")
+    progress_percentage: float = Field(default=0.0, description="进度百分比（按已结束的文件计算）")
+
+    items: List[BatchItemStatus] = Field(default_factory=list, description="各文件的处理状态")
+    skipped: List[str] = Field(default_factory=list, description="压缩包中被跳过的条目（目录、隐藏文件、不支持的类型）")
+
+    created_at: datetime = Field(default_factory=datetime.now, description="创建时间")
+    last_updated: datetime = Field(default_factory=datetime.now, description="最后更新时间")
+
+
 class TaskStatusQuery(BaseModel):
     """任务状态查询响应模型"""
     task_id: str = Field(..., description="任务ID")
@@ -174,6 +229,8 @@ class TaskStatusQuery(BaseModel):
     upload_file_path: Optional[str] = Field(None, description="上传文件保存路径")
     outline_file_path: Optional[str] = Field(None, description="大纲文件保存路径")
     rag_index_status: Optional[str] = Field(None, description="RAG索引状态")
+    rag_indexed_chunks: Optional[int] = Field(None, description="RAG索引已完成嵌入的文本块数量")
+    rag_total_chunks: Optional[int] = Field(None, description="RAG索引的文本块总数")
 
     # 错误信息
     error_step: Optional[str] = Field(None, description="出错的步骤")
@@ -82,6 +82,54 @@ class IndexResponse(BaseModel):
     chunk_count: int = Field(default=0, description="生成的文本块数量")
     processing_time: float = Field(..., description="处理时间（秒）")
     collection_name: str = Field(..., description="集合名称")
+    # 增量更新统计（仅增量更新模式返回）
+    added_count: Optional[int] = Field(None, description="新增的文本块数量")
+    deleted_count: Optional[int] = Field(None, description="删除的文本块数量")
+    unchanged_count: Optional[int] = Field(None, description="内容未变化而保留的文本块数量")
+    # 断点续传统计（仅从断点继续时返回）
+    resumed_count: Optional[int] = Field(None, description="断点中已写入而跳过的文本块数量")
+
+
+class IndexCheckpoint(BaseModel):
+    """索引断点模型，记录已写入向量库的文本块区间"""
+    collection_name: str = Field(..., description="集合名称")
+    content_hash: str = Field(..., description="文档内容哈希")
+    embed_model: str = Field(..., description="嵌入模型名称")
+    chunk_count: int = Field(..., description="文本块总数")
+    ranges: List[List[int]] = Field(default_factory=list, description="已写入的文本块区间 [start, end)，按起点排序且互不重叠")
+
+    def matches(self, collection_name: str, content_hash: str, embed_model: str, chunk_count: int) -> bool:
+        """断点是否适用于本次索引（文档、分块结果、嵌入模型与集合均未变化）"""
+        return (
+            self.collection_name == collection_name
+            and self.content_hash == content_hash
+            and self.embed_model == embed_model
+            and self.chunk_count == chunk_count
+        )
+
+    def covers(self, start: int, end: int) -> bool:
+        """区间 [start, end) 是否已全部写入"""
+        return any(low <= start and end <= high for low, high in self.ranges)
+
+    def add(self, start: int, end: int) -> None:
+        """记录已写入的区间，与相邻或重叠的区间合并"""
+        merged: List[List[int]] = []
+        for low, high in sorted(self.ranges + [[start, end]]):
+            if merged and low <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], high)
+            else:
+                merged.append([low, high])
+        self.ranges = merged
+
+    @property
+    def indexed_count(self) -> int:
+        """已写入的文本块数量"""
+        return sum(high - low for low, high in self.ranges)
+
+    @property
+    def completed(self) -> bool:
+        """全部文本块是否已写入"""
+        return self.indexed_count >= self.chunk_count
 
 
 class CollectionInfo(BaseModel):
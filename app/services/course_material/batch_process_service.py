@@ -0,0 +1,332 @@
+"""
+批量课程材料处理服务
+一次提交多个文件或一个zip压缩包，在一个批量任务内以受限并发执行课程材料处理流程
+"""
+import asyncio
+import zipfile
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from typing import Optional, Dict, Any, List, Tuple
+from fastapi import UploadFile
+
+from ...core.logging import get_logger
+from ...core.config import get_settings
+from ...core.deps import save_upload_file
+from ...core.client_registry import get_client_registry
+from ...schemas.course_materials import (
+    BatchItemStatus, BatchProcessRequest, BatchProcessResponse, CourseProcessRequest, ProcessingStatus
+)
+from ...schemas.outline import TaskStatus
+from ...services.jobs.job_store import JobRecord, JobStore
+from ...services.jobs.worker_pool import job_worker_pool
+from ...services.course_material.course_material_process_service import course_material_process_service
+from ...utils.idgen import IDGenerator
+
+logger = get_logger("batch_process_service")
+
+# 后台任务类型
+BATCH_JOB_KIND = "course_material_batch"
+
+# 压缩包中支持的文件类型
+_ALLOWED_EXTENSIONS = ('.md', '.txt')
+# 解压单个条目时每次读取的字节数
+_CHUNK_SIZE = 64 * 1024
+
+
+class BatchProcessService:
+    """批量课程材料处理服务"""
+
+    def __init__(self):
+        self.settings = get_settings()
+
+    @property
+    def job_store(self) -> JobStore:
+        """获取共享的任务存储"""
+        return get_client_registry().get_job_store()
+
+    async def create_batch(
+        self,
+        request: BatchProcessRequest,
+        files: Optional[List[UploadFile]] = None,
+        archive: Optional[UploadFile] = None
+    ) -> BatchProcessResponse:
+        """
+        提交批量处理任务
+
+        在请求内逐个完成文件上传验证并写入子任务记录，子任务的大纲生成与RAG索引建立
+        由一个批量后台任务以 batch_concurrency 的并发执行。文件名格式为
+        `{课程材料ID}_{材料名称}.md`，不含下划线时文件名同时作为材料ID与名称。
+
+        Args:
+            request: 批量处理请求
+            files: 上传的多个文件
+            archive: 上传的zip压缩包，逐个条目流式解压，不落盘整个压缩包内容
+
+        Returns:
+            批量任务状态
+
+        Raises:
+            ValueError: 没有可处理的文件、文件数超过上限或压缩包无法读取
+        """
+        batch_id = IDGenerator.generate_task_id()
+        items: List[Dict[str, Any]] = []
+        skipped: List[str] = []
+        seen_ids: set = set()
+
+        async def add_entry(entry_name: str, filename: str, save) -> None:
+            material_id, material_name = self._parse_entry_name(filename)
+            item = {
+                "filename": entry_name,
+                "task_id": None,
+                "course_material_id": material_id,
+                "material_name": material_name,
+                "error": None
+            }
+            items.append(item)
+            if material_id in seen_ids:
+                item["error"] = f"批量任务中课程材料ID重复: {material_id}"
+                return
+            seen_ids.add(material_id)
+
+            try:
+                child_request = CourseProcessRequest(
+                    course_id=request.course_id,
+                    course_material_id=material_id,
+                    material_name=material_name,
+                    custom_prompt=request.custom_prompt,
+                    include_refine=request.include_refine,
+                    llm_model=request.llm_model,
+                    enable_rag_indexing=request.enable_rag_indexing,
+                    rag_collection_name=request.rag_collection_name
+                )
+            except Exception as e:
+                item["error"] = f"文件名无法解析为课程材料: {str(e)}"
+                return
+
+            _, record = await course_material_process_service.prepare_task(
+                filename, child_request, save, batch_id=batch_id
+            )
+            # 子任务只写入任务存储、不进入队列，由批量任务调度执行
+            await self.job_store.save(record)
+            item["task_id"] = record.task_id
+
+        if archive is not None:
+            try:
+                zip_file = await asyncio.to_thread(zipfile.ZipFile, archive.file)
+            except zipfile.BadZipFile as e:
+                raise ValueError(f"压缩包无法读取: {str(e)}")
+
+            with zip_file:
+                entries = []
+                for info in zip_file.infolist():
+                    if info.is_dir():
+                        continue
+                    path = PurePosixPath(info.filename)
+                    if any(part.startswith(".") or part == "__MACOSX" for part in path.parts) \
+                            or path.suffix.lower() not in _ALLOWED_EXTENSIONS:
+                        skipped.append(info.filename)
+                        continue
+                    entries.append(info)
+                self._check_file_count(len(entries) + len(files or []))
+
+                for info in entries:
+                    await add_entry(
+                        info.filename,
+                        PurePosixPath(info.filename).name,
+                        lambda target, info=info: asyncio.to_thread(
+                            self._extract_entry, zip_file, info, target
+                        )
+                    )
+        else:
+            self._check_file_count(len(files or []))
+
+        for file in files or []:
+            await add_entry(
+                file.filename,
+                file.filename,
+                lambda target, file=file: save_upload_file(file, target)
+            )
+
+        if not items:
+            raise ValueError("没有可处理的文件，支持的类型: " + ", ".join(_ALLOWED_EXTENSIONS))
+
+        response = BatchProcessResponse(
+            batch_id=batch_id,
+            status=ProcessingStatus.PENDING,
+            message="批量任务已提交",
+            course_id=request.course_id,
+            total_files=len(items),
+            skipped=skipped
+        )
+        await job_worker_pool.submit(JobRecord(
+            task_id=batch_id,
+            kind=BATCH_JOB_KIND,
+            payload={
+                "request": request.model_dump(mode="json"),
+                "items": items,
+                "skipped": skipped
+            },
+            state=response.model_dump(mode="json"),
+            max_attempts=max(1, self.settings.job_max_attempts)
+        ))
+        logger.info(f"批量任务已提交 - 批量ID: {batch_id}, 文件数: {len(items)}, 跳过: {len(skipped)}")
+
+        return await self.get_batch_status(batch_id) or response
+
+    def _check_file_count(self, count: int) -> None:
+        """检查批量文件数上限"""
+        if count > self.settings.batch_max_files:
+            raise ValueError(f"文件数 {count} 超过单个批量任务的上限 {self.settings.batch_max_files}")
+
+    @staticmethod
+    def _parse_entry_name(filename: str) -> Tuple[str, str]:
+        """从文件名解析课程材料ID与材料名称"""
+        stem = PurePosixPath(filename).stem
+        material_id, separator, material_name = stem.partition("_")
+        if not separator or not material_id or not material_name:
+            return stem, stem
+        return material_id, material_name
+
+    def _extract_entry(self, zip_file: zipfile.ZipFile, info: zipfile.ZipInfo, target: Path) -> int:
+        """将压缩包条目分块写入目标文件，按实际解压字节数限制大小"""
+        limit = self.settings.max_file_size
+        if info.file_size > limit:
+            raise ValueError(f"文件过大: {info.file_size} 字节，最大允许 {limit} 字节")
+
+        size = 0
+        try:
+            with zip_file.open(info) as source, open(target, 'wb') as destination:
+                while chunk := source.read(_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > limit:
+                        raise ValueError(f"文件过大: 超过 {limit} 字节")
+                    destination.write(chunk)
+        except Exception:
+            target.unlink(missing_ok=True)
+            raise
+
+        logger.info(f"压缩包条目解压成功: {info.filename} -> {target}, 大小: {size} 字节")
+        return size
+
+    async def run_batch(self, record: JobRecord) -> Dict[str, Any]:
+        """
+        执行批量任务：以受限并发执行尚未结束的子任务
+
+        所有子任务共享同一个文档索引服务与嵌入流水线，嵌入请求的并发与批次
+        由流水线统一控制；批量任务中断后重新执行时只调度未结束的子任务，
+        子任务从各自的断点继续。
+
+        Args:
+            record: 批量任务记录
+
+        Returns:
+            批量任务结束时的状态
+        """
+        semaphore = asyncio.Semaphore(max(1, self.settings.batch_concurrency))
+        task_ids = [item["task_id"] for item in record.payload.get("items", []) if item.get("task_id")]
+
+        async def run_child(task_id: str) -> None:
+            async with semaphore:
+                child = await self.job_store.get(task_id)
+                if child is None or child.finished:
+                    return
+                await job_worker_pool.run_inline(child)
+
+        logger.info(f"开始执行批量任务 - 批量ID: {record.task_id}, 子任务数: {len(task_ids)}")
+        # 等待全部子任务结束后再抛出异常，避免批量任务重试时与仍在执行的子任务重复
+        results = await asyncio.gather(*(run_child(task_id) for task_id in task_ids), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+
+        response = await self.get_batch_status(record.task_id, record)
+        return response.model_dump(mode="json")
+
+    async def on_batch_failed(self, record: JobRecord, error: str) -> Dict[str, Any]:
+        """批量任务最终失败时汇总子任务状态"""
+        response = await self.get_batch_status(record.task_id, record)
+        response.status = ProcessingStatus.FAILED
+        response.message = f"批量任务失败: {error}"
+        return response.model_dump(mode="json")
+
+    async def get_batch_status(
+        self,
+        batch_id: str,
+        record: Optional[JobRecord] = None
+    ) -> Optional[BatchProcessResponse]:
+        """
+        查询批量任务状态，各文件状态从子任务记录实时汇总
+
+        Args:
+            batch_id: 批量任务ID
+            record: 已读取的批量任务记录
+
+        Returns:
+            批量任务状态，不存在时返回None
+        """
+        record = record or await self.job_store.get(batch_id)
+        if record is None or record.kind != BATCH_JOB_KIND:
+            return None
+
+        entries = record.payload.get("items", [])
+        children = await asyncio.gather(*(
+            self.job_store.get(entry["task_id"]) if entry.get("task_id") else asyncio.sleep(0)
+            for entry in entries
+        ))
+
+        items = []
+        for entry, child in zip(entries, children):
+            item = BatchItemStatus(
+                filename=entry["filename"],
+                task_id=entry.get("task_id"),
+                course_material_id=entry.get("course_material_id"),
+                material_name=entry.get("material_name"),
+                status=ProcessingStatus.FAILED,
+                error_message=entry.get("error")
+            )
+            if child is not None:
+                state = child.state
+                item.status = ProcessingStatus(state.get("status", ProcessingStatus.PENDING.value))
+                item.current_step = state.get("current_step")
+                item.progress_percentage = state.get("progress_percentage", 0.0)
+                item.rag_indexed_chunks = state.get("rag_indexed_chunks")
+                item.rag_total_chunks = state.get("rag_total_chunks")
+                item.error_message = state.get("error_message") or child.error
+            elif entry.get("task_id"):
+                item.error_message = "子任务记录不存在或已过期"
+            items.append(item)
+
+        completed = sum(1 for item in items if item.status == ProcessingStatus.COMPLETED)
+        failed = sum(1 for item in items if item.status == ProcessingStatus.FAILED)
+        finished = completed + failed
+
+        if record.status == TaskStatus.FAILED.value:
+            status = ProcessingStatus.FAILED
+        elif finished == len(items):
+            status = ProcessingStatus.COMPLETED
+        elif record.status == TaskStatus.PENDING.value and not any(
+            item.status not in (ProcessingStatus.PENDING, ProcessingStatus.FAILED) for item in items
+        ):
+            status = ProcessingStatus.PENDING
+        else:
+            status = ProcessingStatus.PROCESSING
+
+        return BatchProcessResponse(
+            batch_id=batch_id,
+            status=status,
+            message=record.error if status == ProcessingStatus.FAILED and record.error
+            else f"已完成 {completed}/{len(items)}，失败 {failed}",
+            course_id=record.payload.get("request", {}).get("course_id", ""),
+            total_files=len(items),
+            completed_files=completed,
+            failed_files=failed,
+            progress_percentage=round(finished / len(items) * 100, 2) if items else 100.0,
+            items=items,
+            skipped=record.payload.get("skipped", []),
+            created_at=datetime.fromtimestamp(record.created_at),
+            last_updated=datetime.fromtimestamp(record.updated_at)
+        )
+
+
+# 全局批量课程材料处理服务实例
+batch_process_service = BatchProcessService()
@@ -13,10 +13,17 @@ from ...core.logging import get_logger
 from ...core.config import get_settings
 from ...constants.paths import UPLOADS_DIR, OUTLINES_DIR
 from ...schemas.course_materials import CleanupRequest, CleanupResponse, CleanupOperation
-from ...repositories.rag_repository import rag_repository
+from ...schemas.outline import TaskStatus
+from ...core.client_registry import get_client_registry
+from ...services.jobs.job_store import JobRecord
+from ...services.jobs.worker_pool import job_worker_pool
+from ...utils.idgen import IDGenerator
 
 logger = get_logger("cleanup_service")
 
+# 后台向量删除任务类型
+VECTOR_DELETE_JOB_KIND = "vector_delete"
+
 
 class CleanupService:
     """课程材料清理服务"""
@@ -311,26 +318,18 @@ class CleanupService:
 
         try:
             # 构建过滤条件
+            filter_condition = self._build_rag_filter(course_id, course_material_id)
             if course_material_id:
-                # 清理特定材料的RAG数据
-                filter_condition = {
-                    "must": [
-                        {"key": "course_id", "match": {"value": course_id}},
-                        {"key": "course_material_id", "match": {"value": course_material_id}}
-                    ]
-                }
                 target = f"course_id={course_id}, course_material_id={course_material_id}"
             else:
-                # 清理整个课程的RAG数据
-                filter_condition = {
-                    "must": [
-                        {"key": "course_id", "match": {"value": course_id}}
-                    ]
-                }
                 target = f"course_id={course_id}"
 
             # 删除向量数据
-            deleted_count = rag_repository.delete_vectors_by_filter(filter_condition)
+            qdrant_repo = get_client_registry().get_qdrant_repository()
+            deleted_count = await qdrant_repo.delete_vectors_by_filter(filter_condition)
+
+            # 使相关语义缓存失效
+            await get_client_registry().get_semantic_cache().invalidate(course_id, course_material_id)
 
             operations.append(CleanupOperation(
                 operation_type="rag_cleanup",
@@ -352,6 +351,135 @@ class CleanupService:
 
         return operations
 
+    @staticmethod
+    def _build_rag_filter(course_id: str, course_material_id: Optional[str] = None) -> Dict[str, Any]:
+        """构建课程（材料）范围的向量过滤条件"""
+        must = [{"key": "course_id", "match": {"value": course_id}}]
+        if course_material_id:
+            must.append({"key": "course_material_id", "match": {"value": course_material_id}})
+        return {"must": must}
+
+    async def submit_vector_delete(
+        self,
+        course_id: str,
+        course_material_id: Optional[str] = None,
+        collection_name: Optional[str] = None
+    ) -> JobRecord:
+        """
+        提交后台向量删除任务
+
+        大范围删除（如整个课程）在Qdrant服务端按过滤条件执行，耗时随匹配数量增长，
+        由后台任务等待删除完成并校验剩余数量，进度通过任务状态查询
+
+        Args:
+            course_id: 课程ID
+            course_material_id: 课程材料ID，为空时删除整个课程
+            collection_name: 集合名称，默认使用配置中的集合
+
+        Returns:
+            已提交的任务记录
+        """
+        record = JobRecord(
+            task_id=IDGenerator.generate_task_id(),
+            kind=VECTOR_DELETE_JOB_KIND,
+            payload={
+                "course_id": course_id,
+                "course_material_id": course_material_id,
+                "collection_name": collection_name or self.settings.qdrant_collection_name
+            },
+            state={
+                "status": TaskStatus.PENDING.value,
+                "message": "向量删除任务已提交",
+                "course_id": course_id,
+                "course_material_id": course_material_id,
+                "collection_name": collection_name or self.settings.qdrant_collection_name,
+                "matched": None,
+                "deleted": 0,
+                "remaining": None,
+                "operation_id": None
+            },
+            max_attempts=max(1, self.settings.job_max_attempts)
+        )
+        await job_worker_pool.submit(record)
+        logger.info(f"向量删除任务已提交 - 任务ID: {record.task_id}, 课程ID: {course_id}, 材料ID: {course_material_id}")
+        return record
+
+    async def run_vector_delete(self, record: JobRecord) -> Dict[str, Any]:
+        """
+        执行后台向量删除任务：精确计数、按过滤条件删除并等待完成，再次计数校验
+
+        重试时只删除上次未删除的剩余向量点，删除数量累计
+
+        Args:
+            record: 任务记录
+
+        Returns:
+            任务结束时的状态
+
+        Raises:
+            RuntimeError: 删除完成后仍有匹配的向量点
+        """
+        course_id = record.payload["course_id"]
+        course_material_id = record.payload.get("course_material_id")
+        collection_name = record.payload.get("collection_name")
+        filter_condition = self._build_rag_filter(course_id, course_material_id)
+        qdrant_repo = get_client_registry().get_qdrant_repository()
+        job_store = get_client_registry().get_job_store()
+
+        state = dict(record.state)
+        matched = await qdrant_repo.count_by_filter(filter_condition, collection_name)
+        state.update(status=TaskStatus.PROCESSING.value, message=f"正在删除 {matched} 个向量点")
+        if state.get("matched") is None:
+            state["matched"] = matched
+        await job_store.update_state(record.task_id, state)
+
+        result = await qdrant_repo.delete_by_filter(filter_condition, collection_name, wait=True)
+        state["deleted"] = (state.get("deleted") or 0) + result.matched
+        state["operation_id"] = result.operation_id
+        await job_store.update_state(record.task_id, state)
+
+        remaining = await qdrant_repo.count_by_filter(filter_condition, collection_name)
+        state["remaining"] = remaining
+        if remaining:
+            await job_store.update_state(record.task_id, state)
+            raise RuntimeError(f"删除完成后仍有 {remaining} 个向量点匹配")
+
+        await get_client_registry().get_semantic_cache().invalidate(course_id, course_material_id)
+
+        state.update(status=TaskStatus.COMPLETED.value, message=f"已删除 {state['deleted']} 个向量点")
+        logger.info(
+            f"向量删除任务完成 - 任务ID: {record.task_id}, 集合: {collection_name}, "
+            f"匹配: {state['matched']}, 删除: {state['deleted']}"
+        )
+        return state
+
+    async def on_vector_delete_failed(self, record: JobRecord, error: str) -> Dict[str, Any]:
+        """向量删除任务最终失败时保留已删除数量"""
+        latest = await get_client_registry().get_job_store().get(record.task_id) or record
+        return dict(latest.state, status=TaskStatus.FAILED.value, message=f"向量删除失败: {error}")
+
+    async def get_vector_delete_status(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查询后台向量删除任务状态
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            任务状态，不存在时返回None
+        """
+        record = await get_client_registry().get_job_store().get(task_id)
+        if record is None or record.kind != VECTOR_DELETE_JOB_KIND:
+            return None
+        return dict(
+            record.state,
+            task_id=record.task_id,
+            attempts=record.attempts,
+            error=record.error,
+            created_at=datetime.fromtimestamp(record.created_at).isoformat(),
+            last_updated=datetime.fromtimestamp(record.updated_at).isoformat()
+        )
+
     async def _cleanup_task_data(
         self,
         course_id: str,
@@ -361,23 +489,33 @@ class CleanupService:
         operations = []
 
         try:
-            # 这里可以清理内存中的任务状态数据
-            # 由于当前使用简单的内存存储，这里只是示例
-            # 在实际生产环境中，应该清理数据库中的任务记录
+            # 删除属于该课程（材料）的任务记录，排队中的任务随之取消；
+            # 执行中的任务只标记取消，由执行者结束本次执行后清理其产生的数据并删除记录
+            job_store = get_client_registry().get_job_store()
+            removed = 0
+            cancelled = 0
+            for record in await job_store.list_by_course(course_id, course_material_id):
+                # 删除任务本身不随课程数据清理，以便查询删除结果
+                if record.kind == VECTOR_DELETE_JOB_KIND:
+                    continue
+                if record.status == TaskStatus.PROCESSING.value and await job_store.request_cancel(record.task_id):
+                    cancelled += 1
+                elif await job_store.delete(record.task_id):
+                    removed += 1
 
             operations.append(CleanupOperation(
                 operation_type="task_cleanup",
                 target=f"course_id={course_id}, course_material_id={course_material_id}",
                 success=True,
                 message="任务数据清理成功",
-                details="内存中的任务状态已清理"
+                details=f"已删除任务记录: {removed}, 已取消执行中的任务: {cancelled}"
             ))
 
         except Exception as e:
             logger.error(f"任务数据清理失败: {str(e)}")
             operations.append(CleanupOperation(
                 operation_type="task_cleanup",
-                target="task_storage",
+                target="job_store",
                 success=False,
                 message=f"任务数据清理失败: {str(e)}",
                 details=None
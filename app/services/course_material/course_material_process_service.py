@@ -5,7 +5,7 @@
 import time
 import asyncio
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple, AsyncIterator, Awaitable, Callable
 from datetime import datetime
 from fastapi import UploadFile, HTTPException
 
@@ -14,12 +14,16 @@ from ...core.config import get_settings
 from ...core.deps import save_upload_file
 from ...constants.paths import UPLOADS_DIR
 from ...schemas.course_materials import (
-    CourseProcessRequest, CourseProcessResponse, ProcessingStatus, ProcessingStep
+    CleanupRequest, CourseProcessRequest, CourseProcessResponse, ProcessingStatus, ProcessingStep, TaskStatusQuery
 )
-from ...schemas.rag import DocumentMetadata, IndexRequest
+from ...schemas.outline import TaskStatus
+from ...schemas.rag import DocumentMetadata, IndexRequest, IndexCheckpoint
 from ...services.outline.outline_service import outline_service
+from ...core.client_registry import get_client_registry
+from ...services.jobs.job_store import FINISHED_STATUSES, JobRecord, JobStore
+from ...services.jobs.task_events import TaskEventBus
+from ...services.jobs.worker_pool import job_worker_pool
 from ...services.rag.document_indexing_service import DocumentIndexingService
-from ...services.rag.rag_settings import get_rag_config_manager
 from ...services.course_material.cleanup_service import cleanup_service
 from ...utils.idgen import IDGenerator, path_generator
 from ...utils.validation import CourseValidation, FileValidation
@@ -27,18 +31,95 @@ from ...utils.fileio import file_utils
 
 logger = get_logger("course_material_process_service")
 
+# 后台任务类型
+JOB_KIND = "course_material"
+
 
 class CourseMaterialProcessService:
     """统一课程材料处理服务"""
     
     def __init__(self):
         self.settings = get_settings()
-        # 存储任务状态的简单内存存储（生产环境应使用数据库）
-        self.task_storage: Dict[str, CourseProcessResponse] = {}
-
-        # 初始化文档索引服务
-        rag_config_manager = get_rag_config_manager()
-        self.document_indexing_service = DocumentIndexingService(self.settings, rag_config_manager)
+        # 本进程正在处理的任务，任务状态持久化在任务存储中
+        self._active_tasks: Dict[str, CourseProcessResponse] = {}
+        # 各任务最近一次写入索引进度的时间
+        self._progress_persisted_at: Dict[str, float] = {}
+        # 本进程正在处理的任务的断点，与任务状态一同写入任务存储
+        self._checkpoints: Dict[str, Dict[str, Any]] = {}
+    
+    @property
+    def document_indexing_service(self) -> DocumentIndexingService:
+        """获取共享的文档索引服务"""
+        return get_client_registry().get_document_indexing_service()
+    
+    @property
+    def job_store(self) -> JobStore:
+        """获取共享的任务存储"""
+        return get_client_registry().get_job_store()
+    
+    @property
+    def event_bus(self) -> TaskEventBus:
+        """获取共享的任务事件总线"""
+        return get_client_registry().get_task_event_bus()
+    
+    @staticmethod
+    def build_status_query(response: CourseProcessResponse) -> TaskStatusQuery:
+        """将处理响应转换为任务状态查询响应"""
+        return TaskStatusQuery.model_validate(response.model_dump())
+    
+    async def _persist(self, task_id: str, publish: bool = True) -> None:
+        """
+        将任务当前状态写入任务存储，并推送状态事件
+        
+        Args:
+            task_id: 任务ID
+            publish: 是否推送 status 事件
+        """
+        response = self._active_tasks.get(task_id)
+        if response is None:
+            return
+        try:
+            await self.job_store.update_state(
+                task_id, response.model_dump(mode="json"), checkpoint=self._checkpoints.get(task_id)
+            )
+        except Exception as e:
+            logger.warning(f"任务状态持久化失败 - 任务ID: {task_id}, 错误: {str(e)}")
+        if publish:
+            await self.event_bus.publish(
+                task_id, "status", self.build_status_query(response).model_dump(mode="json")
+            )
+    
+    async def _report_indexing_progress(self, task_id: str, completed: int, total: int) -> None:
+        """
+        记录RAG索引的嵌入进度并推送 progress 事件
+        
+        进度事件每个批次实时推送，写入任务存储按 job_progress_persist_interval 节流
+        
+        Args:
+            task_id: 任务ID
+            completed: 已完成嵌入的文本块数量
+            total: 文本块总数
+        """
+        response = self._active_tasks.get(task_id)
+        if response is None:
+            return
+        response.rag_indexed_chunks = completed
+        response.rag_total_chunks = total
+        
+        await self.event_bus.publish(task_id, "progress", {
+            "task_id": task_id,
+            "step": "rag_indexing",
+            "completed": completed,
+            "total": total,
+            "percentage": round(completed / total * 100, 1) if total else 100.0,
+            "progress_percentage": response.progress_percentage
+        })
+        
+        now = time.monotonic()
+        last = self._progress_persisted_at.get(task_id, 0.0)
+        if completed >= total or now - last >= self.settings.job_progress_persist_interval:
+            self._progress_persisted_at[task_id] = now
+            await self._persist(task_id, publish=False)
     
     async def process_course_material(
         self,
@@ -46,17 +127,50 @@ class CourseMaterialProcessService:
         request: CourseProcessRequest
     ) -> CourseProcessResponse:
         """
-        处理课程材料的完整流程
+        提交课程材料处理任务
+        
+        在请求内完成文件上传验证，大纲生成与RAG索引建立提交到后台任务队列执行
         
         Args:
             file: 上传的文件
             request: 处理请求
             
         Returns:
-            处理响应
+            处理响应（上传成功时状态为 pending）
+        """
+        response, record = await self.prepare_task(
+            file.filename, request, lambda path: save_upload_file(file, path)
+        )
+        if record.status == TaskStatus.PENDING.value:
+            # 后续阶段提交到后台任务队列
+            await job_worker_pool.submit(record)
+        else:
+            try:
+                await self.job_store.save(record)
+            except Exception as store_error:
+                logger.error(f"任务状态持久化失败 - 任务ID: {record.task_id}, 错误: {str(store_error)}")
+        return response
+    
+    async def prepare_task(
+        self,
+        filename: str,
+        request: CourseProcessRequest,
+        save: Callable[[Path], Awaitable[int]],
+        batch_id: Optional[str] = None
+    ) -> Tuple[CourseProcessResponse, JobRecord]:
+        """
+        执行上传阶段并构建后台任务记录（不写入任务存储）
+        
+        Args:
+            filename: 原始文件名
+            request: 处理请求
+            save: 将文件内容写入指定路径的协程函数，返回写入的字节数
+            batch_id: 所属批量任务ID
+            
+        Returns:
+            (处理响应, 任务记录)，上传成功时任务状态为 pending，否则为 failed
         """
         task_id = IDGenerator.generate_task_id()
-        start_time = time.time()
         
         # 初始化响应对象
         response = CourseProcessResponse(
@@ -67,81 +181,140 @@ class CourseMaterialProcessService:
             course_id=request.course_id,
             course_material_id=request.course_material_id,
             material_name=request.material_name,
-            original_filename=file.filename,
+            original_filename=filename,
             file_size=0
         )
         
-        # 存储任务状态
-        self.task_storage[task_id] = response
+        self._active_tasks[task_id] = response
+        upload_result: Dict[str, Any] = {}
         
         try:
             logger.info(f"开始处理课程材料 - 任务ID: {task_id}")
             
             # 第一阶段：文件上传验证
-            await self._update_task_status(
+            upload_step = await self._update_task_status(
                 task_id, ProcessingStatus.UPLOADING, "文件上传验证中", "uploading"
             )
             
-            upload_result = await self._process_file_upload(file, request, task_id)
+            upload_result = await self._process_file_upload(filename, save, request, task_id)
             if not upload_result["success"]:
                 await self._handle_processing_error(
                     task_id, "uploading", upload_result["error"]
                 )
-                return self.task_storage[task_id]
+            else:
+                # 更新文件信息
+                response.upload_file_path = upload_result["file_path"]
+                response.file_size = upload_result["file_size"]
+                self._finish_step(upload_step, ProcessingStatus.COMPLETED, "文件上传完成")
+                self._advance_progress(response)
+                
+                await self._update_task_status(
+                    task_id, ProcessingStatus.PENDING, "文件上传完成，等待后台处理", "pending",
+                    record_step=False
+                )
             
-            # 更新文件信息
-            response.upload_file_path = upload_result["file_path"]
-            response.file_size = upload_result["file_size"]
+        except Exception as e:
+            logger.error(f"课程材料提交异常 - 任务ID: {task_id}, 错误: {str(e)}")
+            await self._handle_processing_error(task_id, "unknown", str(e))
+            upload_result = {}
+        
+        finally:
+            self._active_tasks.pop(task_id, None)
+        
+        record = self._to_job_record(response, request, upload_result)
+        if batch_id is not None:
+            record.payload["batch_id"] = batch_id
+        return response, record
+    
+    def _to_job_record(
+        self,
+        response: CourseProcessResponse,
+        request: CourseProcessRequest,
+        upload_result: Dict[str, Any]
+    ) -> JobRecord:
+        """构建后台任务记录"""
+        failed = response.status == ProcessingStatus.FAILED
+        return JobRecord(
+            task_id=response.task_id,
+            kind=JOB_KIND,
+            status=TaskStatus.FAILED.value if failed else TaskStatus.PENDING.value,
+            payload={
+                "request": request.model_dump(mode="json"),
+                "upload_file_path": upload_result.get("file_path")
+            },
+            state=response.model_dump(mode="json"),
+            checkpoint={
+                "upload": {
+                    "file_path": upload_result["file_path"],
+                    "file_size": upload_result["file_size"]
+                }
+            } if upload_result.get("success") else {},
+            max_attempts=max(1, self.settings.job_max_attempts),
+            error=response.error_message if failed else None
+        )
+    
+    async def run_job(self, record: JobRecord) -> Dict[str, Any]:
+        """
+        执行后台处理任务：并行生成大纲与建立RAG索引
+        
+        阶段失败时抛出异常，由工作池决定重试或最终失败；
+        重试或恢复时从断点继续，跳过已完成的大纲与已写入的索引分段
+        
+        Args:
+            record: 任务记录
+            
+        Returns:
+            任务完成时的处理响应
+        """
+        task_id = record.task_id
+        request = CourseProcessRequest(**record.payload["request"])
+        response = CourseProcessResponse(**record.state)
+        self._active_tasks[task_id] = response
+        self._checkpoints[task_id] = dict(record.checkpoint)
+        
+        try:
+            # 重试时清除上次执行的错误与进度
+            response.error_step = None
+            response.error_message = None
             response.completed_steps = 1
-            response.progress_percentage = 33.3
+            response.progress_percentage = round(100 / response.total_steps, 1)
+            response.rag_index_status = None
+            response.rag_indexed_chunks = None
+            response.rag_total_chunks = None
             
-            # 第二阶段：大纲生成
+            attempt_info = f"（第 {record.attempts}/{record.max_attempts} 次）" if record.attempts > 1 else ""
             await self._update_task_status(
-                task_id, ProcessingStatus.OUTLINE_GENERATING, "大纲生成中", "outline_generating"
-            )
-            
-            outline_result = await self._process_outline_generation(
-                upload_result["file_content"], request, task_id
+                task_id, ProcessingStatus.PROCESSING, f"大纲生成与RAG索引建立中{attempt_info}", "processing",
+                record_step=False
             )
-            if not outline_result["success"]:
-                await self._handle_processing_error(
-                    task_id, "outline_generating", outline_result["error"]
-                )
-                return self.task_storage[task_id]
             
-            # 更新大纲信息
-            response.outline_file_path = outline_result["outline_path"]
-            response.outline_content = outline_result["outline_content"]
-            response.token_usage = outline_result["token_usage"]
-            response.completed_steps = 2
-            response.progress_percentage = 66.6
+            upload_result = {
+                "file_path": record.payload["upload_file_path"],
+                "file_content": await file_utils.read_text_file_safe(Path(record.payload["upload_file_path"]))
+            }
             
-            # 第三阶段：RAG索引建立
+            # 大纲生成与RAG索引建立相互独立，并行执行
+            stages = {
+                "outline_generating": self._run_outline_stage(upload_result, request, task_id)
+            }
             if request.enable_rag_indexing:
-                await self._update_task_status(
-                    task_id, ProcessingStatus.RAG_INDEXING, "RAG索引建立中", "rag_indexing"
-                )
-                
-                rag_result = await self._process_rag_indexing(
-                    upload_result["file_content"], upload_result["file_path"], request, task_id
-                )
-                if not rag_result["success"]:
-                    await self._handle_processing_error(
-                        task_id, "rag_indexing", rag_result["error"]
-                    )
-                    return self.task_storage[task_id]
-                
-                # 更新RAG信息
-                response.rag_index_status = "completed"
-                response.rag_collection_name = rag_result["collection_name"]
-                response.rag_document_count = rag_result["document_count"]
+                stages["rag_indexing"] = self._run_rag_indexing_stage(upload_result, request, task_id)
             else:
                 response.rag_index_status = "skipped"
+                self._advance_progress(response)
+            
+            failure = await self._run_concurrent_stages(task_id, stages)
+            if failure is not None:
+                error_step, error_message = failure
+                response.error_step = error_step
+                response.error_message = error_message
+                await self._persist(task_id)
+                raise RuntimeError(f"{error_step}: {error_message}")
             
-            # 第四阶段：完成确认
-            response.completed_steps = 3
+            # 完成确认
+            response.completed_steps = response.total_steps
             response.progress_percentage = 100.0
-            response.total_processing_time = time.time() - start_time
+            response.total_processing_time = time.time() - response.created_at.timestamp()
             response.completed_at = datetime.now()
             
             await self._update_task_status(
@@ -150,16 +323,210 @@ class CourseMaterialProcessService:
             
             logger.info(f"课程材料处理完成 - 任务ID: {task_id}, 耗时: {response.total_processing_time:.2f}s")
             
-            return response
+            return response.model_dump(mode="json")
+        
+        finally:
+            self._active_tasks.pop(task_id, None)
+            self._progress_persisted_at.pop(task_id, None)
+            self._checkpoints.pop(task_id, None)
+    
+    async def on_job_failed(self, record: JobRecord, error: str) -> Dict[str, Any]:
+        """
+        后台任务最终失败：记录错误，保留已完成阶段的产物与断点以便恢复
+        
+        Args:
+            record: 任务记录
+            error: 最后一次执行的错误信息
             
-        except Exception as e:
-            logger.error(f"课程材料处理异常 - 任务ID: {task_id}, 错误: {str(e)}")
-            await self._handle_processing_error(task_id, "unknown", str(e))
-            return self.task_storage[task_id]
+        Returns:
+            失败后的处理响应
+        """
+        response = CourseProcessResponse(**record.state)
+        self._active_tasks[record.task_id] = response
+        try:
+            await self._handle_processing_error(
+                record.task_id,
+                response.error_step or "processing",
+                response.error_message or error,
+                record_step=response.error_step is None,
+                cleanup=False
+            )
+            return response.model_dump(mode="json")
+        finally:
+            self._active_tasks.pop(record.task_id, None)
+    
+    async def on_job_cancelled(self, record: JobRecord) -> None:
+        """
+        后台任务在执行中被取消（课程或材料已被清理）：删除本次执行写入的文件与向量
+        
+        Args:
+            record: 任务记录
+        """
+        request = CourseProcessRequest(**record.payload["request"])
+        cleanup_request = CleanupRequest(
+            course_id=request.course_id,
+            course_material_id=request.course_material_id,
+            cleanup_files=True,
+            cleanup_rag_data=True,
+            cleanup_task_data=False  # 任务记录由工作池删除
+        )
+        await cleanup_service.cleanup_course_material(cleanup_request)
+        logger.info(f"已取消任务的数据清理完成 - 任务ID: {record.task_id}")
+    
+    def _advance_progress(self, response: CourseProcessResponse) -> None:
+        """完成一个步骤后更新进度"""
+        response.completed_steps = min(response.completed_steps + 1, response.total_steps)
+        response.progress_percentage = round(response.completed_steps / response.total_steps * 100, 1)
+    
+    @staticmethod
+    def _finish_step(
+        step: Optional[ProcessingStep],
+        status: ProcessingStatus,
+        message: str,
+        error_message: Optional[str] = None
+    ) -> None:
+        """结束处理步骤并记录结果"""
+        if step is None:
+            return
+        step.status = status
+        step.message = message
+        step.end_time = datetime.now()
+        step.error_message = error_message
+    
+    async def _run_outline_stage(
+        self,
+        upload_result: Dict[str, Any],
+        request: CourseProcessRequest,
+        task_id: str
+    ) -> Dict[str, Any]:
+        """执行大纲生成阶段，成功后更新响应中的大纲信息；断点中已有同一内容的大纲时直接复用"""
+        content_hash = DocumentIndexingService.compute_content_hash(upload_result["file_content"])
+        result = await self._restore_outline_checkpoint(task_id, content_hash)
+        if result is not None:
+            step = self._start_step(task_id, "outline_generating", ProcessingStatus.OUTLINE_GENERATING, "从断点恢复大纲")
+            message = "大纲已在上次执行中生成，从断点恢复"
+        else:
+            step = self._start_step(task_id, "outline_generating", ProcessingStatus.OUTLINE_GENERATING, "大纲生成中")
+            await self._persist(task_id)
+            result = await self._process_outline_generation(upload_result["file_content"], request, task_id)
+            message = "大纲生成完成"
+        
+        if result["success"]:
+            response = self._active_tasks[task_id]
+            response.outline_file_path = result["outline_path"]
+            response.outline_content = result["outline_content"]
+            response.token_usage = result["token_usage"]
+            self._checkpoints.setdefault(task_id, {})["outline"] = {
+                "outline_file_path": result["outline_path"],
+                "token_usage": result["token_usage"],
+                "content_hash": content_hash
+            }
+            self._finish_step(step, ProcessingStatus.COMPLETED, message)
+            self._advance_progress(response)
+        else:
+            self._finish_step(step, ProcessingStatus.FAILED, "大纲生成失败", result["error"])
+        await self._persist(task_id)
+        return result
+    
+    async def _restore_outline_checkpoint(self, task_id: str, content_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        从断点恢复大纲生成结果
+        
+        Args:
+            task_id: 任务ID
+            content_hash: 当前文件内容哈希
+            
+        Returns:
+            与 _process_outline_generation 相同格式的结果，断点不存在或已失效时返回None
+        """
+        checkpoint = self._checkpoints.get(task_id, {}).get("outline")
+        if not checkpoint or checkpoint.get("content_hash") != content_hash:
+            return None
+        outline_path = Path(checkpoint["outline_file_path"])
+        if not outline_path.exists():
+            return None
+        
+        logger.info(f"从断点恢复大纲 - 任务ID: {task_id}, 路径: {outline_path}")
+        return {
+            "success": True,
+            "outline_path": str(outline_path),
+            "outline_content": await file_utils.read_text_file_safe(outline_path),
+            "token_usage": checkpoint.get("token_usage")
+        }
+    
+    async def _save_index_checkpoint(self, task_id: str, checkpoint: IndexCheckpoint) -> None:
+        """记录已写入向量库的文本块区间"""
+        self._checkpoints.setdefault(task_id, {})["rag_indexing"] = checkpoint.model_dump()
+        await self._persist(task_id, publish=False)
+    
+    async def _run_rag_indexing_stage(
+        self,
+        upload_result: Dict[str, Any],
+        request: CourseProcessRequest,
+        task_id: str
+    ) -> Dict[str, Any]:
+        """执行RAG索引建立阶段，成功后更新响应中的索引信息"""
+        step = self._start_step(task_id, "rag_indexing", ProcessingStatus.RAG_INDEXING, "RAG索引建立中")
+        response = self._active_tasks[task_id]
+        response.rag_index_status = "indexing"
+        await self._persist(task_id)
+        result = await self._process_rag_indexing(
+            upload_result["file_content"], upload_result["file_path"], request, task_id
+        )
+        
+        if result["success"]:
+            response.rag_index_status = "completed"
+            response.rag_collection_name = result["collection_name"]
+            response.rag_document_count = result["document_count"]
+            self._finish_step(step, ProcessingStatus.COMPLETED, "RAG索引建立完成")
+            self._advance_progress(response)
+        else:
+            response.rag_index_status = "failed"
+            self._finish_step(step, ProcessingStatus.FAILED, "RAG索引建立失败", result["error"])
+        await self._persist(task_id)
+        return result
+    
+    async def _run_concurrent_stages(
+        self,
+        task_id: str,
+        stages: Dict[str, Any]
+    ) -> Optional[Tuple[str, str]]:
+        """
+        并行执行相互独立的处理阶段
+
+        某一阶段失败时不取消其他阶段，让其执行完成并保存断点，
+        任务重试时只重做失败的阶段，不重复支付已完成阶段的开销（如大纲生成的LLM调用）
+
+        Args:
+            task_id: 任务ID
+            stages: 步骤名称到阶段协程的映射
+
+        Returns:
+            全部成功时返回None，否则返回 (失败步骤, 错误信息)
+        """
+        results = await asyncio.gather(*stages.values(), return_exceptions=True)
+        
+        failures = []
+        for step_name, result in zip(stages, results):
+            if isinstance(result, BaseException):
+                if isinstance(result, asyncio.CancelledError):
+                    raise result
+                logger.error(f"处理阶段异常 - 任务ID: {task_id}, 步骤: {step_name}, 错误: {str(result)}")
+                result = {"success": False, "error": str(result)}
+            if not result["success"]:
+                failures.append((step_name, result["error"]))
+        
+        if not failures:
+            return None
+        
+        error_step = ",".join(step_name for step_name, _ in failures)
+        error_message = "; ".join(error for _, error in failures)
+        return error_step, error_message
     
     async def _process_file_upload(
         self,
-        file: UploadFile,
+        filename: str,
+        save: Callable[[Path], Awaitable[int]],
         request: CourseProcessRequest,
         task_id: str
     ) -> Dict[str, Any]:
@@ -167,13 +534,13 @@ class CourseMaterialProcessService:
         try:
             # 文件验证
             allowed_extensions = ['.md', '.txt']
-            if not FileValidation.validate_file_extension(file.filename, allowed_extensions):
+            if not FileValidation.validate_file_extension(filename, allowed_extensions):
                 return {
                     "success": False,
-                    "error": f"文件类型不支持: {Path(file.filename).suffix}，支持的类型: {', '.join(allowed_extensions)}"
+                    "error": f"文件类型不支持: {Path(filename).suffix}，支持的类型: {', '.join(allowed_extensions)}"
                 }
 
-            if not FileValidation.validate_filename_characters(file.filename):
+            if not FileValidation.validate_filename_characters(filename):
                 return {
                     "success": False,
                     "error": "文件名包含不安全字符"
@@ -196,14 +563,14 @@ class CourseMaterialProcessService:
                 course_id=request.course_id,
                 course_material_id=request.course_material_id,
                 material_name=request.material_name,
-                file_extension=Path(file.filename).suffix
+                file_extension=Path(filename).suffix
             )
             
             # 确保目录存在
             file_path.parent.mkdir(parents=True, exist_ok=True)
             
             # 保存文件
-            file_size = await save_upload_file(file, file_path)
+            file_size = await save(file_path)
             
             # 读取文件内容
             file_content = await file_utils.read_text_file_safe(file_path)
@@ -305,8 +672,16 @@ class CourseMaterialProcessService:
                 collection_name=request.rag_collection_name
             )
 
-            # 调用新的文档索引服务建立索引
-            index_response = await self.document_indexing_service.build_index(index_request)
+            # 调用新的文档索引服务建立索引，每个嵌入批次完成后推送进度，每段写入后更新断点
+            checkpoint = self._checkpoints.get(task_id, {}).get("rag_indexing")
+            index_response = await self.document_indexing_service.build_index(
+                index_request,
+                progress_callback=lambda completed, total: self._report_indexing_progress(
+                    task_id, completed, total
+                ),
+                checkpoint=IndexCheckpoint(**checkpoint) if checkpoint else None,
+                on_checkpoint=lambda index_checkpoint: self._save_index_checkpoint(task_id, index_checkpoint)
+            )
 
             if not index_response.success:
                 return {
@@ -334,48 +709,82 @@ class CourseMaterialProcessService:
         task_id: str,
         status: ProcessingStatus,
         message: str,
-        current_step: str
-    ):
-        """更新任务状态"""
-        if task_id in self.task_storage:
-            response = self.task_storage[task_id]
+        current_step: str,
+        record_step: bool = True
+    ) -> Optional[ProcessingStep]:
+        """更新任务状态，返回新增的处理步骤记录"""
+        if task_id in self._active_tasks:
+            response = self._active_tasks[task_id]
             response.status = status
             response.message = message
             response.current_step = current_step
 
             # 添加处理步骤记录
-            step = ProcessingStep(
-                step_name=current_step,
-                status=status,
-                message=message,
-                start_time=datetime.now()
-            )
-            response.processing_steps.append(step)
+            step = self._start_step(task_id, current_step, status, message) if record_step else None
+            await self._persist(task_id)
+            return step
+        return None
+
+    def _start_step(
+        self,
+        task_id: str,
+        step_name: str,
+        status: ProcessingStatus,
+        message: str
+    ) -> Optional[ProcessingStep]:
+        """添加处理步骤记录"""
+        if task_id not in self._active_tasks:
+            return None
+        step = ProcessingStep(
+            step_name=step_name,
+            status=status,
+            message=message,
+            start_time=datetime.now()
+        )
+        self._active_tasks[task_id].processing_steps.append(step)
+        return step
 
     async def _handle_processing_error(
         self,
         task_id: str,
         error_step: str,
-        error_message: str
+        error_message: str,
+        record_step: bool = True,
+        cleanup: bool = True
     ):
-        """处理错误情况"""
-        if task_id in self.task_storage:
-            response = self.task_storage[task_id]
+        """
+        处理错误情况，各阶段已自行记录失败步骤时不再重复记录
+        
+        Args:
+            task_id: 任务ID
+            error_step: 出错的步骤
+            error_message: 错误信息
+            record_step: 是否添加错误步骤记录
+            cleanup: 是否清理已完成的操作（保留时可通过恢复接口从断点继续）
+        """
+        if task_id in self._active_tasks:
+            response = self._active_tasks[task_id]
             response.status = ProcessingStatus.FAILED
             response.message = f"处理失败: {error_message}"
             response.error_step = error_step
             response.error_message = error_message
 
             # 添加错误步骤记录
-            step = ProcessingStep(
-                step_name=error_step,
-                status=ProcessingStatus.FAILED,
-                message=error_message,
-                start_time=datetime.now(),
-                end_time=datetime.now(),
-                error_message=error_message
-            )
-            response.processing_steps.append(step)
+            if record_step:
+                step = ProcessingStep(
+                    step_name=error_step,
+                    status=ProcessingStatus.FAILED,
+                    message=error_message,
+                    start_time=datetime.now(),
+                    end_time=datetime.now(),
+                    error_message=error_message
+                )
+                response.processing_steps.append(step)
+
+            if not cleanup:
+                response.message = f"处理失败: {error_message}（已保留断点，可恢复任务）"
+                await self._persist(task_id)
+                return
 
             # 自动清理已完成的操作
             try:
@@ -394,16 +803,107 @@ class CourseMaterialProcessService:
             except Exception as cleanup_error:
                 logger.error(f"自动清理失败 - 任务ID: {task_id}, 错误: {str(cleanup_error)}")
 
-    def get_task_status(self, task_id: str) -> Optional[CourseProcessResponse]:
-        """获取任务状态"""
-        return self.task_storage.get(task_id)
+    async def get_task_status(self, task_id: str) -> Optional[CourseProcessResponse]:
+        """获取任务状态（从任务存储读取，所有工作进程可见）"""
+        record = await self.job_store.get(task_id)
+        if record is None or record.kind != JOB_KIND:
+            return None
+        return CourseProcessResponse(**record.state)
+
+    async def resume_task(self, task_id: str) -> Optional[CourseProcessResponse]:
+        """
+        恢复最终失败的任务，重新提交到后台任务队列，从第一个未完成的阶段继续
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            恢复后的处理响应，任务不存在时返回None
+
+        Raises:
+            ValueError: 任务未失败或上传文件已被清理，无法恢复
+        """
+        record = await self.job_store.get(task_id)
+        if record is None or record.kind != JOB_KIND:
+            return None
+        if record.status != TaskStatus.FAILED.value:
+            raise ValueError(f"任务状态为 {record.status}，只有失败的任务可以恢复")
+        upload_file_path = record.payload.get("upload_file_path")
+        if not upload_file_path or not Path(upload_file_path).exists():
+            raise ValueError("上传文件不存在（上传阶段失败或已被清理），请重新上传")
+
+        response = CourseProcessResponse(**record.state)
+        response.status = ProcessingStatus.PENDING
+        response.message = "任务已恢复，等待后台处理"
+        response.current_step = "pending"
+        response.error_step = None
+        response.error_message = None
+        response.completed_at = None
+
+        record.state = response.model_dump(mode="json")
+        record.status = TaskStatus.PENDING.value
+        record.attempts = 0
+        record.error = None
+        record.available_at = time.time()
+        await job_worker_pool.submit(record)
+
+        logger.info(f"任务已恢复 - 任务ID: {task_id}, 断点: {', '.join(record.checkpoint) or '无'}")
+        await self.event_bus.publish(task_id, "status", self.build_status_query(response).model_dump(mode="json"))
+        return response
+
+    async def watch_task(self, task_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        订阅任务的状态变化与进度事件
+
+        先推送一次当前状态，之后转发事件总线上的事件，任务结束时推送 done 并结束；
+        超过保活间隔未收到事件时从任务存储校对状态，保证事件总线不跨进程时也能看到其他进程的进度
+
+        Args:
+            task_id: 任务ID
+
+        Yields:
+            {"event", "data"} 字典，事件类型为 status、progress、job、keepalive、done、error
+        """
+        async with self.event_bus.subscribe(task_id) as queue:
+            # 先订阅再读取快照，避免遗漏两者之间发生的事件
+            record = await self.job_store.get(task_id)
+            if record is None or record.kind != JOB_KIND:
+                yield {"event": "error", "data": {"task_id": task_id, "message": f"任务 {task_id} 不存在"}}
+                return
+            
+            last_updated = record.updated_at
+            yield {"event": "status", "data": self._record_status(record)}
+            
+            while not record.finished:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=self.settings.job_events_keepalive)
+                except asyncio.TimeoutError:
+                    record = await self.job_store.get(task_id)
+                    if record is None:
+                        yield {"event": "error", "data": {"task_id": task_id, "message": f"任务 {task_id} 已删除"}}
+                        return
+                    if record.updated_at != last_updated:
+                        last_updated = record.updated_at
+                        yield {"event": "status", "data": self._record_status(record)}
+                    else:
+                        yield {"event": "keepalive", "data": {"task_id": task_id, "timestamp": time.time()}}
+                    continue
+                
+                yield message
+                if message["event"] == "job" and message["data"]["status"] in FINISHED_STATUSES:
+                    record = await self.job_store.get(task_id) or record
+                    break
+            
+            yield {"event": "done", "data": self._record_status(record)}
+    
+    @classmethod
+    def _record_status(cls, record: JobRecord) -> Dict[str, Any]:
+        """从任务记录构建状态事件数据"""
+        return cls.build_status_query(CourseProcessResponse(**record.state)).model_dump(mode="json")
 
-    def remove_task(self, task_id: str) -> bool:
+    async def remove_task(self, task_id: str) -> bool:
         """移除任务记录"""
-        if task_id in self.task_storage:
-            del self.task_storage[task_id]
-            return True
-        return False
+        return await self.job_store.delete(task_id)
 
 
 # 创建全局课程材料处理服务实例
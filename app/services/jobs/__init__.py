@@ -0,0 +1 @@
+# 后台任务服务模块
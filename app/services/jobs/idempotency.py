@@ -0,0 +1,420 @@
+"""
+幂等键存储
+客户端通过 Idempotency-Key 请求头重试耗时的POST请求时，返回首次请求的结果或等待进行中的请求完成，
+而不是重新执行；支持SQLite（单节点）和Redis（多节点共享）两种后端，记录在保留期后过期
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from ...core.logging import get_logger
+
+logger = get_logger("idempotency")
+
+T = TypeVar("T", bound=BaseModel)
+
+# 幂等键最大长度
+MAX_KEY_LENGTH = 255
+
+# 重放的响应带有此响应头
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+STATUS_PROCESSING = "processing"
+STATUS_COMPLETED = "completed"
+
+
+@dataclass
+class IdempotencyRecord:
+    """幂等键记录"""
+
+    scope: str
+    key: str
+    # 请求指纹，同一幂等键只能用于相同的请求
+    fingerprint: str
+    status: str = STATUS_PROCESSING
+    # 首次请求的响应
+    response: Optional[Dict[str, Any]] = None
+    # 处理中的记录在此时间后视为执行者已退出，可由重试请求接管
+    locked_until: float = 0.0
+    expires_at: float = 0.0
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False, default=str)
+
+    @classmethod
+    def from_json(cls, raw: Any) -> "IdempotencyRecord":
+        return cls(**json.loads(raw))
+
+
+async def fingerprint_request(fields: Dict[str, Any], file: Optional[UploadFile] = None) -> str:
+    """
+    计算请求指纹
+
+    读取上传文件后将读取位置复位，不影响后续处理
+
+    Args:
+        fields: 表单字段
+        file: 上传文件
+
+    Returns:
+        请求指纹
+    """
+    digest = hashlib.sha256(json.dumps(fields, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+    if file is not None:
+        digest.update(file.filename.encode("utf-8") if file.filename else b"")
+        while chunk := await file.read(1024 * 1024):
+            digest.update(chunk)
+        await file.seek(0)
+    return digest.hexdigest()
+
+
+class IdempotencyStore(ABC):
+    """幂等键存储基类"""
+
+    def __init__(self, ttl: int, wait_timeout: float, poll_interval: float = 0.5):
+        """
+        初始化幂等键存储
+
+        Args:
+            ttl: 记录保留时间（秒）
+            wait_timeout: 重试请求等待进行中的首次请求的最长时间（秒），也是处理中记录的锁定时间，
+                首次请求执行期间定期续期锁定
+            poll_interval: 等待时的轮询间隔（秒）
+        """
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+        # 统计信息
+        self._executed = 0
+        self._replayed = 0
+        self._attached = 0
+        self._conflicts = 0
+
+    @abstractmethod
+    async def reserve(self, record: IdempotencyRecord) -> Optional[IdempotencyRecord]:
+        """
+        原子地占用幂等键
+
+        Args:
+            record: 处理中的新记录
+
+        Returns:
+            占用成功时返回None，否则返回已存在的记录
+        """
+
+    @abstractmethod
+    async def save(self, record: IdempotencyRecord) -> None:
+        """写入记录"""
+
+    @abstractmethod
+    async def release(self, scope: str, key: str) -> None:
+        """删除记录，首次请求失败时释放幂等键以便重试"""
+
+    async def close(self) -> None:
+        """关闭存储"""
+
+    async def execute(
+        self,
+        scope: str,
+        key: Optional[str],
+        fingerprint: str,
+        fn: Callable[[], Awaitable[T]],
+        cacheable: Optional[Callable[[T], bool]] = None
+    ) -> Any:
+        """
+        以幂等方式执行请求
+
+        未提供幂等键时直接执行；首次请求执行并保存响应，失败时释放幂等键；
+        相同幂等键的重试请求返回保存的响应，首次请求仍在执行时等待其完成
+
+        Args:
+            scope: 接口范围，不同接口的幂等键互不影响
+            key: 幂等键
+            fingerprint: 请求指纹
+            fn: 执行请求的协程函数
+            cacheable: 判断响应是否保存，返回False时释放幂等键（如业务失败的响应）
+
+        Returns:
+            首次执行时为 fn 的返回值，重放时为 JSONResponse
+        """
+        if not key:
+            return await fn()
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key 长度不能超过 {MAX_KEY_LENGTH}")
+
+        deadline = time.time() + self.wait_timeout
+        attached = False
+        while True:
+            now = time.time()
+            reservation = IdempotencyRecord(
+                scope=scope,
+                key=key,
+                fingerprint=fingerprint,
+                locked_until=now + self.wait_timeout,
+                expires_at=now + self.ttl
+            )
+            existing = await self.reserve(reservation)
+            if existing is None:
+                break
+
+            if existing.fingerprint != fingerprint:
+                self._conflicts += 1
+                raise HTTPException(status_code=422, detail="Idempotency-Key 已用于内容不同的请求")
+
+            if existing.status == STATUS_COMPLETED:
+                self._replayed += 1
+                logger.info(f"幂等请求重放 - 范围: {scope}, 幂等键: {key}")
+                return self._replay(existing)
+
+            # 首次请求仍在执行，等待其完成
+            if not attached:
+                attached = True
+                self._attached += 1
+                logger.info(f"幂等请求等待进行中的首次请求 - 范围: {scope}, 幂等键: {key}")
+            if now >= deadline:
+                raise HTTPException(status_code=409, detail="相同 Idempotency-Key 的请求仍在处理中，请稍后重试")
+            await asyncio.sleep(self.poll_interval)
+
+        self._executed += 1
+        # 执行期间定期续期锁定，避免耗时超过锁定时间的请求被重试请求接管并重复执行
+        heartbeat = asyncio.create_task(self._renew_lock(reservation))
+        try:
+            result = await fn()
+        except BaseException:
+            await self._stop_heartbeat(heartbeat)
+            await self._safe_release(scope, key)
+            raise
+        await self._stop_heartbeat(heartbeat)
+
+        if cacheable is not None and not cacheable(result):
+            await self._safe_release(scope, key)
+            return result
+
+        try:
+            await self.save(IdempotencyRecord(
+                scope=scope,
+                key=key,
+                fingerprint=fingerprint,
+                status=STATUS_COMPLETED,
+                response=result.model_dump(mode="json"),
+                expires_at=time.time() + self.ttl
+            ))
+        except Exception as e:
+            logger.warning(f"幂等记录保存失败 - 范围: {scope}, 幂等键: {key}, 错误: {str(e)}")
+        return result
+
+    async def _renew_lock(self, record: IdempotencyRecord) -> None:
+        """首次请求执行期间定期延长处理中记录的锁定时间，续期失败只记录日志"""
+        interval = max(self.poll_interval, self.wait_timeout / 3)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.time()
+            record.locked_until = now + self.wait_timeout
+            record.expires_at = now + self.ttl
+            try:
+                await self.save(record)
+            except Exception as e:
+                logger.warning(f"幂等键锁定续期失败 - 范围: {record.scope}, 幂等键: {record.key}, 错误: {str(e)}")
+
+    @staticmethod
+    async def _stop_heartbeat(heartbeat: asyncio.Task) -> None:
+        """停止锁定续期任务，并等待进行中的续期写入结束，避免其覆盖随后保存的结果"""
+        heartbeat.cancel()
+        try:
+            await heartbeat
+        except asyncio.CancelledError:
+            pass
+
+    async def _safe_release(self, scope: str, key: str) -> None:
+        try:
+            await self.release(scope, key)
+        except Exception as e:
+            logger.warning(f"幂等键释放失败 - 范围: {scope}, 幂等键: {key}, 错误: {str(e)}")
+
+    @staticmethod
+    def _replay(record: IdempotencyRecord) -> JSONResponse:
+        return JSONResponse(content=record.response, headers={REPLAYED_HEADER: "true"})
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            "executed": self._executed,
+            "replayed": self._replayed,
+            "attached": self._attached,
+            "conflicts": self._conflicts
+        }
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """基于SQLite的幂等键存储"""
+
+    def __init__(self, db_path: Path, ttl: int, wait_timeout: float):
+        """
+        初始化SQLite幂等键存储
+
+        Args:
+            db_path: 数据库文件路径（可与任务存储共用）
+            ttl: 记录保留时间（秒）
+            wait_timeout: 等待首次请求的最长时间（秒）
+        """
+        super().__init__(ttl, wait_timeout)
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接并初始化表结构"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                scope TEXT NOT NULL,
+                key TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (scope, key)
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_expires ON idempotency_keys(expires_at)")
+        return conn
+
+    def _reserve(self, record: IdempotencyRecord) -> Optional[IdempotencyRecord]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM idempotency_keys WHERE expires_at <= ?", (now,))
+                row = self._conn.execute(
+                    "SELECT data FROM idempotency_keys WHERE scope = ? AND key = ?",
+                    (record.scope, record.key)
+                ).fetchone()
+                if row is not None:
+                    existing = IdempotencyRecord.from_json(row[0])
+                    if existing.status != STATUS_PROCESSING or existing.locked_until >= now:
+                        self._conn.execute("COMMIT")
+                        return existing
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO idempotency_keys (scope, key, expires_at, data) VALUES (?, ?, ?, ?)",
+                    (record.scope, record.key, record.expires_at, record.to_json())
+                )
+                self._conn.execute("COMMIT")
+                return None
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _save(self, record: IdempotencyRecord) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO idempotency_keys (scope, key, expires_at, data) VALUES (?, ?, ?, ?)",
+                (record.scope, record.key, record.expires_at, record.to_json())
+            )
+
+    def _release(self, scope: str, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM idempotency_keys WHERE scope = ? AND key = ?", (scope, key))
+
+    async def reserve(self, record: IdempotencyRecord) -> Optional[IdempotencyRecord]:
+        return await asyncio.to_thread(self._reserve, record)
+
+    async def save(self, record: IdempotencyRecord) -> None:
+        await asyncio.to_thread(self._save, record)
+
+    async def release(self, scope: str, key: str) -> None:
+        await asyncio.to_thread(self._release, scope, key)
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# 键不存在或处理中的记录已超过锁定时间时占用，否则返回已存在的记录
+_RESERVE_SCRIPT = """
+local raw = redis.call("GET", KEYS[1])
+if raw then
+    local record = cjson.decode(raw)
+    if record["status"] ~= "processing" or tonumber(record["locked_until"]) >= tonumber(ARGV[2]) then
+        return raw
+    end
+end
+redis.call("SET", KEYS[1], ARGV[1], "EX", ARGV[3])
+return false
+"""
+
+
+class RedisIdempotencyStore(IdempotencyStore):
+    """基于Redis的幂等键存储，多个节点共享"""
+
+    def __init__(self, redis_client: Any, ttl: int, wait_timeout: float, prefix: str = "idempotency"):
+        """
+        初始化Redis幂等键存储
+
+        Args:
+            redis_client: 异步Redis客户端
+            ttl: 记录保留时间（秒）
+            wait_timeout: 等待首次请求的最长时间（秒）
+            prefix: 键前缀
+        """
+        super().__init__(ttl, wait_timeout)
+        self.redis = redis_client
+        self.prefix = prefix
+
+    def _record_key(self, scope: str, key: str) -> str:
+        return f"{self.prefix}:{scope}:{key}"
+
+    async def reserve(self, record: IdempotencyRecord) -> Optional[IdempotencyRecord]:
+        raw = await self.redis.eval(
+            _RESERVE_SCRIPT, 1, self._record_key(record.scope, record.key),
+            record.to_json(), time.time(), max(1, int(self.ttl))
+        )
+        return IdempotencyRecord.from_json(raw) if raw else None
+
+    async def save(self, record: IdempotencyRecord) -> None:
+        await self.redis.set(
+            self._record_key(record.scope, record.key), record.to_json(), ex=max(1, int(self.ttl))
+        )
+
+    async def release(self, scope: str, key: str) -> None:
+        await self.redis.delete(self._record_key(scope, key))
+
+
+def create_idempotency_store(
+    backend: str,
+    db_path: Path,
+    ttl: int,
+    wait_timeout: float,
+    redis_client: Any = None
+) -> IdempotencyStore:
+    """
+    根据配置创建幂等键存储
+
+    Args:
+        backend: 存储后端，sqlite 或 redis
+        db_path: SQLite数据库文件路径
+        ttl: 记录保留时间（秒）
+        wait_timeout: 等待首次请求的最长时间（秒）
+        redis_client: 异步Redis客户端（redis后端需要）
+
+    Returns:
+        幂等键存储实例
+    """
+    if backend == "redis":
+        return RedisIdempotencyStore(redis_client, ttl, wait_timeout)
+    if backend == "sqlite":
+        return SQLiteIdempotencyStore(db_path, ttl, wait_timeout)
+    raise ValueError(f"不支持的幂等键存储后端: {backend}")
@@ -0,0 +1,604 @@
+"""
+任务存储
+持久化后台任务的状态与队列，支持SQLite（单节点）和Redis（多节点共享）两种后端；
+已结束的任务在保留期后自动清除
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ...core.logging import get_logger
+from ...schemas.outline import TaskStatus
+
+logger = get_logger("job_store")
+
+# 已结束的任务状态，写入时开始计算保留期
+FINISHED_STATUSES = (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value)
+
+
+@dataclass
+class JobRecord:
+    """任务记录"""
+
+    task_id: str
+    kind: str
+    status: str = TaskStatus.PENDING.value
+    # 执行任务所需的输入
+    payload: Dict[str, Any] = field(default_factory=dict)
+    # 业务状态（如处理进度、结果），由任务处理器维护
+    state: Dict[str, Any] = field(default_factory=dict)
+    # 各阶段的断点，重试或恢复时跳过已完成的工作
+    checkpoint: Dict[str, Any] = field(default_factory=dict)
+    attempts: int = 0
+    max_attempts: int = 1
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    available_at: float = field(default_factory=time.time)
+    lease_until: Optional[float] = None
+    expires_at: Optional[float] = None
+    # 执行中被取消：执行者结束本次执行后不再提交结果，清理已产生的数据并删除记录
+    cancelled: bool = False
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False, default=str)
+
+    @classmethod
+    def from_json(cls, raw: Any) -> "JobRecord":
+        return cls(**json.loads(raw))
+
+
+class JobStore(ABC):
+    """任务存储基类"""
+
+    def __init__(self, result_ttl: int):
+        """
+        初始化任务存储
+
+        Args:
+            result_ttl: 已结束任务的保留时间（秒）
+        """
+        self.result_ttl = result_ttl
+
+    def _touch(self, record: JobRecord) -> None:
+        """更新时间戳，已结束的任务设置过期时间"""
+        record.updated_at = time.time()
+        record.expires_at = record.updated_at + self.result_ttl if record.finished else None
+
+    @abstractmethod
+    async def save(self, record: JobRecord) -> None:
+        """写入任务记录（不改变队列）"""
+
+    @abstractmethod
+    async def enqueue(self, record: JobRecord) -> None:
+        """写入任务记录并加入队列，在 available_at 之后可被领取"""
+
+    @abstractmethod
+    async def get(self, task_id: str) -> Optional[JobRecord]:
+        """获取任务记录，不存在或已过期时返回None"""
+
+    @abstractmethod
+    async def delete(self, task_id: str) -> bool:
+        """删除任务记录"""
+
+    @abstractmethod
+    async def list(self, kind: Optional[str] = None, limit: int = 100) -> List[JobRecord]:
+        """按创建时间倒序列出任务记录"""
+
+    @abstractmethod
+    async def list_by_course(self, course_id: str, course_material_id: Optional[str] = None) -> List[JobRecord]:
+        """
+        列出业务状态属于指定课程（材料）的任务记录
+
+        Args:
+            course_id: 课程ID
+            course_material_id: 课程材料ID，为None时列出整个课程的任务
+
+        Returns:
+            任务记录列表
+        """
+
+    @abstractmethod
+    async def request_cancel(self, task_id: str) -> bool:
+        """
+        取消执行中的任务：只做标记，由执行者在提交结果前检查
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            任务处于执行中并已标记时返回True，否则返回False（调用方可直接删除记录）
+        """
+
+    @abstractmethod
+    async def claim(self, lease_seconds: float) -> Optional[JobRecord]:
+        """
+        领取一个到期的任务
+
+        领取后任务状态为 processing，租约到期仍未结束的任务可被重新领取
+
+        Args:
+            lease_seconds: 租约时间（秒）
+
+        Returns:
+            领取到的任务，队列为空时返回None
+        """
+
+    @abstractmethod
+    async def extend_lease(self, task_id: str, lease_seconds: float) -> None:
+        """
+        续期执行中任务的租约，长时间运行的任务定期续期，避免被其他工作者重新领取
+
+        Args:
+            task_id: 任务ID
+            lease_seconds: 从现在起的租约时间（秒）
+        """
+
+    @abstractmethod
+    async def purge_expired(self) -> int:
+        """清除过期的任务记录，返回清除数量"""
+
+    async def update_state(
+        self,
+        task_id: str,
+        state: Dict[str, Any],
+        checkpoint: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """更新任务的业务状态，checkpoint 不为None时同时更新断点"""
+        record = await self.get(task_id)
+        if record is None:
+            return
+        record.state = state
+        if checkpoint is not None:
+            record.checkpoint = checkpoint
+        await self.save(record)
+
+    async def complete(self, record: JobRecord) -> None:
+        """标记任务完成"""
+        record.status = TaskStatus.COMPLETED.value
+        record.error = None
+        record.lease_until = None
+        await self.save(record)
+
+    async def fail(self, record: JobRecord, error: str) -> None:
+        """标记任务最终失败"""
+        record.status = TaskStatus.FAILED.value
+        record.error = error
+        record.lease_until = None
+        await self.save(record)
+
+    async def retry(self, record: JobRecord, delay: float, error: Optional[str] = None) -> None:
+        """任务重新排队，在 delay 秒后可再次领取"""
+        record.status = TaskStatus.PENDING.value
+        record.error = error
+        record.lease_until = None
+        record.available_at = time.time() + delay
+        await self.enqueue(record)
+
+    async def count_by_status(self, kind: Optional[str] = None) -> Dict[str, int]:
+        """按状态统计任务数量"""
+        counts = {status.value: 0 for status in TaskStatus}
+        for record in await self.list(kind, limit=0):
+            counts[record.status] = counts.get(record.status, 0) + 1
+        return counts
+
+    async def close(self) -> None:
+        """关闭存储"""
+
+
+class SQLiteJobStore(JobStore):
+    """基于SQLite的任务存储，适用于单节点部署（同一主机上的多个工作进程共享数据库文件）"""
+
+    def __init__(self, db_path: Path, result_ttl: int):
+        """
+        初始化SQLite任务存储
+
+        Args:
+            db_path: 数据库文件路径
+            result_ttl: 已结束任务的保留时间（秒）
+        """
+        super().__init__(result_ttl)
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接并初始化表结构"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                task_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                queued INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                lease_until REAL,
+                created_at REAL NOT NULL,
+                expires_at REAL,
+                data TEXT NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs(queued, available_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_kind ON jobs(kind, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_expires ON jobs(expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_course ON jobs(json_extract(data, '$.state.course_id'))")
+        logger.info(f"任务存储已加载 - SQLite: {self.db_path}")
+        return conn
+
+    def _upsert(self, record: JobRecord, queued: Optional[bool]) -> None:
+        """
+        写入任务记录，queued 为None时保持原有的排队状态（已结束的任务总是移出队列）
+
+        租约列只在记录清除租约（完成、失败、重试）时清空，否则取两者中较晚的时间：
+        记录数据中的租约停留在领取时，心跳只延长租约列，执行中保存业务状态不能把租约改回领取时；
+        取消标记一经写入即保留，执行中读取的旧记录写回时不会清除取消
+        """
+        self._touch(record)
+        queued_value = 0 if record.finished else (None if queued is None else int(queued))
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO jobs
+                    (task_id, kind, status, queued, available_at, lease_until, created_at, expires_at, data)
+                VALUES (?, ?, ?, COALESCE(?, 0), ?, ?, ?, ?, ?)
+                ON CONFLICT(task_id) DO UPDATE SET
+                    status = excluded.status,
+                    queued = COALESCE(?, jobs.queued),
+                    available_at = excluded.available_at,
+                    lease_until = CASE
+                        WHEN excluded.lease_until IS NULL THEN NULL
+                        ELSE MAX(COALESCE(jobs.lease_until, 0), excluded.lease_until)
+                    END,
+                    expires_at = excluded.expires_at,
+                    data = CASE
+                        WHEN json_extract(jobs.data, '$.cancelled') THEN json_set(excluded.data, '$.cancelled', json('true'))
+                        ELSE excluded.data
+                    END
+                """,
+                (
+                    record.task_id, record.kind, record.status, queued_value, record.available_at,
+                    record.lease_until, record.created_at, record.expires_at, record.to_json(),
+                    queued_value
+                )
+            )
+
+    def _get(self, task_id: str) -> Optional[JobRecord]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM jobs WHERE task_id = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (task_id, time.time())
+            ).fetchone()
+        return JobRecord.from_json(row[0]) if row else None
+
+    def _claim(self, lease_seconds: float) -> Optional[JobRecord]:
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE 获取写锁，保证多个进程不会领取同一个任务
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    """
+                    SELECT data FROM jobs
+                    WHERE queued = 1 AND (
+                        (status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?)
+                    )
+                    ORDER BY available_at LIMIT 1
+                    """,
+                    (TaskStatus.PENDING.value, now, TaskStatus.PROCESSING.value, now)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+
+                record = JobRecord.from_json(row[0])
+                record.status = TaskStatus.PROCESSING.value
+                record.attempts += 1
+                record.lease_until = now + lease_seconds
+                record.updated_at = now
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, lease_until = ?, data = ? WHERE task_id = ?",
+                    (record.status, record.lease_until, record.to_json(), record.task_id)
+                )
+                self._conn.execute("COMMIT")
+                return record
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _extend_lease(self, task_id: str, lease_seconds: float) -> None:
+        # 只更新租约列，不改写记录数据，避免覆盖任务处理器并发写入的业务状态
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE task_id = ? AND status = ?",
+                (time.time() + lease_seconds, task_id, TaskStatus.PROCESSING.value)
+            )
+
+    def _delete(self, task_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM jobs WHERE task_id = ?", (task_id,))
+        return cursor.rowcount > 0
+
+    def _list(self, kind: Optional[str], limit: int) -> List[JobRecord]:
+        sql = "SELECT data FROM jobs WHERE (expires_at IS NULL OR expires_at > ?)"
+        params: List[Any] = [time.time()]
+        if kind is not None:
+            sql += " AND kind = ?"
+            params.append(kind)
+        sql += " ORDER BY created_at DESC"
+        if limit > 0:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [JobRecord.from_json(row[0]) for row in rows]
+
+    def _list_by_course(self, course_id: str, course_material_id: Optional[str]) -> List[JobRecord]:
+        sql = (
+            "SELECT data FROM jobs WHERE json_extract(data, '$.state.course_id') = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)"
+        )
+        params: List[Any] = [course_id, time.time()]
+        if course_material_id is not None:
+            sql += " AND json_extract(data, '$.state.course_material_id') = ?"
+            params.append(course_material_id)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [JobRecord.from_json(row[0]) for row in rows]
+
+    def _request_cancel(self, task_id: str) -> bool:
+        # 按状态条件更新，与执行者的完成写入互斥，已结束的任务不会被改回执行中
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET data = json_set(data, '$.cancelled', json('true')) WHERE task_id = ? AND status = ?",
+                (task_id, TaskStatus.PROCESSING.value)
+            )
+        return cursor.rowcount > 0
+
+    def _purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        return cursor.rowcount
+
+    async def save(self, record: JobRecord) -> None:
+        await asyncio.to_thread(self._upsert, record, None)
+
+    async def enqueue(self, record: JobRecord) -> None:
+        await asyncio.to_thread(self._upsert, record, True)
+
+    async def get(self, task_id: str) -> Optional[JobRecord]:
+        return await asyncio.to_thread(self._get, task_id)
+
+    async def delete(self, task_id: str) -> bool:
+        return await asyncio.to_thread(self._delete, task_id)
+
+    async def list(self, kind: Optional[str] = None, limit: int = 100) -> List[JobRecord]:
+        return await asyncio.to_thread(self._list, kind, limit)
+
+    async def list_by_course(self, course_id: str, course_material_id: Optional[str] = None) -> List[JobRecord]:
+        return await asyncio.to_thread(self._list_by_course, course_id, course_material_id)
+
+    async def request_cancel(self, task_id: str) -> bool:
+        return await asyncio.to_thread(self._request_cancel, task_id)
+
+    async def claim(self, lease_seconds: float) -> Optional[JobRecord]:
+        return await asyncio.to_thread(self._claim, lease_seconds)
+
+    async def extend_lease(self, task_id: str, lease_seconds: float) -> None:
+        await asyncio.to_thread(self._extend_lease, task_id, lease_seconds)
+
+    async def purge_expired(self) -> int:
+        return await asyncio.to_thread(self._purge_expired)
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# 领取任务：先将租约到期的任务放回队列，再领取最早到期的任务并登记租约
+_CLAIM_SCRIPT = """
+local now = tonumber(ARGV[1])
+local lease_until = tonumber(ARGV[2])
+local expired = redis.call("ZRANGEBYSCORE", KEYS[2], "-inf", now)
+for _, task_id in ipairs(expired) do
+    redis.call("ZREM", KEYS[2], task_id)
+    redis.call("ZADD", KEYS[1], now, task_id)
+end
+local ids = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", now, "LIMIT", 0, 1)
+if #ids == 0 then
+    return false
+end
+redis.call("ZREM", KEYS[1], ids[1])
+redis.call("ZADD", KEYS[2], lease_until, ids[1])
+return ids[1]
+"""
+
+
+class RedisJobStore(JobStore):
+    """基于Redis的任务存储，多个节点共享同一队列"""
+
+    def __init__(self, redis_client: Any, result_ttl: int, prefix: str = "jobs"):
+        """
+        初始化Redis任务存储
+
+        Args:
+            redis_client: 异步Redis客户端
+            result_ttl: 已结束任务的保留时间（秒）
+            prefix: 键前缀
+        """
+        super().__init__(result_ttl)
+        self.redis = redis_client
+        self.prefix = prefix
+        self.queue_key = f"{prefix}:queue"
+        self.leases_key = f"{prefix}:leases"
+        logger.info(f"任务存储已加载 - Redis, 前缀: {prefix}")
+
+    def _record_key(self, task_id: str) -> str:
+        return f"{self.prefix}:record:{task_id}"
+
+    def _kind_key(self, kind: str) -> str:
+        return f"{self.prefix}:kind:{kind}"
+
+    def _course_key(self, course_id: str) -> str:
+        return f"{self.prefix}:course:{course_id}"
+
+    def _write(self, record: JobRecord, pipe: Any) -> None:
+        self._touch(record)
+        if record.expires_at is not None:
+            pipe.set(self._record_key(record.task_id), record.to_json(), ex=max(1, int(self.result_ttl)))
+        else:
+            pipe.set(self._record_key(record.task_id), record.to_json())
+        pipe.zadd(self._kind_key(record.kind), {record.task_id: record.created_at})
+        pipe.zadd(f"{self.prefix}:kinds", {record.kind: 0})
+        course_id = record.state.get("course_id")
+        if course_id:
+            pipe.sadd(self._course_key(course_id), record.task_id)
+
+    async def save(self, record: JobRecord) -> None:
+        pipe = self.redis.pipeline()
+        self._write(record, pipe)
+        if record.finished:
+            pipe.zrem(self.queue_key, record.task_id)
+            pipe.zrem(self.leases_key, record.task_id)
+        await pipe.execute()
+
+    async def enqueue(self, record: JobRecord) -> None:
+        pipe = self.redis.pipeline()
+        self._write(record, pipe)
+        pipe.zrem(self.leases_key, record.task_id)
+        pipe.zadd(self.queue_key, {record.task_id: record.available_at})
+        await pipe.execute()
+
+    async def get(self, task_id: str) -> Optional[JobRecord]:
+        raw = await self.redis.get(self._record_key(task_id))
+        return JobRecord.from_json(raw) if raw is not None else None
+
+    async def delete(self, task_id: str) -> bool:
+        record = await self.get(task_id)
+        pipe = self.redis.pipeline()
+        pipe.delete(self._record_key(task_id))
+        pipe.zrem(self.queue_key, task_id)
+        pipe.zrem(self.leases_key, task_id)
+        if record is not None:
+            pipe.zrem(self._kind_key(record.kind), task_id)
+            if record.state.get("course_id"):
+                pipe.srem(self._course_key(record.state["course_id"]), task_id)
+        results = await pipe.execute()
+        return bool(results[0])
+
+    async def list(self, kind: Optional[str] = None, limit: int = 100) -> List[JobRecord]:
+        if kind is not None:
+            kinds = [kind]
+        else:
+            kinds = [value.decode() if isinstance(value, bytes) else value
+                     for value in await self.redis.zrange(f"{self.prefix}:kinds", 0, -1)]
+
+        task_ids = []
+        for kind_name in kinds:
+            task_ids.extend(await self.redis.zrevrange(self._kind_key(kind_name), 0, limit - 1 if limit > 0 else -1))
+        if not task_ids:
+            return []
+
+        raw_records = await self.redis.mget([self._record_key(
+            task_id.decode() if isinstance(task_id, bytes) else task_id
+        ) for task_id in task_ids])
+        records = [JobRecord.from_json(raw) for raw in raw_records if raw is not None]
+        records.sort(key=lambda record: record.created_at, reverse=True)
+        return records[:limit] if limit > 0 else records
+
+    async def list_by_course(self, course_id: str, course_material_id: Optional[str] = None) -> List[JobRecord]:
+        course_key = self._course_key(course_id)
+        task_ids = [task_id.decode() if isinstance(task_id, bytes) else task_id
+                    for task_id in await self.redis.smembers(course_key)]
+        if not task_ids:
+            return []
+
+        raw_records = await self.redis.mget([self._record_key(task_id) for task_id in task_ids])
+        # 顺带清理已过期记录的索引
+        stale = [task_id for task_id, raw in zip(task_ids, raw_records) if raw is None]
+        if stale:
+            await self.redis.srem(course_key, *stale)
+        records = [JobRecord.from_json(raw) for raw in raw_records if raw is not None]
+        if course_material_id is not None:
+            records = [record for record in records if record.state.get("course_material_id") == course_material_id]
+        return records
+
+    async def request_cancel(self, task_id: str) -> bool:
+        record = await self.get(task_id)
+        if record is None or record.status != TaskStatus.PROCESSING.value:
+            return False
+        record.cancelled = True
+        await self.save(record)
+        return True
+
+    async def claim(self, lease_seconds: float) -> Optional[JobRecord]:
+        now = time.time()
+        task_id = await self.redis.eval(_CLAIM_SCRIPT, 2, self.queue_key, self.leases_key, now, now + lease_seconds)
+        if not task_id:
+            return None
+        if isinstance(task_id, bytes):
+            task_id = task_id.decode()
+
+        record = await self.get(task_id)
+        if record is None:
+            await self.redis.zrem(self.leases_key, task_id)
+            return None
+        record.status = TaskStatus.PROCESSING.value
+        record.attempts += 1
+        record.lease_until = now + lease_seconds
+        await self.save(record)
+        return record
+
+    async def extend_lease(self, task_id: str, lease_seconds: float) -> None:
+        # 只更新租约集合中的到期时间（任务已结束或已重新排队时不写入）
+        await self.redis.zadd(self.leases_key, {task_id: time.time() + lease_seconds}, xx=True)
+
+    async def purge_expired(self) -> int:
+        """记录由Redis按TTL过期，这里只清理索引中已失效的任务ID"""
+        removed = 0
+        for kind_name in await self.redis.zrange(f"{self.prefix}:kinds", 0, -1):
+            kind_name = kind_name.decode() if isinstance(kind_name, bytes) else kind_name
+            task_ids = await self.redis.zrange(self._kind_key(kind_name), 0, -1)
+            if not task_ids:
+                continue
+            exists = await self.redis.mget([self._record_key(
+                task_id.decode() if isinstance(task_id, bytes) else task_id
+            ) for task_id in task_ids])
+            stale = [task_id for task_id, raw in zip(task_ids, exists) if raw is None]
+            if stale:
+                removed += await self.redis.zrem(self._kind_key(kind_name), *stale)
+        return removed
+
+
+def create_job_store(backend: str, db_path: Path, result_ttl: int, redis_client: Any = None) -> JobStore:
+    """
+    根据配置创建任务存储
+
+    Args:
+        backend: 存储后端，sqlite 或 redis
+        db_path: SQLite数据库文件路径
+        result_ttl: 已结束任务的保留时间（秒）
+        redis_client: 异步Redis客户端（redis后端需要）
+
+    Returns:
+        任务存储实例
+    """
+    if backend == "redis":
+        return RedisJobStore(redis_client, result_ttl)
+    if backend == "sqlite":
+        return SQLiteJobStore(db_path, result_ttl)
+    raise ValueError(f"不支持的任务存储后端: {backend}")
@@ -0,0 +1,162 @@
+"""
+任务事件总线
+向订阅者推送后台任务的状态变化与进度事件；
+配置Redis时通过发布/订阅在多个工作进程间转发，否则只在本进程内分发
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from ...core.logging import get_logger
+
+logger = get_logger("task_events")
+
+# 每个订阅者缓冲的事件上限，消费过慢时丢弃最旧的事件
+_SUBSCRIBER_QUEUE_SIZE = 256
+
+# 等待Redis频道订阅生效的最长时间（秒），超时后不再等待，由调用方的状态轮询兜底
+_SUBSCRIBE_TIMEOUT = 5.0
+
+
+class TaskEventBus:
+    """任务事件总线类"""
+
+    def __init__(self, redis_client: Any = None, prefix: str = "jobs"):
+        """
+        初始化任务事件总线
+
+        Args:
+            redis_client: 异步Redis客户端，为None时只在本进程内分发
+            prefix: 频道前缀
+        """
+        self.redis = redis_client
+        self.channel_prefix = f"{prefix}:events:"
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        # Redis确认频道订阅后置位，连接断开时清除
+        self._subscribed = asyncio.Event()
+
+        # 统计信息
+        self._published = 0
+        self._delivered = 0
+        self._dropped = 0
+
+    async def publish(self, task_id: str, event: str, data: Dict[str, Any]) -> None:
+        """
+        发布任务事件，发布失败只记录日志
+
+        Args:
+            task_id: 任务ID
+            event: 事件类型
+            data: 事件数据
+        """
+        message = {"event": event, "data": data}
+        self._published += 1
+        if self.redis is None:
+            self._dispatch(task_id, message)
+            return
+        try:
+            await self.redis.publish(
+                f"{self.channel_prefix}{task_id}", json.dumps(message, ensure_ascii=False, default=str)
+            )
+        except Exception as e:
+            logger.warning(f"任务事件发布失败 - 任务ID: {task_id}, 错误: {str(e)}")
+
+    @asynccontextmanager
+    async def subscribe(self, task_id: str) -> AsyncIterator[asyncio.Queue]:
+        """
+        订阅任务事件
+
+        使用Redis时等待频道订阅生效后才返回，进入上下文后发布的事件不会遗漏
+
+        Args:
+            task_id: 任务ID
+
+        Yields:
+            事件队列，元素为 {"event", "data"} 字典
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=_SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        if self.redis is not None:
+            await self._ensure_listener()
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(task_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[task_id]
+
+    def _dispatch(self, task_id: str, message: Dict[str, Any]) -> None:
+        """将事件分发给本进程内的订阅者"""
+        for queue in self._subscribers.get(task_id, ()):
+            if queue.full():
+                queue.get_nowait()
+                self._dropped += 1
+            queue.put_nowait(message)
+            self._delivered += 1
+
+    async def _ensure_listener(self) -> None:
+        """按需启动Redis订阅监听（每个进程一个连接，按频道模式接收全部任务事件），并等待订阅生效"""
+        if self._listener is None or self._listener.done():
+            self._subscribed.clear()
+            self._listener = asyncio.create_task(self._listen())
+        if self._subscribed.is_set():
+            return
+        try:
+            await asyncio.wait_for(self._subscribed.wait(), timeout=_SUBSCRIBE_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"任务事件频道订阅 {_SUBSCRIBE_TIMEOUT}s 内未生效，订阅期间的事件可能遗漏")
+
+    async def _listen(self) -> None:
+        """接收Redis频道消息并分发给本进程内的订阅者，连接异常时自动重连"""
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.psubscribe(f"{self.channel_prefix}*")
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    # 收到服务端的订阅确认后，之后发布的事件都会转发到本连接
+                    if message.get("type") == "psubscribe":
+                        self._subscribed.set()
+                        continue
+                    if message.get("type") != "pmessage":
+                        continue
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    self._dispatch(channel[len(self.channel_prefix):], json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._subscribed.clear()
+                logger.warning(f"任务事件订阅连接异常，稍后重连: {str(e)}")
+                await asyncio.sleep(1.0)
+            finally:
+                self._subscribed.clear()
+                try:
+                    await pubsub.reset()
+                except Exception:
+                    pass
+
+    async def close(self) -> None:
+        """停止Redis订阅监听"""
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取事件总线统计信息"""
+        return {
+            "backend": "redis" if self.redis is not None else "local",
+            "subscribed_tasks": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "published": self._published,
+            "delivered": self._delivered,
+            "dropped": self._dropped
+        }
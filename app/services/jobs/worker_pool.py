@@ -0,0 +1,377 @@
+"""
+后台任务工作池
+从任务存储领取任务并执行，失败时按指数退避重试，超过最大次数后标记失败
+"""
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from ...core.logging import get_logger
+from ...schemas.outline import TaskStatus
+from .job_store import JobRecord, JobStore
+from .task_events import TaskEventBus
+
+logger = get_logger("job_worker_pool")
+
+# 清理过期任务记录的间隔（秒）
+_PURGE_INTERVAL = 300.0
+
+
+@dataclass
+class JobHandler:
+    """任务处理器"""
+
+    # 执行任务，返回任务结束时的业务状态
+    run: Callable[[JobRecord], Awaitable[Dict[str, Any]]]
+    # 任务最终失败时调用，返回失败后的业务状态
+    on_failed: Optional[Callable[[JobRecord, str], Awaitable[Dict[str, Any]]]] = None
+    # 任务在执行中被取消时调用，清理本次执行已产生的数据
+    on_cancelled: Optional[Callable[[JobRecord], Awaitable[None]]] = None
+
+
+class JobWorkerPool:
+    """后台任务工作池类"""
+
+    def __init__(self):
+        self.store: Optional[JobStore] = None
+        self.event_bus: Optional[TaskEventBus] = None
+        self.concurrency = 1
+        self.lease_timeout = 1800.0
+        self.retry_backoff = 5.0
+        self.poll_interval = 1.0
+        self.worker_id = uuid.uuid4().hex[:8]
+
+        self._handlers: Dict[str, JobHandler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self._running: Dict[str, JobRecord] = {}
+
+        # 统计信息
+        self._succeeded = 0
+        self._failed = 0
+        self._retried = 0
+        self._cancelled = 0
+
+    def register(
+        self,
+        kind: str,
+        run: Callable[[JobRecord], Awaitable[Dict[str, Any]]],
+        on_failed: Optional[Callable[[JobRecord, str], Awaitable[Dict[str, Any]]]] = None,
+        on_cancelled: Optional[Callable[[JobRecord], Awaitable[None]]] = None
+    ) -> None:
+        """
+        注册任务处理器
+
+        Args:
+            kind: 任务类型
+            run: 执行任务的协程函数，抛出异常表示本次执行失败
+            on_failed: 任务最终失败时调用的协程函数
+            on_cancelled: 任务在执行中被取消时调用的协程函数
+        """
+        self._handlers[kind] = JobHandler(run=run, on_failed=on_failed, on_cancelled=on_cancelled)
+
+    async def start(
+        self,
+        store: JobStore,
+        concurrency: int,
+        lease_timeout: float,
+        retry_backoff: float,
+        poll_interval: float,
+        event_bus: Optional[TaskEventBus] = None
+    ) -> None:
+        """
+        启动工作池
+
+        Args:
+            store: 任务存储
+            concurrency: 并发执行的任务数
+            lease_timeout: 任务执行租约时间（秒）
+            retry_backoff: 重试的基础退避时间（秒）
+            poll_interval: 空闲时的轮询间隔（秒）
+            event_bus: 任务事件总线，任务完成、重试、失败时推送 job 事件
+        """
+        self.store = store
+        self.event_bus = event_bus
+        self.concurrency = max(1, concurrency)
+        self.lease_timeout = lease_timeout
+        self.retry_backoff = retry_backoff
+        self.poll_interval = poll_interval
+        self._stopping = asyncio.Event()
+        self._wakeup = asyncio.Event()
+
+        self._workers = [
+            asyncio.create_task(self._worker_loop(index)) for index in range(self.concurrency)
+        ]
+        self._workers.append(asyncio.create_task(self._purge_loop()))
+        logger.info(f"后台任务工作池已启动 - 工作者: {self.worker_id}, 并发数: {self.concurrency}")
+
+    async def stop(self) -> None:
+        """停止工作池，执行中的任务立即重新排队，由其他进程或下次启动后继续执行"""
+        self._stopping.set()
+        self._wakeup.set()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info(f"后台任务工作池已停止 - 工作者: {self.worker_id}")
+
+    def notify(self) -> None:
+        """通知工作池有新任务，避免等待下一次轮询"""
+        self._wakeup.set()
+
+    async def submit(self, record: JobRecord) -> None:
+        """
+        提交任务
+
+        Args:
+            record: 任务记录
+        """
+        if self.store is None:
+            raise RuntimeError("后台任务工作池未启动")
+        await self.store.enqueue(record)
+        self.notify()
+        logger.info(f"任务已提交 - 任务ID: {record.task_id}, 类型: {record.kind}")
+
+    async def _worker_loop(self, index: int) -> None:
+        """工作者循环：领取并执行任务，队列为空时等待"""
+        while not self._stopping.is_set():
+            try:
+                record = await self.store.claim(self.lease_timeout)
+            except Exception as e:
+                logger.error(f"领取任务失败 - 工作者: {self.worker_id}-{index}, 错误: {str(e)}")
+                record = None
+
+            if record is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._execute(record)
+
+    async def _execute(self, record: JobRecord) -> None:
+        """执行单个任务并根据结果完成、重试或标记失败"""
+        handler = self._handlers.get(record.kind)
+        if handler is None:
+            await self.store.fail(record, f"未注册的任务类型: {record.kind}")
+            return
+
+        if record.cancelled:
+            await self._discard(record, handler)
+            return
+
+        # 租约到期被重新领取的任务也计入执行次数，超过上限时不再执行
+        if record.attempts > record.max_attempts:
+            await self._give_up(record, handler, "任务执行超时或工作进程退出次数过多")
+            return
+
+        self._running[record.task_id] = record
+        heartbeat = asyncio.create_task(self._renew_lease(record.task_id))
+        start_time = time.time()
+        logger.info(f"开始执行任务 - 任务ID: {record.task_id}, 类型: {record.kind}, 第 {record.attempts}/{record.max_attempts} 次")
+        try:
+            state = await handler.run(record)
+            # 执行期间任务被取消（或记录已删除）时不再提交结果
+            latest = await self.store.get(record.task_id)
+            if latest is None or latest.cancelled:
+                await self._discard(record, handler)
+                return
+            latest.state = state
+            await self.store.complete(latest)
+            await self._publish(latest)
+            self._succeeded += 1
+            logger.info(f"任务执行完成 - 任务ID: {record.task_id}, 耗时: {time.time() - start_time:.2f}s")
+
+        except asyncio.CancelledError:
+            # 工作池停止：立即重新排队，不计入执行次数（记录已删除时不再写回）
+            latest = await self.store.get(record.task_id)
+            if latest is not None:
+                latest.attempts = max(0, latest.attempts - 1)
+                await self.store.retry(latest, 0, "工作进程停止，任务重新排队")
+                logger.info(f"任务已重新排队 - 任务ID: {record.task_id}")
+            raise
+
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            latest = await self.store.get(record.task_id)
+            if latest is None or latest.cancelled:
+                await self._discard(record, handler)
+                return
+            if latest.attempts < latest.max_attempts:
+                delay = self.retry_backoff * (2 ** (latest.attempts - 1))
+                await self.store.retry(latest, delay, error)
+                await self._publish(latest)
+                self._retried += 1
+                logger.warning(
+                    f"任务执行失败，{delay:.1f}s 后重试 - 任务ID: {record.task_id}, "
+                    f"第 {latest.attempts}/{latest.max_attempts} 次, 错误: {error}"
+                )
+            else:
+                await self._give_up(latest, handler, error)
+
+        finally:
+            heartbeat.cancel()
+            self._running.pop(record.task_id, None)
+
+    async def run_inline(self, record: JobRecord) -> JobRecord:
+        """
+        在当前协程中执行任务，不经过队列，失败时按退避时间原地重试
+
+        用于由父任务调度的子任务：子任务记录只写入任务存储、不进入队列，
+        父任务被中断后重新执行时再次调度尚未结束的子任务
+
+        Args:
+            record: 任务记录
+
+        Returns:
+            执行结束（完成或最终失败）后的任务记录
+        """
+        handler = self._handlers.get(record.kind)
+        if handler is None:
+            await self.store.fail(record, f"未注册的任务类型: {record.kind}")
+            return record
+
+        if record.cancelled:
+            await self._discard(record, handler)
+            return record
+
+        self._running[record.task_id] = record
+        try:
+            while True:
+                # 中断前已开始的执行也计入次数，超过上限时不再执行
+                record.status = TaskStatus.PROCESSING.value
+                record.attempts += 1
+                if record.attempts > record.max_attempts:
+                    await self._give_up(record, handler, record.error or "任务执行中断次数过多")
+                    return record
+                await self.store.save(record)
+
+                try:
+                    state = await handler.run(record)
+                    latest = await self.store.get(record.task_id)
+                    if latest is None or latest.cancelled:
+                        await self._discard(record, handler)
+                        return record
+                    latest.state = state
+                    await self.store.complete(latest)
+                    await self._publish(latest)
+                    self._succeeded += 1
+                    return latest
+
+                except asyncio.CancelledError:
+                    # 父任务中断：恢复为等待状态，不计入执行次数（记录已删除时不再写回）
+                    latest = await self.store.get(record.task_id)
+                    if latest is not None:
+                        latest.status = TaskStatus.PENDING.value
+                        latest.attempts = max(0, latest.attempts - 1)
+                        await self.store.save(latest)
+                    raise
+
+                except Exception as e:
+                    error = str(e) or e.__class__.__name__
+                    latest = await self.store.get(record.task_id)
+                    if latest is None or latest.cancelled:
+                        await self._discard(record, handler)
+                        return record
+                    record = latest
+                    if record.attempts >= record.max_attempts:
+                        await self._give_up(record, handler, error)
+                        return record
+
+                    delay = self.retry_backoff * (2 ** (record.attempts - 1))
+                    record.status = TaskStatus.PENDING.value
+                    record.error = error
+                    record.available_at = time.time() + delay
+                    await self.store.save(record)
+                    await self._publish(record)
+                    self._retried += 1
+                    logger.warning(
+                        f"子任务执行失败，{delay:.1f}s 后重试 - 任务ID: {record.task_id}, "
+                        f"第 {record.attempts}/{record.max_attempts} 次, 错误: {error}"
+                    )
+                    await asyncio.sleep(delay)
+        finally:
+            self._running.pop(record.task_id, None)
+
+    async def _renew_lease(self, task_id: str) -> None:
+        """任务执行期间定期续期租约，续期失败只记录日志"""
+        interval = max(1.0, self.lease_timeout / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.store.extend_lease(task_id, self.lease_timeout)
+            except Exception as e:
+                logger.warning(f"任务租约续期失败 - 任务ID: {task_id}, 错误: {str(e)}")
+
+    async def _discard(self, record: JobRecord, handler: JobHandler) -> None:
+        """任务已被取消：不提交结果，清理本次执行产生的数据并删除记录"""
+        logger.info(f"任务已取消，丢弃执行结果 - 任务ID: {record.task_id}, 类型: {record.kind}")
+        if handler.on_cancelled is not None:
+            try:
+                await handler.on_cancelled(record)
+            except Exception as e:
+                logger.error(f"任务取消回调异常 - 任务ID: {record.task_id}, 错误: {str(e)}")
+        await self.store.delete(record.task_id)
+        self._cancelled += 1
+
+    async def _give_up(self, record: JobRecord, handler: JobHandler, error: str) -> None:
+        """任务最终失败"""
+        if handler.on_failed is not None:
+            try:
+                record.state = await handler.on_failed(record, error)
+            except Exception as e:
+                logger.error(f"任务失败回调异常 - 任务ID: {record.task_id}, 错误: {str(e)}")
+        await self.store.fail(record, error)
+        await self._publish(record)
+        self._failed += 1
+        logger.error(f"任务最终失败 - 任务ID: {record.task_id}, 执行次数: {record.attempts}, 错误: {error}")
+
+    async def _publish(self, record: JobRecord) -> None:
+        """推送任务状态变化事件"""
+        if self.event_bus is None:
+            return
+        await self.event_bus.publish(record.task_id, "job", {
+            "task_id": record.task_id,
+            "kind": record.kind,
+            "status": record.status,
+            "attempts": record.attempts,
+            "max_attempts": record.max_attempts,
+            "error": record.error,
+            "available_at": record.available_at
+        })
+
+    async def _purge_loop(self) -> None:
+        """定期清除过期的任务记录"""
+        while not self._stopping.is_set():
+            try:
+                removed = await self.store.purge_expired()
+                if removed:
+                    logger.info(f"已清除过期任务记录: {removed}")
+            except Exception as e:
+                logger.warning(f"清除过期任务记录失败: {str(e)}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=_PURGE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取工作池统计信息"""
+        return {
+            "worker_id": self.worker_id,
+            "running": self.store is not None and bool(self._workers),
+            "concurrency": self.concurrency,
+            "in_progress": len(self._running),
+            "succeeded": self._succeeded,
+            "failed": self._failed,
+            "retried": self._retried,
+            "cancelled": self._cancelled
+        }
+
+
+# 全局后台任务工作池实例
+job_worker_pool = JobWorkerPool()
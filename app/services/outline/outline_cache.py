@@ -0,0 +1,263 @@
+"""
+大纲缓存
+基于磁盘的内容寻址缓存，按 (文件内容, 提示词版本, 模型) 存储生成的大纲，
+大纲文件保存在缓存目录中，索引保存在同目录的SQLite数据库中（多个工作进程共享），超出容量时按LRU淘汰
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from ...core.logging import get_logger
+
+logger = get_logger("outline_cache")
+
+# 命中时更新最近访问时间的最小间隔（秒），避免每次命中都写索引
+_TOUCH_INTERVAL = 60.0
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _atomic_write(path: Path, content: str) -> None:
+    """先写临时文件再原子替换，避免读到写了一半的文件（临时文件按进程区分）"""
+    temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    temp_path.write_text(content, encoding="utf-8")
+    os.replace(temp_path, path)
+
+
+class OutlineCache:
+    """大纲缓存类"""
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        """
+        初始化大纲缓存
+
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存大纲文件的最大字节数
+        """
+        self.cache_dir = Path(cache_dir)
+        self.db_path = self.cache_dir / "index.db"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._evictions = 0
+        self._saved_tokens = 0
+
+        self._conn = self._connect()
+        entries, size_bytes = self._totals()
+        logger.info(f"大纲缓存已加载 - 路径: {self.cache_dir}, 条目: {entries}, 大小: {size_bytes} 字节")
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开索引数据库并初始化表结构"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outlines (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                total_tokens INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_outlines_last_access ON outlines(last_access)")
+        conn.commit()
+        self._import_legacy_index(conn)
+        return conn
+
+    def _import_legacy_index(self, conn: sqlite3.Connection) -> None:
+        """导入旧版 index.json 索引中文件仍存在的条目，导入后删除旧索引"""
+        legacy_path = self.cache_dir / "index.json"
+        if not legacy_path.exists():
+            return
+        try:
+            index = json.loads(legacy_path.read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning(f"旧版大纲缓存索引损坏，跳过导入: {e}")
+            index = {}
+
+        now = time.time()
+        rows = [
+            (
+                key,
+                entry["size"],
+                entry.get("created_at", now),
+                entry.get("last_access", now),
+                (entry.get("token_usage") or {}).get("total_tokens", 0)
+            )
+            for key, entry in index.items() if self._entry_path(key).exists()
+        ]
+        conn.executemany(
+            "INSERT OR IGNORE INTO outlines (key, size, created_at, last_access, total_tokens) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        conn.commit()
+        legacy_path.unlink(missing_ok=True)
+        logger.info(f"已导入旧版大纲缓存索引 - 条目: {len(rows)}")
+
+    def _totals(self) -> tuple:
+        """统计条目数量与总字节数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM outlines").fetchone()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.md"
+
+    @staticmethod
+    def make_key(
+        content: str,
+        outline_prompt: str,
+        refine_prompt: str,
+        outline_model: str,
+        refine_model: str
+    ) -> str:
+        """
+        生成缓存键
+
+        提示词以内容哈希参与计算，修改提示词后旧缓存自然失效
+
+        Args:
+            content: 文件内容
+            outline_prompt: 大纲生成提示词模板
+            refine_prompt: 大纲精简提示词模板
+            outline_model: 大纲生成模型
+            refine_model: 大纲精简模型
+
+        Returns:
+            缓存键
+        """
+        parts = [_sha256(content), _sha256(outline_prompt), _sha256(refine_prompt), outline_model, refine_model]
+        return _sha256("\n".join(parts))
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        查询缓存
+
+        命中时最近访问时间按 _TOUCH_INTERVAL 节流更新，热点条目不会在每次命中时写索引
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存的大纲内容，未命中时返回None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_access, total_tokens FROM outlines WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._misses += 1
+                return None
+            last_access, total_tokens = row
+            try:
+                outline = self._entry_path(key).read_text(encoding="utf-8")
+            except OSError as e:
+                logger.warning(f"大纲缓存文件读取失败，移除条目 - {key[:12]}: {e}")
+                self._remove(key)
+                self._conn.commit()
+                self._misses += 1
+                return None
+
+            if now - last_access >= _TOUCH_INTERVAL:
+                self._conn.execute("UPDATE outlines SET last_access = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            self._hits += 1
+            self._saved_tokens += total_tokens
+            return outline
+
+    def put(self, key: str, outline: str, token_usage: Optional[Dict[str, int]] = None) -> None:
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            outline: 大纲内容
+            token_usage: 生成该大纲消耗的Token，用于统计节省的Token
+        """
+        size = len(outline.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            _atomic_write(self._entry_path(key), outline)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO outlines (key, size, created_at, last_access, total_tokens) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, size, now, now, (token_usage or {}).get("total_tokens", 0))
+            )
+            self._conn.commit()
+            self._writes += 1
+            self._evict_if_needed()
+
+    def _remove(self, key: str) -> None:
+        """移除条目及其文件（需持有锁，由调用方提交）"""
+        self._conn.execute("DELETE FROM outlines WHERE key = ?", (key,))
+        self._entry_path(key).unlink(missing_ok=True)
+
+    def _evict_if_needed(self) -> None:
+        """超出容量时按最近访问时间淘汰，腾出10%余量（需持有锁），总大小从索引统计，包含其他进程写入的条目"""
+        size_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM outlines").fetchone()[0]
+        if size_bytes <= self.max_bytes:
+            return
+
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, size FROM outlines ORDER BY last_access").fetchall():
+            if size_bytes <= target:
+                break
+            self._remove(key)
+            size_bytes -= size
+            evicted += 1
+        self._conn.commit()
+        self._evictions += evicted
+
+        logger.info(f"大纲缓存淘汰完成 - 累计淘汰: {self._evictions}, 当前大小: {size_bytes} 字节")
+
+    async def aget(self, key: str) -> Optional[str]:
+        """异步查询缓存"""
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, outline: str, token_usage: Optional[Dict[str, int]] = None) -> None:
+        """异步写入缓存"""
+        await asyncio.to_thread(self.put, key, outline, token_usage)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        entries, size_bytes = self._totals()
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "path": str(self.cache_dir),
+                "entries": entries,
+                "size_bytes": size_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+                "writes": self._writes,
+                "evictions": self._evictions,
+                "saved_tokens": self._saved_tokens
+            }
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            for (key,) in self._conn.execute("SELECT key FROM outlines").fetchall():
+                self._remove(key)
+            self._conn.commit()
+        logger.info("大纲缓存已清空")
@@ -2,35 +2,58 @@
 大纲生成服务模块
 处理文档大纲生成的核心业务逻辑
 """
+import asyncio
+import inspect
+import os
 import time
 from pathlib import Path
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Optional, Tuple, AsyncIterator, Callable, Union, Awaitable
 import aiofiles
-from openai import AsyncOpenAI
 
 from ...core.config import get_settings
+from ...core.client_registry import get_client_registry
 from ...core.logging import get_logger
 from ...core.deps import generate_filename, read_text_file, write_text_file
 from ...schemas.outline import TaskStatus, OutlineGenerateResponse
-from ...constants.paths import OUTLINES_DIR, PROMPTS_DIR
+from ...constants.paths import OUTLINES_DIR, OUTLINE_CACHE_DIR, PROMPTS_DIR
 from ...utils.idgen import IDGenerator, path_generator
+from ...utils.markdown import split_markdown
+from ...utils.tokens import count_tokens
+from .outline_cache import OutlineCache
+
+# 精简阶段单次输出的Token上限
+_REFINE_MAX_TOKENS_LIMIT = 16000
 
 logger = get_logger("outline_service")
 
 
+def _empty_token_usage() -> Dict[str, int]:
+    return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+
 class OutlineService:
     """大纲生成服务类"""
     
     def __init__(self):
         self.settings = get_settings()
-        self.client = AsyncOpenAI(
-            api_key=self.settings.api_key,
-            base_url=self.settings.base_url
-        )
         
         # 加载提示词模板
         self._outline_prompt_template = None
         self._refine_prompt_template = None
+        
+        # 流式生成的后台任务，保持引用避免被垃圾回收
+        self._background_tasks: set = set()
+        
+        self._outline_cache: Optional[OutlineCache] = None
+    
+    @property
+    def outline_cache(self) -> Optional[OutlineCache]:
+        """大纲缓存，未启用时返回None"""
+        if not self.settings.outline_cache_enabled:
+            return None
+        if self._outline_cache is None:
+            self._outline_cache = OutlineCache(OUTLINE_CACHE_DIR, self.settings.outline_cache_max_bytes)
+        return self._outline_cache
     
     async def _load_prompt_template(self, template_file: str) -> str:
         """加载提示词模板"""
@@ -56,6 +79,179 @@ class OutlineService:
             self._refine_prompt_template = await self._load_prompt_template("outline_refine.txt")
         return self._refine_prompt_template
     
+    async def _create_completion(self, **kwargs):
+        """通过共享OpenAI客户端发起对话补全请求"""
+        async with get_client_registry().openai.acquire() as client:
+            return await client.chat.completions.create(**kwargs)
+    
+    async def _stream_completion(self, total_tokens: Dict[str, int], **kwargs) -> AsyncIterator[str]:
+        """
+        通过共享OpenAI客户端发起流式对话补全请求
+
+        Args:
+            total_tokens: Token使用统计，流结束时累计本次调用的使用量
+            **kwargs: 对话补全参数
+
+        Yields:
+            增量生成的文本
+        """
+        async with get_client_registry().openai.acquire() as client:
+            stream = await client.chat.completions.create(
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs
+            )
+            async for chunk in stream:
+                self._accumulate_usage(total_tokens, chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+    
+    async def _outline_key(self, content: str) -> str:
+        """生成大纲缓存与请求合并共用的键：文件内容、提示词版本与所用模型"""
+        return OutlineCache.make_key(
+            content,
+            await self.get_outline_prompt_template(),
+            await self.get_refine_prompt_template(),
+            self.settings.outline_model,
+            self.settings.refine_model
+        )
+    
+    async def _get_cached_outline(self, outline_key: str, task_id: str) -> Optional[str]:
+        """查询大纲缓存，缓存出错时视为未命中"""
+        if self.outline_cache is None:
+            return None
+        try:
+            outline = await self.outline_cache.aget(outline_key)
+        except Exception as e:
+            logger.warning(f"大纲缓存查询失败 - 任务ID: {task_id}, 错误: {str(e)}")
+            return None
+        if outline is not None:
+            logger.info(f"大纲缓存命中 - 任务ID: {task_id}, 缓存键: {outline_key[:12]}")
+        return outline
+    
+    async def _store_cached_outline(self, outline_key: str, outline: str, token_usage: Dict[str, int], task_id: str) -> None:
+        """写入大纲缓存，失败时只记录日志"""
+        if self.outline_cache is None:
+            return
+        try:
+            await self.outline_cache.aput(outline_key, outline, token_usage)
+        except Exception as e:
+            logger.warning(f"大纲缓存写入失败 - 任务ID: {task_id}, 错误: {str(e)}")
+    
+    @staticmethod
+    def _accumulate_usage(total_tokens: Dict[str, int], response: Any) -> None:
+        """累计单次调用的Token使用"""
+        if hasattr(response, 'usage') and response.usage:
+            total_tokens["prompt_tokens"] += response.usage.prompt_tokens
+            total_tokens["completion_tokens"] += response.usage.completion_tokens
+            total_tokens["total_tokens"] += response.usage.total_tokens
+    
+    async def _outline_request(self, content: str) -> Dict[str, Any]:
+        """构建生成原始大纲的对话补全参数"""
+        template = await self.get_outline_prompt_template()
+        prompt = template.replace("{content}", content)
+        return dict(
+            model=self.settings.outline_model,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=4000
+        )
+    
+    async def _refine_request(self, raw_outline: str, map_reduce: bool = False) -> Dict[str, Any]:
+        """构建精简大纲的对话补全参数，map_reduce 为True时表示合并分段生成的大纲"""
+        refine_template = await self.get_refine_prompt_template()
+        refine_prompt = refine_template.replace("{raw_outline}", raw_outline)
+
+        refine_max_tokens = 3000
+        if map_reduce:
+            # 合并结果与分段大纲拼接后的长度相近，为长大纲预留足够的输出空间
+            refine_max_tokens = min(_REFINE_MAX_TOKENS_LIMIT, max(3000, count_tokens(raw_outline) + 500))
+        return dict(
+            model=self.settings.refine_model,
+            messages=[
+                {"role": "user", "content": refine_prompt}
+            ],
+            temperature=0.3,
+            max_tokens=refine_max_tokens
+        )
+    
+    def _use_map_reduce(self, content: str) -> bool:
+        """判断文档是否需要分段生成大纲"""
+        return count_tokens(content) > self.settings.outline_map_reduce_threshold
+    
+    async def _generate_raw_outline(self, content: str, total_tokens: Dict[str, int]) -> str:
+        """调用大纲模型为一段文本生成原始大纲"""
+        response = await self._create_completion(**await self._outline_request(content))
+        self._accumulate_usage(total_tokens, response)
+        return response.choices[0].message.content
+    
+    async def _map_raw_outline_deltas(
+        self,
+        content: str,
+        task_id: str,
+        total_tokens: Dict[str, int]
+    ) -> AsyncIterator[str]:
+        """
+        分段并行生成原始大纲（map 阶段），按原文顺序逐段输出
+
+        按标题和Token预算切分文档，在并发上限内为各分段生成部分大纲；
+        某一分段及其之前的分段全部完成后立即输出该分段，不必等待所有分段完成
+
+        Args:
+            content: 文档内容
+            task_id: 任务ID
+            total_tokens: Token使用统计，各分段的使用量累计到其中
+
+        Returns:
+            按原文顺序输出的部分大纲（分段之间以空行分隔）
+        """
+        segments = split_markdown(content, self.settings.outline_segment_max_tokens)
+        semaphore = asyncio.Semaphore(max(1, self.settings.outline_map_concurrency))
+        logger.info(
+            f"长文档分段生成大纲 - 任务ID: {task_id}, 分段数: {len(segments)}, "
+            f"并发上限: {self.settings.outline_map_concurrency}"
+        )
+
+        async def generate_segment(index: int, segment: str) -> str:
+            async with semaphore:
+                segment_start = time.time()
+                partial_outline = await self._generate_raw_outline(segment, total_tokens)
+                logger.info(
+                    f"分段大纲生成完成 - 任务ID: {task_id}, 分段: {index + 1}/{len(segments)}, "
+                    f"耗时: {time.time() - segment_start:.2f}秒"
+                )
+                return partial_outline
+
+        tasks = [asyncio.create_task(generate_segment(index, segment)) for index, segment in enumerate(segments)]
+        emitted = False
+        try:
+            for task in tasks:
+                partial_outline = (await task or "").strip()
+                if not partial_outline:
+                    continue
+                yield ("\n\n" if emitted else "") + partial_outline
+                emitted = True
+        finally:
+            # 失败或调用方提前结束时取消尚未完成的分段
+            for task in tasks:
+                task.cancel()
+
+    async def _map_raw_outline(self, content: str, task_id: str, total_tokens: Dict[str, int]) -> str:
+        """
+        分段并行生成原始大纲，按原文顺序拼接
+
+        Args:
+            content: 文档内容
+            task_id: 任务ID
+            total_tokens: Token使用统计，各分段的使用量累计到其中
+
+        Returns:
+            拼接后的原始大纲
+        """
+        return "".join([delta async for delta in self._map_raw_outline_deltas(content, task_id, total_tokens)])
+    
     async def generate_outline_from_text(
         self,
         content: str,
@@ -64,6 +260,8 @@ class OutlineService:
         """
         从文本内容生成大纲
 
+        超过分段阈值的长文档先分段并行生成部分大纲，再由精简阶段合并为完整大纲
+
         Args:
             content: 文档内容
             task_id: 任务ID
@@ -72,60 +270,31 @@ class OutlineService:
             Tuple[生成的大纲内容, Token使用统计]
         """
         start_time = time.time()
-        total_tokens = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        total_tokens = _empty_token_usage()
         
         try:
             # 第一阶段：生成原始大纲
-            template = await self.get_outline_prompt_template()
-            prompt = template.replace("{content}", content)
-
             model = self.settings.outline_model
             
             logger.info(f"开始生成大纲 - 任务ID: {task_id}, 模型: {model}, 内容长度: {len(content)}")
             
-            response = await self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=4000
-            )
-            
-            raw_outline = response.choices[0].message.content
-            
-            # 累计Token使用
-            if hasattr(response, 'usage') and response.usage:
-                total_tokens["prompt_tokens"] += response.usage.prompt_tokens
-                total_tokens["completion_tokens"] += response.usage.completion_tokens
-                total_tokens["total_tokens"] += response.usage.total_tokens
+            map_reduce = self._use_map_reduce(content)
+            if map_reduce:
+                raw_outline = await self._map_raw_outline(content, task_id, total_tokens)
+            else:
+                raw_outline = await self._generate_raw_outline(content, total_tokens)
             
             logger.info(f"原始大纲生成完成 - 任务ID: {task_id}, 长度: {len(raw_outline)}")
             
-            # 第二阶段：精简大纲
-            refine_template = await self.get_refine_prompt_template()
-            refine_prompt = refine_template.replace("{raw_outline}", raw_outline)
-
-            refine_model = self.settings.refine_model
+            # 第二阶段：精简大纲（分段模式下同时合并各分段的大纲）
+            logger.info(f"开始精简大纲 - 任务ID: {task_id}, 模型: {self.settings.refine_model}")
 
-            logger.info(f"开始精简大纲 - 任务ID: {task_id}, 模型: {refine_model}")
-
-            refine_response = await self.client.chat.completions.create(
-                model=refine_model,
-                messages=[
-                    {"role": "user", "content": refine_prompt}
-                ],
-                temperature=0.3,
-                max_tokens=3000
-            )
+            refine_response = await self._create_completion(**await self._refine_request(raw_outline, map_reduce))
 
             final_outline = refine_response.choices[0].message.content
 
             # 累计Token使用
-            if hasattr(refine_response, 'usage') and refine_response.usage:
-                total_tokens["prompt_tokens"] += refine_response.usage.prompt_tokens
-                total_tokens["completion_tokens"] += refine_response.usage.completion_tokens
-                total_tokens["total_tokens"] += refine_response.usage.total_tokens
+            self._accumulate_usage(total_tokens, refine_response)
 
             logger.info(f"大纲精简完成 - 任务ID: {task_id}, 最终长度: {len(final_outline)}")
             
@@ -139,6 +308,42 @@ class OutlineService:
             logger.error(f"大纲生成失败 - 任务ID: {task_id}, 耗时: {processing_time:.2f}秒, 错误: {str(e)}")
             raise
     
+    @staticmethod
+    def get_outline_path(
+        task_id: str,
+        original_filename: str,
+        course_id: Optional[str] = None,
+        course_material_id: Optional[str] = None,
+        material_name: Optional[str] = None
+    ) -> Path:
+        """
+        获取大纲文件路径
+
+        Args:
+            task_id: 任务ID
+            original_filename: 原始文件名
+            course_id: 课程ID
+            course_material_id: 课程材料ID
+            material_name: 材料名称
+
+        Returns:
+            大纲文件路径
+        """
+        # 如果提供了课程信息，使用新的路径生成方式
+        if course_id and course_material_id and material_name:
+            return path_generator.generate_course_outline_path(
+                base_dir=OUTLINES_DIR,
+                course_id=course_id,
+                course_material_id=course_material_id,
+                material_name=material_name
+            )
+        # 兼容旧的路径生成方式
+        outline_filename = generate_filename(
+            f"outline_{Path(original_filename).stem}.md",
+            task_id
+        )
+        return OUTLINES_DIR / outline_filename
+    
     async def save_outline_to_file(
         self,
         outline_content: str,
@@ -163,21 +368,9 @@ class OutlineService:
             保存的文件路径
         """
         try:
-            # 如果提供了课程信息，使用新的路径生成方式
-            if course_id and course_material_id and material_name:
-                outline_path = path_generator.generate_course_outline_path(
-                    base_dir=OUTLINES_DIR,
-                    course_id=course_id,
-                    course_material_id=course_material_id,
-                    material_name=material_name
-                )
-            else:
-                # 兼容旧的路径生成方式
-                outline_filename = generate_filename(
-                    f"outline_{Path(original_filename).stem}.md",
-                    task_id
-                )
-                outline_path = OUTLINES_DIR / outline_filename
+            outline_path = self.get_outline_path(
+                task_id, original_filename, course_id, course_material_id, material_name
+            )
 
             # 确保目录存在
             outline_path.parent.mkdir(parents=True, exist_ok=True)
@@ -223,11 +416,25 @@ class OutlineService:
         try:
             logger.info(f"开始处理大纲生成 - 任务ID: {task_id}, 文件: {original_filename}")
             
-            # 生成大纲
-            outline_content, token_usage = await self.generate_outline_from_text(
-                content=file_content,
-                task_id=task_id
-            )
+            # 相同内容与提示词版本的大纲直接复用缓存，不产生模型调用
+            outline_key = await self._outline_key(file_content)
+            outline_content = await self._get_cached_outline(outline_key, task_id)
+            token_usage = _empty_token_usage()
+            
+            if outline_content is None:
+                # 生成大纲（相同内容的并发请求只调用一次模型，其余请求共享结果）
+                (outline_content, token_usage), shared = await get_client_registry().get_singleflight("outline").do(
+                    outline_key,
+                    lambda: self.generate_outline_from_text(content=file_content, task_id=task_id),
+                    encode=list,
+                    decode=tuple
+                )
+                if shared:
+                    # 共享结果未产生新的模型调用
+                    token_usage = _empty_token_usage()
+                    logger.info(f"复用相同内容的大纲生成结果 - 任务ID: {task_id}")
+                else:
+                    await self._store_cached_outline(outline_key, outline_content, token_usage, task_id)
             
             # 保存大纲文件
             outline_file_path = await self.save_outline_to_file(
@@ -269,6 +476,192 @@ class OutlineService:
                 message=f"大纲生成失败: {str(e)}",
                 processing_time=processing_time
             )
+    
+    def start_streaming_generation(
+        self,
+        file_content: str,
+        original_filename: str,
+        course_id: Optional[str] = None,
+        course_material_id: Optional[str] = None,
+        material_name: Optional[str] = None,
+        task_id: Optional[str] = None,
+        on_complete: Optional[Callable[[OutlineGenerateResponse], Union[None, Awaitable[None]]]] = None
+    ) -> asyncio.Queue:
+        """
+        在后台启动流式大纲生成
+
+        生成在独立的后台任务中执行，客户端断开连接不会中断生成和文件写入
+
+        Args:
+            file_content: 文件内容
+            original_filename: 原始文件名
+            course_id: 课程ID
+            course_material_id: 课程材料ID
+            material_name: 材料名称
+            task_id: 任务ID (可选，如果不提供则自动生成)
+            on_complete: 生成结束（成功或失败）时的回调，可以是协程函数
+
+        Returns:
+            事件队列，元素为 {"event", "data"} 字典，以 None 表示结束
+        """
+        if task_id is None:
+            task_id = IDGenerator.generate_task_id()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        task = asyncio.create_task(self._run_streaming_generation(
+            queue, file_content, original_filename,
+            course_id, course_material_id, material_name, task_id, on_complete
+        ))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return queue
+    
+    async def _stream_to_file(
+        self,
+        path: Path,
+        deltas: AsyncIterator[str],
+        stage: str,
+        queue: asyncio.Queue
+    ) -> str:
+        """将增量文本边写入文件边推送到事件队列，返回完整文本"""
+        parts = []
+        pending = ""
+        async with aiofiles.open(path, 'w', encoding='utf-8') as f:
+            async for delta in deltas:
+                parts.append(delta)
+                queue.put_nowait({"event": "token", "data": {"stage": stage, "delta": delta}})
+                # 按行或缓冲区大小批量写入，减少文件写入次数
+                pending += delta
+                if "\n" in delta or len(pending) >= 256:
+                    await f.write(pending)
+                    await f.flush()
+                    pending = ""
+            if pending:
+                await f.write(pending)
+        return "".join(parts)
+    
+    async def _run_streaming_generation(
+        self,
+        queue: asyncio.Queue,
+        file_content: str,
+        original_filename: str,
+        course_id: Optional[str],
+        course_material_id: Optional[str],
+        material_name: Optional[str],
+        task_id: str,
+        on_complete: Optional[Callable[[OutlineGenerateResponse], Union[None, Awaitable[None]]]]
+    ) -> None:
+        """
+        执行流式大纲生成
+
+        原始大纲边生成边写入大纲文件；精简大纲写入临时文件，完成后原子替换大纲文件，
+        精简失败时保留已完成的原始大纲
+        """
+        start_time = time.time()
+        total_tokens = _empty_token_usage()
+        outline_path = self.get_outline_path(
+            task_id, original_filename, course_id, course_material_id, material_name
+        )
+        temp_path = outline_path.with_name(outline_path.name + ".tmp")
+        raw_outline = None
+
+        try:
+            outline_path.parent.mkdir(parents=True, exist_ok=True)
+            logger.info(f"开始流式生成大纲 - 任务ID: {task_id}, 文件: {original_filename}")
+
+            outline_key = await self._outline_key(file_content)
+            cached_outline = await self._get_cached_outline(outline_key, task_id)
+            if cached_outline is not None:
+                # 缓存命中：直接写入大纲文件并一次性输出
+                await write_text_file(outline_path, cached_outline)
+                queue.put_nowait({"event": "stage", "data": {"stage": "cache"}})
+                queue.put_nowait({"event": "token", "data": {"stage": "cache", "delta": cached_outline}})
+                queue.put_nowait({
+                    "event": "stage_done",
+                    "data": {"stage": "cache", "length": len(cached_outline), "outline_file_path": str(outline_path)}
+                })
+                raw_outline = final_outline = cached_outline
+            else:
+                # 第一阶段：生成原始大纲
+                map_reduce = self._use_map_reduce(file_content)
+                queue.put_nowait({
+                    "event": "stage",
+                    "data": {"stage": "generate", "model": self.settings.outline_model, "map_reduce": map_reduce}
+                })
+                if map_reduce:
+                    # 分段并行生成无法逐Token输出，按原文顺序在每个分段完成后输出整段
+                    deltas = self._map_raw_outline_deltas(file_content, task_id, total_tokens)
+                else:
+                    deltas = self._stream_completion(total_tokens, **await self._outline_request(file_content))
+                raw_outline = await self._stream_to_file(outline_path, deltas, "generate", queue)
+                queue.put_nowait({
+                    "event": "stage_done",
+                    "data": {"stage": "generate", "length": len(raw_outline), "outline_file_path": str(outline_path)}
+                })
+                logger.info(f"原始大纲生成完成 - 任务ID: {task_id}, 长度: {len(raw_outline)}")
+
+                # 第二阶段：精简大纲
+                queue.put_nowait({"event": "stage", "data": {"stage": "refine", "model": self.settings.refine_model}})
+                final_outline = await self._stream_to_file(
+                    temp_path,
+                    self._stream_completion(total_tokens, **await self._refine_request(raw_outline, map_reduce)),
+                    "refine",
+                    queue
+                )
+                os.replace(temp_path, outline_path)
+                queue.put_nowait({
+                    "event": "stage_done",
+                    "data": {"stage": "refine", "length": len(final_outline), "outline_file_path": str(outline_path)}
+                })
+                await self._store_cached_outline(outline_key, final_outline, total_tokens, task_id)
+
+            processing_time = time.time() - start_time
+            result = OutlineGenerateResponse(
+                task_id=task_id,
+                status=TaskStatus.COMPLETED,
+                message="大纲生成成功",
+                course_id=course_id,
+                course_material_id=course_material_id,
+                material_name=material_name,
+                outline_content=final_outline,
+                outline_file_path=str(outline_path),
+                processing_time=processing_time,
+                token_usage=total_tokens,
+                completed_at=time.time()
+            )
+            logger.info(f"流式大纲生成完成 - 任务ID: {task_id}, 总耗时: {processing_time:.2f}秒")
+            queue.put_nowait({"event": "done", "data": result.model_dump(mode="json")})
+
+        except Exception as e:
+            processing_time = time.time() - start_time
+            logger.error(f"流式大纲生成失败 - 任务ID: {task_id}, 耗时: {processing_time:.2f}秒, 错误: {str(e)}")
+            temp_path.unlink(missing_ok=True)
+
+            result = OutlineGenerateResponse(
+                task_id=task_id,
+                status=TaskStatus.FAILED,
+                message=f"大纲生成失败: {str(e)}",
+                course_id=course_id,
+                course_material_id=course_material_id,
+                material_name=material_name,
+                # 精简失败时原始大纲已完整写入文件
+                outline_content=raw_outline,
+                outline_file_path=str(outline_path) if raw_outline is not None else None,
+                processing_time=processing_time,
+                token_usage=total_tokens
+            )
+            queue.put_nowait({"event": "error", "data": {"task_id": task_id, "message": result.message}})
+
+        finally:
+            queue.put_nowait(None)
+
+        if on_complete is not None:
+            try:
+                outcome = on_complete(result)
+                if inspect.isawaitable(outcome):
+                    await outcome
+            except Exception as e:
+                logger.error(f"流式大纲生成完成回调失败 - 任务ID: {task_id}, 错误: {str(e)}")
 
 
 # 全局服务实例
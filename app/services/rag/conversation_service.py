@@ -3,21 +3,29 @@
 负责对话内存管理、聊天引擎工厂、智能聊天处理
 """
 import time
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
 from pathlib import Path
 from loguru import logger
 
 # LlamaIndex imports
 from llama_index.core import Settings, VectorStoreIndex, PromptTemplate
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.base.llms.generic_utils import messages_to_history_str
 from llama_index.core.memory import ChatSummaryMemoryBuffer
-from llama_index.core.chat_engine import SimpleChatEngine
+from llama_index.core.chat_engine import SimpleChatEngine, CondensePlusContextChatEngine
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
 from llama_index.core.vector_stores import MetadataFilter, MetadataFilters, FilterOperator
 from llama_index.storage.chat_store.redis import RedisChatStore
 from llama_index.vector_stores.qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
 
 from app.core.config import Settings as AppSettings
+from app.core.client_registry import get_client_registry
+from app.repositories.qdrant_profiles import get_collection_profile
 from app.services.rag.rag_settings import RAGConfigManager
+from app.services.rag.semantic_cache import SemanticCache, SemanticCacheLookup
+from app.services.rag.embedding_cache import EmbeddingCache
+from app.utils.singleflight import make_key
 from app.schemas.rag import (
     ChatRequest, ChatResponse, ChatEngineType, SourceInfo
 )
@@ -35,6 +43,18 @@ class ConversationMemoryManager:
         """
         self.rag_config_manager = rag_config_manager
         self._load_prompts()
+        self.chat_store = self._create_chat_store()
+    
+    def _create_chat_store(self) -> RedisChatStore:
+        """创建基于共享Redis连接池的聊天存储"""
+        redis_config = self.rag_config_manager.get_redis_config()
+        redis_client, aredis_client = get_client_registry().redis.client
+        return RedisChatStore(
+            redis_url=redis_config["redis_url"],
+            redis_client=redis_client,
+            aredis_client=aredis_client,
+            ttl=redis_config["ttl"]
+        )
     
     def _load_prompts(self):
         """加载提示词模板"""
@@ -62,15 +82,6 @@ class ConversationMemoryManager:
             聊天摘要内存缓冲区
         """
         try:
-            # 获取Redis配置
-            redis_config = self.rag_config_manager.get_redis_config()
-            
-            # 创建Redis聊天存储
-            chat_store = RedisChatStore(
-                redis_url=redis_config["redis_url"], 
-                ttl=redis_config["ttl"]
-            )
-            
             # 获取对话配置
             conversation_config = self.rag_config_manager.get_conversation_config()
             
@@ -78,7 +89,7 @@ class ConversationMemoryManager:
             memory = ChatSummaryMemoryBuffer.from_defaults(
                 token_limit=conversation_config["token_limit"],
                 llm=Settings.llm,
-                chat_store=chat_store,
+                chat_store=self.chat_store,
                 chat_store_key=conversation_id,
                 summarize_prompt=self.summary_prompt
             )
@@ -89,7 +100,37 @@ class ConversationMemoryManager:
             logger.error(f"创建聊天存储和内存失败: {e}")
             raise
     
-    def clear_conversation(self, conversation_id: str) -> bool:
+    async def has_history(self, conversation_id: str) -> bool:
+        """
+        判断对话是否已有历史消息
+        
+        Args:
+            conversation_id: 对话ID
+            
+        Returns:
+            是否已有历史消息
+        """
+        messages = await self.chat_store.aget_messages(conversation_id)
+        return bool(messages)
+    
+    async def append_exchange(
+        self,
+        memory: ChatSummaryMemoryBuffer,
+        question: str,
+        answer: str
+    ) -> None:
+        """
+        将一轮问答写入对话内存（用于未经过聊天引擎的回答，如语义缓存命中）
+        
+        Args:
+            memory: 对话内存
+            question: 用户问题
+            answer: 回答
+        """
+        await memory.aput(ChatMessage(role=MessageRole.USER, content=question))
+        await memory.aput(ChatMessage(role=MessageRole.ASSISTANT, content=answer))
+    
+    async def clear_conversation(self, conversation_id: str) -> bool:
         """
         清除指定对话的内存
         
@@ -100,17 +141,8 @@ class ConversationMemoryManager:
             清除是否成功
         """
         try:
-            # 获取Redis配置
-            redis_config = self.rag_config_manager.get_redis_config()
-            
-            # 创建Redis聊天存储
-            chat_store = RedisChatStore(
-                redis_url=redis_config["redis_url"], 
-                ttl=redis_config["ttl"]
-            )
-            
             # 删除对话记录
-            chat_store.delete_messages(conversation_id)
+            await self.chat_store.adelete_messages(conversation_id)
             
             logger.info(f"对话内存清除成功 - 对话ID: {conversation_id}")
             return True
@@ -119,6 +151,28 @@ class ConversationMemoryManager:
             return False
 
 
+class CondensedQueryRetriever(BaseRetriever):
+    """固定检索问题的检索器：问题已在引擎外压缩时，用压缩后的问题检索，对话内存仍记录用户的原始问题"""
+
+    def __init__(self, retriever: BaseRetriever, query: str):
+        """
+        初始化检索器
+
+        Args:
+            retriever: 实际执行检索的检索器
+            query: 压缩后的独立问题
+        """
+        super().__init__()
+        self._retriever = retriever
+        self._query = query
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self._retriever.retrieve(self._query)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return await self._retriever.aretrieve(self._query)
+
+
 class ChatEngineFactory:
     """聊天引擎工厂"""
     
@@ -133,31 +187,31 @@ class ChatEngineFactory:
         self.app_settings = app_settings
         self.rag_config_manager = rag_config_manager
         self.index = None
+        self.search_params = None
         self._setup_vector_index()
         self._load_prompts()
     
     def _setup_vector_index(self):
         """设置向量索引 - 连接到现有的Qdrant"""
         try:
-            # 获取Qdrant配置
-            qdrant_config = self.rag_config_manager.get_qdrant_config()
-            
-            # 连接到Qdrant
-            qdrant_client = QdrantClient(
-                host=qdrant_config["host"],
-                port=qdrant_config["port"],
-                prefer_grpc=qdrant_config["prefer_grpc"],
-                timeout=qdrant_config["timeout"]
-            )
+            # 使用共享的Qdrant客户端（异步检索走aclient，避免阻塞事件循环）
+            qdrant_client, qdrant_aclient = get_client_registry().qdrant_index_clients
             
             # 从已有集合创建向量存储
             collection_name = self.app_settings.qdrant_collection_name
-            vector_store = QdrantVectorStore(collection_name=collection_name, client=qdrant_client)
+            vector_store = QdrantVectorStore(
+                collection_name=collection_name,
+                client=qdrant_client,
+                aclient=qdrant_aclient
+            )
             
             # 从Qdrant向量存储创建index
             self.index = VectorStoreIndex.from_vector_store(vector_store)
+
+            # 检索时使用集合调优配置的检索参数（量化集合的过采样与重打分）
+            self.search_params = get_collection_profile(self.app_settings, collection_name).search_params()
             
-            logger.info(f"向量索引加载完成，集合: {collection_name}")
+            logger.info(f"向量索引加载完成，集合: {collection_name}, 检索参数: {self.search_params}")
         except Exception as e:
             logger.error(f"向量索引设置失败: {e}")
             raise
@@ -201,7 +255,8 @@ class ChatEngineFactory:
         self, 
         engine_type: ChatEngineType, 
         memory: ChatSummaryMemoryBuffer,
-        filters: Optional[MetadataFilters] = None
+        filters: Optional[MetadataFilters] = None,
+        condensed_question: Optional[str] = None
     ):
         """
         创建聊天引擎
@@ -210,50 +265,79 @@ class ChatEngineFactory:
             engine_type: 引擎类型
             memory: 对话内存
             filters: 元数据过滤器
+            condensed_question: 问题已在引擎外压缩时传入压缩后的问题，引擎跳过压缩步骤并用它检索，
+                生成与对话内存仍使用用户的原始问题
             
         Returns:
             聊天引擎实例
         """
         try:
             if engine_type == ChatEngineType.CONDENSE_PLUS_CONTEXT:
-                return self._create_condense_plus_context_engine(memory, filters)
+                return self._create_condense_plus_context_engine(memory, filters, condensed_question)
             else:
                 return self._create_simple_engine(memory)
         except Exception as e:
             logger.error(f"创建聊天引擎失败: {e}")
             raise
     
+    async def condense_question(self, memory: ChatSummaryMemoryBuffer, question: str) -> str:
+        """
+        结合聊天历史将问题压缩为独立问题，与condense_plus_context引擎的压缩步骤一致
+        
+        Args:
+            memory: 对话内存
+            question: 用户问题
+            
+        Returns:
+            独立问题，无聊天历史时返回原问题
+        """
+        chat_history = await memory.aget(input=question)
+        if not chat_history:
+            return question
+        
+        return await Settings.llm.apredict(
+            self.condense_prompt,
+            question=question,
+            chat_history=messages_to_history_str(chat_history)
+        )
+    
     def _create_condense_plus_context_engine(
         self,
         memory: ChatSummaryMemoryBuffer,
-        filters: Optional[MetadataFilters] = None
+        filters: Optional[MetadataFilters] = None,
+        condensed_question: Optional[str] = None
     ):
         """创建condense_plus_context聊天引擎"""
         try:
             # 获取对话配置
             conversation_config = self.rag_config_manager.get_conversation_config()
 
-            # 创建condense_plus_context聊天引擎，直接传递过滤器参数
+            # 检索器参数：检索参数经 vector_store_kwargs 传给 QdrantVectorStore 的查询
+            retriever_kwargs: Dict[str, Any] = {
+                "similarity_top_k": conversation_config["similarity_top_k"]
+            }
+            if self.search_params is not None:
+                retriever_kwargs["vector_store_kwargs"] = {"search_params": self.search_params}
+            if filters:
+                retriever_kwargs["filters"] = filters  # 直接传递过滤器
+
+            retriever = self.index.as_retriever(**retriever_kwargs)
+            if condensed_question is not None:
+                retriever = CondensedQueryRetriever(retriever, condensed_question)
+
+            # 创建condense_plus_context聊天引擎
+            chat_engine = CondensePlusContextChatEngine.from_defaults(
+                retriever=retriever,
+                llm=Settings.llm,
+                memory=memory,
+                condense_prompt=self.condense_prompt,
+                context_prompt=self.context_prompt,
+                skip_condense=condensed_question is not None,
+                verbose=True
+            )
             if filters:
-                chat_engine = self.index.as_chat_engine(
-                    chat_mode="condense_plus_context",
-                    condense_prompt=self.condense_prompt,
-                    context_prompt=self.context_prompt,
-                    memory=memory,
-                    verbose=True,
-                    similarity_top_k=conversation_config["similarity_top_k"],
-                    filters=filters  # 直接传递过滤器
-                )
                 logger.info(f"condense_plus_context聊天引擎创建成功，使用过滤器: {filters}")
             else:
-                chat_engine = self.index.as_chat_engine(
-                    chat_mode="condense_plus_context",
-                    condense_prompt=self.condense_prompt,
-                    context_prompt=self.context_prompt,
-                    memory=memory,
-                    verbose=True,
-                    similarity_top_k=conversation_config["similarity_top_k"]
-                )
                 logger.info("condense_plus_context聊天引擎创建成功，无过滤器")
 
             return chat_engine
@@ -300,6 +384,34 @@ class ConversationService:
         # 初始化组件
         self.memory_manager = ConversationMemoryManager(rag_config_manager)
         self.engine_factory = ChatEngineFactory(app_settings, rag_config_manager)
+        self.semantic_cache = get_client_registry().get_semantic_cache()
+        self.singleflight = get_client_registry().get_singleflight("chat")
+    
+    async def _lookup_semantic_cache(
+        self,
+        request: ChatRequest,
+        memory: ChatSummaryMemoryBuffer
+    ) -> Tuple[str, bool, Optional[SemanticCacheLookup]]:
+        """
+        压缩问题并查询语义回答缓存（仅condense_plus_context模式）
+
+        Args:
+            request: 聊天请求
+            memory: 对话内存
+
+        Returns:
+            Tuple[用于检索的问题, 问题是否已压缩, 缓存查询结果]
+        """
+        if (request.chat_engine_type != ChatEngineType.CONDENSE_PLUS_CONTEXT
+                or not self.semantic_cache.enabled):
+            return request.question, False, None
+
+        question = await self.engine_factory.condense_question(memory, request.question)
+        embedding = await Settings.embed_model.aget_query_embedding(question)
+        lookup = await self.semantic_cache.lookup(
+            request.course_id, request.course_material_id, question, embedding
+        )
+        return question, True, lookup
     
     def _create_filters(self, course_id: Optional[str], course_material_id: Optional[str]) -> Optional[MetadataFilters]:
         """创建动态过滤器"""
@@ -370,20 +482,24 @@ class ConversationService:
             # 生成过滤信息描述
             filter_info = self._get_filter_info(request.course_id, request.course_material_id)
 
-            # 创建聊天引擎
-            chat_engine = self.engine_factory.create_engine(
-                request.chat_engine_type, memory, filters
-            )
-
-            # 执行聊天
-            if request.chat_engine_type == ChatEngineType.CONDENSE_PLUS_CONTEXT:
-                response = await self._chat_with_condense_plus_context(
-                    request.question, chat_engine, filters
-                )
+            # 无历史的相同问题合并执行，跟随者将共享的回答写入各自的对话内存
+            if await self.memory_manager.has_history(request.conversation_id):
+                response = await self._answer(request, memory, filters)
             else:
-                response = await self._chat_with_simple_engine(
-                    request.question, chat_engine
+                response, shared = await self.singleflight.do(
+                    self._coalesce_key(request),
+                    lambda: self._answer(request, memory, filters),
+                    encode=lambda result: {
+                        "answer": result["answer"],
+                        "sources": [source.model_dump() for source in result["sources"]]
+                    },
+                    decode=lambda data: {
+                        "answer": data["answer"],
+                        "sources": [SourceInfo(**source) for source in data["sources"]]
+                    }
                 )
+                if shared:
+                    await self.memory_manager.append_exchange(memory, request.question, response["answer"])
 
             processing_time = time.time() - start_time
 
@@ -415,6 +531,64 @@ class ConversationService:
                 processing_time=processing_time
             )
 
+    @staticmethod
+    def _coalesce_key(request: ChatRequest) -> str:
+        """生成请求合并键：引擎类型、生效的过滤条件与规范化后的问题"""
+        scope = None
+        if request.chat_engine_type == ChatEngineType.CONDENSE_PLUS_CONTEXT:
+            scope = SemanticCache.get_scope(request.course_id, request.course_material_id)
+        question = EmbeddingCache.normalize_text(request.question).casefold()
+        return make_key(request.chat_engine_type.value, scope, question)
+
+    async def _answer(
+        self,
+        request: ChatRequest,
+        memory: ChatSummaryMemoryBuffer,
+        filters: Optional[MetadataFilters]
+    ) -> Dict[str, Any]:
+        """
+        生成回答并写入对话内存（优先使用语义回答缓存）
+
+        Args:
+            request: 聊天请求
+            memory: 对话内存
+            filters: 元数据过滤器
+
+        Returns:
+            包含 answer 与 sources 的字典
+        """
+        # 查询语义回答缓存，命中时直接使用缓存的回答和来源
+        question, condensed, cache_lookup = await self._lookup_semantic_cache(request, memory)
+        if cache_lookup is not None and cache_lookup.hit:
+            await self.memory_manager.append_exchange(memory, request.question, cache_lookup.answer)
+            return {
+                "answer": cache_lookup.answer,
+                "sources": [SourceInfo(**source) for source in cache_lookup.sources]
+            }
+
+        # 创建聊天引擎
+        chat_engine = self.engine_factory.create_engine(
+            request.chat_engine_type, memory, filters, condensed_question=question if condensed else None
+        )
+
+        # 执行聊天，压缩后的问题只用于检索，对话内存记录用户的原始问题
+        if request.chat_engine_type == ChatEngineType.CONDENSE_PLUS_CONTEXT:
+            generation_start = time.time()
+            response = await self._chat_with_condense_plus_context(
+                request.question, chat_engine, filters
+            )
+            if response["sources"]:
+                await self.semantic_cache.store(
+                    cache_lookup,
+                    question,
+                    response["answer"],
+                    [source.model_dump() for source in response["sources"]],
+                    time.time() - generation_start
+                )
+            return response
+
+        return await self._chat_with_simple_engine(request.question, chat_engine)
+
     def _get_filter_info(self, course_id: Optional[str], course_material_id: Optional[str]) -> str:
         """获取过滤条件信息描述"""
         if course_id and course_material_id:
@@ -429,31 +603,12 @@ class ConversationService:
     async def _chat_with_condense_plus_context(self, question: str, chat_engine, filters=None) -> dict:
         """使用condense_plus_context模式进行聊天"""
         try:
-            # 执行聊天
-            response = chat_engine.chat(question)
+            # 异步执行问题压缩、检索、生成与内存写入，不阻塞事件循环
+            response = await chat_engine.achat(question)
 
             # 提取来源信息
-            sources = []
-            if hasattr(response, 'source_nodes') and response.source_nodes:
-                for source_node in response.source_nodes:
-                    metadata = source_node.node.metadata
-                    content = source_node.node.get_content().strip()
-
-                    # 限制内容预览长度
-                    if len(content) > 200:
-                        content_preview = content[:200] + "..."
-                    else:
-                        content_preview = content
-
-                    score = getattr(source_node, 'score', 0.0)
-
-                    sources.append(SourceInfo(
-                        course_id=metadata.get("course_id", ""),
-                        course_material_id=metadata.get("course_material_id", ""),
-                        chunk_text=content_preview,
-                        score=score
-                    ))
-            else:
+            sources = self._extract_sources(response)
+            if not sources:
                 # 如果有过滤条件但没有检索到任何文档，返回特定错误信息
                 if filters is not None:
                     logger.warning("有过滤条件但未检索到匹配的文档")
@@ -471,11 +626,146 @@ class ConversationService:
             logger.error(f"condense_plus_context聊天失败: {e}")
             raise
 
+    @staticmethod
+    def _extract_sources(response) -> List[SourceInfo]:
+        """从聊天响应中提取来源信息"""
+        sources = []
+        for source_node in getattr(response, 'source_nodes', None) or []:
+            metadata = source_node.node.metadata
+            content = source_node.node.get_content().strip()
+
+            # 限制内容预览长度
+            if len(content) > 200:
+                content_preview = content[:200] + "..."
+            else:
+                content_preview = content
+
+            score = getattr(source_node, 'score', 0.0)
+
+            sources.append(SourceInfo(
+                course_id=metadata.get("course_id", ""),
+                course_material_id=metadata.get("course_material_id", ""),
+                chunk_text=content_preview,
+                score=score
+            ))
+        return sources
+
+    async def stream_chat(self, request: ChatRequest) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式处理聊天请求
+
+        依次产出事件：sources（检索来源，在生成开始前发送）、token（增量文本）、
+        done（完成信息）；出错时产出 error。回答在流结束后由聊天引擎写回Redis内存，
+        客户端中途断开时写回仍会在后台完成。
+
+        Args:
+            request: 聊天请求
+
+        Yields:
+            事件字典，包含 event 与 data
+        """
+        start_time = time.time()
+        filter_info = self._get_filter_info(request.course_id, request.course_material_id)
+
+        def done_event(answer: str, first_token_time: Optional[float] = None) -> Dict[str, Any]:
+            return {
+                "event": "done",
+                "data": {
+                    "answer": answer,
+                    "conversation_id": request.conversation_id,
+                    "chat_engine_type": request.chat_engine_type,
+                    "filter_info": filter_info,
+                    "first_token_time": first_token_time,
+                    "processing_time": time.time() - start_time
+                }
+            }
+
+        try:
+            logger.info(f"处理流式聊天请求 - 对话ID: {request.conversation_id}, 引擎类型: {request.chat_engine_type}")
+
+            filters = self._create_filters(request.course_id, request.course_material_id)
+
+            # 对于condense_plus_context模式，强制要求过滤条件
+            if request.chat_engine_type == ChatEngineType.CONDENSE_PLUS_CONTEXT and filters is None:
+                logger.warning("condense_plus_context模式必须提供过滤条件")
+                filter_info = "检索必须携带过滤条件，不支持无过滤条件检索"
+                yield {"event": "sources", "data": {"sources": [], "filter_info": filter_info}}
+                yield done_event(filter_info)
+                return
+
+            memory = self.memory_manager.create_memory(request.conversation_id)
+
+            # 查询语义回答缓存，命中时一次性发送缓存的回答
+            question, condensed, cache_lookup = await self._lookup_semantic_cache(request, memory)
+            if cache_lookup is not None and cache_lookup.hit:
+                await self.memory_manager.append_exchange(memory, request.question, cache_lookup.answer)
+                yield {"event": "sources", "data": {"sources": cache_lookup.sources, "filter_info": filter_info}}
+                yield {"event": "token", "data": {"delta": cache_lookup.answer}}
+                yield done_event(cache_lookup.answer, time.time() - start_time)
+                return
+
+            chat_engine = self.engine_factory.create_engine(
+                request.chat_engine_type, memory, filters, condensed_question=question if condensed else None
+            )
+
+            # 检索在此完成，随后开始流式生成；压缩后的问题只用于检索，对话内存记录用户的原始问题
+            generation_start = time.time()
+            response = await chat_engine.astream_chat(request.question)
+
+            sources = self._extract_sources(response)
+            if (request.chat_engine_type == ChatEngineType.CONDENSE_PLUS_CONTEXT
+                    and not sources and filters is not None):
+                logger.warning("有过滤条件但未检索到匹配的文档")
+                filter_info = "检索的课程和材料不在数据库中"
+                yield {"event": "sources", "data": {"sources": [], "filter_info": filter_info}}
+                yield done_event(filter_info)
+                return
+
+            source_dicts = [source.model_dump() for source in sources]
+            yield {
+                "event": "sources",
+                "data": {
+                    "sources": source_dicts,
+                    "filter_info": filter_info
+                }
+            }
+
+            answer_parts = []
+            first_token_time = None
+            async for token in response.async_response_gen():
+                if not token:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.time() - start_time
+                answer_parts.append(token)
+                yield {"event": "token", "data": {"delta": token}}
+
+            logger.info(
+                f"流式聊天完成 - 对话ID: {request.conversation_id}, "
+                f"首Token耗时: {first_token_time or 0:.2f}s, 总耗时: {time.time() - start_time:.2f}s"
+            )
+            answer = "".join(answer_parts)
+            if sources:
+                await self.semantic_cache.store(
+                    cache_lookup, question, answer, source_dicts, time.time() - generation_start
+                )
+            yield done_event(answer, first_token_time)
+
+        except Exception as e:
+            logger.error(f"流式聊天处理失败: {e}")
+            yield {
+                "event": "error",
+                "data": {
+                    "message": f"抱歉，处理您的问题时出现错误: {str(e)}",
+                    "conversation_id": request.conversation_id
+                }
+            }
+
     async def _chat_with_simple_engine(self, question: str, chat_engine) -> dict:
         """使用simple模式进行聊天"""
         try:
-            # 执行聊天
-            response = chat_engine.chat(question)
+            # 异步执行生成与内存写入，不阻塞事件循环
+            response = await chat_engine.achat(question)
 
             return {
                 "answer": str(response),
@@ -498,7 +788,7 @@ class ConversationService:
         """
         try:
             logger.info(f"清除对话 - 对话ID: {conversation_id}")
-            success = self.memory_manager.clear_conversation(conversation_id)
+            success = await self.memory_manager.clear_conversation(conversation_id)
             if success:
                 logger.info(f"对话清除成功 - 对话ID: {conversation_id}")
             else:
@@ -518,10 +808,16 @@ class ConversationService:
         try:
             rag_settings_summary = self.rag_config_manager.get_settings_summary()
 
+            embedding_cache = self.rag_config_manager.get_embedding_cache()
+
             return {
                 "service_name": "ConversationService",
                 "status": "healthy",
                 "rag_config": rag_settings_summary,
+                "embedding_cache": (
+                    {"enabled": True, **embedding_cache.get_stats()}
+                    if embedding_cache is not None else {"enabled": False}
+                ),
                 "components": {
                     "memory_manager": "ConversationMemoryManager",
                     "engine_factory": "ChatEngineFactory"
@@ -3,20 +3,23 @@
 负责文档索引建立和管理、向量存储操作、集合管理
 """
 import time
-import uuid
-from typing import List, Optional, Dict, Any
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from datetime import datetime
 from loguru import logger
 
 # LlamaIndex imports
-from llama_index.core import Document, Settings
+from llama_index.core import Document
 from qdrant_client.http.models import PointStruct
 
 from app.core.config import Settings as AppSettings
-from app.repositories.rag_repository import QdrantRepository
+from app.core.client_registry import get_client_registry
 from app.services.rag.rag_settings import RAGConfigManager
+from app.services.rag.embedding_pipeline import EmbeddingPipeline, ProgressCallback, maybe_await
+from app.repositories.qdrant_profiles import chunk_point_id
 from app.schemas.rag import (
-    IndexRequest, IndexResponse, CollectionInfo
+    IndexRequest, IndexResponse, IndexCheckpoint, CollectionInfo
 )
 
 
@@ -33,18 +36,35 @@ class DocumentIndexingService:
         """
         self.app_settings = app_settings
         self.rag_config_manager = rag_config_manager
-        self.qdrant_repo = QdrantRepository(app_settings)
+        self.qdrant_repo = get_client_registry().get_qdrant_repository()
+        self.semantic_cache = get_client_registry().get_semantic_cache()
         
         # 确保RAG配置已初始化
         if not rag_config_manager.rag_settings:
             rag_config_manager.initialize(app_settings)
+        
+        # 初始化嵌入流水线
+        self.embedding_pipeline = EmbeddingPipeline(rag_config_manager)
+        self.upsert_batch_size = max(1, rag_config_manager.get_embedding_config()["upsert_batch_size"])
     
-    async def build_index(self, request: IndexRequest) -> IndexResponse:
+    async def build_index(
+        self,
+        request: IndexRequest,
+        progress_callback: Optional[ProgressCallback] = None,
+        checkpoint: Optional[IndexCheckpoint] = None,
+        on_checkpoint: Optional[Callable[[IndexCheckpoint], Awaitable[None]]] = None
+    ) -> IndexResponse:
         """
         建立文档索引
         
+        文本块按 upsert_batch_size 分段嵌入并写入，每段写入成功后更新断点；
+        传入的断点与本次索引匹配时跳过已写入的分段，从第一个未写入的分段继续
+        
         Args:
             request: 索引建立请求
+            progress_callback: 每个嵌入批次完成后调用的进度回调
+            checkpoint: 上次执行保存的索引断点
+            on_checkpoint: 每段写入成功后调用，用于持久化断点
             
         Returns:
             索引建立响应
@@ -58,52 +78,74 @@ class DocumentIndexingService:
             logger.info(f"开始建立文档索引 - 集合: {collection_name}")
             
             # 确保集合存在
-            self.qdrant_repo.create_collection(collection_name)
-            
-            # 创建文档对象
-            document = Document(
-                text=request.file_content,
-                metadata={
-                    "course_id": request.metadata.course_id,
-                    "course_material_id": request.metadata.course_material_id,
-                    "file_path": request.metadata.file_path,
-                    "file_size": request.metadata.file_size,
-                    "upload_time": request.metadata.upload_time or datetime.now().isoformat()
-                }
-            )
+            await self.qdrant_repo.create_collection(collection_name)
             
             # 文本分块
-            text_splitter = self.rag_config_manager.get_text_splitter()
-            nodes = text_splitter.get_nodes_from_documents([document])
+            nodes = await self.split_document(request)
             logger.info(f"文档分块完成，生成 {len(nodes)} 个文本块")
             
-            # 生成向量并存储到Qdrant
-            points = []
-            for i, node in enumerate(nodes):
-                # 生成嵌入向量
-                embedding = Settings.embed_model.get_text_embedding(node.text)
-                
-                # 创建向量点
-                point = PointStruct(
-                    id=str(uuid.uuid4()),
-                    vector=embedding,
-                    payload={
-                        "text": node.text,
-                        "course_id": request.metadata.course_id,
-                        "course_material_id": request.metadata.course_material_id,
-                        "file_path": request.metadata.file_path,
-                        "chunk_index": i,
-                        "created_at": datetime.now().isoformat()
-                    }
+            # 断点只在文档、分块结果、嵌入模型与集合均未变化时有效
+            content_hash = self.compute_content_hash(request.file_content)
+            embed_model = self.embedding_pipeline.embed_model.model_name
+            if checkpoint is None or not checkpoint.matches(collection_name, content_hash, embed_model, len(nodes)):
+                checkpoint = IndexCheckpoint(
+                    collection_name=collection_name,
+                    content_hash=content_hash,
+                    embed_model=embed_model,
+                    chunk_count=len(nodes)
                 )
-                points.append(point)
             
-            # 批量插入向量点
-            success = self.qdrant_repo.upsert_points(collection_name, points)
+            segments = [
+                (begin, min(begin + self.upsert_batch_size, len(nodes)))
+                for begin in range(0, len(nodes), self.upsert_batch_size)
+            ]
+            pending_segments = [(begin, end) for begin, end in segments if not checkpoint.covers(begin, end)]
+            resumed_count = len(nodes) - sum(end - begin for begin, end in pending_segments)
+            if resumed_count:
+                logger.info(f"从断点继续建立索引 - 已写入: {resumed_count}, 待写入: {len(nodes) - resumed_count}")
+            
+            # 跳过的文本块计入进度
+            finished = resumed_count
+            if progress_callback is not None and finished:
+                await maybe_await(progress_callback(finished, len(nodes)))
+            
+            success = True
+            for begin, end in pending_segments:
+                segment_callback = None
+                if progress_callback is not None:
+                    offset = finished
+                    segment_callback = lambda completed, _total, offset=offset: progress_callback(
+                        offset + completed, len(nodes)
+                    )
+                
+                # 分批并发生成嵌入向量
+                embeddings = await self.embedding_pipeline.embed_texts(
+                    [node.text for node in nodes[begin:end]], progress_callback=segment_callback
+                )
+                
+                # 创建向量点并存储到Qdrant
+                points = [
+                    self.build_point(collection_name, node.text, i, embedding, request)
+                    for i, (node, embedding) in enumerate(zip(nodes[begin:end], embeddings), start=begin)
+                ]
+                
+                # 批量插入向量点
+                if not await self.qdrant_repo.upsert_points(collection_name, points):
+                    success = False
+                    break
+                
+                finished += end - begin
+                checkpoint.add(begin, end)
+                if on_checkpoint is not None:
+                    await on_checkpoint(checkpoint)
             
             processing_time = time.time() - start_time
             
             if success:
+                # 材料内容变化，使相关语义缓存失效
+                await self.semantic_cache.invalidate(
+                    request.metadata.course_id, request.metadata.course_material_id
+                )
                 logger.info(f"文档索引建立成功 - 集合: {collection_name}, 耗时: {processing_time:.2f}s")
                 return IndexResponse(
                     success=True,
@@ -111,10 +153,11 @@ class DocumentIndexingService:
                     document_count=1,
                     chunk_count=len(nodes),
                     processing_time=processing_time,
-                    collection_name=collection_name
+                    collection_name=collection_name,
+                    resumed_count=resumed_count or None
                 )
             else:
-                logger.error(f"文档索引建立失败 - 集合: {collection_name}")
+                logger.error(f"文档索引建立失败 - 集合: {collection_name}, 已写入: {checkpoint.indexed_count}/{len(nodes)}")
                 return IndexResponse(
                     success=False,
                     message="索引建立失败",
@@ -136,7 +179,251 @@ class DocumentIndexingService:
                 collection_name=request.collection_name or self.app_settings.qdrant_collection_name
             )
     
-    def get_collections(self) -> List[CollectionInfo]:
+    async def update_index(
+        self,
+        request: IndexRequest,
+        progress_callback: Optional[ProgressCallback] = None
+    ) -> IndexResponse:
+        """
+        增量更新文档索引
+
+        重新分块后按内容哈希与集合中已有的文本块比对，
+        只嵌入并写入新增的文本块，只删除已消失的文本块，
+        内容未变但位置变化的文本块复用原向量，按新位置重新生成点ID。
+
+        Args:
+            request: 索引建立请求
+            progress_callback: 每个嵌入批次完成后调用的进度回调（只统计需要嵌入的文本块）
+
+        Returns:
+            索引建立响应（包含新增、删除、保留的文本块数量）
+        """
+        start_time = time.time()
+        collection_name = request.collection_name or self.app_settings.qdrant_collection_name
+        
+        try:
+            logger.info(
+                f"开始增量更新文档索引 - 集合: {collection_name}, "
+                f"材料ID: {request.metadata.course_material_id}"
+            )
+            
+            # 确保集合存在
+            await self.qdrant_repo.create_collection(collection_name)
+            
+            # 重新分块并计算内容哈希
+            nodes = await self.split_document(request)
+            new_hashes = [self.compute_content_hash(node.text) for node in nodes]
+            
+            # 查询该材料已有的文本块
+            existing_points = await self.qdrant_repo.scroll_points(
+                collection_name,
+                self._material_filter(request.metadata.course_id, request.metadata.course_material_id),
+                with_payload=["content_hash", "chunk_index", "text"]
+            )
+            
+            # 按内容哈希分组已有文本块（兼容未记录content_hash的旧数据）
+            existing_by_hash: Dict[str, List[Any]] = {}
+            for point in existing_points:
+                payload = point.payload or {}
+                content_hash = payload.get("content_hash") or self.compute_content_hash(payload.get("text", ""))
+                existing_by_hash.setdefault(content_hash, []).append(point)
+            
+            # 比对：哈希相同的文本块保留，点ID与新位置不符时需重建；其余为新增
+            matches, added_indices = self._match_chunks(new_hashes, existing_by_hash)
+            unchanged_count = len(matches)
+            rekey_points: Dict[int, Any] = {
+                i: point for i, point in matches.items()
+                if str(point.id) != self._chunk_point_id(collection_name, request, i, new_hashes[i])
+            }
+            
+            # 未被匹配的已有文本块即为已消失的文本块
+            removed_ids = [point.id for points in existing_by_hash.values() for point in points]
+            
+            logger.info(
+                f"文本块比对完成 - 新增: {len(added_indices)}, 删除: {len(removed_ids)}, "
+                f"保留: {unchanged_count}, 需重建ID: {len(rekey_points)}"
+            )
+            
+            points: List[PointStruct] = []
+            
+            # 位置变化的文本块复用原向量
+            if rekey_points:
+                records = await self.qdrant_repo.retrieve_points(
+                    collection_name,
+                    [point.id for point in rekey_points.values()],
+                    with_vectors=True
+                )
+                vectors = {str(record.id): record.vector for record in records}
+                for i, point in rekey_points.items():
+                    vector = vectors.get(str(point.id))
+                    if vector is None:
+                        # 原向量读取失败时按新增处理
+                        added_indices.append(i)
+                        continue
+                    points.append(self.build_point(collection_name, nodes[i].text, i, vector, request))
+            
+            # 只为新增文本块生成嵌入
+            if added_indices:
+                embeddings = await self.embedding_pipeline.embed_texts(
+                    [nodes[i].text for i in added_indices], progress_callback=progress_callback
+                )
+                points.extend(
+                    self.build_point(collection_name, nodes[i].text, i, embedding, request)
+                    for i, embedding in zip(added_indices, embeddings)
+                )
+            
+            if points and not await self.qdrant_repo.upsert_points(collection_name, points):
+                raise RuntimeError("文本块写入失败")
+            
+            # 已消失与被重建的文本块旧ID需要删除；确定性ID可能与本次写入的点相同，这些ID不能删除
+            written_ids = {str(point.id) for point in points}
+            stale_ids = [
+                point_id for point_id in removed_ids + [point.id for point in rekey_points.values()]
+                if str(point_id) not in written_ids
+            ]
+            
+            # 新内容写入后再删除旧文本块，避免检索出现空窗
+            if not await self.qdrant_repo.delete_points(collection_name, stale_ids):
+                raise RuntimeError("旧文本块删除失败")
+            
+            if added_indices or removed_ids:
+                await self.semantic_cache.invalidate(
+                    request.metadata.course_id, request.metadata.course_material_id
+                )
+            
+            processing_time = time.time() - start_time
+            logger.info(f"文档索引增量更新成功 - 集合: {collection_name}, 耗时: {processing_time:.2f}s")
+            
+            return IndexResponse(
+                success=True,
+                message="索引增量更新成功",
+                document_count=1,
+                chunk_count=len(nodes),
+                processing_time=processing_time,
+                collection_name=collection_name,
+                added_count=len(added_indices),
+                deleted_count=len(removed_ids),
+                unchanged_count=unchanged_count
+            )
+        
+        except Exception as e:
+            processing_time = time.time() - start_time
+            logger.error(f"索引增量更新异常: {e}")
+            return IndexResponse(
+                success=False,
+                message=f"索引增量更新失败: {str(e)}",
+                document_count=0,
+                chunk_count=0,
+                processing_time=processing_time,
+                collection_name=collection_name
+            )
+    
+    @staticmethod
+    def compute_content_hash(text: str) -> str:
+        """计算文本块内容哈希"""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _match_chunks(
+        new_hashes: List[str],
+        existing_by_hash: Dict[str, List[Any]]
+    ) -> Tuple[Dict[int, Any], List[int]]:
+        """
+        将新文本块与已有文本块按内容哈希配对
+
+        先配对内容哈希与位置都相同的文本块，剩余的新文本块再按内容哈希配对剩余的已有文本块，
+        重复的文本块不会抢占其他位置上完全匹配的已有文本块；配对成功的已有文本块从 existing_by_hash 中移除
+
+        Args:
+            new_hashes: 新文本块的内容哈希（按位置排列）
+            existing_by_hash: 按内容哈希分组的已有文本块
+
+        Returns:
+            Tuple[新位置到配对的已有文本块的映射, 需要新增的文本块位置]
+        """
+        matches: Dict[int, Any] = {}
+        for i, content_hash in enumerate(new_hashes):
+            candidates = existing_by_hash.get(content_hash) or []
+            match = next((p for p in candidates if (p.payload or {}).get("chunk_index") == i), None)
+            if match is not None:
+                candidates.remove(match)
+                matches[i] = match
+        
+        added_indices: List[int] = []
+        for i, content_hash in enumerate(new_hashes):
+            if i in matches:
+                continue
+            candidates = existing_by_hash.get(content_hash)
+            if candidates:
+                matches[i] = candidates.pop(0)
+            else:
+                added_indices.append(i)
+        return matches, added_indices
+    
+    @staticmethod
+    def _material_filter(course_id: str, course_material_id: str) -> Dict[str, Any]:
+        """构建课程材料过滤条件"""
+        return {
+            "must": [
+                {"key": "course_id", "match": {"value": course_id}},
+                {"key": "course_material_id", "match": {"value": course_material_id}}
+            ]
+        }
+    
+    async def split_document(self, request: IndexRequest) -> List[Any]:
+        """将请求中的文档内容分块"""
+        document = Document(
+            text=request.file_content,
+            metadata={
+                "course_id": request.metadata.course_id,
+                "course_material_id": request.metadata.course_material_id,
+                "file_path": request.metadata.file_path,
+                "file_size": request.metadata.file_size,
+                "upload_time": request.metadata.upload_time or datetime.now().isoformat()
+            }
+        )
+        
+        # CPU密集型操作，放到线程中执行避免阻塞事件循环
+        text_splitter = self.rag_config_manager.get_text_splitter()
+        return await asyncio.to_thread(text_splitter.get_nodes_from_documents, [document])
+    
+    @staticmethod
+    def _chunk_point_id(collection_name: str, request: IndexRequest, chunk_index: int, content_hash: str) -> str:
+        """生成文本块向量点ID（版本化物理集合按所属别名生成）"""
+        return chunk_point_id(
+            collection_name,
+            request.metadata.course_id,
+            request.metadata.course_material_id,
+            chunk_index,
+            content_hash
+        )
+    
+    def build_point(
+        self,
+        collection_name: str,
+        text: str,
+        chunk_index: int,
+        embedding: List[float],
+        request: IndexRequest
+    ) -> PointStruct:
+        """构建文本块对应的向量点，点ID由文本块身份确定性生成"""
+        content_hash = self.compute_content_hash(text)
+        point_id = self._chunk_point_id(collection_name, request, chunk_index, content_hash)
+        return PointStruct(
+            id=point_id,
+            vector=embedding,
+            payload={
+                "text": text,
+                "course_id": request.metadata.course_id,
+                "course_material_id": request.metadata.course_material_id,
+                "file_path": request.metadata.file_path,
+                "chunk_index": chunk_index,
+                "content_hash": content_hash,
+                "created_at": datetime.now().isoformat()
+            }
+        )
+    
+    async def get_collections(self) -> List[CollectionInfo]:
         """
         获取所有集合信息
 
@@ -145,14 +432,14 @@ class DocumentIndexingService:
         """
         try:
             logger.info("获取集合列表")
-            collections = self.qdrant_repo.get_collections()
+            collections = await self.qdrant_repo.get_collections()
             logger.info(f"获取到 {len(collections)} 个集合")
             return collections
         except Exception as e:
             logger.error(f"获取集合列表失败: {e}")
             return []
     
-    def get_collection_info(self, collection_name: str) -> Optional[CollectionInfo]:
+    async def get_collection_info(self, collection_name: str) -> Optional[CollectionInfo]:
         """
         获取指定集合的详细信息
 
@@ -164,7 +451,7 @@ class DocumentIndexingService:
         """
         try:
             logger.info(f"获取集合信息 - 集合: {collection_name}")
-            collection_info = self.qdrant_repo.get_collection_info(collection_name)
+            collection_info = await self.qdrant_repo.get_collection_info(collection_name)
             if collection_info:
                 logger.info(f"集合信息获取成功 - 向量数量: {collection_info.vectors_count}")
             else:
@@ -174,7 +461,7 @@ class DocumentIndexingService:
             logger.error(f"获取集合信息失败: {e}")
             return None
     
-    def delete_collection(self, collection_name: str) -> bool:
+    async def delete_collection(self, collection_name: str) -> bool:
         """
         删除指定集合
 
@@ -186,8 +473,9 @@ class DocumentIndexingService:
         """
         try:
             logger.info(f"删除集合 - 集合: {collection_name}")
-            success = self.qdrant_repo.delete_collection(collection_name)
+            success = await self.qdrant_repo.delete_collection(collection_name)
             if success:
+                await self.semantic_cache.invalidate()
                 logger.info(f"集合删除成功: {collection_name}")
             else:
                 logger.error(f"集合删除失败: {collection_name}")
@@ -196,7 +484,7 @@ class DocumentIndexingService:
             logger.error(f"删除集合异常: {e}")
             return False
     
-    def count_documents(self, collection_name: str) -> int:
+    async def count_documents(self, collection_name: str) -> int:
         """
         统计集合中的文档数量
 
@@ -208,14 +496,14 @@ class DocumentIndexingService:
         """
         try:
             logger.info(f"统计文档数量 - 集合: {collection_name}")
-            count = self.qdrant_repo.count_points(collection_name)
+            count = await self.qdrant_repo.count_points(collection_name)
             logger.info(f"文档数量统计完成 - 集合: {collection_name}, 数量: {count}")
             return count
         except Exception as e:
             logger.error(f"统计文档数量失败: {e}")
             return 0
     
-    def delete_documents_by_course(
+    async def delete_documents_by_course(
         self,
         course_id: str,
         collection_name: Optional[str] = None
@@ -229,32 +517,31 @@ class DocumentIndexingService:
 
         Returns:
             删除的文档数量
-        """
-        try:
-            if collection_name is None:
-                collection_name = self.app_settings.qdrant_collection_name
 
-            logger.info(f"删除课程文档 - 课程ID: {course_id}, 集合: {collection_name}")
+        Raises:
+            Exception: 向量删除失败，不以0条删除掩盖失败
+        """
+        if collection_name is None:
+            collection_name = self.app_settings.qdrant_collection_name
 
-            # 构建过滤条件
-            filter_condition = {
-                "must": [
-                    {"key": "course_id", "match": {"value": course_id}}
-                ]
-            }
+        logger.info(f"删除课程文档 - 课程ID: {course_id}, 集合: {collection_name}")
 
-            deleted_count = self.qdrant_repo.delete_vectors_by_filter(
-                filter_condition, collection_name
-            )
+        # 构建过滤条件
+        filter_condition = {
+            "must": [
+                {"key": "course_id", "match": {"value": course_id}}
+            ]
+        }
 
-            logger.info(f"课程文档删除完成 - 课程ID: {course_id}, 删除数量: {deleted_count}")
-            return deleted_count
+        deleted_count = await self.qdrant_repo.delete_vectors_by_filter(
+            filter_condition, collection_name
+        )
 
-        except Exception as e:
-            logger.error(f"删除课程文档失败: {e}")
-            return 0
+        await self.semantic_cache.invalidate(course_id)
+        logger.info(f"课程文档删除完成 - 课程ID: {course_id}, 删除数量: {deleted_count}")
+        return deleted_count
     
-    def delete_documents_by_material(
+    async def delete_documents_by_material(
         self,
         course_id: str,
         course_material_id: str,
@@ -270,31 +557,37 @@ class DocumentIndexingService:
 
         Returns:
             删除的文档数量
+
+        Raises:
+            Exception: 向量删除失败，不以0条删除掩盖失败
         """
-        try:
-            if collection_name is None:
-                collection_name = self.app_settings.qdrant_collection_name
+        if collection_name is None:
+            collection_name = self.app_settings.qdrant_collection_name
 
-            logger.info(f"删除课程材料文档 - 课程ID: {course_id}, 材料ID: {course_material_id}, 集合: {collection_name}")
+        logger.info(f"删除课程材料文档 - 课程ID: {course_id}, 材料ID: {course_material_id}, 集合: {collection_name}")
 
-            # 构建过滤条件
-            filter_condition = {
-                "must": [
-                    {"key": "course_id", "match": {"value": course_id}},
-                    {"key": "course_material_id", "match": {"value": course_material_id}}
-                ]
-            }
+        # 构建过滤条件
+        filter_condition = self._material_filter(course_id, course_material_id)
 
-            deleted_count = self.qdrant_repo.delete_vectors_by_filter(
-                filter_condition, collection_name
-            )
+        deleted_count = await self.qdrant_repo.delete_vectors_by_filter(
+            filter_condition, collection_name
+        )
 
-            logger.info(f"课程材料文档删除完成 - 材料ID: {course_material_id}, 删除数量: {deleted_count}")
-            return deleted_count
+        await self.semantic_cache.invalidate(course_id, course_material_id)
+        logger.info(f"课程材料文档删除完成 - 材料ID: {course_material_id}, 删除数量: {deleted_count}")
+        return deleted_count
+    
+    def get_embedding_cache_stats(self) -> Dict[str, Any]:
+        """
+        获取嵌入缓存统计信息
 
-        except Exception as e:
-            logger.error(f"删除课程材料文档失败: {e}")
-            return 0
+        Returns:
+            缓存统计字典，未启用缓存时仅包含 enabled=False
+        """
+        cache = self.rag_config_manager.get_embedding_cache()
+        if cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **cache.get_stats()}
     
     def get_service_status(self) -> Dict[str, Any]:
         """
@@ -310,6 +603,7 @@ class DocumentIndexingService:
                 "service_name": "DocumentIndexingService",
                 "status": "healthy",
                 "rag_config": rag_settings_summary,
+                "embedding_cache": self.get_embedding_cache_stats(),
                 "qdrant_config": {
                     "url": self.app_settings.qdrant_url,
                     "grpc_port": self.app_settings.qdrant_grpc_port,
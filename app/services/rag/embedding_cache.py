@@ -0,0 +1,358 @@
+"""
+嵌入向量缓存
+基于SQLite的持久化内容寻址缓存，按 (嵌入模型, 文本哈希) 存储向量，超出容量时按LRU淘汰
+"""
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from loguru import logger
+from pydantic import PrivateAttr
+
+# LlamaIndex imports
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+from app.utils.tokens import count_tokens
+
+# SQLite 单条语句的参数数量上限较低，批量查询时分段执行
+_SQL_BATCH_SIZE = 500
+
+
+class EmbeddingCache:
+    """嵌入向量缓存类"""
+
+    def __init__(self, db_path: Path, max_bytes: int):
+        """
+        初始化嵌入向量缓存
+
+        Args:
+            db_path: SQLite数据库文件路径
+            max_bytes: 缓存向量数据的最大字节数
+        """
+        self.db_path = Path(db_path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size_bytes = 0
+
+        # 统计信息
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._evictions = 0
+        self._saved_tokens = 0
+        self._embedded_texts = 0
+        self._embedding_seconds = 0.0
+
+        self._conn = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接并初始化表结构"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        conn.commit()
+
+        row = conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        self._size_bytes = row[0]
+        logger.info(f"嵌入缓存已加载 - 路径: {self.db_path}, 大小: {self._size_bytes} 字节")
+        return conn
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """规范化文本：Unicode NFC 规范化并折叠空白字符"""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    @staticmethod
+    def cache_namespace(model_name: str, kind: str = "text") -> str:
+        """
+        生成缓存命名空间
+
+        查询向量与文本向量分开缓存，兼容两者使用不同嵌入方式的模型
+
+        Args:
+            model_name: 嵌入模型名称
+            kind: 向量类型，text 或 query
+
+        Returns:
+            缓存命名空间
+        """
+        return f"{model_name}:{kind}"
+
+    @classmethod
+    def make_key(cls, model: str, text: str) -> str:
+        """根据模型名称和规范化文本生成缓存键"""
+        digest = hashlib.sha256(cls.normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{model}:{digest}"
+
+    @staticmethod
+    def _encode_vector(vector: Sequence[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _decode_vector(blob: bytes) -> List[float]:
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        批量查询缓存
+
+        Args:
+            model: 嵌入模型名称
+            texts: 文本列表
+
+        Returns:
+            与输入顺序一致的向量列表，未命中的位置为None
+        """
+        if not texts:
+            return []
+
+        keys = [self.make_key(model, text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        now = time.time()
+
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), _SQL_BATCH_SIZE):
+                chunk = unique_keys[start:start + _SQL_BATCH_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = self._decode_vector(blob)
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            results = [found.get(key) for key in keys]
+            hit_count = sum(1 for result in results if result is not None)
+            self._hits += hit_count
+            self._misses += len(keys) - hit_count
+            self._saved_tokens += sum(
+                count_tokens(text) for text, result in zip(texts, results) if result is not None
+            )
+
+        return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]) -> None:
+        """
+        批量写入缓存
+
+        Args:
+            model: 嵌入模型名称
+            texts: 文本列表
+            embeddings: 与文本一一对应的向量列表
+        """
+        if not texts:
+            return
+
+        now = time.time()
+        rows = {}
+        for text, embedding in zip(texts, embeddings):
+            rows[self.make_key(model, text)] = (model, len(embedding), self._encode_vector(embedding))
+
+        with self._lock:
+            # 覆盖写入前扣除旧记录的大小
+            existing = 0
+            keys = list(rows)
+            for start in range(0, len(keys), _SQL_BATCH_SIZE):
+                chunk = keys[start:start + _SQL_BATCH_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                row = self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchone()
+                existing += row[0]
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, last_access) VALUES (?, ?, ?, ?, ?)",
+                [(key, model_name, dim, blob, now) for key, (model_name, dim, blob) in rows.items()]
+            )
+            self._conn.commit()
+
+            self._size_bytes += sum(len(blob) for _, _, blob in rows.values()) - existing
+            self._writes += len(rows)
+            self._evict_if_needed()
+
+    def _evict_if_needed(self) -> None:
+        """超出容量时按最近访问时间淘汰，腾出10%余量（需持有锁）"""
+        if self._size_bytes <= self.max_bytes:
+            return
+
+        target = int(self.max_bytes * 0.9)
+        while self._size_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_access LIMIT ?",
+                (_SQL_BATCH_SIZE,)
+            ).fetchall()
+            if not rows:
+                self._size_bytes = 0
+                break
+
+            evict_keys = []
+            for key, size in rows:
+                evict_keys.append(key)
+                self._size_bytes -= size
+                if self._size_bytes <= target:
+                    break
+
+            placeholders = ",".join("?" * len(evict_keys))
+            self._conn.execute(f"DELETE FROM embeddings WHERE key IN ({placeholders})", evict_keys)
+            self._conn.commit()
+            self._evictions += len(evict_keys)
+
+        logger.info(f"嵌入缓存淘汰完成 - 累计淘汰: {self._evictions}, 当前大小: {self._size_bytes} 字节")
+
+    async def aget_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """异步批量查询缓存"""
+        return await asyncio.to_thread(self.get_many, model, texts)
+
+    async def aput_many(self, model: str, texts: List[str], embeddings: List[List[float]]) -> None:
+        """异步批量写入缓存"""
+        await asyncio.to_thread(self.put_many, model, texts, embeddings)
+
+    def record_embedding_time(self, text_count: int, elapsed: float) -> None:
+        """记录未命中文本的实际嵌入耗时，用于估算缓存节省的时间"""
+        with self._lock:
+            self._embedded_texts += text_count
+            self._embedding_seconds += elapsed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self._hits + self._misses
+            avg_seconds = (
+                self._embedding_seconds / self._embedded_texts if self._embedded_texts else 0.0
+            )
+            return {
+                "path": str(self.db_path),
+                "entries": entries,
+                "size_bytes": self._size_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+                "writes": self._writes,
+                "evictions": self._evictions,
+                "saved_tokens": self._saved_tokens,
+                "estimated_seconds_saved": self._hits * avg_seconds
+            }
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._size_bytes = 0
+        logger.info("嵌入缓存已清空")
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """带缓存的嵌入模型包装器，在调用底层模型前查询嵌入缓存"""
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, cache: EmbeddingCache, **kwargs: Any):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            **kwargs
+        )
+        self._inner = inner
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        """底层嵌入模型"""
+        return self._inner
+
+    def _cache_model(self, kind: str) -> str:
+        return EmbeddingCache.cache_namespace(self._inner.model_name, kind)
+
+    def _embed_sync(self, texts: List[str], kind: str) -> List[List[float]]:
+        model = self._cache_model(kind)
+        results = self._cache.get_many(model, texts)
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            miss_texts = [texts[i] for i in misses]
+            start_time = time.time()
+            if kind == "query":
+                embeddings = [self._inner.get_query_embedding(text) for text in miss_texts]
+            else:
+                embeddings = self._inner.get_text_embedding_batch(miss_texts)
+            self._cache.record_embedding_time(len(miss_texts), time.time() - start_time)
+            self._cache.put_many(model, miss_texts, embeddings)
+            for i, embedding in zip(misses, embeddings):
+                results[i] = embedding
+        return results
+
+    async def _embed_async(self, texts: List[str], kind: str) -> List[List[float]]:
+        model = self._cache_model(kind)
+        results = await self._cache.aget_many(model, texts)
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            miss_texts = [texts[i] for i in misses]
+            start_time = time.time()
+            if kind == "query":
+                embeddings = [await self._inner.aget_query_embedding(text) for text in miss_texts]
+            else:
+                embeddings = await self._inner.aget_text_embedding_batch(miss_texts)
+            self._cache.record_embedding_time(len(miss_texts), time.time() - start_time)
+            await self._cache.aput_many(model, miss_texts, embeddings)
+            for i, embedding in zip(misses, embeddings):
+                results[i] = embedding
+        return results
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed_sync([query], "query")[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await self._embed_async([query], "query"))[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed_sync([text], "text")[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._embed_async([text], "text"))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_sync(texts, "text")
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self._embed_async(texts, "text")
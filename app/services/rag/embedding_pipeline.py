@@ -0,0 +1,230 @@
+"""
+嵌入流水线
+负责嵌入缓存查询、文本块分批、并发嵌入、按批次重试
+"""
+import asyncio
+import inspect
+import time
+from typing import Any, Awaitable, Callable, List, Optional, Union
+
+from loguru import logger
+
+# LlamaIndex imports
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+from app.services.rag.rag_settings import RAGConfigManager
+from app.services.rag.embedding_cache import EmbeddingCache, CachedEmbedding
+from app.utils.ratelimit import AsyncRateLimiter
+from app.utils.tokens import count_tokens
+
+# 进度回调：(已完成文本块数量, 文本块总数)
+ProgressCallback = Callable[[int, int], Union[None, Awaitable[None]]]
+
+
+class EmbeddingPipeline:
+    """嵌入流水线类"""
+
+    def __init__(
+        self,
+        rag_config_manager: RAGConfigManager,
+        embed_model: Optional[BaseEmbedding] = None,
+        use_cache: bool = True,
+        batch_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        rate_limiter: Optional[AsyncRateLimiter] = None
+    ):
+        """
+        初始化嵌入流水线
+
+        Args:
+            rag_config_manager: RAG配置管理器
+            embed_model: 嵌入模型，默认使用LlamaIndex全局配置的嵌入模型
+            use_cache: 是否查询和写入嵌入缓存
+            batch_size: 单次嵌入请求的最大文本块数量，默认使用RAG配置
+            concurrency: 并发执行的嵌入批次数量，默认使用RAG配置
+            rate_limiter: 嵌入请求限流器，每次请求（含重试）前获取令牌
+        """
+        self.rag_config_manager = rag_config_manager
+        self._embed_model = embed_model
+        self.use_cache = use_cache
+        self.rate_limiter = rate_limiter
+
+        embedding_config = rag_config_manager.get_embedding_config()
+        self.batch_size = max(1, batch_size or embedding_config["batch_size"])
+        self.batch_max_tokens = max(1, embedding_config["batch_max_tokens"])
+        self.concurrency = max(1, concurrency or embedding_config["concurrency"])
+        self.max_retries = max(0, embedding_config["max_retries"])
+        self.retry_backoff = embedding_config["retry_backoff"]
+
+        # 限制同时在途的嵌入请求数量
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        """获取嵌入模型"""
+        model = self._embed_model or Settings.embed_model
+        # 缓存由流水线统一处理，直接调用底层模型避免重复查询
+        if isinstance(model, CachedEmbedding):
+            return model.inner
+        return model
+
+    @property
+    def embedding_cache(self) -> Optional[EmbeddingCache]:
+        """获取嵌入缓存，未启用时返回None"""
+        if not self.use_cache:
+            return None
+        return self.rag_config_manager.get_embedding_cache()
+
+    def build_batches(self, texts: List[str]) -> List[List[int]]:
+        """
+        按数量和Token上限将文本分组
+
+        超过Token上限的单个文本单独成批
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            批次列表，每个批次为文本下标列表
+        """
+        batches: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = 0
+
+        for index, text in enumerate(texts):
+            tokens = count_tokens(text)
+            if current and (
+                len(current) >= self.batch_size
+                or current_tokens + tokens > self.batch_max_tokens
+            ):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(index)
+            current_tokens += tokens
+
+        if current:
+            batches.append(current)
+
+        return batches
+
+    async def embed_texts(
+        self,
+        texts: List[str],
+        progress_callback: Optional[ProgressCallback] = None
+    ) -> List[List[float]]:
+        """
+        批量生成文本嵌入向量
+
+        Args:
+            texts: 文本列表
+            progress_callback: 每个批次完成后调用的进度回调
+
+        Returns:
+            与输入顺序一致的嵌入向量列表
+        """
+        if not texts:
+            return []
+
+        start_time = time.time()
+        total = len(texts)
+
+        # 先查询嵌入缓存，只对未命中的文本发起请求
+        cache = self.embedding_cache
+        cache_model = EmbeddingCache.cache_namespace(self.embed_model.model_name)
+        if cache is not None:
+            results: List[Optional[List[float]]] = await cache.aget_many(cache_model, texts)
+        else:
+            results = [None] * total
+
+        pending = [i for i, result in enumerate(results) if result is None]
+        completed = total - len(pending)
+        if completed and progress_callback is not None:
+            await maybe_await(progress_callback(completed, total))
+        if not pending:
+            logger.info(f"嵌入向量全部命中缓存 - 文本块: {total}")
+            return results
+
+        batches = [
+            [pending[i] for i in batch]
+            for batch in self.build_batches([texts[i] for i in pending])
+        ]
+
+        logger.info(
+            f"开始生成嵌入向量 - 文本块: {total}, 缓存命中: {completed}, "
+            f"批次: {len(batches)}, 并发: {self.concurrency}"
+        )
+
+        async def run_batch(batch_no: int, indices: List[int]) -> None:
+            nonlocal completed
+            batch_texts = [texts[i] for i in indices]
+            batch_start = time.time()
+            embeddings = await self._embed_batch(batch_no, batch_texts)
+            for i, embedding in zip(indices, embeddings):
+                results[i] = embedding
+
+            if cache is not None:
+                cache.record_embedding_time(len(batch_texts), time.time() - batch_start)
+                await cache.aput_many(cache_model, batch_texts, embeddings)
+
+            completed += len(indices)
+            if progress_callback is not None:
+                await maybe_await(progress_callback(completed, total))
+
+        tasks = [
+            asyncio.create_task(run_batch(batch_no, indices))
+            for batch_no, indices in enumerate(batches)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # 任一批次最终失败时取消其余批次
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        logger.info(
+            f"嵌入向量生成完成 - 文本块: {total}, 批次: {len(batches)}, "
+            f"耗时: {time.time() - start_time:.2f}s"
+        )
+        return results
+
+    async def _embed_batch(self, batch_no: int, batch_texts: List[str]) -> List[List[float]]:
+        """执行单个批次的嵌入请求，失败时按指数退避重试"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    if self.rate_limiter is not None:
+                        await self.rate_limiter.acquire()
+                    embeddings = await self.embed_model.aget_text_embedding_batch(batch_texts)
+
+                if len(embeddings) != len(batch_texts):
+                    raise ValueError(
+                        f"嵌入结果数量不匹配: 期望 {len(batch_texts)}, 实际 {len(embeddings)}"
+                    )
+
+                logger.debug(f"嵌入批次完成 - 批次: {batch_no}, 文本块: {len(batch_texts)}")
+                return embeddings
+
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    logger.error(f"嵌入批次失败 - 批次: {batch_no}, 已重试 {attempt} 次, 错误: {e}")
+                    raise
+
+                delay = self.retry_backoff * (2 ** attempt)
+                logger.warning(
+                    f"嵌入批次失败，{delay:.1f}s 后重试 - 批次: {batch_no}, "
+                    f"第 {attempt + 1}/{self.max_retries} 次重试, 错误: {e}"
+                )
+                await asyncio.sleep(delay)
+
+        # 循环内必定返回或抛出异常
+        raise RuntimeError("嵌入批次重试逻辑异常")
+
+
+async def maybe_await(value: Any) -> None:
+    """等待可能为协程的回调返回值"""
+    if inspect.isawaitable(value):
+        await value
@@ -3,6 +3,7 @@ RAG配置管理器
 统一管理LlamaIndex全局配置，支持环境变量覆盖默认配置
 """
 import os
+from pathlib import Path
 from typing import Optional
 from loguru import logger
 from pydantic import Field
@@ -15,6 +16,8 @@ from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.core.node_parser import SentenceSplitter
 
 from app.core.config import Settings as AppSettings
+from app.constants.paths import RAG_DIR
+from app.services.rag.embedding_cache import EmbeddingCache, CachedEmbedding
 
 
 class RAGSettings(BaseSettings):
@@ -23,17 +26,35 @@ class RAGSettings(BaseSettings):
     # Redis 配置
     redis_url: str = Field(default="redis://localhost:6379", description="Redis连接URL")
     redis_ttl: int = Field(default=3600, description="Redis数据TTL（秒）")
+    redis_max_connections: int = Field(default=50, description="Redis连接池最大连接数")
     
     # 对话配置
     conversation_token_limit: int = Field(default=4000, description="对话内存Token限制")
     conversation_similarity_top_k: int = Field(default=6, description="对话检索Top-K")
     
+    # 语义回答缓存配置
+    semantic_cache_enabled: bool = Field(default=True, description="是否启用语义回答缓存")
+    semantic_cache_threshold: float = Field(default=0.95, description="语义缓存命中的最低余弦相似度")
+    semantic_cache_ttl: int = Field(default=86400, description="语义缓存条目TTL（秒）")
+    semantic_cache_max_entries: int = Field(default=500, description="每个过滤范围的最大缓存条目数")
+    
     # LLM 配置
     llm_model: str = Field(default="gpt-4o-mini", description="LLM模型名称")
     llm_temperature: float = Field(default=0.1, description="LLM温度参数")
     
     # 嵌入模型配置
     embed_model: str = Field(default="text-embedding-3-small", description="嵌入模型名称")
+    embed_batch_size: int = Field(default=64, description="单次嵌入请求的最大文本块数量")
+    embed_batch_max_tokens: int = Field(default=50000, description="单次嵌入请求的最大Token数量")
+    embed_concurrency: int = Field(default=4, description="并发执行的嵌入批次数量")
+    embed_max_retries: int = Field(default=3, description="单个嵌入批次的最大重试次数")
+    embed_retry_backoff: float = Field(default=1.0, description="嵌入批次重试退避基数（秒）")
+    index_upsert_batch_size: int = Field(default=256, description="建立索引时每次写入Qdrant的文本块数量，也是断点续传的粒度")
+    
+    # 嵌入缓存配置
+    embed_cache_enabled: bool = Field(default=True, description="是否启用嵌入向量缓存")
+    embed_cache_path: str = Field(default=str(RAG_DIR / "embedding_cache.sqlite3"), description="嵌入缓存数据库路径")
+    embed_cache_max_bytes: int = Field(default=1073741824, description="嵌入缓存最大字节数（默认1GB）")
     
     # 文本分块配置
     chunk_size: int = Field(default=512, description="文本分块大小")
@@ -66,6 +87,8 @@ class RAGConfigManager:
             self.app_settings: Optional[AppSettings] = None
             self.rag_settings: Optional[RAGSettings] = None
             self.text_splitter: Optional[SentenceSplitter] = None
+            self.base_embed_model: Optional[OpenAIEmbedding] = None
+            self.embedding_cache: Optional[EmbeddingCache] = None
             self._initialized = True
     
     def initialize(self, app_settings: AppSettings) -> None:
@@ -106,18 +129,44 @@ class RAGConfigManager:
             )
             
             # 配置嵌入模型
-            Settings.embed_model = OpenAIEmbedding(
+            self.base_embed_model = OpenAIEmbedding(
                 model=self.rag_settings.embed_model,
                 api_key=self.app_settings.api_key,
                 api_base=self.app_settings.base_url
             )
             
+            # 配置嵌入缓存，查询路径和索引路径共用
+            self._setup_embedding_cache()
+            if self.embedding_cache is not None:
+                Settings.embed_model = CachedEmbedding(self.base_embed_model, self.embedding_cache)
+            else:
+                Settings.embed_model = self.base_embed_model
+            
             logger.info("LlamaIndex全局配置完成")
             
         except Exception as e:
             logger.error(f"LlamaIndex配置失败: {e}")
             raise
     
+    def _setup_embedding_cache(self) -> None:
+        """设置嵌入向量缓存"""
+        if not self.rag_settings.embed_cache_enabled:
+            if self.embedding_cache is not None:
+                self.embedding_cache.close()
+                self.embedding_cache = None
+            logger.info("嵌入缓存已禁用")
+            return
+        
+        cache_path = Path(self.rag_settings.embed_cache_path)
+        if self.embedding_cache is not None and self.embedding_cache.db_path == cache_path:
+            # 重新加载配置时复用已打开的缓存
+            self.embedding_cache.max_bytes = self.rag_settings.embed_cache_max_bytes
+            return
+        
+        if self.embedding_cache is not None:
+            self.embedding_cache.close()
+        self.embedding_cache = EmbeddingCache(cache_path, self.rag_settings.embed_cache_max_bytes)
+    
     def _setup_text_splitter(self) -> None:
         """设置文本分块器"""
         try:
@@ -136,7 +185,8 @@ class RAGConfigManager:
         """获取Redis配置"""
         return {
             "redis_url": self.rag_settings.redis_url,
-            "ttl": self.rag_settings.redis_ttl
+            "ttl": self.rag_settings.redis_ttl,
+            "max_connections": self.rag_settings.redis_max_connections
         }
     
     def get_qdrant_config(self) -> dict:
@@ -148,6 +198,27 @@ class RAGConfigManager:
             "timeout": self.rag_settings.qdrant_timeout
         }
     
+    def get_semantic_cache_config(self) -> dict:
+        """获取语义回答缓存配置"""
+        return {
+            "enabled": self.rag_settings.semantic_cache_enabled,
+            "threshold": self.rag_settings.semantic_cache_threshold,
+            "ttl": self.rag_settings.semantic_cache_ttl,
+            "max_entries": self.rag_settings.semantic_cache_max_entries
+        }
+    
+    def get_embedding_config(self) -> dict:
+        """获取嵌入流水线配置"""
+        return {
+            "model": self.rag_settings.embed_model,
+            "batch_size": self.rag_settings.embed_batch_size,
+            "batch_max_tokens": self.rag_settings.embed_batch_max_tokens,
+            "concurrency": self.rag_settings.embed_concurrency,
+            "max_retries": self.rag_settings.embed_max_retries,
+            "retry_backoff": self.rag_settings.embed_retry_backoff,
+            "upsert_batch_size": self.rag_settings.index_upsert_batch_size
+        }
+    
     def get_conversation_config(self) -> dict:
         """获取对话配置"""
         return {
@@ -155,6 +226,16 @@ class RAGConfigManager:
             "similarity_top_k": self.rag_settings.conversation_similarity_top_k
         }
     
+    def get_embedding_cache(self) -> Optional[EmbeddingCache]:
+        """获取嵌入缓存实例，未启用时返回None"""
+        return self.embedding_cache
+    
+    def get_base_embed_model(self) -> OpenAIEmbedding:
+        """获取未经缓存包装的嵌入模型实例"""
+        if self.base_embed_model is None:
+            raise RuntimeError("嵌入模型未初始化，请先调用initialize()方法")
+        return self.base_embed_model
+    
     def get_text_splitter(self) -> SentenceSplitter:
         """获取文本分块器实例"""
         if self.text_splitter is None:
@@ -196,7 +277,13 @@ class RAGConfigManager:
                 "temperature": self.rag_settings.llm_temperature
             },
             "embedding": {
-                "model": self.rag_settings.embed_model
+                "model": self.rag_settings.embed_model,
+                "batch_size": self.rag_settings.embed_batch_size,
+                "batch_max_tokens": self.rag_settings.embed_batch_max_tokens,
+                "concurrency": self.rag_settings.embed_concurrency,
+                "max_retries": self.rag_settings.embed_max_retries,
+                "cache_enabled": self.rag_settings.embed_cache_enabled,
+                "cache_max_bytes": self.rag_settings.embed_cache_max_bytes
             },
             "text_splitting": {
                 "chunk_size": self.rag_settings.chunk_size,
@@ -211,7 +298,8 @@ class RAGConfigManager:
             "conversation": {
                 "token_limit": self.rag_settings.conversation_token_limit,
                 "similarity_top_k": self.rag_settings.conversation_similarity_top_k
-            }
+            },
+            "semantic_cache": self.get_semantic_cache_config()
         }
 
 
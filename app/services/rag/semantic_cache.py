@@ -0,0 +1,276 @@
+"""
+语义回答缓存
+基于Redis缓存 condense_plus_context 模式的回答，按过滤范围和独立问题的嵌入向量相似度命中；
+课程或材料重新索引、清理时通过递增代数使旧缓存自动失效
+"""
+import json
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from app.services.rag.rag_settings import RAGConfigManager
+
+_KEY_PREFIX = "semcache"
+
+
+@dataclass
+class SemanticCacheLookup:
+    """一次缓存查询的结果，未命中时用于写回"""
+
+    scope: str
+    entries_key: str
+    embedding: List[float]
+    generations: Dict[str, int]
+    answer: Optional[str] = None
+    sources: List[Dict[str, Any]] = field(default_factory=list)
+    similarity: float = 0.0
+
+    @property
+    def hit(self) -> bool:
+        return self.answer is not None
+
+
+class SemanticCache:
+    """语义回答缓存类"""
+
+    def __init__(self, rag_config_manager: RAGConfigManager):
+        """
+        初始化语义回答缓存
+
+        Args:
+            rag_config_manager: RAG配置管理器
+        """
+        config = rag_config_manager.get_semantic_cache_config()
+        self.enabled = config["enabled"]
+        self.threshold = config["threshold"]
+        self.ttl = config["ttl"]
+        self.max_entries = max(1, config["max_entries"])
+
+        # 统计信息
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._invalidations = 0
+        self._errors = 0
+        self._lookup_seconds = 0.0
+        self._saved_seconds = 0.0
+
+    @property
+    def redis(self):
+        """共享的异步Redis客户端"""
+        from app.core.client_registry import get_client_registry
+
+        return get_client_registry().redis.client[1]
+
+    @staticmethod
+    def get_scope(course_id: Optional[str], course_material_id: Optional[str]) -> Optional[str]:
+        """根据过滤条件确定缓存范围，与检索过滤逻辑一致（优先使用 course_id）"""
+        if course_id:
+            return f"course:{course_id}"
+        if course_material_id:
+            return f"material:{course_material_id}"
+        return None
+
+    @staticmethod
+    def _generation_key(scope: str) -> str:
+        return f"{_KEY_PREFIX}:gen:{scope}"
+
+    async def _get_generations(self, scopes: List[str]) -> Dict[str, int]:
+        """读取各范围当前的缓存代数"""
+        values = await self.redis.mget([self._generation_key(scope) for scope in scopes])
+        return {scope: int(value or 0) for scope, value in zip(scopes, values)}
+
+    async def lookup(
+        self,
+        course_id: Optional[str],
+        course_material_id: Optional[str],
+        question: str,
+        embedding: List[float]
+    ) -> Optional[SemanticCacheLookup]:
+        """
+        查询缓存
+
+        Args:
+            course_id: 课程ID
+            course_material_id: 课程材料ID
+            question: 独立问题
+            embedding: 独立问题的嵌入向量
+
+        Returns:
+            查询结果，未启用缓存、无过滤范围或查询出错时返回None
+        """
+        scope = self.get_scope(course_id, course_material_id)
+        if not self.enabled or scope is None:
+            return None
+
+        start_time = time.time()
+        try:
+            generations = await self._get_generations(["global", scope])
+            entries_key = f"{_KEY_PREFIX}:{scope}:{generations['global']}:{generations[scope]}"
+            lookup = SemanticCacheLookup(
+                scope=scope,
+                entries_key=entries_key,
+                embedding=embedding,
+                generations=generations
+            )
+
+            raw_entries = await self.redis.hgetall(entries_key)
+            best_entry, best_similarity = None, -1.0
+            if raw_entries:
+                entries = [json.loads(value) for value in raw_entries.values()]
+                matrix = np.asarray([entry["embedding"] for entry in entries], dtype=np.float32)
+                query = np.asarray(embedding, dtype=np.float32)
+                norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+                similarities = matrix @ query / np.where(norms == 0, 1.0, norms)
+                best_index = int(np.argmax(similarities))
+                best_entry, best_similarity = entries[best_index], float(similarities[best_index])
+
+            # 材料范围的缓存还依赖所属课程，课程被整体清理时同样失效
+            if best_entry is not None and best_similarity >= self.threshold and best_entry.get("course_id"):
+                course_scope = f"course:{best_entry['course_id']}"
+                if scope != course_scope:
+                    current = await self._get_generations([course_scope])
+                    if current[course_scope] != best_entry.get("course_generation", 0):
+                        best_entry = None
+
+            elapsed = time.time() - start_time
+            self._lookup_seconds += elapsed
+
+            if best_entry is not None and best_similarity >= self.threshold:
+                self._hits += 1
+                self._saved_seconds += max(0.0, best_entry.get("generation_time", 0.0) - elapsed)
+                lookup.answer = best_entry["answer"]
+                lookup.sources = best_entry.get("sources", [])
+                lookup.similarity = best_similarity
+                logger.info(
+                    f"语义缓存命中 - 范围: {scope}, 相似度: {best_similarity:.4f}, "
+                    f"缓存问题: {best_entry.get('question', '')[:50]}"
+                )
+            else:
+                self._misses += 1
+                logger.info(f"语义缓存未命中 - 范围: {scope}, 最高相似度: {best_similarity:.4f}")
+            return lookup
+
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"语义缓存查询失败，跳过缓存: {e}")
+            return None
+
+    async def store(
+        self,
+        lookup: SemanticCacheLookup,
+        question: str,
+        answer: str,
+        sources: List[Dict[str, Any]],
+        generation_time: float
+    ) -> None:
+        """
+        写入缓存
+
+        Args:
+            lookup: 未命中时的查询结果
+            question: 独立问题
+            answer: 回答
+            sources: 来源信息
+            generation_time: 生成回答的耗时（秒），用于统计节省的时间
+        """
+        if not self.enabled or lookup is None:
+            return
+
+        try:
+            course_id = sources[0].get("course_id") if sources else None
+            course_generation = 0
+            if course_id and lookup.scope != f"course:{course_id}":
+                course_generation = (await self._get_generations([f"course:{course_id}"]))[f"course:{course_id}"]
+
+            entry = {
+                "question": question,
+                "embedding": lookup.embedding,
+                "answer": answer,
+                "sources": sources,
+                "course_id": course_id,
+                "course_generation": course_generation,
+                "generation_time": generation_time,
+                "created_at": time.time()
+            }
+
+            pipe = self.redis.pipeline()
+            pipe.hset(lookup.entries_key, uuid.uuid4().hex, json.dumps(entry, ensure_ascii=False))
+            pipe.expire(lookup.entries_key, self.ttl)
+            pipe.hlen(lookup.entries_key)
+            size = (await pipe.execute())[-1]
+
+            if size > self.max_entries:
+                await self._trim(lookup.entries_key)
+
+            self._writes += 1
+            logger.info(f"语义缓存写入 - 范围: {lookup.scope}, 当前条目: {min(size, self.max_entries)}")
+
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"语义缓存写入失败: {e}")
+
+    async def _trim(self, entries_key: str) -> None:
+        """删除最早写入的条目，使条目数量不超过上限"""
+        raw_entries = await self.redis.hgetall(entries_key)
+        ordered = sorted(
+            raw_entries.items(),
+            key=lambda item: json.loads(item[1]).get("created_at", 0)
+        )
+        expired = [entry_id for entry_id, _ in ordered[:len(ordered) - self.max_entries]]
+        if expired:
+            await self.redis.hdel(entries_key, *expired)
+
+    async def invalidate(
+        self,
+        course_id: Optional[str] = None,
+        course_material_id: Optional[str] = None
+    ) -> None:
+        """
+        使缓存失效
+
+        材料变化时同时使材料范围和所属课程范围的缓存失效；
+        未指定任何范围时使全部缓存失效
+
+        Args:
+            course_id: 课程ID
+            course_material_id: 课程材料ID
+        """
+        scopes = []
+        if course_id:
+            scopes.append(f"course:{course_id}")
+        if course_material_id:
+            scopes.append(f"material:{course_material_id}")
+        if not scopes:
+            scopes.append("global")
+
+        try:
+            pipe = self.redis.pipeline()
+            for scope in scopes:
+                pipe.incr(self._generation_key(scope))
+            await pipe.execute()
+            self._invalidations += 1
+            logger.info(f"语义缓存已失效 - 范围: {', '.join(scopes)}")
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"语义缓存失效失败 - 范围: {', '.join(scopes)}, 错误: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        lookups = self._hits + self._misses
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": self._hits / lookups if lookups else 0.0,
+            "writes": self._writes,
+            "invalidations": self._invalidations,
+            "errors": self._errors,
+            "avg_lookup_ms": (self._lookup_seconds / lookups * 1000) if lookups else 0.0,
+            "estimated_seconds_saved": self._saved_seconds
+        }
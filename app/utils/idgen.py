@@ -14,6 +14,9 @@ from ..core.logging import get_logger
 
 logger = get_logger("idgen")
 
+# 文本块向量点ID的命名空间，保证同一文本块在任意环境下生成相同ID
+CHUNK_POINT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "rwai-fastapi/rag/chunk")
+
 
 class IDGenerator:
     """ID生成器类"""
@@ -53,6 +56,32 @@ class IDGenerator:
     def generate_session_id() -> str:
         """生成会话ID"""
         return IDGenerator.generate_timestamp_id()
+    
+    @staticmethod
+    def generate_chunk_point_id(
+        collection_name: str,
+        course_id: str,
+        course_material_id: str,
+        chunk_index: int,
+        content_hash: str
+    ) -> str:
+        """
+        生成文本块向量点ID
+        
+        基于UUID5确定性生成，同一文本块重复写入时覆盖而非重复插入
+        
+        Args:
+            collection_name: 集合名称
+            course_id: 课程ID
+            course_material_id: 课程材料ID
+            chunk_index: 文本块序号
+            content_hash: 文本块内容哈希
+            
+        Returns:
+            向量点ID
+        """
+        name = f"{collection_name}/{course_id}/{course_material_id}/{chunk_index}/{content_hash}"
+        return str(uuid.uuid5(CHUNK_POINT_NAMESPACE, name))
 
 
 class FilenameGenerator:
@@ -0,0 +1,107 @@
+"""
+Markdown 工具模块
+提供按标题和Token预算切分Markdown文档的功能，用于长文档分段处理
+"""
+import re
+from typing import Callable, List, Optional
+
+from .tokens import count_tokens
+
+_HEADING_PATTERN = re.compile(r"^#{1,6}\s+\S")
+_FENCE_PATTERN = re.compile(r"^(```|~~~)")
+# 句末标点，超长段落按句切分时使用
+_SENTENCE_PATTERN = re.compile(r"(?<=[。！？!?；;.])")
+
+
+def split_by_headings(text: str) -> List[str]:
+    """
+    按Markdown标题切分文档
+
+    每个部分以标题行开头（文档开头标题前的内容单独成为一部分），代码块内的 # 行不视为标题
+
+    Args:
+        text: Markdown文本
+
+    Returns:
+        按原文顺序排列的部分列表
+    """
+    sections: List[List[str]] = [[]]
+    in_fence = False
+    for line in text.splitlines(keepends=True):
+        if _FENCE_PATTERN.match(line.lstrip()):
+            in_fence = not in_fence
+        elif not in_fence and _HEADING_PATTERN.match(line) and sections[-1]:
+            sections.append([])
+        sections[-1].append(line)
+    return ["".join(lines) for lines in sections if "".join(lines).strip()]
+
+
+def _split_oversized(text: str, max_tokens: int, counter: Callable[[str], int]) -> List[str]:
+    """将超出预算的部分依次按段落、句子、字符切分"""
+    for separator, parts in (
+        ("\n\n", text.split("\n\n")),
+        ("", _SENTENCE_PATTERN.split(text)),
+    ):
+        parts = [part for part in parts if part]
+        if len(parts) > 1:
+            return _pack(parts, max_tokens, counter, separator)
+
+    # 无法再按结构切分时按字符数硬切分，按Token与字符比例估算每段长度
+    tokens = max(1, counter(text))
+    size = max(1, len(text) * max_tokens // tokens)
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _pack(
+    parts: List[str],
+    max_tokens: int,
+    counter: Callable[[str], int],
+    separator: str = ""
+) -> List[str]:
+    """将连续的部分合并为不超过预算的分段，单个超预算的部分继续切分"""
+    segments: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+
+    for part in parts:
+        if not part:
+            continue
+        part_tokens = counter(part)
+        if part_tokens > max_tokens:
+            if current:
+                segments.append(separator.join(current))
+                current, current_tokens = [], 0
+            segments.extend(_split_oversized(part, max_tokens, counter))
+            continue
+        if current and current_tokens + part_tokens > max_tokens:
+            segments.append(separator.join(current))
+            current, current_tokens = [], 0
+        current.append(part)
+        current_tokens += part_tokens
+
+    if current:
+        segments.append(separator.join(current))
+    return segments
+
+
+def split_markdown(
+    text: str,
+    max_tokens: int,
+    counter: Optional[Callable[[str], int]] = None
+) -> List[str]:
+    """
+    按标题和Token预算切分Markdown文档
+
+    优先在标题处切分，并将相邻的小节合并到同一分段；单个小节超出预算时再按段落、句子切分
+
+    Args:
+        text: Markdown文本
+        max_tokens: 每个分段的最大Token数
+        counter: Token计数函数，默认使用全局Token计数器
+
+    Returns:
+        按原文顺序排列的分段列表
+    """
+    counter = counter or count_tokens
+    segments = _pack(split_by_headings(text), max(1, max_tokens), counter)
+    return [segment for segment in segments if segment.strip()]
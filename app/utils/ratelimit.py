@@ -0,0 +1,71 @@
+"""
+限流工具模块
+提供异步令牌桶限流器，将调用外部接口的请求速率限制在给定预算内
+"""
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from ..core.logging import get_logger
+
+logger = get_logger("ratelimit")
+
+
+class AsyncRateLimiter:
+    """异步令牌桶限流器：平均速率不超过 rate 次/秒，允许最多 burst 次突发"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        """
+        初始化限流器
+
+        Args:
+            rate: 每秒允许的请求数
+            burst: 令牌桶容量，默认为每秒请求数（至少为1）
+
+        Raises:
+            ValueError: 速率不为正数
+        """
+        if rate <= 0:
+            raise ValueError(f"限流速率必须为正数: {rate}")
+        self.rate = rate
+        self.capacity = float(max(1, burst or int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        # 等待者按到达顺序依次获取令牌
+        self._lock = asyncio.Lock()
+        self._acquired = 0
+        self._waited = 0.0
+
+    def _refill(self) -> None:
+        """按流逝时间补充令牌"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """
+        获取一个令牌，令牌不足时等待
+
+        Returns:
+            本次等待的秒数
+        """
+        async with self._lock:
+            self._refill()
+            wait = 0.0
+            if self._tokens < 1:
+                wait = (1 - self._tokens) / self.rate
+                await asyncio.sleep(wait)
+                self._refill()
+            self._tokens -= 1
+            self._acquired += 1
+            self._waited += wait
+            return wait
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取限流统计"""
+        return {
+            "rate": self.rate,
+            "burst": int(self.capacity),
+            "acquired": self._acquired,
+            "waited_seconds": round(self._waited, 3)
+        }
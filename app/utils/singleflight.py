@@ -0,0 +1,234 @@
+"""
+请求合并工具模块
+相同键的并发任务只执行一次，所有等待者共享同一结果；
+可选通过Redis锁扩展为集群范围的合并
+"""
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from ..core.logging import get_logger
+
+logger = get_logger("singleflight")
+
+T = TypeVar("T")
+
+# 仅在锁仍由自己持有时释放，避免误删其他节点重新获取的锁
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def make_key(*parts: Any) -> str:
+    """由多个部分生成合并键"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """请求合并器类"""
+
+    def __init__(
+        self,
+        name: str,
+        redis_client: Any = None,
+        lock_ttl: float = 120.0,
+        wait_timeout: float = 180.0,
+        result_ttl: float = 10.0,
+        poll_interval: float = 0.2
+    ):
+        """
+        初始化请求合并器
+
+        Args:
+            name: 合并器名称，用于区分Redis键
+            redis_client: 异步Redis客户端，提供时启用集群范围合并
+            lock_ttl: 集群锁的过期时间（秒），防止执行节点崩溃后锁无法释放
+            wait_timeout: 等待其他节点结果的最长时间（秒），超时后本地执行
+            result_ttl: 集群共享结果无人读取时的最长保留时间（秒），正常情况下最后一个等待者读取后即删除
+            poll_interval: 等待其他节点结果时的轮询间隔（秒）
+        """
+        self.name = name
+        self.redis = redis_client
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        # 统计信息
+        self._leaders = 0
+        self._followers = 0
+        self._remote_followers = 0
+        self._errors = 0
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        encode: Optional[Callable[[T], Any]] = None,
+        decode: Optional[Callable[[Any], T]] = None
+    ) -> Tuple[T, bool]:
+        """
+        执行任务，相同键的并发调用只执行一次
+
+        Args:
+            key: 合并键
+            fn: 实际执行的任务
+            encode: 将结果转换为可JSON序列化对象，提供 encode/decode 且配置了Redis时启用集群合并
+            decode: 将JSON对象还原为结果
+
+        Returns:
+            Tuple[任务结果, 结果是否来自其他调用者]
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            self._followers += 1
+            logger.info(f"合并进行中的相同请求 - {self.name}: {key[:12]}")
+            # shield 保证单个等待者被取消时不影响执行者与其他等待者
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            if self.redis is not None and encode is not None and decode is not None:
+                result, shared = await self._do_clustered(key, fn, encode, decode)
+            else:
+                self._leaders += 1
+                result, shared = await fn(), False
+            future.set_result(result)
+            return result, shared
+        except BaseException as e:
+            self._errors += 1
+            if not future.done():
+                future.set_exception(e)
+                # 没有等待者时避免 "exception was never retrieved" 警告
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _do_clustered(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        encode: Callable[[T], Any],
+        decode: Callable[[Any], T]
+    ) -> Tuple[T, bool]:
+        """
+        通过Redis锁在集群范围内合并，其他节点正在执行时等待其共享结果
+
+        共享结果按执行者的锁令牌存储，只有执行期间加入等待的调用者能读取，
+        执行结束后到达的相同请求会重新执行，共享结果不会成为过期的结果缓存；
+        最后一个等待者读取后删除结果，result_ttl 仅用于清理等待者异常退出时遗留的结果
+        """
+        lock_key = f"singleflight:{self.name}:{key}:lock"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            try:
+                acquired = await self.redis.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000))
+                holder = None if acquired else await self.redis.get(lock_key)
+            except Exception as e:
+                logger.warning(f"集群请求合并不可用，本地执行 - {self.name}: {e}")
+                break
+
+            if acquired:
+                try:
+                    self._leaders += 1
+                    result = await fn()
+                    try:
+                        await self.redis.set(
+                            self._result_key(key, token),
+                            json.dumps(encode(result), ensure_ascii=False),
+                            px=int(self.result_ttl * 1000)
+                        )
+                    except Exception as e:
+                        logger.warning(f"共享请求结果写入失败 - {self.name}: {e}")
+                    return result, False
+                finally:
+                    try:
+                        await self.redis.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+                    except Exception as e:
+                        logger.warning(f"释放请求合并锁失败 - {self.name}: {e}")
+
+            if holder is not None:
+                try:
+                    shared = await self._wait_for_result(key, lock_key, holder, deadline)
+                except Exception as e:
+                    logger.warning(f"等待其他节点结果失败，本地执行 - {self.name}: {e}")
+                    break
+                if shared is not None:
+                    self._remote_followers += 1
+                    logger.info(f"复用其他节点的相同请求结果 - {self.name}: {key[:12]}")
+                    return decode(json.loads(shared)), True
+
+            # 执行者未写入结果（执行失败或锁过期），重新尝试获取锁
+            if time.monotonic() >= deadline:
+                logger.warning(f"等待其他节点结果超时，本地执行 - {self.name}: {key[:12]}")
+                break
+            await asyncio.sleep(self.poll_interval)
+
+        self._leaders += 1
+        return await fn(), False
+
+    def _result_key(self, key: str, holder: str) -> str:
+        return f"singleflight:{self.name}:{key}:{holder}:result"
+
+    async def _wait_for_result(self, key: str, lock_key: str, holder: Any, deadline: float) -> Optional[bytes]:
+        """
+        等待持有锁的执行者写入共享结果
+
+        Args:
+            key: 合并键
+            lock_key: 锁键
+            holder: 等待开始时锁的持有者令牌
+            deadline: 等待截止时间（time.monotonic）
+
+        Returns:
+            共享结果，执行者结束时未写入结果或等待超时返回None
+        """
+        holder = holder.decode() if isinstance(holder, bytes) else holder
+        result_key = self._result_key(key, holder)
+        waiters_key = f"singleflight:{self.name}:{key}:{holder}:waiters"
+        await self.redis.incr(waiters_key)
+        await self.redis.pexpire(waiters_key, int((self.lock_ttl + self.result_ttl) * 1000))
+
+        shared = None
+        while True:
+            shared = await self.redis.get(result_key)
+            if shared is not None or time.monotonic() >= deadline:
+                break
+            current = await self.redis.get(lock_key)
+            if (current.decode() if isinstance(current, bytes) else current) != holder:
+                # 执行者已释放锁，结果在释放前写入，最后再检查一次
+                shared = await self.redis.get(result_key)
+                break
+            await asyncio.sleep(self.poll_interval)
+
+        # 最后一个等待者离开时删除共享结果
+        if await self.redis.decr(waiters_key) <= 0:
+            await self.redis.delete(result_key, waiters_key)
+        return shared
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计信息"""
+        total = self._leaders + self._followers + self._remote_followers
+        coalesced = self._followers + self._remote_followers
+        return {
+            "clustered": self.redis is not None,
+            "in_flight": len(self._inflight),
+            "executions": self._leaders,
+            "coalesced": coalesced,
+            "local_coalesced": self._followers,
+            "remote_coalesced": self._remote_followers,
+            "coalesce_ratio": coalesced / total if total else 0.0,
+            "errors": self._errors
+        }
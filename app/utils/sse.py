@@ -0,0 +1,38 @@
+"""
+Server-Sent Events 工具模块
+提供SSE事件格式化功能，用于流式接口
+"""
+import json
+from typing import Any, Optional
+
+# SSE 响应头：禁止缓存并关闭反向代理缓冲，保证事件即时送达
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"
+}
+
+
+def format_sse(data: Any, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """
+    格式化SSE事件
+
+    Args:
+        data: 事件数据，非字符串时序列化为JSON
+        event: 事件类型
+        event_id: 事件ID
+
+    Returns:
+        SSE事件文本
+    """
+    if not isinstance(data, str):
+        data = json.dumps(data, ensure_ascii=False)
+
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    # 多行数据需拆分为多个 data 字段
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,81 @@
+"""
+Token估算工具模块
+提供文本Token数量估算功能，用于分批和上下文预算控制
+"""
+import re
+from typing import Callable, List, Optional
+
+from ..core.logging import get_logger
+
+logger = get_logger("tokens")
+
+# 中日韩字符，每个字符大约对应一个Token
+_CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿豈-﫿가-힯]")
+
+
+class TokenCounter:
+    """Token计数器类"""
+
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        self.encoding_name = encoding_name
+        self._encode: Optional[Callable[[str], List[int]]] = None
+        self._load_attempted = False
+
+    def _load_encoding(self) -> None:
+        """懒加载 tiktoken 编码器，不可用时回退到启发式估算"""
+        self._load_attempted = True
+        try:
+            import tiktoken
+
+            encoding = tiktoken.get_encoding(self.encoding_name)
+            self._encode = lambda text: encoding.encode(text, disallowed_special=())
+            logger.debug(f"tiktoken编码器加载成功: {self.encoding_name}")
+        except Exception as e:
+            logger.warning(f"tiktoken不可用，使用启发式Token估算: {e}")
+            self._encode = None
+
+    @staticmethod
+    def estimate_tokens_heuristic(text: str) -> int:
+        """
+        启发式估算Token数量
+
+        中日韩字符按每字1个Token计算，其余字符按每4个字符1个Token计算
+
+        Args:
+            text: 文本内容
+
+        Returns:
+            估算的Token数量
+        """
+        if not text:
+            return 0
+        cjk_count = len(_CJK_PATTERN.findall(text))
+        other_count = len(text) - cjk_count
+        return cjk_count + (other_count + 3) // 4
+
+    def count(self, text: str) -> int:
+        """
+        统计文本Token数量
+
+        Args:
+            text: 文本内容
+
+        Returns:
+            Token数量
+        """
+        if not text:
+            return 0
+        if not self._load_attempted:
+            self._load_encoding()
+        if self._encode is not None:
+            return len(self._encode(text))
+        return self.estimate_tokens_heuristic(text)
+
+
+# 全局Token计数器实例
+token_counter = TokenCounter()
+
+
+def count_tokens(text: str) -> int:
+    """统计文本Token数量"""
+    return token_counter.count(text)
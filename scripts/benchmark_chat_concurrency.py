@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+聊天并发基准测试脚本
+先测量单个聊天请求的耗时，再同时发起N个独立会话的聊天请求，
+比较两者的总耗时，验证多个会话能否在同一工作进程上交错执行
+
+默认每个请求提问不同的问题，避免请求合并和语义回答缓存让并发测试失真；
+测试前后读取 /metrics，分别统计被合并的请求数与语义缓存命中数
+"""
+import sys
+import math
+import time
+import asyncio
+import argparse
+import statistics
+from typing import List, Dict, Any, Optional
+import httpx
+from loguru import logger
+
+
+class ChatConcurrencyBenchmark:
+    """聊天并发基准测试器"""
+
+    def __init__(
+        self,
+        base_url: str,
+        endpoint: str,
+        engine_type: str,
+        question: str,
+        course_id: Optional[str] = None,
+        course_material_id: Optional[str] = None,
+        timeout: float = 120.0,
+        same_question: bool = False
+    ):
+        """
+        初始化基准测试器
+
+        Args:
+            base_url: 服务地址
+            endpoint: 聊天接口路径
+            engine_type: 聊天引擎类型
+            question: 提问内容
+            course_id: 课程ID
+            course_material_id: 课程材料ID
+            timeout: 单个请求超时（秒）
+            same_question: 是否所有请求提问相同的问题（用于测量请求合并与缓存效果）
+        """
+        self.url = base_url.rstrip("/") + endpoint
+        self.metrics_url = base_url.rstrip("/") + "/metrics"
+        self.engine_type = engine_type
+        self.question = question
+        self.course_id = course_id
+        self.course_material_id = course_material_id
+        self.timeout = timeout
+        self.same_question = same_question
+        self.run_id = int(time.time())
+
+    def _build_question(self, index: int) -> str:
+        """构建提问内容，默认追加请求编号使每个请求的问题互不相同"""
+        if self.same_question:
+            return self.question
+        return f"{self.question}（编号 {self.run_id}-{index}）"
+
+    def _build_payload(self, index: int) -> Dict[str, Any]:
+        """构建聊天请求体，每个请求使用独立的会话ID"""
+        payload = {
+            "conversation_id": f"bench_{self.run_id}_{index}",
+            "chat_engine_type": self.engine_type,
+            "question": self._build_question(index)
+        }
+        if self.course_id:
+            payload["course_id"] = self.course_id
+        if self.course_material_id:
+            payload["course_material_id"] = self.course_material_id
+        return payload
+
+    async def _send(self, client: httpx.AsyncClient, index: int) -> Dict[str, Any]:
+        """发送单个聊天请求并记录耗时"""
+        start_time = time.perf_counter()
+        try:
+            response = await client.post(self.url, json=self._build_payload(index))
+            response.raise_for_status()
+            ok = True
+            error = None
+        except Exception as e:
+            ok = False
+            error = str(e)
+        return {"ok": ok, "latency": time.perf_counter() - start_time, "error": error}
+
+    async def _fetch_counters(self, client: httpx.AsyncClient) -> Optional[Dict[str, int]]:
+        """
+        读取服务端聊天请求合并与语义缓存的累计计数
+
+        Returns:
+            包含 coalesced 与 cache_hits 的字典，读取失败时返回 None
+        """
+        try:
+            response = await client.get(self.metrics_url)
+            response.raise_for_status()
+            metrics = response.json()
+        except Exception as e:
+            logger.warning(f"读取运行指标失败，将不统计请求合并与缓存命中: {e}")
+            return None
+        chat_flight = metrics.get("singleflight", {}).get("chat", {})
+        return {
+            "coalesced": chat_flight.get("coalesced", 0),
+            "cache_hits": metrics.get("semantic_cache", {}).get("hits", 0)
+        }
+
+    async def run(self, concurrency: int, warmup: int = 1) -> Dict[str, Any]:
+        """
+        执行基准测试
+
+        Args:
+            concurrency: 并发请求数量
+            warmup: 预热请求数量（不计入结果）
+
+        Returns:
+            测试结果
+        """
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as client:
+            for i in range(warmup):
+                await self._send(client, -1 - i)
+
+            # 单个请求基线
+            single = await self._send(client, 0)
+            logger.info(f"单个请求耗时: {single['latency']:.2f}s")
+
+            # 同时发起N个请求，前后读取计数以统计本轮被合并与命中缓存的请求
+            before = await self._fetch_counters(client)
+            start_time = time.perf_counter()
+            results: List[Dict[str, Any]] = await asyncio.gather(
+                *(self._send(client, i + 1) for i in range(concurrency))
+            )
+            wall_time = time.perf_counter() - start_time
+            after = await self._fetch_counters(client)
+
+        latencies = sorted(r["latency"] for r in results if r["ok"])
+        errors = [r["error"] for r in results if not r["ok"]]
+        # 多工作进程部署时计数来自处理 /metrics 请求的单个进程，仅供参考
+        if before is not None and after is not None:
+            coalesced = after["coalesced"] - before["coalesced"]
+            cache_hits = after["cache_hits"] - before["cache_hits"]
+        else:
+            coalesced = cache_hits = None
+
+        summary = {
+            "url": self.url,
+            "concurrency": concurrency,
+            "single_latency": single["latency"],
+            "concurrent_wall_time": wall_time,
+            "slowdown": wall_time / single["latency"] if single["latency"] else 0.0,
+            "succeeded": len(latencies),
+            "failed": len(errors),
+            "p50_latency": statistics.median(latencies) if latencies else 0.0,
+            "p95_latency": latencies[math.ceil(len(latencies) * 0.95) - 1] if latencies else 0.0,
+            "max_latency": latencies[-1] if latencies else 0.0,
+            "same_question": self.same_question,
+            "coalesced": coalesced,
+            "cache_hits": cache_hits
+        }
+
+        logger.info("📊 基准测试结果:")
+        logger.info("-" * 60)
+        logger.info(f"接口: {summary['url']}")
+        logger.info(f"并发数: {concurrency}, 成功: {summary['succeeded']}, 失败: {summary['failed']}")
+        logger.info(f"单个请求耗时: {summary['single_latency']:.2f}s")
+        logger.info(f"{concurrency} 个并发请求总耗时: {summary['concurrent_wall_time']:.2f}s")
+        logger.info(f"耗时倍数: {summary['slowdown']:.2f}x（串行执行约为 {concurrency}x）")
+        logger.info(
+            f"延迟 p50: {summary['p50_latency']:.2f}s, p95: {summary['p95_latency']:.2f}s, "
+            f"max: {summary['max_latency']:.2f}s"
+        )
+        if coalesced is not None:
+            logger.info(f"请求合并: {coalesced} 个, 语义缓存命中: {cache_hits} 个")
+            if (coalesced or cache_hits) and not self.same_question:
+                logger.warning("存在被合并或命中缓存的请求，耗时倍数不能完全反映并发执行能力")
+        for error in errors[:5]:
+            logger.warning(f"请求失败: {error}")
+
+        return summary
+
+
+async def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="聊天并发基准测试脚本")
+    parser.add_argument("--base-url", default="http://localhost:8000", help="服务地址（默认: http://localhost:8000）")
+    parser.add_argument("--endpoint", default="/api/v1/conversation/chat", help="聊天接口路径")
+    parser.add_argument("-n", "--concurrency", type=int, default=10, help="并发请求数量（默认: 10）")
+    parser.add_argument(
+        "--engine",
+        default="simple",
+        choices=["simple", "condense_plus_context"],
+        help="聊天引擎类型（默认: simple）"
+    )
+    parser.add_argument("--question", default="请用一句话介绍你自己。", help="提问内容")
+    parser.add_argument(
+        "--same-question",
+        action="store_true",
+        help="所有请求提问相同的问题（测量请求合并与语义缓存效果，而非并发执行能力）"
+    )
+    parser.add_argument("--course-id", help="课程ID（condense_plus_context模式需要）")
+    parser.add_argument("--course-material-id", help="课程材料ID")
+    parser.add_argument("--warmup", type=int, default=1, help="预热请求数量（默认: 1）")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求超时（秒）")
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=None,
+        help="并发总耗时与单个请求耗时之比的上限，超过时以非零状态退出"
+    )
+
+    args = parser.parse_args()
+
+    if args.engine == "condense_plus_context" and not (args.course_id or args.course_material_id):
+        parser.error("condense_plus_context 模式需要 --course-id 或 --course-material-id")
+
+    benchmark = ChatConcurrencyBenchmark(
+        base_url=args.base_url,
+        endpoint=args.endpoint,
+        engine_type=args.engine,
+        question=args.question,
+        course_id=args.course_id,
+        course_material_id=args.course_material_id,
+        timeout=args.timeout,
+        same_question=args.same_question
+    )
+    summary = await benchmark.run(args.concurrency, args.warmup)
+
+    if summary["failed"]:
+        sys.exit(1)
+    if args.max_slowdown is not None and summary["slowdown"] > args.max_slowdown:
+        logger.error(f"❌ 耗时倍数 {summary['slowdown']:.2f}x 超过上限 {args.max_slowdown}x")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
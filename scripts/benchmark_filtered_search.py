@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+过滤检索基准测试脚本
+向临时集合写入大量带 course_id / course_material_id 载荷的随机向量，
+分别在建立载荷索引前后测量按课程或材料过滤的向量检索延迟
+"""
+import sys
+import math
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+import numpy as np
+from loguru import logger
+from qdrant_client.http import models
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.config import get_settings
+from app.repositories.rag_repository import AsyncQdrantRepository
+from app.repositories.qdrant_profiles import COLLECTION_PROFILES, get_collection_profile
+
+
+class FilteredSearchBenchmark:
+    """过滤检索基准测试器"""
+
+    def __init__(
+        self,
+        collection_name: str,
+        profile_name: Optional[str] = None,
+        dim: int = 1536,
+        courses: int = 1000,
+        materials_per_course: int = 20,
+        seed: int = 42
+    ):
+        """初始化基准测试器"""
+        self.settings = get_settings()
+        self.repo = AsyncQdrantRepository(self.settings)
+        self.client = self.repo.client
+        self.collection_name = collection_name
+        self.profile = COLLECTION_PROFILES[profile_name] if profile_name \
+            else get_collection_profile(self.settings, collection_name)
+        self.dim = dim
+        self.courses = courses
+        self.materials_per_course = materials_per_course
+        self.rng = np.random.default_rng(seed)
+        random.seed(seed)
+
+    def _random_vectors(self, count: int) -> np.ndarray:
+        """生成归一化的随机向量"""
+        vectors = self.rng.standard_normal((count, self.dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+    def _payload(self, point_id: int) -> Dict[str, Any]:
+        """按点ID确定性地分配课程与材料"""
+        course = point_id % self.courses
+        material = (point_id // self.courses) % self.materials_per_course
+        return {
+            "course_id": f"course_{course}",
+            "course_material_id": f"course_{course}_material_{material}"
+        }
+
+    async def create_collection(self) -> None:
+        """创建不带载荷索引的集合（直接调用客户端，绕过仓库自动建立的索引）"""
+        if await self.client.collection_exists(self.collection_name):
+            await self.client.delete_collection(self.collection_name)
+        await self.client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=self.profile.vectors_config(self.dim),
+            hnsw_config=self.profile.hnsw_config(),
+            quantization_config=self.profile.quantization_config(),
+            on_disk_payload=self.profile.on_disk_payload
+        )
+        logger.info(f"已创建集合 {self.collection_name}，调优配置: {self.profile.name}，维度: {self.dim}")
+
+    async def load_points(self, total: int, batch_size: int = 1000, parallel: int = 4) -> float:
+        """
+        并发分批写入随机向量点
+
+        Returns:
+            写入耗时（秒）
+        """
+        semaphore = asyncio.Semaphore(parallel)
+        written = 0
+        start_time = time.perf_counter()
+
+        async def upload(begin: int) -> None:
+            nonlocal written
+            count = min(batch_size, total - begin)
+            vectors = self._random_vectors(count)
+            points = [
+                models.PointStruct(id=begin + i, vector=vectors[i].tolist(), payload=self._payload(begin + i))
+                for i in range(count)
+            ]
+            async with semaphore:
+                await self.client.upsert(collection_name=self.collection_name, points=points, wait=True)
+            written += count
+            if written % (batch_size * 100) < count:
+                elapsed = time.perf_counter() - start_time
+                logger.info(f"已写入 {written}/{total} 个向量点，{written / elapsed:.0f} 点/s")
+
+        # 分组提交，避免一次性创建全部协程
+        for group_start in range(0, total, batch_size * parallel * 4):
+            group_end = min(total, group_start + batch_size * parallel * 4)
+            await asyncio.gather(*(upload(begin) for begin in range(group_start, group_end, batch_size)))
+
+        return time.perf_counter() - start_time
+
+    async def wait_until_optimized(self, timeout: float = 3600.0) -> None:
+        """等待集合完成索引与段优化（状态为 green）"""
+        start_time = time.perf_counter()
+        while time.perf_counter() - start_time < timeout:
+            info = await self.client.get_collection(self.collection_name)
+            if info.status == models.CollectionStatus.GREEN:
+                logger.info(f"集合已就绪，等待 {time.perf_counter() - start_time:.1f}s")
+                return
+            await asyncio.sleep(2.0)
+        logger.warning("等待集合优化超时，继续测试")
+
+    def _build_filter(self, filter_field: str) -> models.Filter:
+        """随机选择一个课程或材料构建过滤条件"""
+        point_id = random.randrange(self.courses * self.materials_per_course)
+        value = self._payload(point_id)[filter_field]
+        return models.Filter(must=[
+            models.FieldCondition(key=filter_field, match=models.MatchValue(value=value))
+        ])
+
+    async def measure(self, queries: int, concurrency: int, limit: int, filter_field: str) -> Dict[str, Any]:
+        """执行过滤检索并统计延迟"""
+        semaphore = asyncio.Semaphore(concurrency)
+        vectors = self._random_vectors(queries)
+        search_params = self.profile.search_params()
+
+        async def search(index: int) -> float:
+            query_filter = self._build_filter(filter_field)
+            async with semaphore:
+                start_time = time.perf_counter()
+                await self.client.search(
+                    collection_name=self.collection_name,
+                    query_vector=vectors[index].tolist(),
+                    query_filter=query_filter,
+                    limit=limit,
+                    search_params=search_params
+                )
+                return time.perf_counter() - start_time
+
+        # 预热
+        await asyncio.gather(*(search(i) for i in range(min(concurrency, queries))))
+
+        start_time = time.perf_counter()
+        latencies = sorted(await asyncio.gather(*(search(i) for i in range(queries))))
+        wall_time = time.perf_counter() - start_time
+
+        def percentile(p: float) -> float:
+            return latencies[max(0, math.ceil(len(latencies) * p) - 1)]
+
+        return {
+            "queries": queries,
+            "qps": queries / wall_time if wall_time else 0.0,
+            "mean": statistics.mean(latencies),
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": latencies[-1]
+        }
+
+    async def run(
+        self,
+        points: int,
+        queries: int,
+        concurrency: int,
+        limit: int,
+        filter_fields: List[str],
+        batch_size: int,
+        skip_load: bool = False
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        执行基准测试
+
+        Args:
+            points: 向量点数量
+            queries: 每轮检索次数
+            concurrency: 并发检索数
+            limit: 每次检索返回数量
+            filter_fields: 参与测试的过滤字段
+            batch_size: 写入批次大小
+            skip_load: 复用已有集合（删除已有载荷索引后测试）
+
+        Returns:
+            {过滤字段: {"before": 统计, "after": 统计}}
+        """
+        if skip_load:
+            info = await self.client.get_collection(self.collection_name)
+            for field_name in (info.payload_schema or {}):
+                await self.client.delete_payload_index(self.collection_name, field_name, wait=True)
+            logger.info(f"复用集合 {self.collection_name}，已删除已有载荷索引")
+        else:
+            await self.create_collection()
+            load_time = await self.load_points(points, batch_size)
+            logger.info(f"写入 {points} 个向量点耗时 {load_time:.1f}s")
+        await self.wait_until_optimized()
+
+        results: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for field_name in filter_fields:
+            results[field_name] = {"before": await self.measure(queries, concurrency, limit, field_name)}
+            logger.info(f"无载荷索引 - {field_name}: p50 {results[field_name]['before']['p50'] * 1000:.1f}ms")
+
+        index_start = time.perf_counter()
+        created = await self.repo.ensure_payload_indexes(self.collection_name, wait=True)
+        await self.wait_until_optimized()
+        logger.info(f"建立载荷索引 {', '.join(created)} 耗时 {time.perf_counter() - index_start:.1f}s")
+
+        for field_name in filter_fields:
+            results[field_name]["after"] = await self.measure(queries, concurrency, limit, field_name)
+
+        self._print_summary(points, concurrency, results)
+        return results
+
+    def _print_summary(self, points: int, concurrency: int, results: Dict[str, Dict[str, Dict[str, Any]]]) -> None:
+        """打印前后对比"""
+        logger.info("📊 过滤检索基准测试结果:")
+        logger.info("-" * 60)
+        logger.info(f"集合: {self.collection_name}, 向量点: {points}, 维度: {self.dim}, 调优配置: {self.profile.name}")
+        logger.info(f"课程数: {self.courses}, 每课程材料数: {self.materials_per_course}, 并发: {concurrency}")
+        for field_name, result in results.items():
+            before, after = result["before"], result["after"]
+            logger.info(f"过滤字段: {field_name}")
+            for key in ("mean", "p50", "p95", "p99", "max"):
+                speedup = before[key] / after[key] if after[key] else 0.0
+                logger.info(
+                    f"  {key:>4}: {before[key] * 1000:8.2f}ms -> {after[key] * 1000:8.2f}ms  ({speedup:.1f}x)"
+                )
+            logger.info(f"   qps: {before['qps']:8.1f}   -> {after['qps']:8.1f}")
+        logger.info("-" * 60)
+
+    async def cleanup(self) -> None:
+        """删除测试集合"""
+        await self.client.delete_collection(self.collection_name)
+        logger.info(f"已删除测试集合 {self.collection_name}")
+
+
+async def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="过滤检索基准测试脚本（载荷索引前后对比）")
+    parser.add_argument("--collection", default="bench_filtered_search", help="测试集合名称（默认: bench_filtered_search）")
+    parser.add_argument("--points", type=int, default=1_000_000, help="向量点数量（默认: 1000000）")
+    parser.add_argument("--dim", type=int, default=1536, help="向量维度（默认: 1536）")
+    parser.add_argument("--courses", type=int, default=1000, help="课程数量（默认: 1000）")
+    parser.add_argument("--materials-per-course", type=int, default=20, help="每个课程的材料数量（默认: 20）")
+    parser.add_argument("--profile", choices=list(COLLECTION_PROFILES), help="集合调优配置（默认: 配置中为该集合指定的调优配置）")
+    parser.add_argument("--queries", type=int, default=500, help="每轮检索次数（默认: 500）")
+    parser.add_argument("-n", "--concurrency", type=int, default=8, help="并发检索数（默认: 8）")
+    parser.add_argument("--limit", type=int, default=5, help="每次检索返回数量（默认: 5）")
+    parser.add_argument(
+        "--filter",
+        choices=["course_id", "course_material_id", "both"],
+        default="both",
+        help="测试的过滤字段（默认: both）"
+    )
+    parser.add_argument("--batch-size", type=int, default=1000, help="写入批次大小（默认: 1000）")
+    parser.add_argument("--skip-load", action="store_true", help="复用已写入数据的集合")
+    parser.add_argument("--keep", action="store_true", help="测试结束后保留集合")
+
+    args = parser.parse_args()
+
+    if args.collection == get_settings().qdrant_collection_name:
+        parser.error("测试集合不能与业务集合同名")
+
+    benchmark = FilteredSearchBenchmark(
+        collection_name=args.collection,
+        profile_name=args.profile,
+        dim=args.dim,
+        courses=args.courses,
+        materials_per_course=args.materials_per_course
+    )
+    filter_fields = ["course_id", "course_material_id"] if args.filter == "both" else [args.filter]
+
+    try:
+        await benchmark.run(
+            points=args.points,
+            queries=args.queries,
+            concurrency=args.concurrency,
+            limit=args.limit,
+            filter_fields=filter_fields,
+            batch_size=args.batch_size,
+            skip_load=args.skip_load
+        )
+    finally:
+        if not args.keep:
+            await benchmark.cleanup()
+        await benchmark.repo.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,15 +1,19 @@
 #!/usr/bin/env python3
 """
-RAG索引构建脚本
-用于批量处理文档并建立向量索引
+RAG索引批量构建脚本
+并行读取与分块文档，跨文件合并文本块生成嵌入向量，流水线写入Qdrant；
+通过断点清单记录已完成的文件，重新运行时跳过内容未变化的文件
 """
 import os
 import sys
+import json
+import time
 import asyncio
 import argparse
+from dataclasses import dataclass, field
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
-import time
+from typing import List, Dict, Any, Optional, Set, Tuple
 from loguru import logger
 
 # 添加项目根目录到Python路径
@@ -17,208 +21,597 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from app.core.config import get_settings
-from app.services.rag_service import RAGService
+from app.core.client_registry import get_client_registry
+from app.constants.paths import RAG_DIR
+from app.services.rag.rag_settings import initialize_rag_config
+from app.services.rag.document_indexing_service import DocumentIndexingService
 from app.schemas.rag import IndexRequest, DocumentMetadata
 
 
-class RAGIndexBuilder:
-    """RAG索引构建器"""
-    
+@dataclass(eq=False)
+class FileTask:
+    """单个文件的索引任务"""
+    path: Path
+    key: str
+    content_hash: str
+    request: IndexRequest
+    nodes: List[Any] = field(default_factory=list)
+    # 尚未写入Qdrant的文本块数量
+    remaining: int = 0
+    error: Optional[str] = None
+
+
+class IndexManifest:
+    """断点清单：记录每个文件已写入索引时的内容哈希"""
+
+    VERSION = 1
+
+    def __init__(self, path: Path, collection_name: str, embed_model: str, save_interval: float = 2.0):
+        """
+        初始化断点清单
+
+        Args:
+            path: 清单文件路径
+            collection_name: 集合名称
+            embed_model: 嵌入模型名称，集合或模型变化时清单中的记录全部失效
+            save_interval: 两次写盘的最小间隔（秒）
+        """
+        self.path = path
+        self.collection_name = collection_name
+        self.embed_model = embed_model
+        self.save_interval = save_interval
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._saved_at = 0.0
+        self._dirty = False
+
+    def load(self) -> None:
+        """读取清单文件，与本次集合或嵌入模型不一致时忽略已有记录"""
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning(f"断点清单读取失败，将重新索引全部文件: {e}")
+            return
+
+        if data.get("collection_name") != self.collection_name or data.get("embed_model") != self.embed_model:
+            logger.warning(
+                f"断点清单的集合或嵌入模型与本次不一致（{data.get('collection_name')}/{data.get('embed_model')}），"
+                f"将重新索引全部文件"
+            )
+            return
+        self.files = data.get("files", {})
+        logger.info(f"已加载断点清单: {self.path}，已索引文件: {len(self.files)}")
+
+    def is_indexed(self, key: str, content_hash: str) -> bool:
+        """文件是否已按当前内容写入索引"""
+        entry = self.files.get(key)
+        return entry is not None and entry.get("content_hash") == content_hash
+
+    def forget(self, key: str) -> bool:
+        """移除文件记录，返回记录是否存在"""
+        if self.files.pop(key, None) is None:
+            return False
+        self._dirty = True
+        return True
+
+    def record(self, key: str, entry: Dict[str, Any]) -> None:
+        """记录已完成的文件，按间隔写盘"""
+        self.files[key] = entry
+        self._dirty = True
+        if time.time() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def save(self) -> None:
+        """写入清单文件（先写临时文件再替换，避免中断时损坏）"""
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        temp_path.write_text(json.dumps({
+            "version": self.VERSION,
+            "collection_name": self.collection_name,
+            "embed_model": self.embed_model,
+            "updated_at": datetime.now().isoformat(),
+            "files": self.files
+        }, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(temp_path, self.path)
+        self._saved_at = time.time()
+        self._dirty = False
+
+
+class ThroughputMeter:
+    """吞吐量统计"""
+
     def __init__(self):
-        """初始化构建器"""
+        self.start_time = time.time()
+        self.files = 0
+        self.chunks = 0
+        self.embeddings = 0
+        self._last: Tuple[float, int, int, int] = (self.start_time, 0, 0, 0)
+
+    def rates(self, since_last: bool = False) -> Dict[str, float]:
+        """计算每秒处理的文件、文本块与嵌入向量数量"""
+        now = time.time()
+        last_time, last_files, last_chunks, last_embeddings = (
+            self._last if since_last else (self.start_time, 0, 0, 0)
+        )
+        if since_last:
+            self._last = (now, self.files, self.chunks, self.embeddings)
+        elapsed = max(now - last_time, 1e-6)
+        return {
+            "elapsed": now - self.start_time,
+            "files_per_second": (self.files - last_files) / elapsed,
+            "chunks_per_second": (self.chunks - last_chunks) / elapsed,
+            "embeddings_per_second": (self.embeddings - last_embeddings) / elapsed
+        }
+
+
+class RAGIndexBuilder:
+    """RAG索引批量构建器"""
+
+    def __init__(
+        self,
+        readers: int = 4,
+        upserters: int = 2,
+        group_size: Optional[int] = None,
+        max_inflight_groups: int = 2,
+        report_interval: float = 5.0
+    ):
+        """
+        初始化构建器
+
+        Args:
+            readers: 并行读取与分块文件的协程数
+            upserters: 并行写入Qdrant的协程数
+            group_size: 跨文件合并后每次提交给嵌入流水线的文本块数量，默认与写入分段大小相同
+            max_inflight_groups: 同时在途的嵌入分组数量
+            report_interval: 吞吐量报告间隔（秒）
+        """
         self.settings = get_settings()
-        self.rag_service = RAGService(self.settings)
+        initialize_rag_config(self.settings)
+        self.indexing_service: DocumentIndexingService = get_client_registry().get_document_indexing_service()
+
+        self.readers = max(1, readers)
+        self.upserters = max(1, upserters)
+        self.group_size = max(1, group_size or self.indexing_service.upsert_batch_size)
+        self.max_inflight_groups = max(1, max_inflight_groups)
+        self.report_interval = report_interval
+
+        self.meter = ThroughputMeter()
         self.stats = {
             "total_files": 0,
             "processed_files": 0,
+            "skipped_files": 0,
             "failed_files": 0,
             "total_chunks": 0,
             "start_time": None,
             "end_time": None
         }
-    
+        self.failures: Dict[str, str] = {}
+
+        self.course_id = ""
+        self.collection_name = ""
+        self.manifest: Optional[IndexManifest] = None
+
     async def build_index_from_directory(
-        self, 
-        directory: Path, 
+        self,
+        directory: Path,
         course_id: str,
         collection_name: str = None,
-        file_pattern: str = "*.md"
+        file_pattern: str = "*.md",
+        manifest_path: Optional[Path] = None,
+        force: bool = False
     ) -> Dict[str, Any]:
-        """从目录批量构建索引"""
+        """
+        从目录批量构建索引
+
+        Args:
+            directory: 文档目录
+            course_id: 课程ID
+            collection_name: 集合名称，默认使用配置中的名称
+            file_pattern: 文件匹配模式（支持 **/*.md 递归匹配）
+            manifest_path: 断点清单路径，默认为 data/outputs/rag/manifests/{course_id}_{集合}.json
+            force: 忽略断点清单，重新索引全部文件
+
+        Returns:
+            处理统计
+        """
         self.stats["start_time"] = time.time()
-        
+        self.course_id = course_id
+        self.collection_name = collection_name or self.settings.qdrant_collection_name
+        embed_model = self.indexing_service.embedding_pipeline.embed_model.model_name
+
         logger.info(f"开始处理目录: {directory}")
         logger.info(f"课程ID: {course_id}")
         logger.info(f"文件模式: {file_pattern}")
-        logger.info(f"集合名称: {collection_name or self.settings.qdrant_collection_name}")
-        
+        logger.info(f"集合名称: {self.collection_name}")
+        logger.info(
+            f"读取协程: {self.readers}, 写入协程: {self.upserters}, "
+            f"嵌入分组: {self.group_size} 个文本块 x {self.max_inflight_groups}"
+        )
+
+        self.manifest = IndexManifest(
+            manifest_path or RAG_DIR / "manifests" / f"{course_id}_{self.collection_name}.json",
+            self.collection_name,
+            embed_model
+        )
+        if not force:
+            self.manifest.load()
+
         # 查找所有匹配的文件
-        files = list(directory.glob(file_pattern))
+        files = sorted(path for path in directory.glob(file_pattern) if path.is_file())
         if not files:
             logger.warning(f"在目录 {directory} 中未找到匹配 {file_pattern} 的文件")
             return self.stats
-        
+
         self.stats["total_files"] = len(files)
         logger.info(f"找到 {len(files)} 个文件待处理")
-        
-        # 处理每个文件
-        for i, file_path in enumerate(files, 1):
-            logger.info(f"处理文件 {i}/{len(files)}: {file_path.name}")
-            
-            try:
-                await self._process_file(file_path, course_id, collection_name)
-                self.stats["processed_files"] += 1
-                logger.info(f"✅ 文件处理成功: {file_path.name}")
-            except Exception as e:
-                self.stats["failed_files"] += 1
-                logger.error(f"❌ 文件处理失败: {file_path.name} - {e}")
-        
+
+        await self.indexing_service.qdrant_repo.create_collection(self.collection_name)
+
+        path_queue: asyncio.Queue = asyncio.Queue()
+        for path in files:
+            path_queue.put_nowait(path)
+        # 有界队列形成背压：嵌入或写入变慢时读取与分块随之放缓
+        split_queue: asyncio.Queue = asyncio.Queue(maxsize=self.readers * 2)
+        upsert_queue: asyncio.Queue = asyncio.Queue(maxsize=self.upserters * 2)
+
+        material_ids: Dict[str, str] = {}
+        readers = [
+            asyncio.create_task(self._read_worker(directory, path_queue, split_queue, material_ids))
+            for _ in range(self.readers)
+        ]
+        embedder = asyncio.create_task(self._embed_worker(split_queue, upsert_queue))
+        upserters = [asyncio.create_task(self._upsert_worker(upsert_queue)) for _ in range(self.upserters)]
+        reporter = asyncio.create_task(self._report_loop())
+
+        try:
+            await asyncio.gather(*readers)
+            await split_queue.put(None)
+            await embedder
+            for _ in upserters:
+                await upsert_queue.put(None)
+            await asyncio.gather(*upserters)
+        finally:
+            for task in readers + [embedder, reporter] + upserters:
+                task.cancel()
+            await asyncio.gather(*readers, embedder, reporter, *upserters, return_exceptions=True)
+            self.manifest.save()
+
         self.stats["end_time"] = time.time()
         self._print_summary()
-        
+
         return self.stats
-    
-    async def _process_file(
-        self, 
-        file_path: Path, 
-        course_id: str,
-        collection_name: str = None
-    ):
-        """处理单个文件"""
-        try:
-            # 读取文件内容
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 生成材料ID（基于文件名）
-            material_id = f"material_{file_path.stem}"
-            
-            # 构建元数据
-            metadata = DocumentMetadata(
-                course_id=course_id,
-                course_material_id=material_id,
-                course_material_name=file_path.stem,
+
+    async def _read_worker(
+        self,
+        directory: Path,
+        path_queue: asyncio.Queue,
+        split_queue: asyncio.Queue,
+        material_ids: Dict[str, str]
+    ) -> None:
+        """读取文件并分块，跳过断点清单中内容未变化的文件"""
+        while True:
+            try:
+                file_path = path_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            key = file_path.relative_to(directory).as_posix()
+            try:
+                content = await asyncio.to_thread(file_path.read_text, encoding="utf-8")
+                content_hash = self.indexing_service.compute_content_hash(content)
+                if self.manifest.is_indexed(key, content_hash):
+                    self.stats["skipped_files"] += 1
+                    logger.debug(f"文件内容未变化，跳过: {key}")
+                    continue
+
+                request = self._build_request(directory, file_path, content)
+                metadata = request.metadata
+                material_key = f"{metadata.course_id}/{metadata.course_material_id}"
+                if material_ids.setdefault(material_key, key) != key:
+                    raise ValueError(f"材料ID {metadata.course_material_id} 与 {material_ids[material_key]} 重复")
+
+                # 内容变化的文件先删除旧文本块，避免残留已消失的内容
+                if self.manifest.forget(key):
+                    await self.indexing_service.qdrant_repo.delete_vectors_by_filter(
+                        {"must": [
+                            {"key": "course_id", "match": {"value": metadata.course_id}},
+                            {"key": "course_material_id", "match": {"value": metadata.course_material_id}}
+                        ]},
+                        self.collection_name
+                    )
+
+                task = FileTask(path=file_path, key=key, content_hash=content_hash, request=request)
+                task.nodes = await self.indexing_service.split_document(request)
+                task.remaining = len(task.nodes)
+                logger.debug(f"文件 {key} 生成了 {len(task.nodes)} 个文本块")
+
+                if not task.nodes:
+                    await self._finish_file(task)
+                    continue
+                await split_queue.put(task)
+
+            except Exception as e:
+                self.stats["failed_files"] += 1
+                self.failures[key] = str(e)
+                logger.error(f"❌ 文件处理失败: {key} - {e}")
+
+    def _build_request(self, directory: Path, file_path: Path, content: str) -> IndexRequest:
+        """构建文件的索引请求，材料ID基于文件名生成"""
+        return IndexRequest(
+            file_content=content,
+            metadata=DocumentMetadata(
+                course_id=self.course_id,
+                course_material_id=f"material_{file_path.stem}",
                 file_path=str(file_path),
                 file_size=len(content.encode('utf-8'))
+            ),
+            collection_name=self.collection_name
+        )
+
+    async def _embed_worker(self, split_queue: asyncio.Queue, upsert_queue: asyncio.Queue) -> None:
+        """跨文件合并文本块分组提交嵌入，限制同时在途的分组数量"""
+        pending: List[Tuple[FileTask, int]] = []
+        inflight: Set[asyncio.Task] = set()
+        semaphore = asyncio.Semaphore(self.max_inflight_groups)
+
+        async def flush() -> None:
+            group = pending[:]
+            pending.clear()
+            await semaphore.acquire()
+            task = asyncio.create_task(self._embed_group(group, upsert_queue))
+            inflight.add(task)
+            task.add_done_callback(lambda done: (inflight.discard(done), semaphore.release()))
+
+        try:
+            while True:
+                file_task = await split_queue.get()
+                if file_task is None:
+                    break
+                for index in range(len(file_task.nodes)):
+                    pending.append((file_task, index))
+                    if len(pending) >= self.group_size:
+                        await flush()
+            if pending:
+                await flush()
+            await asyncio.gather(*inflight)
+        finally:
+            for task in inflight:
+                task.cancel()
+
+    async def _embed_group(self, group: List[Tuple[FileTask, int]], upsert_queue: asyncio.Queue) -> None:
+        """为一组文本块生成嵌入向量，并按写入分段大小交给写入协程"""
+        group = [(task, index) for task, index in group if task.error is None]
+        if not group:
+            return
+        try:
+            embeddings = await self.indexing_service.embedding_pipeline.embed_texts(
+                [task.nodes[index].text for task, index in group]
             )
-            
-            # 构建索引请求
-            request = IndexRequest(
-                file_content=content,
-                metadata=metadata,
-                collection_name=collection_name
-            )
-            
-            # 执行索引建立
-            response = await self.rag_service.build_index(request)
-            
-            if response.success:
-                self.stats["total_chunks"] += response.chunk_count
-                logger.debug(f"文件 {file_path.name} 生成了 {response.chunk_count} 个文本块")
-            else:
-                raise Exception(response.message)
-        
         except Exception as e:
-            logger.error(f"处理文件 {file_path} 时出错: {e}")
-            raise
-    
+            self._fail_files({task for task, _ in group}, f"嵌入生成失败: {e}")
+            return
+        self.meter.embeddings += len(embeddings)
+
+        batch_size = self.indexing_service.upsert_batch_size
+        for begin in range(0, len(group), batch_size):
+            refs = group[begin:begin + batch_size]
+            points = [
+                self.indexing_service.build_point(
+                    self.collection_name, task.nodes[index].text, index, embedding, task.request
+                )
+                for (task, index), embedding in zip(refs, embeddings[begin:begin + batch_size])
+            ]
+            await upsert_queue.put((points, refs))
+
+    async def _upsert_worker(self, upsert_queue: asyncio.Queue) -> None:
+        """写入向量点，文件的全部文本块写入后记录到断点清单"""
+        while True:
+            item = await upsert_queue.get()
+            if item is None:
+                return
+            points, refs = item
+            if not await self.indexing_service.qdrant_repo.upsert_points(self.collection_name, points):
+                self._fail_files({task for task, _ in refs}, "向量点写入失败")
+                continue
+
+            self.meter.chunks += len(points)
+            for task, _ in refs:
+                task.remaining -= 1
+                if task.remaining == 0 and task.error is None:
+                    await self._finish_file(task)
+
+    async def _finish_file(self, task: FileTask) -> None:
+        """文件索引完成：使语义缓存失效并记录到断点清单"""
+        metadata = task.request.metadata
+        await self.indexing_service.semantic_cache.invalidate(metadata.course_id, metadata.course_material_id)
+        self.manifest.record(task.key, {
+            "content_hash": task.content_hash,
+            "course_id": metadata.course_id,
+            "course_material_id": metadata.course_material_id,
+            "chunk_count": len(task.nodes),
+            "indexed_at": datetime.now().isoformat()
+        })
+        self.stats["processed_files"] += 1
+        self.stats["total_chunks"] += len(task.nodes)
+        self.meter.files += 1
+        task.nodes = []
+        logger.info(f"✅ 文件处理成功: {task.key}")
+
+    def _fail_files(self, tasks: Set[FileTask], error: str) -> None:
+        """标记文件失败，失败的文件不写入断点清单，下次运行时重新索引"""
+        for task in tasks:
+            if task.error is not None:
+                continue
+            task.error = error
+            self.stats["failed_files"] += 1
+            self.failures[task.key] = error
+            logger.error(f"❌ 文件处理失败: {task.key} - {error}")
+
+    async def _report_loop(self) -> None:
+        """定期输出进度与吞吐量"""
+        while True:
+            await asyncio.sleep(self.report_interval)
+            rates = self.meter.rates(since_last=True)
+            finished = self.stats["processed_files"] + self.stats["skipped_files"] + self.stats["failed_files"]
+            logger.info(
+                f"📈 进度 {finished}/{self.stats['total_files']} | "
+                f"{rates['files_per_second']:.2f} 文件/s | "
+                f"{rates['chunks_per_second']:.1f} 文本块/s | "
+                f"{rates['embeddings_per_second']:.1f} 嵌入/s"
+            )
+
     def _print_summary(self):
-        """打印处理摘要"""
+        """打印处理摘要与平均吞吐量"""
         duration = self.stats["end_time"] - self.stats["start_time"]
-        
+        rates = self.meter.rates()
+
         logger.info("=" * 60)
         logger.info("📊 索引构建摘要")
         logger.info("=" * 60)
         logger.info(f"总文件数: {self.stats['total_files']}")
         logger.info(f"成功处理: {self.stats['processed_files']}")
+        logger.info(f"未变化跳过: {self.stats['skipped_files']}")
         logger.info(f"处理失败: {self.stats['failed_files']}")
         logger.info(f"总文本块: {self.stats['total_chunks']}")
         logger.info(f"处理时间: {duration:.2f} 秒")
-        
-        if self.stats["processed_files"] > 0:
-            avg_time = duration / self.stats["processed_files"]
-            logger.info(f"平均处理时间: {avg_time:.2f} 秒/文件")
-        
-        success_rate = (self.stats["processed_files"] / self.stats["total_files"]) * 100
-        logger.info(f"成功率: {success_rate:.1f}%")
+        logger.info(
+            f"吞吐量: {rates['files_per_second']:.2f} 文件/s, "
+            f"{rates['chunks_per_second']:.1f} 文本块/s, "
+            f"{rates['embeddings_per_second']:.1f} 嵌入/s"
+        )
+        logger.info(f"断点清单: {self.manifest.path}")
+        for key, error in sorted(self.failures.items()):
+            logger.info(f"失败文件: {key} - {error}")
         logger.info("=" * 60)
 
 
 async def main():
     """主函数"""
-    parser = argparse.ArgumentParser(description="RAG索引构建脚本")
+    parser = argparse.ArgumentParser(description="RAG索引批量构建脚本")
     parser.add_argument(
-        "directory", 
-        type=str, 
+        "directory",
+        type=str,
         help="包含文档的目录路径"
     )
     parser.add_argument(
-        "--course-id", 
-        type=str, 
+        "--course-id",
+        type=str,
         required=True,
         help="课程ID"
     )
     parser.add_argument(
-        "--collection-name", 
-        type=str, 
+        "--collection-name",
+        type=str,
         help="Qdrant集合名称（可选，默认使用配置中的名称）"
     )
     parser.add_argument(
-        "--pattern", 
-        type=str, 
+        "--pattern",
+        type=str,
         default="*.md",
-        help="文件匹配模式（默认: *.md）"
+        help="文件匹配模式（默认: *.md，递归匹配使用 **/*.md）"
+    )
+    parser.add_argument(
+        "--readers",
+        type=int,
+        default=4,
+        help="并行读取与分块文件的协程数（默认: 4）"
+    )
+    parser.add_argument(
+        "--upserters",
+        type=int,
+        default=2,
+        help="并行写入Qdrant的协程数（默认: 2）"
     )
     parser.add_argument(
-        "--log-level", 
-        type=str, 
+        "--group-size",
+        type=int,
+        help="跨文件合并后每次提交嵌入的文本块数量（默认: 写入分段大小）"
+    )
+    parser.add_argument(
+        "--inflight-groups",
+        type=int,
+        default=2,
+        help="同时在途的嵌入分组数量（默认: 2）"
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        help="断点清单路径（默认: data/outputs/rag/manifests/{课程ID}_{集合}.json）"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="忽略断点清单，重新索引全部文件"
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=5.0,
+        help="吞吐量报告间隔秒数（默认: 5）"
+    )
+    parser.add_argument(
+        "--log-level",
+        type=str,
         default="INFO",
         choices=["DEBUG", "INFO", "WARNING", "ERROR"],
         help="日志级别（默认: INFO）"
     )
-    
+
     args = parser.parse_args()
-    
+
     # 设置日志级别
     logger.remove()
     logger.add(sys.stderr, level=args.log_level)
-    
+
     # 验证目录
     directory = Path(args.directory)
     if not directory.exists():
         logger.error(f"目录不存在: {directory}")
         sys.exit(1)
-    
+
     if not directory.is_dir():
         logger.error(f"路径不是目录: {directory}")
         sys.exit(1)
-    
-    # 创建构建器并执行
-    builder = RAGIndexBuilder()
-    
+
     try:
+        # 创建构建器并执行
+        builder = RAGIndexBuilder(
+            readers=args.readers,
+            upserters=args.upserters,
+            group_size=args.group_size,
+            max_inflight_groups=args.inflight_groups,
+            report_interval=args.report_interval
+        )
         stats = await builder.build_index_from_directory(
             directory=directory,
             course_id=args.course_id,
             collection_name=args.collection_name,
-            file_pattern=args.pattern
+            file_pattern=args.pattern,
+            manifest_path=Path(args.manifest) if args.manifest else None,
+            force=args.force
         )
-        
-        # 根据结果设置退出码
-        if stats["failed_files"] == 0:
-            logger.info("🎉 所有文件处理成功！")
-            sys.exit(0)
-        elif stats["processed_files"] > 0:
-            logger.warning("⚠️ 部分文件处理失败")
-            sys.exit(1)
-        else:
-            logger.error("❌ 所有文件处理失败")
-            sys.exit(2)
-    
+
     except Exception as e:
         logger.error(f"索引构建过程中出现错误: {e}")
+        await get_client_registry().shutdown()
         sys.exit(3)
 
+    await get_client_registry().shutdown()
+
+    # 根据结果设置退出码
+    if stats["failed_files"] == 0:
+        logger.info("🎉 所有文件处理成功！")
+        sys.exit(0)
+    elif stats["processed_files"] + stats["skipped_files"] > 0:
+        logger.warning("⚠️ 部分文件处理失败")
+        sys.exit(1)
+    else:
+        logger.error("❌ 所有文件处理失败")
+        sys.exit(2)
+
 
 if __name__ == "__main__":
     asyncio.run(main())
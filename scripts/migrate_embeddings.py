@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+嵌入模型迁移脚本
+分页滚动读取源集合，复用向量点载荷中保存的文本块（text）以新的嵌入模型重新生成向量，
+按原ID与载荷写入新维度的目标集合，无需重新上传文件。
+嵌入请求以大批次并发执行并限制在每秒请求数预算内；每页写入后记录滚动偏移量断点，
+中断后重新运行从断点继续。
+
+迁移期间写入源集合的新文本块可能被遗漏，建议在写入较少时执行，完成后核对数量；
+目标集合默认为别名的新版本，可通过 rebuild_rag_collection.py swap 切换。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+from loguru import logger
+from qdrant_client.http import models
+from qdrant_client.http.models import PointStruct
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from llama_index.embeddings.openai import OpenAIEmbedding
+
+from app.core.config import get_settings
+from app.core.client_registry import get_client_registry
+from app.constants.paths import RAG_DIR
+from app.repositories.qdrant_profiles import (
+    alias_of_version, get_collection_profile, versioned_collection_name
+)
+from app.services.rag.rag_settings import get_rag_config_manager, initialize_rag_config
+from app.services.rag.embedding_pipeline import EmbeddingPipeline
+from app.utils.ratelimit import AsyncRateLimiter
+
+# Qdrant默认的建索引阈值（KB），段大小超过该值时建立HNSW索引
+_DEFAULT_INDEXING_THRESHOLD = 20000
+
+ScrollOffset = Optional[Union[int, str]]
+
+
+def default_checkpoint_path(source: str, model: str, dimensions: Optional[int] = None) -> Path:
+    """默认断点路径：按源集合与目标模型区分，未指定目标集合时可据此继续上次的迁移"""
+    suffix = f"_{dimensions}" if dimensions else ""
+    return RAG_DIR / "manifests" / f"migrate_{source}_{model.replace('/', '_')}{suffix}.json"
+
+
+class MigrationCheckpoint:
+    """迁移断点：记录已完整写入目标集合的滚动偏移量"""
+
+    VERSION = 1
+
+    def __init__(self, path: Path, source: str, target: str, model: str, dimensions: Optional[int]):
+        """
+        初始化迁移断点
+
+        Args:
+            path: 断点文件路径
+            source: 源物理集合名称
+            target: 目标集合名称
+            model: 嵌入模型名称
+            dimensions: 嵌入向量维度参数
+        """
+        self.path = path
+        self.source = source
+        self.target = target
+        self.model = model
+        self.dimensions = dimensions
+        # 下一页的起始偏移量，之前的向量点均已写入目标集合
+        self.offset: ScrollOffset = None
+        self.vector_size: Optional[int] = None
+        self.migrated = 0
+        self.skipped = 0
+        self.done = False
+
+    def load(self) -> bool:
+        """
+        读取断点文件
+
+        Returns:
+            是否存在断点
+
+        Raises:
+            ValueError: 断点与本次迁移的源、目标或模型不一致
+        """
+        if not self.path.exists():
+            return False
+        data = json.loads(self.path.read_text(encoding="utf-8"))
+        expected = {"source": self.source, "target": self.target, "model": self.model, "dimensions": self.dimensions}
+        actual = {key: data.get(key) for key in expected}
+        if actual != expected:
+            raise ValueError(f"断点 {self.path} 与本次迁移不一致: {actual}，如需重新迁移请使用 --reset")
+
+        self.offset = data.get("offset")
+        self.vector_size = data.get("vector_size")
+        self.migrated = data.get("migrated", 0)
+        self.skipped = data.get("skipped", 0)
+        self.done = data.get("done", False)
+        return True
+
+    def save(self) -> None:
+        """写入断点文件（先写临时文件再替换，避免中断时损坏）"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        temp_path.write_text(json.dumps({
+            "version": self.VERSION,
+            "source": self.source,
+            "target": self.target,
+            "model": self.model,
+            "dimensions": self.dimensions,
+            "vector_size": self.vector_size,
+            "offset": self.offset,
+            "migrated": self.migrated,
+            "skipped": self.skipped,
+            "done": self.done,
+            "updated_at": datetime.now().isoformat()
+        }, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(temp_path, self.path)
+
+
+class EmbeddingMigrator:
+    """嵌入模型迁移器"""
+
+    def __init__(
+        self,
+        source: str,
+        target: str,
+        model: str,
+        dimensions: Optional[int] = None,
+        requests_per_second: float = 5.0,
+        batch_size: int = 256,
+        concurrency: int = 8,
+        scroll_size: int = 1024,
+        inflight_pages: int = 4,
+        checkpoint_path: Optional[Path] = None,
+        use_cache: bool = True,
+        report_interval: float = 10.0
+    ):
+        """
+        初始化迁移器
+
+        Args:
+            source: 源集合或别名
+            target: 目标集合
+            model: 新的嵌入模型名称
+            dimensions: 嵌入向量维度参数（仅支持缩短维度的模型可用），默认使用模型原生维度
+            requests_per_second: 每秒嵌入请求数预算
+            batch_size: 单次嵌入请求的文本块数量
+            concurrency: 同时在途的嵌入请求数量
+            scroll_size: 每页滚动读取的向量点数量
+            inflight_pages: 同时处理的页数
+            checkpoint_path: 断点文件路径，默认为 data/outputs/rag/manifests/migrate_{源集合}_{模型}.json
+            use_cache: 是否查询和写入嵌入缓存（指定维度参数时不使用缓存）
+            report_interval: 进度报告间隔（秒）
+        """
+        self.settings = get_settings()
+        initialize_rag_config(self.settings)
+        self.qdrant_repo = get_client_registry().get_qdrant_repository()
+        self.client = self.qdrant_repo.client
+
+        self.source = source
+        self.target = target
+        self.model = model
+        self.dimensions = dimensions
+        self.scroll_size = max(1, scroll_size)
+        self.inflight_pages = max(1, inflight_pages)
+        self.checkpoint_path = checkpoint_path or default_checkpoint_path(source, model, dimensions)
+        self.report_interval = report_interval
+
+        self.rate_limiter = AsyncRateLimiter(requests_per_second, burst=max(1, concurrency))
+        embed_kwargs: Dict[str, Any] = {"dimensions": dimensions} if dimensions else {}
+        self.embed_model = OpenAIEmbedding(
+            model=model,
+            api_key=self.settings.api_key,
+            api_base=self.settings.base_url,
+            embed_batch_size=max(1, batch_size),
+            **embed_kwargs
+        )
+        # 同一模型不同维度的向量不能共用缓存命名空间
+        self.pipeline = EmbeddingPipeline(
+            get_rag_config_manager(),
+            embed_model=self.embed_model,
+            use_cache=use_cache and not dimensions,
+            batch_size=batch_size,
+            concurrency=concurrency,
+            rate_limiter=self.rate_limiter
+        )
+
+        self.checkpoint: Optional[MigrationCheckpoint] = None
+        self.start_time = 0.0
+        self.pages = 0
+
+    async def run(self, reset: bool = False) -> Dict[str, Any]:
+        """
+        执行迁移
+
+        Args:
+            reset: 忽略已有断点，从头迁移
+
+        Returns:
+            迁移统计
+        """
+        source_collection = await self.qdrant_repo.get_alias_target(self.source) or self.source
+        if not await self.client.collection_exists(source_collection):
+            raise ValueError(f"源集合不存在: {self.source}")
+        if source_collection == self.target or self.target == self.source:
+            raise ValueError("目标集合不能与源集合相同")
+
+        self.checkpoint = MigrationCheckpoint(
+            self.checkpoint_path, source_collection, self.target, self.model, self.dimensions
+        )
+        if not reset and self.checkpoint.load():
+            if self.checkpoint.done:
+                logger.info(f"迁移已完成，无需继续: {self.checkpoint_path}")
+                return self._stats()
+            logger.info(f"从断点继续 - 偏移量: {self.checkpoint.offset}, 已迁移: {self.checkpoint.migrated}")
+
+        logger.info(f"🚚 嵌入迁移: {source_collection} -> {self.target}, 模型: {self.model}")
+        logger.info(
+            f"每秒请求预算: {self.rate_limiter.rate}, 批次: {self.pipeline.batch_size} 个文本块, "
+            f"并发: {self.pipeline.concurrency}, 每页: {self.scroll_size}, 同时处理页数: {self.inflight_pages}"
+        )
+
+        if self.checkpoint.vector_size is None:
+            self.checkpoint.vector_size = await self._probe_vector_size()
+        profile = get_collection_profile(self.settings, self.target)
+        if not await self.qdrant_repo.create_collection(self.target, self.checkpoint.vector_size, profile=profile):
+            raise RuntimeError(f"创建目标集合失败: {self.target}")
+        self.checkpoint.save()
+
+        # 批量写入期间暂停建立HNSW索引，写入完成后统一建立
+        collection_info = await self.client.get_collection(self.target)
+        # 中断的迁移可能没有恢复阈值，继续时读到0按默认值恢复
+        indexing_threshold = collection_info.config.optimizer_config.indexing_threshold \
+            or _DEFAULT_INDEXING_THRESHOLD
+        await self.client.update_collection(
+            collection_name=self.target,
+            optimizer_config=models.OptimizersConfigDiff(indexing_threshold=0)
+        )
+
+        self.start_time = time.perf_counter()
+        reporter = asyncio.create_task(self._report_loop())
+        try:
+            await self._migrate(source_collection)
+        finally:
+            reporter.cancel()
+            await asyncio.gather(reporter, return_exceptions=True)
+            await self.client.update_collection(
+                collection_name=self.target,
+                optimizer_config=models.OptimizersConfigDiff(indexing_threshold=indexing_threshold)
+            )
+
+        await self._verify(source_collection)
+        self._print_summary()
+        return self._stats()
+
+    async def _probe_vector_size(self) -> int:
+        """生成一个探测向量，确定新模型的向量维度"""
+        await self.rate_limiter.acquire()
+        embedding = await self.embed_model.aget_text_embedding("向量维度探测")
+        logger.info(f"模型 {self.model} 的向量维度: {len(embedding)}")
+        return len(embedding)
+
+    async def _migrate(self, source_collection: str) -> None:
+        """滚动读取源集合，多页并行嵌入与写入，按页序提交断点"""
+        page_queue: asyncio.Queue = asyncio.Queue(maxsize=self.inflight_pages)
+        finished_pages: Dict[int, Tuple[ScrollOffset, int, int]] = {}
+        next_commit = 0
+
+        async def read_pages() -> None:
+            # 滚动偏移量依赖上一页的结果，读取只能顺序进行
+            offset = self.checkpoint.offset
+            sequence = 0
+            while True:
+                points, next_offset = await self.client.scroll(
+                    collection_name=source_collection,
+                    limit=self.scroll_size,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=False
+                )
+                await page_queue.put((sequence, points, next_offset))
+                sequence += 1
+                if next_offset is None:
+                    break
+                offset = next_offset
+            for _ in range(self.inflight_pages):
+                await page_queue.put(None)
+
+        async def commit(sequence: int, next_offset: ScrollOffset, migrated: int, skipped: int) -> None:
+            # 只有之前的页全部写入后才推进断点，中断后从第一个未完成的页重新开始
+            nonlocal next_commit
+            finished_pages[sequence] = (next_offset, migrated, skipped)
+            while next_commit in finished_pages:
+                next_offset, migrated, skipped = finished_pages.pop(next_commit)
+                self.checkpoint.offset = next_offset
+                self.checkpoint.migrated += migrated
+                self.checkpoint.skipped += skipped
+                self.checkpoint.done = next_offset is None
+                next_commit += 1
+            self.checkpoint.save()
+
+        async def process_pages() -> None:
+            while True:
+                item = await page_queue.get()
+                if item is None:
+                    return
+                sequence, points, next_offset = item
+                migrated, skipped = await self._migrate_page(points)
+                self.pages += 1
+                await commit(sequence, next_offset, migrated, skipped)
+
+        tasks = [asyncio.create_task(read_pages())] + [
+            asyncio.create_task(process_pages()) for _ in range(self.inflight_pages)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _migrate_page(self, points: List[models.Record]) -> Tuple[int, int]:
+        """
+        重新嵌入一页向量点并写入目标集合
+
+        Returns:
+            (写入数量, 缺少文本而跳过的数量)
+        """
+        records = [point for point in points if (point.payload or {}).get("text")]
+        skipped = len(points) - len(records)
+        if skipped:
+            logger.warning(f"{skipped} 个向量点的载荷中没有文本，已跳过")
+        if not records:
+            return 0, skipped
+
+        embeddings = await self.pipeline.embed_texts([record.payload["text"] for record in records])
+        new_points = [
+            PointStruct(id=record.id, vector=embedding, payload=record.payload)
+            for record, embedding in zip(records, embeddings)
+        ]
+        if not await self.qdrant_repo.upsert_points(self.target, new_points):
+            raise RuntimeError(f"写入目标集合失败: {self.target}")
+        return len(new_points), skipped
+
+    async def _verify(self, source_collection: str) -> None:
+        """核对源集合与目标集合的向量数量"""
+        source_count = await self.qdrant_repo.count_points(source_collection)
+        target_count = await self.qdrant_repo.count_points(self.target)
+        expected = source_count - self.checkpoint.skipped
+        if target_count == expected:
+            logger.info(f"📏 数量核对一致 - 源: {source_count}, 跳过: {self.checkpoint.skipped}, 目标: {target_count}")
+        else:
+            logger.warning(
+                f"⚠️ 数量不一致 - 源: {source_count}, 跳过: {self.checkpoint.skipped}, 目标: {target_count}，"
+                f"迁移期间源集合可能有写入或删除"
+            )
+
+    async def _report_loop(self) -> None:
+        """定期输出进度与吞吐量"""
+        while True:
+            await asyncio.sleep(self.report_interval)
+            elapsed = time.perf_counter() - self.start_time
+            limiter = self.rate_limiter.get_stats()
+            logger.info(
+                f"📈 已迁移 {self.checkpoint.migrated} 个向量点 | 页: {self.pages} | "
+                f"{self.checkpoint.migrated / elapsed if elapsed else 0:.1f} 点/s | "
+                f"嵌入请求: {limiter['acquired']}，限流等待: {limiter['waited_seconds']}s"
+            )
+
+    def _stats(self) -> Dict[str, Any]:
+        """迁移统计"""
+        return {
+            "source": self.checkpoint.source,
+            "target": self.target,
+            "model": self.model,
+            "vector_size": self.checkpoint.vector_size,
+            "migrated": self.checkpoint.migrated,
+            "skipped": self.checkpoint.skipped,
+            "done": self.checkpoint.done,
+            "rate_limiter": self.rate_limiter.get_stats()
+        }
+
+    def _print_summary(self) -> None:
+        """打印迁移摘要"""
+        duration = time.perf_counter() - self.start_time
+        stats = self._stats()
+        logger.info("=" * 60)
+        logger.info("📊 嵌入迁移摘要")
+        logger.info("=" * 60)
+        logger.info(f"源集合: {stats['source']} -> 目标集合: {stats['target']}")
+        logger.info(f"嵌入模型: {stats['model']}，向量维度: {stats['vector_size']}")
+        logger.info(f"已迁移: {stats['migrated']}，跳过: {stats['skipped']}")
+        logger.info(f"本次耗时: {duration:.2f} 秒")
+        logger.info(f"嵌入请求: {stats['rate_limiter']['acquired']}，限流等待: {stats['rate_limiter']['waited_seconds']}s")
+        logger.info(f"断点文件: {self.checkpoint_path}")
+        if alias_of_version(self.target):
+            logger.info(
+                f"切换别名前请确认查询侧嵌入模型已改为 {self.model}，"
+                f"然后执行: python scripts/rebuild_rag_collection.py swap --to {self.target}"
+            )
+        logger.info("=" * 60)
+
+
+async def main():
+    """主函数"""
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="嵌入模型迁移脚本（复用已存储的文本块重新生成向量）")
+    parser.add_argument("--model", required=True, help="新的嵌入模型名称")
+    parser.add_argument("--dimensions", type=int, help="嵌入向量维度参数（默认: 模型原生维度）")
+    parser.add_argument("--source", default=settings.qdrant_collection_name, help="源集合或别名（默认: 配置中的集合名称）")
+    parser.add_argument("--target", help="目标集合（默认: 继续断点中的目标集合，或源别名的新版本 {别名}_v{时间}）")
+    parser.add_argument("--rps", type=float, default=5.0, help="每秒嵌入请求数预算（默认: 5）")
+    parser.add_argument("--batch-size", type=int, default=256, help="单次嵌入请求的文本块数量（默认: 256）")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时在途的嵌入请求数量（默认: 8）")
+    parser.add_argument("--scroll-size", type=int, default=1024, help="每页滚动读取的向量点数量（默认: 1024）")
+    parser.add_argument("--inflight-pages", type=int, default=4, help="同时处理的页数（默认: 4）")
+    parser.add_argument("--checkpoint", help="断点文件路径（默认: data/outputs/rag/manifests/migrate_{源集合}_{模型}.json）")
+    parser.add_argument("--no-cache", action="store_true", help="不使用嵌入缓存")
+    parser.add_argument("--reset", action="store_true", help="忽略已有断点，从头迁移")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="进度报告间隔秒数（默认: 10）")
+    parser.add_argument(
+        "--log-level",
+        type=str,
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        help="日志级别（默认: INFO）"
+    )
+
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    checkpoint_path = Path(args.checkpoint) if args.checkpoint \
+        else default_checkpoint_path(args.source, args.model, args.dimensions)
+    target = args.target
+    if target is None and not args.reset and checkpoint_path.exists():
+        target = json.loads(checkpoint_path.read_text(encoding="utf-8")).get("target")
+    target = target or versioned_collection_name(alias_of_version(args.source) or args.source)
+
+    migrator = EmbeddingMigrator(
+        source=args.source,
+        target=target,
+        model=args.model,
+        dimensions=args.dimensions,
+        requests_per_second=args.rps,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        scroll_size=args.scroll_size,
+        inflight_pages=args.inflight_pages,
+        checkpoint_path=checkpoint_path,
+        use_cache=not args.no_cache,
+        report_interval=args.report_interval
+    )
+
+    try:
+        stats = await migrator.run(reset=args.reset)
+    except Exception as e:
+        logger.error(f"嵌入迁移失败: {e}")
+        await get_client_registry().shutdown()
+        sys.exit(1)
+
+    await get_client_registry().shutdown()
+    sys.exit(0 if stats["done"] else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,6 +7,7 @@ import os
 import sys
 import asyncio
 import argparse
+import hashlib
 from pathlib import Path
 from typing import List, Dict, Any
 import json
@@ -17,7 +18,8 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from app.core.config import get_settings
-from app.repositories.rag_repository import QdrantRepository
+from app.repositories.rag_repository import AsyncQdrantRepository
+from app.repositories.qdrant_profiles import COLLECTION_PROFILES, chunk_point_id, get_collection_profile
 
 
 class RAGDataManager:
@@ -26,7 +28,7 @@ class RAGDataManager:
     def __init__(self):
         """初始化管理器"""
         self.settings = get_settings()
-        self.qdrant_repo = QdrantRepository(self.settings)
+        self.qdrant_repo = AsyncQdrantRepository(self.settings)
     
     async def list_collections(self) -> List[Dict[str, Any]]:
         """列出所有集合"""
@@ -154,16 +156,21 @@ class RAGDataManager:
     async def create_collection(
         self, 
         collection_name: str, 
-        vector_size: int = 1536
+        vector_size: int = 1536,
+        profile_name: str = None
     ) -> bool:
         """创建新集合"""
         try:
+            profile = COLLECTION_PROFILES[profile_name] if profile_name \
+                else get_collection_profile(self.settings, collection_name)
             logger.info(f"创建集合: {collection_name}")
             logger.info(f"向量维度: {vector_size}")
+            logger.info(f"调优配置: {profile.name}")
             
             success = await self.qdrant_repo.create_collection(
                 collection_name=collection_name,
-                vector_size=vector_size
+                vector_size=vector_size,
+                profile=profile
             )
             
             if success:
@@ -177,6 +184,42 @@ class RAGDataManager:
             logger.error(f"创建集合失败: {e}")
             raise
     
+    def list_profiles(self) -> None:
+        """列出可用的集合调优配置"""
+        default_name = self.settings.qdrant_collection_profile
+        logger.info("⚙️ 集合调优配置:")
+        logger.info("-" * 60)
+        for name, profile in COLLECTION_PROFILES.items():
+            logger.info(f"{name}{'（默认）' if name == default_name else ''}: {profile.description}")
+            for key, value in profile.to_dict().items():
+                if key not in ("name", "description"):
+                    logger.info(f"  {key}: {value}")
+            logger.info("-" * 60)
+        for collection_name, name in self.settings.qdrant_collection_profiles.items():
+            logger.info(f"集合 {collection_name} 指定配置: {name}")
+    
+    async def apply_profile(self, collection_name: str, profile_name: str = None) -> bool:
+        """将调优配置应用到已有集合，不指定时使用配置中为该集合指定的调优配置"""
+        try:
+            profile = COLLECTION_PROFILES[profile_name] if profile_name \
+                else get_collection_profile(self.settings, collection_name)
+            logger.info(f"应用调优配置 {profile.name} 到集合 {collection_name}: {profile.description}")
+            
+            result = await self.qdrant_repo.apply_collection_profile(collection_name, profile)
+            for item in result["skipped"]:
+                logger.warning(f"未能在线应用: {item}")
+            
+            if result["success"]:
+                logger.info(f"✅ 集合 {collection_name} 已应用调优配置 {profile.name}，Qdrant将在后台按新配置重建段")
+            else:
+                logger.error(f"❌ 集合 {collection_name} 调优配置应用失败")
+            
+            return result["success"]
+        
+        except Exception as e:
+            logger.error(f"应用调优配置失败: {e}")
+            raise
+    
     async def count_vectors(self, collection_name: str) -> int:
         """统计集合中的向量数量"""
         try:
@@ -188,9 +231,69 @@ class RAGDataManager:
             logger.error(f"统计向量数量失败: {e}")
             raise
     
-    def close(self):
+    async def dedup_collection(self, collection_name: str, dry_run: bool = False) -> Dict[str, int]:
+        """
+        清理集合中的重复文本块
+
+        按 (课程ID, 材料ID, 文本块序号, 内容哈希) 分组，每组只保留一个向量点，
+        优先保留与确定性点ID一致的向量点
+        """
+        try:
+            logger.info(f"开始扫描集合: {collection_name}")
+            records = await self.qdrant_repo.scroll_points(
+                collection_name,
+                with_payload=["course_id", "course_material_id", "chunk_index", "content_hash", "text"]
+            )
+            
+            groups: Dict[tuple, List[Any]] = {}
+            for record in records:
+                payload = record.payload or {}
+                content_hash = payload.get("content_hash") or hashlib.sha256(
+                    payload.get("text", "").encode("utf-8")
+                ).hexdigest()
+                key = (
+                    payload.get("course_id"),
+                    payload.get("course_material_id"),
+                    payload.get("chunk_index"),
+                    content_hash
+                )
+                groups.setdefault(key, []).append(record)
+            
+            duplicate_ids = []
+            for (course_id, course_material_id, chunk_index, content_hash), group in groups.items():
+                if len(group) < 2:
+                    continue
+                expected_id = chunk_point_id(
+                    collection_name, course_id, course_material_id, chunk_index, content_hash
+                )
+                keep = next((r for r in group if str(r.id) == expected_id), group[0])
+                duplicate_ids.extend(r.id for r in group if r is not keep)
+            
+            logger.info(f"扫描向量点: {len(records)}, 唯一文本块: {len(groups)}, 重复向量点: {len(duplicate_ids)}")
+            
+            if duplicate_ids and not dry_run:
+                batch_size = 1000
+                for start in range(0, len(duplicate_ids), batch_size):
+                    batch = duplicate_ids[start:start + batch_size]
+                    if not await self.qdrant_repo.delete_points(collection_name, batch):
+                        raise RuntimeError("删除重复向量点失败")
+                logger.info(f"✅ 已删除 {len(duplicate_ids)} 个重复向量点")
+            elif dry_run:
+                logger.info("试运行模式，未删除任何向量点")
+            
+            return {
+                "scanned": len(records),
+                "unique": len(groups),
+                "duplicates": len(duplicate_ids)
+            }
+        
+        except Exception as e:
+            logger.error(f"清理重复文本块失败: {e}")
+            raise
+    
+    async def close(self):
         """关闭连接"""
-        self.qdrant_repo.close()
+        await self.qdrant_repo.close()
 
 
 async def main():
@@ -217,11 +320,25 @@ async def main():
     create_parser = subparsers.add_parser("create", help="创建新集合")
     create_parser.add_argument("collection_name", help="集合名称")
     create_parser.add_argument("--vector-size", type=int, default=1536, help="向量维度（默认: 1536）")
+    create_parser.add_argument("--profile", choices=list(COLLECTION_PROFILES), help="调优配置（默认: 配置中为该集合指定的调优配置）")
+    
+    # 列出调优配置
+    subparsers.add_parser("profiles", help="列出可用的集合调优配置")
+    
+    # 应用调优配置
+    apply_profile_parser = subparsers.add_parser("apply-profile", help="将调优配置应用到已有集合")
+    apply_profile_parser.add_argument("collection_name", help="集合名称")
+    apply_profile_parser.add_argument("--profile", choices=list(COLLECTION_PROFILES), help="调优配置（默认: 配置中为该集合指定的调优配置）")
     
     # 统计向量数量
     count_parser = subparsers.add_parser("count", help="统计集合中的向量数量")
     count_parser.add_argument("collection_name", help="集合名称")
     
+    # 清理重复文本块
+    dedup_parser = subparsers.add_parser("dedup", help="清理集合中的重复文本块")
+    dedup_parser.add_argument("collection_name", help="集合名称")
+    dedup_parser.add_argument("--dry-run", action="store_true", help="只统计不删除")
+    
     # 日志级别
     parser.add_argument(
         "--log-level", 
@@ -263,20 +380,32 @@ async def main():
         elif args.command == "create":
             success = await manager.create_collection(
                 args.collection_name, 
-                args.vector_size
+                args.vector_size,
+                args.profile
             )
             sys.exit(0 if success else 1)
         
+        elif args.command == "profiles":
+            manager.list_profiles()
+        
+        elif args.command == "apply-profile":
+            success = await manager.apply_profile(args.collection_name, args.profile)
+            sys.exit(0 if success else 1)
+        
         elif args.command == "count":
             count = await manager.count_vectors(args.collection_name)
             logger.info(f"向量数量: {count}")
+        
+        elif args.command == "dedup":
+            result = await manager.dedup_collection(args.collection_name, args.dry_run)
+            logger.info(f"清理结果: {result}")
     
     except Exception as e:
         logger.error(f"执行命令时出错: {e}")
         sys.exit(1)
     
     finally:
-        manager.close()
+        await manager.close()
 
 
 if __name__ == "__main__":
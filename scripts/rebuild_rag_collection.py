@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+RAG集合零停机重建脚本
+业务代码与聊天引擎通过 qdrant_collection_name 访问集合，该名称在Qdrant中是一个别名，
+指向版本化的物理集合（{别名}_v{创建时间}）。修改分块参数或分块器后，从 data/uploads
+中保存的上传文件全量重建一个新版本，校验数量并预热后原子地切换别名，旧版本保留用于回滚。
+
+重建期间新上传的材料仍通过别名写入当前版本，重建在切换前后各补齐一轮新增或修改的文件，
+并删除上传文件已被清理的材料。更换嵌入模型时，查询侧的嵌入模型需要与别名切换同时更新。
+"""
+import sys
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from pathlib import Path
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+from loguru import logger
+from qdrant_client.http import models
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.config import get_settings
+from app.core.client_registry import get_client_registry
+from app.constants.paths import PROJECT_ROOT, RAG_DIR, UPLOADS_DIR
+from app.repositories.qdrant_profiles import (
+    alias_of_version, get_collection_profile, versioned_collection_name
+)
+from app.schemas.rag import IndexRequest, DocumentMetadata
+from build_rag_index import RAGIndexBuilder, IndexManifest
+
+# 上传文件的目录结构：data/uploads/course_{课程ID}/course_material_{材料ID}{扩展名}
+_COURSE_PREFIX = "course_"
+_MATERIAL_PREFIX = "course_material_"
+_UPLOAD_PATTERN = f"{_COURSE_PREFIX}*/{_MATERIAL_PREFIX}*"
+# Qdrant默认的建索引阈值（KB），段大小超过该值时建立HNSW索引
+_DEFAULT_INDEXING_THRESHOLD = 20000
+
+
+class UploadsIndexBuilder(RAGIndexBuilder):
+    """从上传目录构建索引，课程与材料ID从上传路径解析，元数据与在线索引一致"""
+
+    def _build_request(self, directory: Path, file_path: Path, content: str) -> IndexRequest:
+        """按上传路径构建索引请求"""
+        course_dir = file_path.relative_to(directory).parts[0]
+        try:
+            relative_path = file_path.relative_to(PROJECT_ROOT).as_posix()
+        except ValueError:
+            relative_path = str(file_path)
+
+        return IndexRequest(
+            file_content=content,
+            metadata=DocumentMetadata(
+                course_id=course_dir[len(_COURSE_PREFIX):],
+                course_material_id=file_path.stem[len(_MATERIAL_PREFIX):],
+                file_path=relative_path,
+                file_size=len(content.encode('utf-8')),
+                upload_time=datetime.fromtimestamp(file_path.stat().st_mtime).isoformat()
+            ),
+            collection_name=self.collection_name
+        )
+
+
+class CollectionRebuilder:
+    """版本化集合的重建、切换与回滚"""
+
+    def __init__(self, alias_name: Optional[str] = None):
+        """
+        初始化重建器
+
+        Args:
+            alias_name: 别名，默认使用配置中的集合名称
+        """
+        self.settings = get_settings()
+        self.alias_name = alias_name or self.settings.qdrant_collection_name
+        self.qdrant_repo = get_client_registry().get_qdrant_repository()
+        self.client = self.qdrant_repo.client
+
+    async def list_versions(self) -> List[str]:
+        """列出别名的全部版本，按创建时间升序"""
+        response = await self.client.get_collections()
+        return sorted(
+            collection.name for collection in response.collections
+            if alias_of_version(collection.name) == self.alias_name
+        )
+
+    async def _is_legacy(self) -> bool:
+        """别名名称是否仍是一个物理集合（引入别名之前创建的集合）"""
+        return await self.qdrant_repo.get_alias_target(self.alias_name) is None \
+            and await self.client.collection_exists(self.alias_name)
+
+    async def status(self) -> Dict[str, Any]:
+        """输出别名当前指向与各版本的向量数量"""
+        target = await self.qdrant_repo.get_alias_target(self.alias_name)
+        versions = await self.list_versions()
+        counts = await asyncio.gather(*(self.qdrant_repo.count_points(name) for name in versions))
+
+        logger.info(f"🔗 别名: {self.alias_name} -> {target or '（未创建）'}")
+        if target is None and await self._is_legacy():
+            logger.info(f"⚠️ {self.alias_name} 仍是物理集合，首次切换时需要 --replace-legacy")
+        logger.info("-" * 60)
+        for name, count in zip(versions, counts):
+            marker = "*" if name == target else " "
+            logger.info(f"{marker} {name}  向量数量: {count}")
+        logger.info("-" * 60)
+        return {"alias": self.alias_name, "target": target, "versions": dict(zip(versions, counts))}
+
+    async def rebuild(
+        self,
+        resume: Optional[str] = None,
+        vector_size: int = 1536,
+        max_passes: int = 3,
+        warmup_queries: int = 200,
+        swap: bool = True,
+        replace_legacy: bool = False,
+        readers: int = 4,
+        upserters: int = 2,
+        group_size: Optional[int] = None,
+        max_inflight_groups: int = 2,
+        force: bool = False
+    ) -> Optional[str]:
+        """
+        从上传文件全量重建新版本并切换别名
+
+        Args:
+            resume: 继续之前中断的重建，传入该版本的集合名称
+            vector_size: 向量维度
+            max_passes: 切换前补齐新增文件的最大轮数
+            warmup_queries: 切换前预热检索的次数
+            swap: 重建完成后是否切换别名
+            replace_legacy: 别名名称仍是物理集合时，切换前删除该集合
+            readers: 并行读取与分块文件的协程数
+            upserters: 并行写入Qdrant的协程数
+            group_size: 每次提交嵌入的文本块数量
+            max_inflight_groups: 同时在途的嵌入分组数量
+            force: 当前版本中的材料在新版本中缺失时仍然切换别名
+
+        Returns:
+            新版本的集合名称，校验失败时返回None
+        """
+        if swap and await self._is_legacy() and not replace_legacy:
+            logger.error(f"{self.alias_name} 仍是物理集合，切换别名需要删除它，请确认后加 --replace-legacy")
+            return None
+
+        if resume:
+            if alias_of_version(resume) != self.alias_name:
+                logger.error(f"{resume} 不是别名 {self.alias_name} 的版本")
+                return None
+            collection_name = resume
+        else:
+            collection_name = versioned_collection_name(self.alias_name)
+        builder_options = {
+            "readers": readers,
+            "upserters": upserters,
+            "group_size": group_size,
+            "max_inflight_groups": max_inflight_groups
+        }
+        manifest_path = RAG_DIR / "manifests" / f"rebuild_{collection_name}.json"
+        logger.info(f"🏗️ 重建版本: {collection_name}（别名: {self.alias_name}）")
+
+        profile = get_collection_profile(self.settings, self.alias_name)
+        if not await self.qdrant_repo.create_collection(collection_name, vector_size, profile=profile):
+            return None
+        # 批量写入期间暂停建立HNSW索引，写入完成后统一建立
+        collection_info = await self.client.get_collection(collection_name)
+        # 中断的重建可能没有恢复阈值，继续时读到0按默认值恢复
+        indexing_threshold = collection_info.config.optimizer_config.indexing_threshold \
+            or _DEFAULT_INDEXING_THRESHOLD
+        await self.client.update_collection(
+            collection_name=collection_name,
+            optimizer_config=models.OptimizersConfigDiff(indexing_threshold=0)
+        )
+
+        try:
+            if not await self._index_uploads(collection_name, manifest_path, builder_options, max_passes):
+                return None
+        finally:
+            await self.client.update_collection(
+                collection_name=collection_name,
+                optimizer_config=models.OptimizersConfigDiff(indexing_threshold=indexing_threshold)
+            )
+
+        await self._wait_until_optimized(collection_name)
+        if not await self._verify(collection_name, manifest_path, force=force):
+            return None
+        await self._warm_up(collection_name, warmup_queries)
+
+        if not swap:
+            logger.info(f"✅ 版本 {collection_name} 已就绪，未切换别名，可通过 swap --to {collection_name} 切换")
+            return collection_name
+
+        if not await self.swap(collection_name, replace_legacy=replace_legacy):
+            return None
+        # 补齐切换前最后一轮之后写入旧版本的文件
+        await self._index_uploads(collection_name, manifest_path, builder_options, max_passes=1)
+        return collection_name
+
+    async def _index_uploads(
+        self,
+        collection_name: str,
+        manifest_path: Path,
+        builder_options: Dict[str, Any],
+        max_passes: int
+    ) -> bool:
+        """
+        索引上传文件并补齐新增或修改的文件，直到一轮中没有需要处理的文件
+
+        每轮通过断点清单跳过内容未变化的文件，只处理重建期间新增或修改的文件
+
+        Returns:
+            最后一轮是否没有失败的文件
+        """
+        stats: Dict[str, Any] = {}
+        for index in range(max(1, max_passes)):
+            builder = UploadsIndexBuilder(**builder_options)
+            stats = await builder.build_index_from_directory(
+                directory=UPLOADS_DIR,
+                course_id="uploads",
+                collection_name=collection_name,
+                file_pattern=_UPLOAD_PATTERN,
+                manifest_path=manifest_path
+            )
+            logger.info(
+                f"第 {index + 1} 轮索引完成 - 处理: {stats['processed_files']}, "
+                f"跳过: {stats['skipped_files']}, 失败: {stats['failed_files']}"
+            )
+            if stats["processed_files"] == 0 and stats["failed_files"] == 0:
+                break
+
+        await self._remove_deleted_materials(collection_name, manifest_path)
+        if stats.get("failed_files"):
+            logger.error(f"❌ {stats['failed_files']} 个文件索引失败，未切换别名，修复后使用 --resume {collection_name} 继续")
+            return False
+        return True
+
+    async def _remove_deleted_materials(self, collection_name: str, manifest_path: Path) -> None:
+        """删除上传文件已被清理（课程或材料已删除）的材料的文本块"""
+        manifest = self._load_manifest(collection_name, manifest_path)
+        for key, entry in list(manifest.files.items()):
+            if (UPLOADS_DIR / key).exists():
+                continue
+            await self.qdrant_repo.delete_vectors_by_filter(
+                {"must": [
+                    {"key": "course_id", "match": {"value": entry["course_id"]}},
+                    {"key": "course_material_id", "match": {"value": entry["course_material_id"]}}
+                ]},
+                collection_name
+            )
+            manifest.forget(key)
+            logger.info(f"上传文件已删除，移除材料: {key}")
+        manifest.save()
+
+    def _load_manifest(self, collection_name: str, manifest_path: Path) -> IndexManifest:
+        """读取重建使用的断点清单"""
+        indexing_service = get_client_registry().get_document_indexing_service()
+        manifest = IndexManifest(
+            manifest_path,
+            collection_name,
+            indexing_service.embedding_pipeline.embed_model.model_name
+        )
+        manifest.load()
+        return manifest
+
+    async def _wait_until_optimized(self, collection_name: str, timeout: float = 3600.0) -> None:
+        """等待HNSW索引与段优化完成（状态为 green），避免切换后检索落在未建索引的段上"""
+        start_time = time.perf_counter()
+        while time.perf_counter() - start_time < timeout:
+            info = await self.client.get_collection(collection_name)
+            if info.status == models.CollectionStatus.GREEN:
+                logger.info(f"集合 {collection_name} 索引已就绪，等待 {time.perf_counter() - start_time:.1f}s")
+                return
+            await asyncio.sleep(2.0)
+        logger.warning(f"等待集合 {collection_name} 优化超时，继续执行")
+
+    async def _verify(self, collection_name: str, manifest_path: Path, force: bool = False) -> bool:
+        """校验新版本的向量数量与断点清单记录的文本块数量一致，且包含当前版本中的全部材料"""
+        manifest = self._load_manifest(collection_name, manifest_path)
+        expected = sum(entry.get("chunk_count", 0) for entry in manifest.files.values())
+        actual = await self.qdrant_repo.count_points(collection_name)
+        current = await self.qdrant_repo.count_points(self.alias_name)
+
+        logger.info(f"📏 数量校验 - 文件: {len(manifest.files)}, 期望文本块: {expected}, 实际: {actual}, 当前版本: {current}")
+        if actual != expected:
+            logger.error(f"❌ 版本 {collection_name} 的向量数量与期望不一致，未切换别名")
+            return False
+        return await self.verify_materials(collection_name, force=force)
+
+    async def _count_by_material(self, collection_name: str) -> Counter:
+        """按 (课程ID, 材料ID) 统计集合中的向量点数量"""
+        records = await self.qdrant_repo.scroll_points(
+            collection_name, with_payload=["course_id", "course_material_id"], batch_size=1024
+        )
+        return Counter(
+            ((record.payload or {}).get("course_id"), (record.payload or {}).get("course_material_id"))
+            for record in records
+        )
+
+    async def verify_materials(self, collection_name: str, force: bool = False) -> bool:
+        """
+        按材料比对当前版本与新版本：通过 /rag/index 或其他目录写入当前版本的材料不在上传目录中，
+        重建时不会被包含，这类材料缺失时拒绝切换别名
+
+        Args:
+            collection_name: 新版本
+            force: 存在缺失的材料时仍然允许切换
+
+        Returns:
+            是否允许切换
+        """
+        if await self.qdrant_repo.get_alias_target(self.alias_name) is None and not await self._is_legacy():
+            return True
+
+        current_counts, new_counts = await asyncio.gather(
+            self._count_by_material(self.alias_name), self._count_by_material(collection_name)
+        )
+        missing: List[Tuple[Any, Any]] = [key for key in current_counts if key not in new_counts]
+        changed = sum(1 for key, count in current_counts.items() if key in new_counts and new_counts[key] != count)
+
+        logger.info(
+            f"📏 材料校验 - 当前版本材料: {len(current_counts)}, 新版本材料: {len(new_counts)}, "
+            f"缺失: {len(missing)}, 文本块数量变化: {changed}"
+        )
+        if not missing:
+            return True
+
+        for course_id, course_material_id in missing[:20]:
+            logger.warning(
+                f"新版本缺少材料 - 课程ID: {course_id}, 材料ID: {course_material_id}, "
+                f"当前版本文本块: {current_counts[(course_id, course_material_id)]}"
+            )
+        if force:
+            logger.warning(f"⚠️ 新版本缺少 {len(missing)} 个材料，已指定 --force，继续切换")
+            return True
+        logger.error(f"❌ 新版本缺少 {len(missing)} 个材料，未切换别名；确认这些材料可以丢弃时加 --force")
+        return False
+
+    async def _warm_up(self, collection_name: str, queries: int) -> None:
+        """以集合中的已有向量作为查询执行检索，预先加载磁盘上的向量与索引"""
+        if queries <= 0:
+            return
+        points, _ = await self.client.scroll(
+            collection_name=collection_name,
+            limit=queries,
+            with_payload=False,
+            with_vectors=True
+        )
+        search_params = get_collection_profile(self.settings, collection_name).search_params()
+        start_time = time.perf_counter()
+        for point in points:
+            await self.client.search(
+                collection_name=collection_name,
+                query_vector=point.vector,
+                limit=5,
+                search_params=search_params
+            )
+        logger.info(f"🔥 预热完成 - 检索 {len(points)} 次，耗时 {time.perf_counter() - start_time:.1f}s")
+
+    async def swap(self, collection_name: str, replace_legacy: bool = False) -> bool:
+        """
+        将别名切换到指定版本
+
+        Args:
+            collection_name: 目标版本
+            replace_legacy: 别名名称仍是物理集合时，先删除该集合再创建别名
+
+        Returns:
+            是否切换成功
+        """
+        if alias_of_version(collection_name) != self.alias_name \
+                or not await self.client.collection_exists(collection_name):
+            logger.error(f"{collection_name} 不是别名 {self.alias_name} 的已有版本")
+            return False
+
+        if await self._is_legacy():
+            if not replace_legacy:
+                logger.error(f"{self.alias_name} 仍是物理集合，切换别名需要删除它，请确认后加 --replace-legacy")
+                return False
+            # 物理集合与别名不能同名：删除与创建别名之间有一次请求的间隔，之后的切换均为原子操作
+            logger.warning(f"删除引入别名之前的物理集合 {self.alias_name}，该集合无法回滚")
+            await self.client.delete_collection(self.alias_name)
+
+        previous = await self.qdrant_repo.swap_alias(self.alias_name, collection_name)
+        logger.info(f"✅ 别名 {self.alias_name} 已切换: {previous} -> {collection_name}")
+        return True
+
+    async def rollback(self, collection_name: Optional[str] = None) -> bool:
+        """
+        回滚到指定版本，未指定时回滚到当前版本之前最近的版本
+
+        Args:
+            collection_name: 目标版本
+
+        Returns:
+            是否回滚成功
+        """
+        target = await self.qdrant_repo.get_alias_target(self.alias_name)
+        if collection_name is None:
+            older = [name for name in await self.list_versions() if target is None or name < target]
+            if not older:
+                logger.error(f"别名 {self.alias_name} 没有可回滚的旧版本")
+                return False
+            collection_name = older[-1]
+        return await self.swap(collection_name)
+
+    async def prune(self, keep: int = 1) -> List[str]:
+        """
+        删除旧版本，保留当前版本、比当前版本新的版本与最近的 keep 个旧版本
+
+        Args:
+            keep: 保留的旧版本数量
+
+        Returns:
+            已删除的版本
+        """
+        target = await self.qdrant_repo.get_alias_target(self.alias_name)
+        if target is None:
+            logger.error(f"别名 {self.alias_name} 不存在，不删除任何版本")
+            return []
+
+        older = [name for name in await self.list_versions() if name < target]
+        removed = older[:max(0, len(older) - max(0, keep))]
+        for name in removed:
+            await self.qdrant_repo.delete_collection(name)
+            (RAG_DIR / "manifests" / f"rebuild_{name}.json").unlink(missing_ok=True)
+        logger.info(f"🧹 已删除旧版本: {', '.join(removed) or '无'}")
+        return removed
+
+
+async def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="RAG集合零停机重建脚本（版本化集合 + 别名切换）")
+    parser.add_argument("--alias", help="别名（默认: 配置中的集合名称）")
+    subparsers = parser.add_subparsers(dest="command", help="可用命令")
+
+    subparsers.add_parser("status", help="查看别名指向与各版本")
+
+    rebuild_parser = subparsers.add_parser("rebuild", help="从上传文件重建新版本并切换别名")
+    rebuild_parser.add_argument("--resume", help="继续之前中断的重建（版本集合名称）")
+    rebuild_parser.add_argument("--vector-size", type=int, default=1536, help="向量维度（默认: 1536）")
+    rebuild_parser.add_argument("--max-passes", type=int, default=3, help="切换前补齐新增文件的最大轮数（默认: 3）")
+    rebuild_parser.add_argument("--warmup-queries", type=int, default=200, help="切换前预热检索次数（默认: 200）")
+    rebuild_parser.add_argument("--no-swap", action="store_true", help="只重建与校验，不切换别名")
+    rebuild_parser.add_argument("--replace-legacy", action="store_true", help="别名名称仍是物理集合时，切换前删除该集合")
+    rebuild_parser.add_argument("--readers", type=int, default=4, help="并行读取与分块文件的协程数（默认: 4）")
+    rebuild_parser.add_argument("--upserters", type=int, default=2, help="并行写入Qdrant的协程数（默认: 2）")
+    rebuild_parser.add_argument("--group-size", type=int, help="每次提交嵌入的文本块数量（默认: 写入分段大小）")
+    rebuild_parser.add_argument("--inflight-groups", type=int, default=2, help="同时在途的嵌入分组数量（默认: 2）")
+    rebuild_parser.add_argument("--force", action="store_true", help="当前版本中的材料在新版本中缺失时仍然切换别名")
+
+    swap_parser = subparsers.add_parser("swap", help="将别名切换到指定版本")
+    swap_parser.add_argument("--to", required=True, help="目标版本集合名称")
+    swap_parser.add_argument("--replace-legacy", action="store_true", help="别名名称仍是物理集合时，切换前删除该集合")
+    swap_parser.add_argument("--force", action="store_true", help="当前版本中的材料在目标版本中缺失时仍然切换别名")
+
+    rollback_parser = subparsers.add_parser("rollback", help="回滚到旧版本")
+    rollback_parser.add_argument("--to", help="目标版本集合名称（默认: 当前版本之前最近的版本）")
+
+    prune_parser = subparsers.add_parser("prune", help="删除旧版本")
+    prune_parser.add_argument("--keep", type=int, default=1, help="保留的旧版本数量（默认: 1）")
+
+    args = parser.parse_args()
+
+    if not args.command:
+        parser.print_help()
+        return
+
+    rebuilder = CollectionRebuilder(args.alias)
+    success = True
+    try:
+        if args.command == "status":
+            await rebuilder.status()
+        elif args.command == "rebuild":
+            success = await rebuilder.rebuild(
+                resume=args.resume,
+                vector_size=args.vector_size,
+                max_passes=args.max_passes,
+                warmup_queries=args.warmup_queries,
+                swap=not args.no_swap,
+                replace_legacy=args.replace_legacy,
+                readers=args.readers,
+                upserters=args.upserters,
+                group_size=args.group_size,
+                max_inflight_groups=args.inflight_groups,
+                force=args.force
+            ) is not None
+        elif args.command == "swap":
+            success = await rebuilder.verify_materials(args.to, force=args.force) \
+                and await rebuilder.swap(args.to, replace_legacy=args.replace_legacy)
+        elif args.command == "rollback":
+            success = await rebuilder.rollback(args.to)
+        elif args.command == "prune":
+            await rebuilder.prune(args.keep)
+    except Exception as e:
+        logger.error(f"执行命令失败: {e}")
+        success = False
+    finally:
+        await get_client_registry().shutdown()
+
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())